@@ -4,6 +4,8 @@ Encapsulate the different transports available to Salt.
 This includes client side transport, for the ReqServer and the Publisher
 """
 
+import collections
+import hmac
 import logging
 import os
 import time
@@ -16,8 +18,11 @@ import salt.crypt
 import salt.exceptions
 import salt.payload
 import salt.transport.frame
+import salt.utils.bloom
+import salt.utils.compression
 import salt.utils.event
 import salt.utils.files
+import salt.utils.merkle
 import salt.utils.minions
 import salt.utils.stringutils
 import salt.utils.verify
@@ -156,6 +161,8 @@ class AsyncReqChannel:
         self._closing = False
         self.timeout = timeout
         self.tries = tries
+        self.compressor = salt.utils.compression.Compressor(self.opts)
+        self.ciphers = salt.crypt.aead_ciphers(self.opts)
 
     @property
     def crypt(self):
@@ -167,12 +174,82 @@ class AsyncReqChannel:
     def ttype(self):
         return self.transport.ttype
 
-    def _package_load(self, load):
-        return {
+    def _creds(self):
+        if not self.auth:
+            return {}
+        try:
+            return self.auth.creds or {}
+        except AttributeError:
+            # Not signed in yet
+            return {}
+
+    def _compression(self):
+        """
+        Return the compression algorithm negotiated with the master, or None
+        """
+        algorithm = self._creds().get("compression")
+        if algorithm not in self.compressor.algorithms:
+            return None
+        return algorithm
+
+    def _cipher(self):
+        """
+        Return the AEAD cipher negotiated with the master, or None for
+        AES-CBC and HMAC-SHA256
+        """
+        cipher = self._creds().get("cipher")
+        if cipher not in self.ciphers:
+            return None
+        return cipher
+
+    def _encrypt(self, load):
+        # Only pass what was negotiated, so an older Crypticle still works
+        kwargs = {}
+        compress = self.compressor.using(self._compression())
+        if compress is not None:
+            kwargs["compress"] = compress
+        cipher = self._cipher()
+        if cipher is not None:
+            kwargs["cipher"] = cipher
+        return self.auth.crypticle.dumps(load, **kwargs)
+
+    @staticmethod
+    def _command(load):
+        if isinstance(load, dict):
+            return load.get("cmd")
+        return None
+
+    def _decrypt_kwargs(self, cipher):
+        """
+        Return the keyword arguments of ``Crypticle.loads`` for a reply
+        encrypted with ``cipher``
+        """
+        kwargs = {}
+        if self.compressor.algorithms:
+            kwargs["decompress"] = self.compressor.decompress
+        if cipher is not None:
+            kwargs["cipher"] = cipher
+        return kwargs
+
+    def _package_load(self, load, cmd=None):
+        ret = {
             "enc": self.crypt,
             "load": load,
             "version": 2,
         }
+        if cmd is not None:
+            # The master routes the request to its workers with it, without
+            # decrypting the load
+            ret["cmd"] = cmd
+        compression = self._compression()
+        if compression:
+            # The master compresses the reply with it
+            ret["compression"] = compression
+        cipher = self._cipher()
+        if cipher:
+            # The load is encrypted with it, and so is the reply
+            ret["cipher"] = cipher
+        return ret
 
     @tornado.gen.coroutine
     def _send_with_retry(self, load, tries, timeout):
@@ -209,8 +286,9 @@ class AsyncReqChannel:
         load["nonce"] = nonce
         if not self.auth.authenticated:
             yield self.auth.authenticate()
+        cipher = self._cipher()
         ret = yield self._send_with_retry(
-            self._package_load(self.auth.crypticle.dumps(load)),
+            self._package_load(self._encrypt(load), self._command(load)),
             tries,
             timeout,
         )
@@ -218,20 +296,21 @@ class AsyncReqChannel:
         if "key" not in ret:
             # Reauth in the case our key is deleted on the master side.
             yield self.auth.authenticate()
+            cipher = self._cipher()
             ret = yield self._send_with_retry(
-                self._package_load(self.auth.crypticle.dumps(load)),
+                self._package_load(self._encrypt(load), self._command(load)),
                 tries,
                 timeout,
             )
         if HAS_M2:
             aes = key.private_decrypt(ret["key"], RSA.pkcs1_oaep_padding)
         else:
-            cipher = PKCS1_OAEP.new(key)  # pylint: disable=used-before-assignment
-            aes = cipher.decrypt(ret["key"])
+            oaep = PKCS1_OAEP.new(key)  # pylint: disable=used-before-assignment
+            aes = oaep.decrypt(ret["key"])
 
         # Decrypt using the public key.
         pcrypt = salt.crypt.Crypticle(self.opts, aes)
-        signed_msg = pcrypt.loads(ret[dictkey])
+        signed_msg = pcrypt.loads(ret[dictkey], **self._decrypt_kwargs(cipher))
 
         # Validate the master's signature.
         if not self.verify_signature(signed_msg["data"], signed_msg["sig"]):
@@ -273,8 +352,9 @@ class AsyncReqChannel:
         @tornado.gen.coroutine
         def _do_transfer():
             # Yield control to the caller. When send() completes, resume by populating data with the Future.result
+            cipher = self._cipher()
             data = yield self.transport.send(
-                self._package_load(self.auth.crypticle.dumps(load)),
+                self._package_load(self._encrypt(load), self._command(load)),
                 timeout=timeout,
             )
             # we may not have always data
@@ -282,7 +362,12 @@ class AsyncReqChannel:
             # communication, we do not subscribe to return events, we just
             # upload the results to the master
             if data:
-                data = self.auth.crypticle.loads(data, raw, nonce=nonce)
+                data = self.auth.crypticle.loads(
+                    data,
+                    raw,
+                    nonce=nonce,
+                    **self._decrypt_kwargs(cipher),
+                )
             if not raw or self.ttype == "tcp":  # XXX Why is this needed for tcp
                 data = salt.transport.frame.decode_embedded_strs(data)
             raise tornado.gen.Return(data)
@@ -426,6 +511,9 @@ class AsyncPubChannel:
         self._reconnected = False
         self.event = salt.utils.event.get_event("minion", opts=self.opts, listen=False)
         self.master_pubkey_path = os.path.join(self.opts["pki_dir"], self.auth.mpub)
+        # The Merkle roots of the batches of publishes whose signature was
+        # verified, the other publishes of a batch only need their proof
+        self._verified_roots = collections.deque(maxlen=32)
 
     @property
     def crypt(self):
@@ -506,7 +594,9 @@ class AsyncPubChannel:
         @tornado.gen.coroutine
         def _do_transfer():
             msg = self._package_load(self.auth.crypticle.dumps(load))
-            package = salt.transport.frame.frame_msg(msg, header=None)
+            package = salt.transport.frame.frame_msg(
+                msg, header=salt.transport.frame.advertise()
+            )
             yield self.transport.send(package)
 
             raise tornado.gen.Return(True)
@@ -592,13 +682,53 @@ class AsyncPubChannel:
                     "Message signing is enabled but the payload has no signature."
                 )
 
+            signed = payload["load"]
+            if "sig_proof" in payload:
+                # The master signed the Merkle root of a batch of publishes
+                try:
+                    signed = salt.utils.merkle.root_from_proof(
+                        payload["load"], payload["sig_proof"]
+                    )
+                except (TypeError, ValueError):
+                    raise salt.crypt.AuthenticationError(
+                        "Message signature proof is invalid."
+                    )
+                if signed in self._verified_roots:
+                    return
+
             # Verify that the signature is valid
             if not salt.crypt.verify_signature(
-                self.master_pubkey_path, payload["load"], payload.get("sig")
+                self.master_pubkey_path, signed, payload.get("sig")
             ):
                 raise salt.crypt.AuthenticationError(
                     "Message signature failed to validate."
                 )
+            if "sig_proof" in payload:
+                self._verified_roots.append(signed)
+
+    def _targeted(self, payload):
+        """
+        Return False if the target filter of the publish tells for sure it
+        is not for this minion. A filter which can not be authenticated, for
+        instance because the AES key was rotated, is ignored.
+        """
+        if "tgt_filter" not in payload or self.opts.get("__role") == "syndic":
+            # A syndic passes on the publishes to its own minions
+            return True
+        try:
+            tgt_filter = salt.utils.stringutils.to_bytes(payload["tgt_filter"])
+            load = salt.utils.stringutils.to_bytes(payload["load"])
+            crypticle = self.auth.crypticle
+            mac = crypticle.mac(tgt_filter + load[-crypticle.SIG_SIZE :])
+            if not hmac.compare_digest(
+                mac, salt.utils.stringutils.to_bytes(payload.get("tgt_filter_mac"))
+            ):
+                log.debug("Ignoring the target filter which failed to validate")
+                return True
+            return self.opts["id"] in salt.utils.bloom.BloomFilter.loads(tgt_filter)
+        except Exception as exc:  # pylint: disable=broad-except
+            log.debug("Ignoring the invalid target filter: %s", exc)
+            return True
 
     @tornado.gen.coroutine
     def _decode_payload(self, payload):
@@ -606,6 +736,9 @@ class AsyncPubChannel:
         log.trace("Decoding payload: %s", payload)
         reauth = False
         if payload["enc"] == "aes":
+            if not self._targeted(payload):
+                log.trace("Skipping a publish which does not target this minion")
+                raise tornado.gen.Return(None)
             self._verify_master_signature(payload)
             try:
                 payload["load"] = self.auth.crypticle.loads(payload["load"])
@@ -11,7 +11,7 @@ import hashlib
 import logging
 import os
 import pathlib
-import shutil
+import time
 
 import tornado.gen
 
@@ -19,9 +19,12 @@ import salt.crypt
 import salt.master
 import salt.payload
 import salt.transport.frame
+import salt.utils.bloom
 import salt.utils.channel
+import salt.utils.compression
 import salt.utils.event
-import salt.utils.files
+import salt.utils.key_store
+import salt.utils.merkle
 import salt.utils.minions
 import salt.utils.platform
 import salt.utils.stringutils
@@ -73,6 +76,10 @@ class ReqServerChannel:
             self.opts, self.opts["sock_dir"], listen=False
         )
         self.master_key = salt.crypt.MasterKeys(self.opts)
+        self.key_store = salt.utils.key_store.factory(self.opts)
+        self._session_crypticle = None
+        self.compressor = salt.utils.compression.Compressor(self.opts)
+        self.ciphers = salt.crypt.aead_ciphers(self.opts)
 
     @property
     def aes_key(self):
@@ -80,6 +87,17 @@ class ReqServerChannel:
             return salt.master.SMaster.secrets["cluster_aes"]["secret"].value
         return salt.master.SMaster.secrets["aes"]["secret"].value
 
+    @property
+    def session_crypticle(self):
+        """
+        The Crypticle auth session tickets are sealed with
+        """
+        if self._session_crypticle is None:
+            self._session_crypticle = salt.crypt.Crypticle(
+                self.opts, salt.crypt.session_ticket_key(self.key_store.pki_dir)
+            )
+        return self._session_crypticle
+
     def pre_fork(self, process_manager):
         """
         Do anything necessary pre-fork. Since this is on the master side this will
@@ -174,6 +192,17 @@ class ReqServerChannel:
         if version > 1:
             nonce = payload["load"].pop("nonce", None)
 
+        # The algorithm the minion negotiated, to compress the reply with
+        compress = self.compressor.using(payload.get("compression"))
+        # The request was decrypted with it, the reply is encrypted with it
+        cipher = payload.get("cipher")
+        # Only pass what was negotiated, so an older Crypticle still works
+        crypt_kwargs = {}
+        if compress is not None:
+            crypt_kwargs["compress"] = compress
+        if cipher is not None:
+            crypt_kwargs["cipher"] = cipher
+
         # TODO: test
         try:
             # Take the payload_handler function that was registered when we created the channel
@@ -188,7 +217,7 @@ class ReqServerChannel:
         if req_fun == "send_clear":
             raise tornado.gen.Return(ret)
         elif req_fun == "send":
-            raise tornado.gen.Return(self.crypticle.dumps(ret, nonce))
+            raise tornado.gen.Return(self.crypticle.dumps(ret, nonce, **crypt_kwargs))
         elif req_fun == "send_private":
             raise tornado.gen.Return(
                 self._encrypt_private(
@@ -197,30 +226,38 @@ class ReqServerChannel:
                     req_opts["tgt"],
                     nonce,
                     sign_messages,
+                    compress=compress,
+                    cipher=cipher,
                 ),
             )
         log.error("Unknown req_fun %s", req_fun)
         # always attempt to return an error to the minion
         raise tornado.gen.Return("Server-side exception handling payload")
 
-    def _encrypt_private(self, ret, dictkey, target, nonce=None, sign_messages=True):
+    def _encrypt_private(
+        self,
+        ret,
+        dictkey,
+        target,
+        nonce=None,
+        sign_messages=True,
+        compress=None,
+        cipher=None,
+    ):
         """
         The server equivalent of ReqChannel.crypted_transfer_decode_dictentry
         """
         # encrypt with a specific AES key
-        if self.master_key.cluster_key:
-            pubfn = os.path.join(self.opts["cluster_pki_dir"], "minions", target)
-        else:
-            pubfn = os.path.join(self.opts["pki_dir"], "minions", target)
         key = salt.crypt.Crypticle.generate_key_string()
         pcrypt = salt.crypt.Crypticle(self.opts, key)
+        pub_str = self.key_store.get(salt.utils.key_store.ACC, target)
+        if pub_str is None:
+            log.error("AES key not found")
+            return {"error": "AES key not found"}
         try:
-            pub = salt.crypt.PublicKey(pubfn)
+            pub = salt.crypt.PublicKey.from_str(pub_str)
         except (ValueError, IndexError, TypeError):
             return self.crypticle.dumps({})
-        except OSError:
-            log.error("AES key not found")
-            return {"error": "AES key not found"}
         pret = {}
         pret["key"] = pub.encrypt(key)
         if ret is False:
@@ -235,9 +272,9 @@ class ReqServerChannel:
                 "data": tosign,
                 "sig": salt.crypt.PrivateKey(self.master_key.rsa_path).sign(tosign),
             }
-            pret[dictkey] = pcrypt.dumps(signed_msg)
+            pret[dictkey] = pcrypt.dumps(signed_msg, compress=compress, cipher=cipher)
         else:
-            pret[dictkey] = pcrypt.dumps(ret)
+            pret[dictkey] = pcrypt.dumps(ret, compress=compress, cipher=cipher)
         return pret
 
     def _clear_signed(self, load):
@@ -281,12 +318,20 @@ class ReqServerChannel:
 
         # we need to decrypt it
         if payload["enc"] == "aes":
+            cipher = payload.get("cipher")
+            if cipher is not None and cipher not in self.ciphers:
+                raise salt.crypt.AuthenticationError(f"cipher {cipher} not allowed")
+            crypt_kwargs = {}
+            if self.compressor.algorithms:
+                crypt_kwargs["decompress"] = self.compressor.decompress
+            if cipher is not None:
+                crypt_kwargs["cipher"] = cipher
             try:
-                payload["load"] = self.crypticle.loads(payload["load"])
+                payload["load"] = self.crypticle.loads(payload["load"], **crypt_kwargs)
             except salt.crypt.AuthenticationError:
                 if not self._update_aes():
                     raise
-                payload["load"] = self.crypticle.loads(payload["load"])
+                payload["load"] = self.crypticle.loads(payload["load"], **crypt_kwargs)
         return payload
 
     def _auth(self, load, sign_messages=False):
@@ -356,26 +401,39 @@ class ReqServerChannel:
                     else:
                         return {"enc": "clear", "load": {"ret": "full"}}
 
-        pki_dir = self.opts["pki_dir"]
-        if self.opts["cluster_id"]:
-            if self.opts["cluster_pki_dir"]:
-                pki_dir = self.opts["cluster_pki_dir"]
-
         # Check if key is configured to be auto-rejected/signed
         auto_reject = self.auto_key.check_autoreject(load["id"])
         auto_sign = self.auto_key.check_autosign(
             load["id"], load.get("autosign_grains", None)
         )
 
-        pubfn = os.path.join(pki_dir, "minions", load["id"])
-        pubfn_pend = os.path.join(pki_dir, "minions_pre", load["id"])
-        pubfn_rejected = os.path.join(pki_dir, "minions_rejected", load["id"])
-        pubfn_denied = os.path.join(pki_dir, "minions_denied", load["id"])
+        acc = salt.utils.key_store.ACC
+        pend = salt.utils.key_store.PEND
+        rej = salt.utils.key_store.REJ
+        den = salt.utils.key_store.DEN
+        # The states the minion id has a key in, and the keys
+        keys = self.key_store.lookup(load["id"])
+        if (
+            "session" in load
+            and sign_messages
+            and self.opts.get("auth_session_tickets")
+            and not self.opts["open_mode"]
+            and acc in keys
+            and rej not in keys
+        ):
+            ret = self._resume_session(load, keys[acc])
+            if ret is not None:
+                return ret
+            log.debug(
+                "Invalid session ticket from %s, falling back to full auth",
+                load["id"],
+            )
+
         if self.opts["open_mode"]:
             # open mode is turned on, nuts to checks and overwrite whatever
             # is there
             pass
-        elif os.path.isfile(pubfn_rejected):
+        elif rej in keys:
             # The key has been rejected, don't place it in pending
             log.info(
                 "Public key rejected for %s. Key is present in rejection key dir.",
@@ -388,42 +446,23 @@ class ReqServerChannel:
                 return self._clear_signed({"ret": False, "nonce": load["nonce"]})
             else:
                 return {"enc": "clear", "load": {"ret": False}}
-        elif os.path.isfile(pubfn):
+        elif acc in keys:
             # The key has been accepted, check it
-            with salt.utils.files.fopen(pubfn, "r") as pubfn_handle:
-                if not self.compare_keys(pubfn_handle.read(), load["pub"]):
-                    log.error(
-                        "Authentication attempt from %s failed, the public "
-                        "keys did not match. This may be an attempt to compromise "
-                        "the Salt cluster.",
-                        load["id"],
-                    )
-                    # put denied minion key into minions_denied
-                    with salt.utils.files.fopen(pubfn_denied, "w+") as fp_:
-                        fp_.write(load["pub"])
-                    eload = {
-                        "result": False,
-                        "id": load["id"],
-                        "act": "denied",
-                        "pub": load["pub"],
-                    }
-                    if self.opts.get("auth_events") is True:
-                        self.event.fire_event(
-                            eload, salt.utils.event.tagify(prefix="auth")
-                        )
-                    if sign_messages:
-                        return self._clear_signed(
-                            {"ret": False, "nonce": load["nonce"]}
-                        )
-                    else:
-                        return {"enc": "clear", "load": {"ret": False}}
-
-        elif not os.path.isfile(pubfn_pend):
-            # The key has not been accepted, this is a new minion
-            if os.path.isdir(pubfn_pend):
-                # The key path is a directory, error out
-                log.info("New public key %s is a directory", load["id"])
-                eload = {"result": False, "id": load["id"], "pub": load["pub"]}
+            if not self.compare_keys(keys[acc], load["pub"]):
+                log.error(
+                    "Authentication attempt from %s failed, the public "
+                    "keys did not match. This may be an attempt to compromise "
+                    "the Salt cluster.",
+                    load["id"],
+                )
+                # put denied minion key into minions_denied
+                self.key_store.put(den, load["id"], load["pub"])
+                eload = {
+                    "result": False,
+                    "id": load["id"],
+                    "act": "denied",
+                    "pub": load["pub"],
+                }
                 if self.opts.get("auth_events") is True:
                     self.event.fire_event(eload, salt.utils.event.tagify(prefix="auth"))
                 if sign_messages:
@@ -431,27 +470,43 @@ class ReqServerChannel:
                 else:
                     return {"enc": "clear", "load": {"ret": False}}
 
+        elif pend not in keys:
+            # The key has not been accepted, this is a new minion
             if auto_reject:
-                key_path = pubfn_rejected
+                key_state = rej
                 log.info(
                     "New public key for %s rejected via autoreject_file", load["id"]
                 )
                 key_act = "reject"
                 key_result = False
             elif not auto_sign:
-                key_path = pubfn_pend
+                key_state = pend
                 log.info("New public key for %s placed in pending", load["id"])
                 key_act = "pend"
                 key_result = True
             else:
                 # The key is being automatically accepted, don't do anything
                 # here and let the auto accept logic below handle it.
-                key_path = None
+                key_state = None
 
-            if key_path is not None:
-                # Write the key to the appropriate location
-                with salt.utils.files.fopen(key_path, "w+") as fp_:
-                    fp_.write(load["pub"])
+            if key_state is not None:
+                # Store the key in the appropriate state
+                try:
+                    self.key_store.put(key_state, load["id"], load["pub"])
+                except OSError as exc:
+                    # e.g. the key path is a directory, error out
+                    log.info("Unable to store new public key %s: %s", load["id"], exc)
+                    eload = {"result": False, "id": load["id"], "pub": load["pub"]}
+                    if self.opts.get("auth_events") is True:
+                        self.event.fire_event(
+                            eload, salt.utils.event.tagify(prefix="auth")
+                        )
+                    if sign_messages:
+                        return self._clear_signed(
+                            {"ret": False, "nonce": load["nonce"]}
+                        )
+                    else:
+                        return {"enc": "clear", "load": {"ret": False}}
                 eload = {
                     "result": key_result,
                     "act": key_act,
@@ -467,16 +522,12 @@ class ReqServerChannel:
                 else:
                     return {"enc": "clear", "load": {"ret": key_result}}
 
-        elif os.path.isfile(pubfn_pend):
+        elif pend in keys:
             # This key is in the pending dir and is awaiting acceptance
             if auto_reject:
                 # We don't care if the keys match, this minion is being
-                # auto-rejected. Move the key file from the pending dir to the
-                # rejected dir.
-                try:
-                    shutil.move(pubfn_pend, pubfn_rejected)
-                except OSError:
-                    pass
+                # auto-rejected. Move the key from pending to rejected.
+                self.key_store.move({pend: [load["id"]]}, rej)
                 log.info(
                     "Pending public key for %s rejected via autoreject_file",
                     load["id"],
@@ -499,86 +550,80 @@ class ReqServerChannel:
                 # Check if the keys are the same and error out if this is the
                 # case. Otherwise log the fact that the minion is still
                 # pending.
-                with salt.utils.files.fopen(pubfn_pend, "r") as pubfn_handle:
-                    if not self.compare_keys(pubfn_handle.read(), load["pub"]):
-                        log.error(
-                            "Authentication attempt from %s failed, the public "
-                            "key in pending did not match. This may be an "
-                            "attempt to compromise the Salt cluster.",
-                            load["id"],
+                if not self.compare_keys(keys[pend], load["pub"]):
+                    log.error(
+                        "Authentication attempt from %s failed, the public "
+                        "key in pending did not match. This may be an "
+                        "attempt to compromise the Salt cluster.",
+                        load["id"],
+                    )
+                    # put denied minion key into minions_denied
+                    self.key_store.put(den, load["id"], load["pub"])
+                    eload = {
+                        "result": False,
+                        "id": load["id"],
+                        "act": "denied",
+                        "pub": load["pub"],
+                    }
+                    if self.opts.get("auth_events") is True:
+                        self.event.fire_event(
+                            eload, salt.utils.event.tagify(prefix="auth")
+                        )
+                    if sign_messages:
+                        return self._clear_signed(
+                            {"ret": False, "nonce": load["nonce"]}
                         )
-                        # put denied minion key into minions_denied
-                        with salt.utils.files.fopen(pubfn_denied, "w+") as fp_:
-                            fp_.write(load["pub"])
-                        eload = {
-                            "result": False,
-                            "id": load["id"],
-                            "act": "denied",
-                            "pub": load["pub"],
-                        }
-                        if self.opts.get("auth_events") is True:
-                            self.event.fire_event(
-                                eload, salt.utils.event.tagify(prefix="auth")
-                            )
-                        if sign_messages:
-                            return self._clear_signed(
-                                {"ret": False, "nonce": load["nonce"]}
-                            )
-                        else:
-                            return {"enc": "clear", "load": {"ret": False}}
                     else:
-                        log.info(
-                            "Authentication failed from host %s, the key is in "
-                            "pending and needs to be accepted with salt-key "
-                            "-a %s",
-                            load["id"],
-                            load["id"],
+                        return {"enc": "clear", "load": {"ret": False}}
+                else:
+                    log.info(
+                        "Authentication failed from host %s, the key is in "
+                        "pending and needs to be accepted with salt-key "
+                        "-a %s",
+                        load["id"],
+                        load["id"],
+                    )
+                    eload = {
+                        "result": True,
+                        "act": "pend",
+                        "id": load["id"],
+                        "pub": load["pub"],
+                    }
+                    if self.opts.get("auth_events") is True:
+                        self.event.fire_event(
+                            eload, salt.utils.event.tagify(prefix="auth")
                         )
-                        eload = {
-                            "result": True,
-                            "act": "pend",
-                            "id": load["id"],
-                            "pub": load["pub"],
-                        }
-                        if self.opts.get("auth_events") is True:
-                            self.event.fire_event(
-                                eload, salt.utils.event.tagify(prefix="auth")
-                            )
-                        if sign_messages:
-                            return self._clear_signed(
-                                {"ret": True, "nonce": load["nonce"]}
-                            )
-                        else:
-                            return {"enc": "clear", "load": {"ret": True}}
+                    if sign_messages:
+                        return self._clear_signed({"ret": True, "nonce": load["nonce"]})
+                    else:
+                        return {"enc": "clear", "load": {"ret": True}}
             else:
                 # This key is in pending and has been configured to be
                 # auto-signed. Check to see if it is the same key, and if
                 # so, pass on doing anything here, and let it get automatically
                 # accepted below.
-                with salt.utils.files.fopen(pubfn_pend, "r") as pubfn_handle:
-                    if not self.compare_keys(pubfn_handle.read(), load["pub"]):
-                        log.error(
-                            "Authentication attempt from %s failed, the public "
-                            "keys in pending did not match. This may be an "
-                            "attempt to compromise the Salt cluster.",
-                            load["id"],
+                if not self.compare_keys(keys[pend], load["pub"]):
+                    log.error(
+                        "Authentication attempt from %s failed, the public "
+                        "keys in pending did not match. This may be an "
+                        "attempt to compromise the Salt cluster.",
+                        load["id"],
+                    )
+                    # put denied minion key into minions_denied
+                    self.key_store.put(den, load["id"], load["pub"])
+                    eload = {"result": False, "id": load["id"], "pub": load["pub"]}
+                    if self.opts.get("auth_events") is True:
+                        self.event.fire_event(
+                            eload, salt.utils.event.tagify(prefix="auth")
+                        )
+                    if sign_messages:
+                        return self._clear_signed(
+                            {"ret": False, "nonce": load["nonce"]}
                         )
-                        # put denied minion key into minions_denied
-                        with salt.utils.files.fopen(pubfn_denied, "w+") as fp_:
-                            fp_.write(load["pub"])
-                        eload = {"result": False, "id": load["id"], "pub": load["pub"]}
-                        if self.opts.get("auth_events") is True:
-                            self.event.fire_event(
-                                eload, salt.utils.event.tagify(prefix="auth")
-                            )
-                        if sign_messages:
-                            return self._clear_signed(
-                                {"ret": False, "nonce": load["nonce"]}
-                            )
-                        else:
-                            return {"enc": "clear", "load": {"ret": False}}
                     else:
-                        os.remove(pubfn_pend)
+                        return {"enc": "clear", "load": {"ret": False}}
+                else:
+                    self.key_store.delete({pend: [load["id"]]})
 
         else:
             # Something happened that I have not accounted for, FAIL!
@@ -594,18 +639,15 @@ class ReqServerChannel:
         log.info("Authentication accepted from %s", load["id"])
         # only write to disk if you are adding the file, and in open mode,
         # which implies we accept any key from a minion.
-        if not os.path.isfile(pubfn) and not self.opts["open_mode"]:
-            with salt.utils.files.fopen(pubfn, "w+") as fp_:
-                fp_.write(load["pub"])
+        if acc not in keys and not self.opts["open_mode"]:
+            self.key_store.put(acc, load["id"], load["pub"])
+            keys[acc] = load["pub"]
         elif self.opts["open_mode"]:
-            disk_key = ""
-            if os.path.isfile(pubfn):
-                with salt.utils.files.fopen(pubfn, "r") as fp_:
-                    disk_key = fp_.read()
+            disk_key = keys.get(acc, "")
             if load["pub"] and load["pub"] != disk_key:
                 log.debug("Host key change detected in open mode.")
-                with salt.utils.files.fopen(pubfn, "w+") as fp_:
-                    fp_.write(load["pub"])
+                self.key_store.put(acc, load["id"], load["pub"])
+                keys[acc] = load["pub"]
             elif not load["pub"]:
                 log.error("Public key is empty: %s", load["id"])
                 if sign_messages:
@@ -622,9 +664,9 @@ class ReqServerChannel:
         # The key payload may sometimes be corrupt when using auto-accept
         # and an empty request comes in
         try:
-            pub = salt.crypt.get_rsa_pub_key(pubfn)
+            pub = salt.crypt.load_rsa_pub_key(keys[acc])
         except salt.crypt.InvalidKeyError as err:
-            log.error('Corrupt public key "%s": %s', pubfn, err)
+            log.error('Corrupt public key of "%s": %s', load["id"], err)
             if sign_messages:
                 return self._clear_signed({"ret": False, "nonce": load["nonce"]})
             else:
@@ -637,6 +679,14 @@ class ReqServerChannel:
             "pub_key": self.master_key.get_pub_str(),
             "publish_port": self.opts["publish_port"],
         }
+        compression = salt.utils.compression.negotiate(
+            self.opts, load.get("compression")
+        )
+        if compression:
+            ret["compression"] = compression
+        aead_cipher = salt.crypt.negotiate_cipher(self.opts, load.get("ciphers"))
+        if aead_cipher:
+            ret["cipher"] = aead_cipher
 
         # sign the master's pubkey (if enabled) before it is
         # sent to the minion that was just authenticated
@@ -715,10 +765,76 @@ class ReqServerChannel:
         if self.opts.get("auth_events") is True:
             self.event.fire_event(eload, salt.utils.event.tagify(prefix="auth"))
         if sign_messages:
+            if self.opts.get("auth_session_tickets"):
+                ret["session"] = self._issue_session(load["id"], keys[acc], pub)
             ret["nonce"] = load["nonce"]
             return self._clear_signed(ret)
         return ret
 
+    def _issue_session(self, id_, pub_str, pub):
+        """
+        Create a session ticket for a minion which just authenticated. The
+        ticket is opaque to the minion, the session key in it is encrypted
+        with the public key of the minion.
+        """
+        skey = salt.crypt.Crypticle.generate_key_string()
+        ticket = self.session_crypticle.dumps(
+            {
+                "id": id_,
+                "skey": skey,
+                "finger": salt.crypt.session_finger(pub_str),
+                "expires": time.time() + self.opts["auth_session_ticket_ttl"],
+            }
+        )
+        skey = salt.utils.stringutils.to_bytes(skey)
+        if HAS_M2:
+            skey = pub.public_encrypt(skey, RSA.pkcs1_oaep_padding)
+        else:
+            skey = PKCS1_OAEP.new(pub).encrypt(skey)
+        return {"ticket": ticket, "skey": skey}
+
+    def _resume_session(self, load, pub_str):
+        """
+        Return the reply to a sign in with a session ticket, or None if the
+        ticket is not valid and the minion has to go through the full auth.
+
+        The current AES key is encrypted with the session key from the ticket,
+        so there are no RSA operations involved.
+        """
+        try:
+            ticket = self.session_crypticle.loads(load["session"])
+        except Exception:  # pylint: disable=broad-except
+            return None
+        if (
+            not isinstance(ticket, dict)
+            or ticket.get("id") != load["id"]
+            or ticket.get("expires", 0) < time.time()
+            or ticket.get("finger") != salt.crypt.session_finger(pub_str)
+            or not self.compare_keys(pub_str, load["pub"])
+        ):
+            return None
+        log.info("Authentication session resumed for %s", load["id"])
+        if self.cache_cli:
+            self.cache_cli.put_cache([load["id"]])
+        eload = {"result": True, "act": "accept", "id": load["id"], "pub": load["pub"]}
+        if self.opts.get("auth_events") is True:
+            self.event.fire_event(eload, salt.utils.event.tagify(prefix="auth"))
+        reply = {
+            "aes": self.aes_key,
+            "publish_port": self.opts["publish_port"],
+            "nonce": load["nonce"],
+        }
+        compression = salt.utils.compression.negotiate(
+            self.opts, load.get("compression")
+        )
+        if compression:
+            reply["compression"] = compression
+        cipher = salt.crypt.negotiate_cipher(self.opts, load.get("ciphers"))
+        if cipher:
+            reply["cipher"] = cipher
+        session = salt.crypt.Crypticle(self.opts, ticket["skey"]).dumps(reply)
+        return {"enc": "clear", "load": {"session": session}}
+
     def close(self):
         self.transport.close()
         if self.event is not None:
@@ -730,6 +846,10 @@ class PubServerChannel:
     Factory class to create subscription channels to the master's Publisher
     """
 
+    # The most publishes signed with a single signature when
+    # publish_batch_signing is enabled
+    BATCH_SIZE = 1024
+
     @classmethod
     def factory(cls, opts, **kwargs):
         if "master_uri" not in opts and "master_uri" in kwargs:
@@ -755,7 +875,11 @@ class PubServerChannel:
         self.aes_funcs = salt.master.AESFuncs(self.opts)
         self.present = {}
         self.presence_events = presence_events
+        self.compressor = salt.utils.compression.Compressor(self.opts)
         self.event = salt.utils.event.get_event("master", opts=self.opts, listen=False)
+        self._signer = None
+        self._batch = []
+        self._batch_task = None
 
     @property
     def aes_key(self):
@@ -778,8 +902,15 @@ class PubServerChannel:
         self.ckminions = salt.utils.minions.CkMinions(self.opts)
         self.present = {}
         self.master_key = salt.crypt.MasterKeys(self.opts)
+        self.compressor = salt.utils.compression.Compressor(self.opts)
+        self._signer = None
+        self._batch = []
+        self._batch_task = None
 
     def close(self):
+        if self._batch_task is not None:
+            self._batch_task.cancel()
+            self._batch_task = None
         self.transport.close()
         if self.event is not None:
             self.event.destroy()
@@ -824,11 +955,44 @@ class PubServerChannel:
         if not self.aes_funcs.verify_minion(load["id"], load["tok"]):
             return
         subscriber.id_ = load["id"]
+        if hasattr(subscriber, "lag_callback"):
+            subscriber.lag_callback = self._client_lagging
         self._add_client_present(subscriber)
 
     def remove_presence_callback(self, subscriber):
         self._remove_client_present(subscriber)
 
+    def _lag(self):
+        """
+        Return how far behind the subscribers of each minion which fell behind
+        are, for the transports which keep track of it
+        """
+        ret = {}
+        for id_, clients in self.present.items():
+            for client in clients:
+                if not hasattr(client, "lag"):
+                    continue
+                lag = client.lag()
+                if lag["queued_bytes"] or lag["dropped"]:
+                    ret[id_] = lag
+        return ret
+
+    def _present_event(self):
+        data = {"present": list(self.present.keys())}
+        lag = self._lag()
+        if lag:
+            data["lag"] = lag
+        self.event.fire_event(data, salt.utils.event.tagify("present", "presence"))
+
+    def _client_lagging(self, client):
+        """
+        A subscriber fell behind and publishes to it were dropped
+        """
+        if self.presence_events and client.id_ in self.present:
+            data = {"id": client.id_}
+            data.update(client.lag())
+            self.event.fire_event(data, salt.utils.event.tagify("lag", "presence"))
+
     def _add_client_present(self, client):
         id_ = client.id_
         if id_ in self.present:
@@ -841,10 +1005,7 @@ class PubServerChannel:
                 self.event.fire_event(
                     data, salt.utils.event.tagify("change", "presence")
                 )
-                data = {"present": list(self.present.keys())}
-                self.event.fire_event(
-                    data, salt.utils.event.tagify("present", "presence")
-                )
+                self._present_event()
 
     def _remove_client_present(self, client):
         id_ = client.id_
@@ -869,60 +1030,123 @@ class PubServerChannel:
                 self.event.fire_event(
                     data, salt.utils.event.tagify("change", "presence")
                 )
-                data = {"present": list(self.present.keys())}
-                self.event.fire_event(
-                    data, salt.utils.event.tagify("present", "presence")
-                )
+                self._present_event()
 
     async def publish_payload(self, load, *args):
         load = salt.payload.loads(load)
-        unpacked_package = self.wrap_payload(load)
-        try:
-            payload = salt.payload.loads(unpacked_package["payload"])
-        except KeyError:
-            log.error("Invalid package %r", unpacked_package)
-            raise
-        payload = salt.payload.dumps(payload)
-        if "topic_lst" in unpacked_package:
-            topic_list = unpacked_package["topic_lst"]
-            ret = await self.transport.publish_payload(payload, topic_list)
-        else:
-            ret = await self.transport.publish_payload(payload)
-        return ret
+        if self.opts.get("publish_batch_signing") and self.opts["sign_pub_messages"]:
+            # The publishes coming in while a batch is signed and sent make up
+            # the next batch
+            self._batch.append(load)
+            if self._batch_task is None or self._batch_task.done():
+                self._batch_task = asyncio.ensure_future(self._publish_batches())
+            return
+        return await self._send_package(self.wrap_payload(load))
 
-    def wrap_payload(self, load):
+    async def _send_package(self, package):
+        if "topic_lst" in package:
+            return await self.transport.publish_payload(
+                package["payload"], package["topic_lst"]
+            )
+        return await self.transport.publish_payload(package["payload"])
+
+    async def _publish_batches(self):
+        while self._batch:
+            loads = self._batch[: self.BATCH_SIZE]
+            del self._batch[: self.BATCH_SIZE]
+            try:
+                packages = self.wrap_payloads(loads)
+            except Exception:  # pylint: disable=broad-except
+                log.error(
+                    "Unable to wrap a batch of %d publishes", len(loads), exc_info=True
+                )
+                continue
+            for package in packages:
+                try:
+                    await self._send_package(package)
+                except Exception:  # pylint: disable=broad-except
+                    log.error("Unable to publish a payload", exc_info=True)
+
+    def _sign(self, data):
+        if self._signer is None:
+            self._signer = salt.crypt.PrivateKey(self.master_key.rsa_path)
+        return self._signer.sign(data)
+
+    def _encrypt_payload(self, load):
         payload = {"enc": "aes"}
         if not self.opts.get("cluster_id", None):
             load["serial"] = salt.master.SMaster.get_serial()
         crypticle = salt.crypt.Crypticle(self.opts, self.aes_key)
-        payload["load"] = crypticle.dumps(load)
+        compress = None
+        if self.opts.get("publish_compression") and self.compressor.algorithms:
+            # A publish is encrypted once for all the minions, so the
+            # algorithm can not be negotiated with each of them
+            compress = self.compressor.using(self.compressor.algorithms[0])
+        payload["load"] = crypticle.dumps(load, compress=compress)
+        return payload
+
+    def wrap_payload(self, load):
+        payload = self._encrypt_payload(load)
         if self.opts["sign_pub_messages"]:
             log.debug("Signing data packet")
-            payload["sig"] = salt.crypt.PrivateKey(
-                self.master_key.rsa_path,
-            ).sign(payload["load"])
-        int_payload = {"payload": salt.payload.dumps(payload)}
+            payload["sig"] = self._sign(payload["load"])
+        return self._package(load, payload)
 
+    def wrap_payloads(self, loads):
+        """
+        Wrap a batch of publishes, signed with a single signature over the
+        Merkle root of their encrypted loads. Each payload carries the proof
+        leading from its load to the root.
+        """
+        payloads = [self._encrypt_payload(load) for load in loads]
+        levels = salt.utils.merkle.tree([payload["load"] for payload in payloads])
+        log.debug("Signing a batch of %d data packets", len(payloads))
+        sig = self._sign(salt.utils.merkle.root(levels))
+        for index, payload in enumerate(payloads):
+            payload["sig"] = sig
+            payload["sig_proof"] = salt.utils.merkle.proof(levels, index)
+        return [self._package(load, payload) for load, payload in zip(loads, payloads)]
+
+    def _package(self, load, payload):
+        int_payload = {}
+        filter_max = self.opts.get("publish_target_filter") or 0
         # If topics are upported, target matching has to happen master side
         match_targets = ["pcre", "glob", "list"]
-        if self.transport.topic_support and load["tgt_type"] in match_targets:
-            # add some targeting stuff for lists only (for now)
-            if load["tgt_type"] == "list":
-                int_payload["topic_lst"] = load["tgt"]
+        matching = self.transport.topic_support or filter_max
+        if matching and load["tgt_type"] in match_targets:
             if isinstance(load["tgt"], str):
                 # Fetch a list of minions that match
                 _res = self.ckminions.check_minions(
                     load["tgt"], tgt_type=load["tgt_type"]
                 )
-                match_ids = _res["minions"]
-                log.debug("Publish Side Match: %s", match_ids)
-                # Send list of miions thru so zmq can target them
-                int_payload["topic_lst"] = match_ids
+                targets = _res["minions"]
+                log.debug("Publish Side Match: %s", targets)
             else:
-                int_payload["topic_lst"] = load["tgt"]
-
+                targets = load["tgt"]
+            if self.transport.topic_support:
+                # Send list of miions thru so zmq can target them
+                int_payload["topic_lst"] = targets
+            # A list of patterns is not resolved to minions
+            resolved = isinstance(load["tgt"], str) or load["tgt_type"] == "list"
+            if resolved and 0 < len(targets) <= filter_max:
+                self._add_target_filter(payload, targets)
+        int_payload["payload"] = salt.payload.dumps(payload)
         return int_payload
 
+    def _add_target_filter(self, payload, targets):
+        """
+        Attach a Bloom filter of the targeted minions to the payload, so the
+        other minions skip it without decrypting it. The filter is
+        authenticated along with the signature of the encrypted load, which
+        binds it to this load.
+        """
+        tgt_filter = salt.utils.bloom.BloomFilter.from_items(targets).dumps()
+        crypticle = salt.crypt.Crypticle(self.opts, self.aes_key)
+        payload["tgt_filter"] = tgt_filter
+        payload["tgt_filter_mac"] = crypticle.mac(
+            tgt_filter + payload["load"][-crypticle.SIG_SIZE :]
+        )
+
     async def publish(self, load):
         """
         Publish "load" to minions
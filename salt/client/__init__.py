@@ -8,6 +8,7 @@ The data structure needs to be:
               'key': '<read in the key file>'}
 """
 
+import contextlib
 import logging
 
 # The components here are simple, and they need to be and stay simple, we
@@ -227,6 +228,7 @@ class LocalClient:
             listen=self.listen,
             io_loop=io_loop,
             keep_loop=keep_loop,
+            filter_events=True,
         )
         self.utils = salt.loader.utils(self.opts)
         self.functions = salt.loader.minion_mods(self.opts, utils=self.utils)
@@ -383,32 +385,54 @@ class LocalClient:
         """
         arg = salt.utils.args.condition_input(arg, kwarg)
 
-        try:
-            pub_data = self.pub(
-                tgt,
-                fun,
-                arg,
-                tgt_type,
-                ret,
-                jid=jid,
-                timeout=self._get_timeout(timeout),
-                listen=listen,
-                **kwargs,
-            )
-        except SaltClientError:
-            # Re-raise error with specific message
-            raise SaltClientError(
-                "The salt master could not be contacted. Is master running?"
-            )
-        except AuthenticationError as err:
-            raise
-        except AuthorizationError as err:
-            raise
-        except Exception as general_exception:  # pylint: disable=broad-except
-            # Convert to generic client error and pass along message
-            raise SaltClientError(general_exception)
+        with self._job_events(listen):
+            try:
+                pub_data = self.pub(
+                    tgt,
+                    fun,
+                    arg,
+                    tgt_type,
+                    ret,
+                    jid=jid,
+                    timeout=self._get_timeout(timeout),
+                    listen=listen,
+                    **kwargs,
+                )
+            except SaltClientError:
+                # Re-raise error with specific message
+                raise SaltClientError(
+                    "The salt master could not be contacted. Is master running?"
+                )
+            except AuthenticationError as err:
+                raise
+            except AuthorizationError as err:
+                raise
+            except Exception as general_exception:  # pylint: disable=broad-except
+                # Convert to generic client error and pass along message
+                raise SaltClientError(general_exception)
 
-        return self._check_pub_data(pub_data, listen=listen)
+            return self._check_pub_data(pub_data, listen=listen)
+
+    @contextlib.contextmanager
+    def _job_events(self, listen):
+        """
+        Have the event publisher forward the events of every job while one is
+        published, so none of its events are dropped before its jid is
+        subscribed to
+        """
+        if not listen:
+            yield
+            return
+        tags = [["salt/job/", "startswith"]]
+        if self.opts.get("order_masters"):
+            tags.append(["syndic/", "startswith"])
+        for tag, match_type in tags:
+            self.event.expect(tag, match_type)
+        try:
+            yield
+        finally:
+            for tag, match_type in tags:
+                self.event.unexpect(tag, match_type)
 
     def gather_minions(self, tgt, expr_form):
         _res = salt.utils.minions.CkMinions(self.opts).check_minions(
@@ -447,33 +471,34 @@ class LocalClient:
         """
         arg = salt.utils.args.condition_input(arg, kwarg)
 
-        try:
-            pub_data = yield self.pub_async(
-                tgt,
-                fun,
-                arg,
-                tgt_type,
-                ret,
-                jid=jid,
-                timeout=self._get_timeout(timeout),
-                io_loop=io_loop,
-                listen=listen,
-                **kwargs,
-            )
-        except SaltClientError:
-            # Re-raise error with specific message
-            raise SaltClientError(
-                "The salt master could not be contacted. Is master running?"
-            )
-        except AuthenticationError as err:
-            raise AuthenticationError(err)
-        except AuthorizationError as err:
-            raise AuthorizationError(err)
-        except Exception as general_exception:  # pylint: disable=broad-except
-            # Convert to generic client error and pass along message
-            raise SaltClientError(general_exception)
-
-        raise tornado.gen.Return(self._check_pub_data(pub_data, listen=listen))
+        with self._job_events(listen):
+            try:
+                pub_data = yield self.pub_async(
+                    tgt,
+                    fun,
+                    arg,
+                    tgt_type,
+                    ret,
+                    jid=jid,
+                    timeout=self._get_timeout(timeout),
+                    io_loop=io_loop,
+                    listen=listen,
+                    **kwargs,
+                )
+            except SaltClientError:
+                # Re-raise error with specific message
+                raise SaltClientError(
+                    "The salt master could not be contacted. Is master running?"
+                )
+            except AuthenticationError as err:
+                raise AuthenticationError(err)
+            except AuthorizationError as err:
+                raise AuthorizationError(err)
+            except Exception as general_exception:  # pylint: disable=broad-except
+                # Convert to generic client error and pass along message
+                raise SaltClientError(general_exception)
+
+            raise tornado.gen.Return(self._check_pub_data(pub_data, listen=listen))
 
     def cmd_async(
         self, tgt, fun, arg=(), tgt_type="glob", ret="", jid="", kwarg=None, **kwargs
@@ -4,7 +4,6 @@ correct cloud modules
 """
 
 import copy
-import glob
 import logging
 import multiprocessing
 import os
@@ -24,6 +23,7 @@ import salt.utils.crypt
 import salt.utils.data
 import salt.utils.dictupdate
 import salt.utils.files
+import salt.utils.key_store
 import salt.utils.user
 import salt.utils.verify
 import salt.utils.yaml
@@ -1033,6 +1033,7 @@ class Cloud:
         # now the processed data structure contains the output from either
         # the parallel or non-parallel destroy and we should finish up
         # with removing minion keys if necessary
+        key_store = salt.utils.cloud.get_key_store(self.opts["pki_dir"], self.opts)
         for alias, driver, name in vms_to_destroy:
             ret = processed[alias][driver][name]
             if not ret:
@@ -1047,34 +1048,33 @@ class Cloud:
             minion_dict = salt.config.get_cloud_config_value(
                 "minion", vm_, self.opts, default={}
             )
-            key_file = os.path.join(
-                self.opts["pki_dir"], "minions", minion_dict.get("id", name)
-            )
-            globbed_key_file = glob.glob(f"{key_file}.*")
+            key_id = minion_dict.get("id", name)
+            key_exists = key_store.get(salt.utils.key_store.ACC, key_id) is not None
+            globbed_keys = key_store.match(
+                f"{key_id}.*", states=(salt.utils.key_store.ACC,)
+            ).get(salt.utils.key_store.ACC, [])
 
-            if not os.path.isfile(key_file) and not globbed_key_file:
+            if not key_exists and not globbed_keys:
                 # There's no such key file!? It might have been renamed
                 if isinstance(ret, dict) and "newname" in ret:
-                    salt.utils.cloud.remove_key(self.opts["pki_dir"], ret["newname"])
+                    salt.utils.cloud.remove_key(
+                        self.opts["pki_dir"], ret["newname"], opts=self.opts
+                    )
                 continue
 
-            if os.path.isfile(key_file) and not globbed_key_file:
+            if key_exists and not globbed_keys:
                 # Single key entry. Remove it!
                 salt.utils.cloud.remove_key(
-                    self.opts["pki_dir"], os.path.basename(key_file)
+                    self.opts["pki_dir"], key_id, opts=self.opts
                 )
                 continue
 
             # Since we have globbed matches, there are probably some keys for which their minion
             # configuration has append_domain set.
-            if (
-                not os.path.isfile(key_file)
-                and globbed_key_file
-                and len(globbed_key_file) == 1
-            ):
+            if not key_exists and len(globbed_keys) == 1:
                 # Single entry, let's remove it!
                 salt.utils.cloud.remove_key(
-                    self.opts["pki_dir"], os.path.basename(globbed_key_file[0])
+                    self.opts["pki_dir"], globbed_keys[0], opts=self.opts
                 )
                 continue
 
@@ -1089,8 +1089,8 @@ class Cloud:
                 "deleted:".format(name)
             )
             while True:
-                for idx, filename in enumerate(globbed_key_file):
-                    print(f" {idx}: {os.path.basename(filename)}")
+                for idx, filename in enumerate(globbed_keys):
+                    print(f" {idx}: {filename}")
                 selection = input("Which minion key should be deleted(number)? ")
                 try:
                     selection = int(selection)
@@ -1098,13 +1098,15 @@ class Cloud:
                     print(f"'{selection}' is not a valid selection.")
 
                 try:
-                    filename = os.path.basename(globbed_key_file.pop(selection))
+                    filename = globbed_keys.pop(selection)
                 except Exception:  # pylint: disable=broad-except
                     continue
 
                 delete = input(f"Delete '{filename}'? [Y/n]? ")
                 if delete == "" or delete.lower().startswith("y"):
-                    salt.utils.cloud.remove_key(self.opts["pki_dir"], filename)
+                    salt.utils.cloud.remove_key(
+                        self.opts["pki_dir"], filename, opts=self.opts
+                    )
                     print(f"Deleted '{filename}'")
                     break
 
@@ -1207,7 +1209,9 @@ class Cloud:
 
         if local_master is True and deploy is True:
             # Accept the key on the local master
-            salt.utils.cloud.accept_key(self.opts["pki_dir"], vm_["pub_key"], key_id)
+            salt.utils.cloud.accept_key(
+                self.opts["pki_dir"], vm_["pub_key"], key_id, opts=self.opts
+            )
 
         vm_["os"] = salt.config.get_cloud_config_value("script", vm_, self.opts)
 
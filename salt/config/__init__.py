@@ -175,8 +175,13 @@ VALID_OPTS = immutabletypes.freeze(
         # The caching mechanism to use for the PKI key store. Can substantially decrease master publish
         # times. Available types:
         # 'maint': Runs on a schedule as a part of the maintenance process.
+        # 'watch': Kept up to date by a master process watching the key directories.
         # '': Disable the key cache [default]
         "key_cache": str,
+        # The backend storing the minion keys, 'dirs' [default] or 'sqlite'
+        "key_store": str,
+        # The database of the 'sqlite' key store, <pki_dir>/keys.sqlite3 by default
+        "key_store_path": (type(None), str),
         # The user under which the daemon should run
         "user": str,
         # The root directory prepended to these options: pki_dir, cachedir,
@@ -320,6 +325,9 @@ VALID_OPTS = immutabletypes.freeze(
         "ipv6": (type(None), bool),
         # The chunk size to use when streaming files with the file server
         "file_buffer_size": int,
+        # The number of chunk requests in flight when fetching a file from the
+        # master
+        "file_transfer_window": int,
         # The TCP port on which minion events should be published if ipc_mode is TCP
         "tcp_pub_port": int,
         # The TCP port on which minion events should be pulled if ipc_mode is TCP
@@ -333,6 +341,8 @@ VALID_OPTS = immutabletypes.freeze(
         "tcp_master_publish_pull": int,
         # The TCP port for mworkers to connect to on the master
         "tcp_master_workers": int,
+        # Hand the requests of the tcp transport to the least busy MWorker
+        "tcp_request_router": bool,
         # The file to send logging data to
         "log_file": str,
         # The level of verbosity at which to log
@@ -464,8 +474,24 @@ VALID_OPTS = immutabletypes.freeze(
         "event_return_whitelist": list,
         # Events matching a tag in this list should never be sent to an event returner.
         "event_return_blacklist": list,
+        # The number of events queued in memory for each event returner, the
+        # events past it are spilled to disk
+        "event_return_queue_hwm": int,
+        # The number of events spilled to disk for each event returner, the
+        # oldest ones are dropped past it. 0 disables spilling.
+        "event_return_spill_hwm": int,
+        # The number of times a batch of events is retried when an event
+        # returner fails to store it, 0 to retry until it succeeds
+        "event_return_retries": int,
+        # The seconds to wait before retrying a batch of events, doubled on
+        # each attempt up to event_return_retry_backoff_max
+        "event_return_retry_backoff": (int, float),
+        "event_return_retry_backoff_max": (int, float),
         # default match type for filtering events tags: startswith, endswith, find, regex, fnmatch
         "event_match_type": str,
+        # The number of events received for subscribed tags an event listener
+        # keeps until they are asked for, 0 for no limit
+        "max_pending_events": int,
         # This pidfile to write out to when a daemon starts
         "pidfile": str,
         # Used with the SECO range master tops system
@@ -491,9 +517,20 @@ VALID_OPTS = immutabletypes.freeze(
         # Set the zeromq high water mark on the publisher interface.
         # http://api.zeromq.org/3-2:zmq-setsockopt
         "pub_hwm": int,
+        # The bytes queued for a subscriber of the tcp publisher before the
+        # tcp_pub_slow_subscriber policy applies, 0 for no limit
+        "tcp_pub_buffer_size": int,
+        # What the tcp publisher does with a subscriber which fell behind:
+        # disconnect or drop_oldest
+        "tcp_pub_slow_subscriber": str,
+        # The publishes to a subscriber coalesced in a single write, in bytes
+        "tcp_pub_coalesce_size": int,
         # IPC buffer size
         # Refs https://github.com/saltstack/salt/issues/34215
         "ipc_write_buffer": int,
+        # The size in bytes of the shared memory ring the local event bus
+        # listeners read the events from, 0 to send the events over the socket
+        "ipc_event_ring_size": int,
         # various subprocess niceness levels
         "req_server_niceness": (type(None), int),
         "pub_server_niceness": (type(None), int),
@@ -507,6 +544,12 @@ VALID_OPTS = immutabletypes.freeze(
         # The number of MWorker processes for a master to startup. This number needs to scale up as
         # the number of connected minions increases.
         "worker_threads": int,
+        # Queue the requests to the MWorkers by request class
+        "request_admission": bool,
+        # The queue, concurrency limit and priority of each request class
+        "request_classes": dict,
+        # Named pools of MWorkers and the commands they handle
+        "worker_pools": dict,
         # The port for the master to listen to returns on. The minion needs to connect to this port
         # to send returns.
         "ret_port": int,
@@ -518,6 +561,13 @@ VALID_OPTS = immutabletypes.freeze(
         # If the returner supports `clean_old_jobs`, then at cleanup time,
         # archive the job data before deleting it.
         "archive_jobs": bool,
+        # The on-disk layout used by the local_cache returner to store minion
+        # returns, either "dirs" (one directory per minion) or "segment" (one
+        # append-only log per job)
+        "local_cache_storage": str,
+        # Store the local_cache jobs in time buckets of this many seconds so
+        # expired jobs can be removed a whole bucket at a time, 0 disables it
+        "local_cache_bucket_seconds": int,
         # A master-only copy of the file_roots dictionary, used by the state compiler
         "master_roots": dict,
         # Add the proxymodule LazyLoader object to opts.  This breaks many things
@@ -719,6 +769,12 @@ VALID_OPTS = immutabletypes.freeze(
         "reactor_worker_threads": int,
         # The queue size for workers in the reactor
         "reactor_worker_hwm": int,
+        # Cache the render output of the reactor SLS files which do not depend
+        # on the event
+        "reactor_render_cache": bool,
+        # The classes of reactions, queued separately by priority with their
+        # own concurrency limits
+        "reactor_classes": dict,
         # Defines engines. See https://docs.saltproject.io/en/latest/topics/engines/
         "engines": list,
         # Whether or not to store runner returns in the job cache
@@ -799,6 +855,27 @@ VALID_OPTS = immutabletypes.freeze(
         "keysize": int,
         # The transport system for this daemon. (i.e. zeromq, tcp, detect, etc)
         "transport": str,
+        # The algorithms the request and publish payloads may be compressed
+        # with, in order of preference: zstd, zlib
+        "compression": list,
+        # The compression level, None for the default of the algorithm
+        "compression_level": (type(None), int),
+        # The payloads smaller than this many bytes are not compressed
+        "compression_threshold": int,
+        # The most bytes a compressed payload is decompressed to
+        "compression_max_size": int,
+        # Compress the publishes, all the minions must support it
+        "publish_compression": bool,
+        # Sign the publishes in batches with a single signature over a Merkle
+        # tree, all the minions must support it
+        "publish_batch_signing": bool,
+        # Attach a Bloom filter of the targeted minions to the publishes which
+        # target at most this many minions, 0 to disable
+        "publish_target_filter": int,
+        # The AEAD ciphers the request channel may be encrypted with instead
+        # of AES-CBC and HMAC-SHA256, in order of preference: aes-256-gcm,
+        # chacha20-poly1305
+        "aead_ciphers": list,
         # The number of seconds to wait when the client is requesting information about running jobs
         "gather_job_timeout": int,
         # The number of seconds to wait before timing out an authentication request
@@ -854,6 +931,15 @@ VALID_OPTS = immutabletypes.freeze(
         "zmq_filtering": bool,
         # Connection caching. Can greatly speed up salt performance.
         "con_cache": bool,
+        # Keep an in-memory index of the minion data cache in a dedicated master
+        # process and use it to resolve grain and pillar targets
+        "minion_data_index": bool,
+        # The interval in seconds at which the minion data index is rebuilt
+        # from the minion data cache
+        "minion_data_index_refresh": int,
+        # The number of seconds to wait for the minion data index to answer
+        # before falling back to searching the minion data cache
+        "minion_data_index_timeout": (int, float),
         "rotate_aes_key": bool,
         # Cache ZeroMQ connections. Can greatly improve salt performance.
         "cache_sreqs": bool,
@@ -966,6 +1052,11 @@ VALID_OPTS = immutabletypes.freeze(
         "schedule": dict,
         # Whether to fire auth events
         "auth_events": bool,
+        # Whether the master issues session tickets minions can sign in with
+        # again without a full RSA authentication
+        "auth_session_tickets": bool,
+        # How long, in seconds, an auth session ticket stays valid
+        "auth_session_ticket_ttl": int,
         # Whether to fire Minion data cache refresh events
         "minion_data_cache_events": bool,
         # Enable calling ssh minions from the salt master
@@ -1175,8 +1266,10 @@ DEFAULT_MINION_OPTS = immutabletypes.freeze(
         "mine_interval": 60,
         "ipc_mode": _DFLT_IPC_MODE,
         "ipc_write_buffer": _DFLT_IPC_WBUFFER,
+        "ipc_event_ring_size": 0,
         "ipv6": None,
         "file_buffer_size": 262144,
+        "file_transfer_window": 1,
         "tcp_pub_port": 4510,
         "tcp_pull_port": 4511,
         "tcp_authentication_retries": 5,
@@ -1255,6 +1348,8 @@ DEFAULT_MINION_OPTS = immutabletypes.freeze(
         "reactor_refresh_interval": 60,
         "reactor_worker_threads": 10,
         "reactor_worker_hwm": 10000,
+        "reactor_render_cache": False,
+        "reactor_classes": {},
         "engines": [],
         "tcp_keepalive": True,
         "tcp_keepalive_idle": 300,
@@ -1267,6 +1362,11 @@ DEFAULT_MINION_OPTS = immutabletypes.freeze(
         "minion_id_remove_domain": False,
         "keysize": 2048,
         "transport": "zeromq",
+        "compression": [],
+        "compression_level": 3,
+        "compression_threshold": 4096,
+        "compression_max_size": 104857600,
+        "aead_ciphers": [],
         "auth_timeout": 5,
         "auth_tries": 7,
         "master_tries": _MASTER_TRIES,
@@ -1287,6 +1387,7 @@ DEFAULT_MINION_OPTS = immutabletypes.freeze(
         "http_request_timeout": 1 * 60 * 60.0,  # 1 hour
         "http_max_body": 100 * 1024 * 1024 * 1024,  # 100GB
         "event_match_type": "startswith",
+        "max_pending_events": 100000,
         "minion_restart_command": [],
         "pub_ret": True,
         "proxy_host": "",
@@ -1320,9 +1421,15 @@ DEFAULT_MASTER_OPTS = immutabletypes.freeze(
         "publish_port": 4505,
         "zmq_backlog": 1000,
         "pub_hwm": 1000,
+        "tcp_pub_buffer_size": 0,
+        "tcp_pub_slow_subscriber": "disconnect",
+        "tcp_pub_coalesce_size": 65536,
         "auth_mode": 1,
         "user": _MASTER_USER,
         "worker_threads": 5,
+        "request_admission": False,
+        "request_classes": {},
+        "worker_pools": {},
         "sock_dir": os.path.join(salt.syspaths.SOCK_DIR, "master"),
         "sock_pool_size": 1,
         "ret_port": 4506,
@@ -1330,9 +1437,13 @@ DEFAULT_MASTER_OPTS = immutabletypes.freeze(
         "keep_jobs": 24,
         "keep_jobs_seconds": 86400,
         "archive_jobs": False,
+        "local_cache_storage": "dirs",
+        "local_cache_bucket_seconds": 0,
         "root_dir": salt.syspaths.ROOT_DIR,
         "pki_dir": os.path.join(salt.syspaths.LIB_STATE_DIR, "pki", "master"),
         "key_cache": "",
+        "key_store": "dirs",
+        "key_store_path": None,
         "cachedir": os.path.join(salt.syspaths.CACHE_DIR, "master"),
         "file_roots": {
             "base": [salt.syspaths.BASE_FILE_ROOTS_DIR, salt.syspaths.SPM_FORMULA_PATH]
@@ -1496,6 +1607,7 @@ DEFAULT_MASTER_OPTS = immutabletypes.freeze(
         "enforce_mine_cache": False,
         "ipc_mode": _DFLT_IPC_MODE,
         "ipc_write_buffer": _DFLT_IPC_WBUFFER,
+        "ipc_event_ring_size": 0,
         # various subprocess niceness levels
         "req_server_niceness": None,
         "pub_server_niceness": None,
@@ -1511,6 +1623,7 @@ DEFAULT_MASTER_OPTS = immutabletypes.freeze(
         "tcp_master_pull_port": 4513,
         "tcp_master_publish_pull": 4514,
         "tcp_master_workers": 4515,
+        "tcp_request_router": False,
         "log_file": os.path.join(salt.syspaths.LOGS_DIR, "master"),
         "log_level": "warning",
         "log_level_logfile": None,
@@ -1529,12 +1642,20 @@ DEFAULT_MASTER_OPTS = immutabletypes.freeze(
         "reactor_refresh_interval": 60,
         "reactor_worker_threads": 10,
         "reactor_worker_hwm": 10000,
+        "reactor_render_cache": False,
+        "reactor_classes": {},
         "engines": [],
         "event_return": "",
         "event_return_queue": 0,
         "event_return_whitelist": [],
         "event_return_blacklist": [],
+        "event_return_queue_hwm": 10000,
+        "event_return_spill_hwm": 1000000,
+        "event_return_retries": 5,
+        "event_return_retry_backoff": 1,
+        "event_return_retry_backoff_max": 300,
         "event_match_type": "startswith",
+        "max_pending_events": 100000,
         "runner_returns": True,
         "serial": "msgpack",
         "test": False,
@@ -1589,6 +1710,14 @@ DEFAULT_MASTER_OPTS = immutabletypes.freeze(
         "sign_pub_messages": True,
         "keysize": 2048,
         "transport": "zeromq",
+        "compression": [],
+        "compression_level": 3,
+        "compression_threshold": 4096,
+        "compression_max_size": 104857600,
+        "aead_ciphers": [],
+        "publish_compression": False,
+        "publish_batch_signing": False,
+        "publish_target_filter": 0,
         "gather_job_timeout": 10,
         "syndic_event_forward_timeout": 0.5,
         "syndic_jid_forward_cache_hwm": 100,
@@ -1617,6 +1746,9 @@ DEFAULT_MASTER_OPTS = immutabletypes.freeze(
         "zmq_filtering": False,
         "zmq_monitor": False,
         "con_cache": False,
+        "minion_data_index": False,
+        "minion_data_index_refresh": 300,
+        "minion_data_index_timeout": 5,
         "rotate_aes_key": True,
         "cache_sreqs": True,
         "dummy_pub": False,
@@ -1643,6 +1775,8 @@ DEFAULT_MASTER_OPTS = immutabletypes.freeze(
         "discovery": False,
         "schedule": {},
         "auth_events": True,
+        "auth_session_tickets": False,
+        "auth_session_ticket_ttl": 86400,
         "minion_data_cache_events": True,
         "enable_ssh_minions": False,
         "netapi_allow_raw_shell": False,
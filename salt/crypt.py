@@ -27,6 +27,8 @@ import tornado.gen
 import salt.channel.client
 import salt.defaults.exitcodes
 import salt.payload
+import salt.utils.admission
+import salt.utils.compression
 import salt.utils.crypt
 import salt.utils.decorators
 import salt.utils.event
@@ -80,8 +82,54 @@ if not HAS_M2 and not HAS_CRYPTO:
         HAS_CRYPTO = False
 
 
+try:
+    from cryptography.exceptions import InvalidTag
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM, ChaCha20Poly1305
+
+    HAS_AEAD = True
+except ImportError:
+    HAS_AEAD = False
+
 log = logging.getLogger(__name__)
 
+# The AEAD ciphers the request channel can negotiate, in place of AES-CBC
+# and HMAC-SHA256
+AES_GCM = "aes-256-gcm"
+CHACHA20_POLY1305 = "chacha20-poly1305"
+AEAD_CIPHERS = (AES_GCM, CHACHA20_POLY1305)
+
+
+def aead_ciphers(opts):
+    """
+    Return the configured AEAD ciphers this host supports, in order of
+    preference
+    """
+    configured = opts.get("aead_ciphers") or []
+    if isinstance(configured, str):
+        configured = [configured]
+    ret = []
+    for name in configured:
+        if name not in AEAD_CIPHERS:
+            log.warning("Ignoring unknown AEAD cipher '%s'", name)
+        elif not HAS_AEAD:
+            log.debug("AEAD cipher '%s' is not available", name)
+        else:
+            ret.append(name)
+    return ret
+
+
+def negotiate_cipher(opts, offered):
+    """
+    Return the first configured AEAD cipher the peer offered, or None to
+    keep using AES-CBC and HMAC-SHA256
+    """
+    if not isinstance(offered, (list, tuple)):
+        return None
+    for name in aead_ciphers(opts):
+        if name in offered:
+            return name
+    return None
+
 
 def clean_key(key):
     """
@@ -128,6 +176,37 @@ def dropfile(cachedir, user=None, master_id=""):
         os.rename(dfn_next, dfn)
 
 
+def session_ticket_key(keydir):
+    """
+    Return the key the master seals auth session tickets with, it is
+    generated the first time it is needed and kept across restarts
+    """
+    path = os.path.join(keydir, "session_ticket.key")
+    if not os.path.isfile(path):
+        tmp = f"{path}.{os.getpid()}"
+        # set a mask (to avoid a race condition on file creation)
+        with salt.utils.files.set_umask(0o277):
+            with salt.utils.files.fopen(tmp, "w") as fp_:
+                fp_.write(Crypticle.generate_key_string())
+        try:
+            # Only one of the MWorkers creating the key at the same time wins
+            os.link(tmp, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(tmp)
+    with salt.utils.files.fopen(path) as fp_:
+        return fp_.read().strip()
+
+
+def session_finger(pub):
+    """
+    Return the fingerprint of a minion public key an auth session ticket is
+    bound to
+    """
+    return hashlib.sha256(salt.utils.stringutils.to_bytes(clean_key(pub))).hexdigest()
+
+
 def gen_keys(keydir, keyname, keysize, user=None, passphrase=None):
     """
     Generate a RSA public keypair for use with salt
@@ -242,6 +321,16 @@ class PublicKey:
                 except (ValueError, IndexError, TypeError):
                     raise InvalidKeyError("Encountered bad RSA public key")
 
+    @classmethod
+    def from_str(cls, data):
+        """
+        Load a public key from a PEM string instead of a file
+        """
+        pub = cls.__new__(cls)
+        pub._HAS_M2 = HAS_M2
+        pub.key = load_rsa_pub_key(data)
+        return pub
+
     def encrypt(self, data):
         bdata = salt.utils.stringutils.to_bytes(data)
         if self._HAS_M2:
@@ -329,6 +418,24 @@ def get_rsa_pub_key(path):
     return key
 
 
+def load_rsa_pub_key(data):
+    """
+    Load a public key from a PEM string.
+    """
+    if HAS_M2:
+        bio = BIO.MemoryBuffer(
+            salt.utils.stringutils.to_bytes(data).replace(b"RSA ", b"")
+        )
+        try:
+            return RSA.load_pub_key_bio(bio)
+        except RSA.RSAError:
+            raise InvalidKeyError("Encountered bad RSA public key")
+    try:
+        return RSA.importKey(data)
+    except (ValueError, IndexError, TypeError):
+        raise InvalidKeyError("Encountered bad RSA public key")
+
+
 def sign_message(privkey_path, message, passphrase=None):
     """
     Use Crypto.Signature.PKCS1_v1_5 to sign a message. Returns the signature.
@@ -674,6 +781,9 @@ class AsyncAuth:
     # mapping of key -> creds
     creds_map = {}
 
+    # mapping of key -> auth session ticket and session key
+    session_map = {}
+
     def __new__(cls, opts, io_loop=None):
         """
         Only create one instance of AsyncAuth per __key()
@@ -955,9 +1065,26 @@ class AsyncAuth:
         finally:
             if close_channel:
                 channel.close()
+        delay = self.retry_delay(payload)
+        if delay is not None:
+            yield tornado.gen.sleep(delay)
+            raise tornado.gen.Return("retry")
         ret = self.handle_signin_response(sign_in_payload, payload)
         raise tornado.gen.Return(ret)
 
+    def retry_delay(self, payload):
+        """
+        Return how many seconds to wait before signing in again when the
+        master turned the sign in away, or None. The hint of the master is
+        spread out so the minions do not all come back at the same time.
+        """
+        retry_after = salt.utils.admission.retry_after(payload)
+        if retry_after is None:
+            return None
+        delay = retry_after + random.uniform(0, retry_after)
+        log.info("The master is busy, signing in again in %.1f seconds", delay)
+        return delay
+
     def handle_signin_response(self, sign_in_payload, payload):
         auth = {}
         m_pub_fn = os.path.join(self.opts["pki_dir"], self.mpub)
@@ -966,6 +1093,11 @@ class AsyncAuth:
             log.error("Sign-in attempt failed: %s", payload)
             return False
 
+        if isinstance(payload["load"], dict) and "session" in payload["load"]:
+            return self.handle_session_response(
+                sign_in_payload, payload["load"]["session"], auth
+            )
+
         clear_signed_data = payload["load"]
         clear_signature = payload["sig"]
         payload = salt.payload.loads(clear_signed_data)
@@ -1057,8 +1189,60 @@ class AsyncAuth:
                     self._finger_fail(self.opts["master_finger"], m_pub_fn)
 
         auth["publish_port"] = payload["publish_port"]
+        auth["compression"] = payload.get("compression")
+        auth["cipher"] = payload.get("cipher")
+        if "session" in payload:
+            self.store_session(payload["session"])
+        else:
+            AsyncAuth.session_map.pop(self.__key(self.opts), None)
+        return auth
+
+    def handle_session_response(self, sign_in_payload, session, auth):
+        """
+        Handle the reply of the master to a sign in with a session ticket,
+        which carries the current AES key encrypted with the session key.
+        """
+        key = self.__key(self.opts)
+        if key not in AsyncAuth.session_map:
+            log.error("Received an auth session reply without a session")
+            return "retry"
+        try:
+            reply = Crypticle(self.opts, AsyncAuth.session_map[key]["skey"]).loads(
+                session
+            )
+        except AuthenticationError:
+            log.warning("The auth session reply did not validate")
+            AsyncAuth.session_map.pop(key, None)
+            return "retry"
+        if reply["nonce"] != sign_in_payload["nonce"]:
+            log.critical("The payload nonce did not validate.")
+            raise SaltClientError("Invalid nonce")
+        log.debug("Resumed the auth session with the master")
+        auth["aes"] = salt.utils.stringutils.to_str(reply["aes"])
+        auth["publish_port"] = reply["publish_port"]
+        auth["compression"] = reply.get("compression")
+        auth["cipher"] = reply.get("cipher")
         return auth
 
+    def store_session(self, session):
+        """
+        Keep the session ticket handed out by the master, so the next sign in
+        does not need a full authentication.
+        """
+        key = self.get_keys()
+        try:
+            if HAS_M2:
+                skey = key.private_decrypt(session["skey"], RSA.pkcs1_oaep_padding)
+            else:
+                skey = PKCS1_OAEP.new(key).decrypt(session["skey"])
+        except Exception:  # pylint: disable=broad-except
+            log.warning("Unable to decrypt the auth session key")
+            return
+        AsyncAuth.session_map[self.__key(self.opts)] = {
+            "ticket": session["ticket"],
+            "skey": salt.utils.stringutils.to_str(skey),
+        }
+
     def get_keys(self):
         """
         Return keypair object for the minion.
@@ -1106,6 +1290,15 @@ class AsyncAuth:
         payload["cmd"] = "_auth"
         payload["id"] = self.opts["id"]
         payload["nonce"] = uuid.uuid4().hex
+        session = AsyncAuth.session_map.get(self.__key(self.opts))
+        if session is not None:
+            payload["session"] = session["ticket"]
+        compression = salt.utils.compression.algorithms(self.opts)
+        if compression:
+            payload["compression"] = compression
+        ciphers = aead_ciphers(self.opts)
+        if ciphers:
+            payload["ciphers"] = ciphers
         if "autosign_grains" in self.opts:
             autosign_grains = {}
             for grain in self.opts["autosign_grains"]:
@@ -1596,6 +1789,10 @@ class SAuth(AsyncAuth):
             if close_channel:
                 channel.close()
 
+        delay = self.retry_delay(payload)
+        if delay is not None:
+            time.sleep(delay)
+            return "retry"
         return self.handle_signin_response(sign_in_payload, payload)
 
 
@@ -1605,17 +1802,28 @@ class Crypticle:
 
     Encryption algorithm: AES-CBC
     Signing algorithm: HMAC-SHA256
+
+    Or, when a ``cipher`` is given, one of the :py:data:`AEAD_CIPHERS`,
+    which encrypt and authenticate in a single pass. Their key is derived
+    from the signing key, a message is ``nonce, ciphertext, tag``.
     """
 
     PICKLE_PAD = b"pickle::"
     AES_BLOCK_SIZE = 16
     SIG_SIZE = hashlib.sha256().digest_size
+    NONCE_SIZE = 12
+    TAG_SIZE = 16
+    # The bytes an AEAD cipher adds to a message
+    AEAD_OVERHEAD = NONCE_SIZE + TAG_SIZE
 
     def __init__(self, opts, key_string, key_size=192, serial=0):
         self.key_string = key_string
         self.keys = self.extract_keys(self.key_string, key_size)
         self.key_size = key_size
         self.serial = serial
+        # The AEAD ciphers, keyed with a key derived from the signing key
+        self._aead_keys = {}
+        self._mac_key = None
 
     @classmethod
     def generate_key_string(cls, key_size=192, **kwargs):
@@ -1649,10 +1857,86 @@ class Crypticle:
         assert len(key) == key_size / 8 + cls.SIG_SIZE, "invalid key"
         return key[: -cls.SIG_SIZE], key[-cls.SIG_SIZE :]
 
-    def encrypt(self, data):
+    def _aead(self, cipher):
+        if not HAS_AEAD or cipher not in AEAD_CIPHERS:
+            raise AuthenticationError(f"unsupported cipher {cipher}")
+        aead = self._aead_keys.get(cipher)
+        if aead is None:
+            key = hmac.new(self.keys[1], cipher.encode(), hashlib.sha256).digest()
+            if cipher == AES_GCM:
+                aead = AESGCM(key)
+            else:
+                aead = ChaCha20Poly1305(key)
+            self._aead_keys[cipher] = aead
+        return aead
+
+    def mac(self, data):
+        """
+        Return the HMAC-SHA256 of data sent along an encrypted message, keyed
+        with a key derived from the signing key
+        """
+        if self._mac_key is None:
+            self._mac_key = hmac.new(self.keys[1], b"mac", hashlib.sha256).digest()
+        return hmac.new(self._mac_key, data, hashlib.sha256).digest()
+
+    def encrypt_into(self, data, buffer, cipher):
+        """
+        Encrypt data with an AEAD cipher into ``buffer``, a writable buffer
+        of at least ``len(data) + AEAD_OVERHEAD`` bytes. Returns the number
+        of bytes written.
+        """
+        size = len(data) + self.AEAD_OVERHEAD
+        out = memoryview(buffer)
+        if len(out) < size:
+            raise ValueError(f"The buffer must hold at least {size} bytes")
+        nonce = os.urandom(self.NONCE_SIZE)
+        out[: self.NONCE_SIZE] = nonce
+        aead = self._aead(cipher)
+        if hasattr(aead, "encrypt_into"):
+            aead.encrypt_into(nonce, data, None, out[self.NONCE_SIZE : size])
+        else:
+            out[self.NONCE_SIZE : size] = aead.encrypt(nonce, bytes(data), None)
+        return size
+
+    def decrypt_into(self, data, buffer, cipher):
+        """
+        Verify and decrypt data encrypted with an AEAD cipher into
+        ``buffer``, a writable buffer of at least ``len(data) -
+        AEAD_OVERHEAD`` bytes. Returns the number of bytes written.
+        """
+        if isinstance(data, str):
+            data = salt.utils.stringutils.to_bytes(data)
+        size = len(data) - self.AEAD_OVERHEAD
+        if size < 0:
+            log.debug("Failed to authenticate message")
+            raise AuthenticationError("message authentication failed")
+        src = memoryview(data)
+        out = memoryview(buffer)
+        if len(out) < size:
+            raise ValueError(f"The buffer must hold at least {size} bytes")
+        aead = self._aead(cipher)
+        nonce = bytes(src[: self.NONCE_SIZE])
+        try:
+            if hasattr(aead, "decrypt_into"):
+                aead.decrypt_into(nonce, src[self.NONCE_SIZE :], None, out[:size])
+            else:
+                out[:size] = aead.decrypt(nonce, bytes(src[self.NONCE_SIZE :]), None)
+        except InvalidTag:
+            # Do not leave unauthenticated data behind
+            out[:size] = bytes(size)
+            log.debug("Failed to authenticate message")
+            raise AuthenticationError("message authentication failed")
+        return size
+
+    def encrypt(self, data, cipher=None):
         """
-        encrypt data with AES-CBC and sign it with HMAC-SHA256
+        encrypt data with AES-CBC and sign it with HMAC-SHA256, or with the
+        AEAD ``cipher``
         """
+        if cipher:
+            buffer = bytearray(len(data) + self.AEAD_OVERHEAD)
+            self.encrypt_into(data, buffer, cipher)
+            return bytes(buffer)
         aes_key, hmac_key = self.keys
         pad = self.AES_BLOCK_SIZE - len(data) % self.AES_BLOCK_SIZE
         data = data + salt.utils.stringutils.to_bytes(pad * chr(pad))
@@ -1670,10 +1954,15 @@ class Crypticle:
         sig = hmac.new(hmac_key, data, hashlib.sha256).digest()
         return data + sig
 
-    def decrypt(self, data):
+    def decrypt(self, data, cipher=None):
         """
-        verify HMAC-SHA256 signature and decrypt data with AES-CBC
+        verify HMAC-SHA256 signature and decrypt data with AES-CBC, or
+        verify and decrypt data with the AEAD ``cipher``
         """
+        if cipher:
+            buffer = bytearray(max(len(data) - self.AEAD_OVERHEAD, 0))
+            self.decrypt_into(data, buffer, cipher)
+            return bytes(buffer)
         aes_key, hmac_key = self.keys
         sig = data[-self.SIG_SIZE :]
         data = data[: -self.SIG_SIZE]
@@ -1703,21 +1992,34 @@ class Crypticle:
             data = cypher.decrypt(data)
         return data[: -data[-1]]
 
-    def dumps(self, obj, nonce=None):
+    def dumps(self, obj, nonce=None, compress=None, cipher=None):
         """
         Serialize and encrypt a python object
+
+        :param callable compress: Called with the serialized object, to
+            compress it before it is encrypted
+        :param str cipher: The AEAD cipher to encrypt it with, None for
+            AES-CBC and HMAC-SHA256
         """
+        data = salt.payload.dumps(obj)
+        if compress is not None:
+            data = compress(data)
         if nonce:
-            toencrypt = self.PICKLE_PAD + nonce.encode() + salt.payload.dumps(obj)
+            toencrypt = self.PICKLE_PAD + nonce.encode() + data
         else:
-            toencrypt = self.PICKLE_PAD + salt.payload.dumps(obj)
-        return self.encrypt(toencrypt)
+            toencrypt = self.PICKLE_PAD + data
+        return self.encrypt(toencrypt, cipher=cipher)
 
-    def loads(self, data, raw=False, nonce=None):
+    def loads(self, data, raw=False, nonce=None, decompress=None, cipher=None):
         """
         Decrypt and un-serialize a python object
+
+        :param callable decompress: Called with the decrypted data, defaults
+            to :py:func:`salt.utils.compression.decompress`
+        :param str cipher: The AEAD cipher it was encrypted with, None for
+            AES-CBC and HMAC-SHA256
         """
-        data = self.decrypt(data)
+        data = self.decrypt(data, cipher=cipher)
         # simple integrity check to verify that we got meaningful data
         if not data.startswith(self.PICKLE_PAD):
             return {}
@@ -1727,7 +2029,9 @@ class Crypticle:
             data = data[32:]
             if ret_nonce != nonce:
                 raise SaltClientError(f"Nonce verification error {ret_nonce} {nonce}")
-        payload = salt.payload.loads(data, raw=raw)
+        if decompress is None:
+            decompress = salt.utils.compression.decompress
+        payload = salt.payload.loads(decompress(data), raw=raw)
         if isinstance(payload, dict):
             if "serial" in payload:
                 serial = payload.pop("serial")
@@ -33,6 +33,7 @@ import salt.utils.gzip_util
 import salt.utils.jid
 import salt.utils.job
 import salt.utils.mine
+import salt.utils.minion_index
 import salt.utils.minions
 import salt.utils.path
 import salt.utils.platform
@@ -773,6 +774,9 @@ class RemoteFuncs:
                 "data",
                 {"grains": load["grains"], "pillar": data},
             )
+            salt.utils.minion_index.notify_update(
+                self.opts, load["id"], {"grains": load["grains"], "pillar": data}
+            )
             if self.opts.get("minion_data_cache_events") is True:
                 self.event.fire_event(
                     {"comment": "Minion data cache refresh"},
@@ -2,9 +2,11 @@
 Classes that manage file clients
 """
 
+import asyncio
 import contextlib
 import errno
 import ftplib  # nosec
+import hashlib
 import http.server
 import logging
 import os
@@ -36,7 +38,13 @@ import salt.utils.url
 import salt.utils.verify
 import salt.utils.versions
 from salt.config import DEFAULT_HASH_TYPE
-from salt.exceptions import CommandExecutionError, MinionError, SaltClientError
+from salt.exceptions import (
+    CommandExecutionError,
+    MinionError,
+    SaltClientError,
+    SaltReqTimeoutError,
+)
+from salt.utils.asynchronous import SyncWrapper
 from salt.utils.openstack.swift import SaltSwift
 
 log = logging.getLogger(__name__)
@@ -1118,6 +1126,112 @@ class PillarClient(Client):
         return {}
 
 
+class AsyncChunkFetcher:
+    """
+    Fetch the chunks of a file served by the master with several requests in
+    flight. Each request in flight gets a channel of its own, as some
+    transports only carry one request at a time on a channel.
+
+    :param dict opts: The minion options
+    :param int window: The number of requests in flight
+    """
+
+    async_methods = ["fetch"]
+    close_methods = ["close"]
+
+    def __init__(self, opts, window, io_loop=None):
+        self.opts = opts
+        self.window = window
+        self.io_loop = io_loop
+        self.channels = []
+
+    def _channel(self):
+        return salt.channel.client.AsyncReqChannel.factory(
+            self.opts, io_loop=self.io_loop
+        )
+
+    async def fetch(self, load, chunk_size, start, write, size=None):
+        """
+        Fetch the chunks of ``chunk_size`` bytes from ``start`` to the end of
+        the file, passing each one to ``write(offset, data)`` in whatever
+        order they come. Returns the offset up to which all the chunks were
+        written: the end of the file, unless requests kept failing.
+
+        :param int size: The size of the file if known, no chunk past it is
+            requested
+        """
+        while len(self.channels) < self.window:
+            self.channels.append(self._channel())
+        state = {"next": start, "end": size}
+        written = {}
+        results = await asyncio.gather(
+            *(
+                self._fetch_chunks(index, load, chunk_size, state, written, write)
+                for index in range(self.window)
+            ),
+            return_exceptions=True,
+        )
+        for result in results:
+            if isinstance(result, Exception):
+                log.warning("Unable to fetch a chunk of %s: %s", load["path"], result)
+        offset = start
+        while written.get(offset):
+            offset += written[offset]
+        return offset
+
+    async def _fetch_chunks(self, index, load, chunk_size, state, written, write):
+        while state["end"] is None or state["next"] < state["end"]:
+            offset = state["next"]
+            state["next"] += chunk_size
+            tries = 0
+            while True:
+                try:
+                    data = await self.channels[index].send(
+                        dict(load, loc=offset), raw=True
+                    )
+                    data = decode_dict_keys_to_str(data)
+                    chunk = data["data"]
+                    break
+                except (SaltReqTimeoutError, TypeError, KeyError) as exc:
+                    tries += 1
+                    if tries > 3:
+                        raise
+                    log.debug(
+                        "Chunk at %d of %s failed, attempt %d of 3: %s",
+                        offset,
+                        load["path"],
+                        tries,
+                        exc,
+                    )
+                    # Resume from the same offset on a new connection
+                    self.channels[index].close()
+                    self.channels[index] = self._channel()
+            if not chunk:
+                # Past the end of the file
+                self._end(state, offset)
+                return
+            if data.get("gzip", None):
+                chunk = salt.utils.gzip_util.uncompress(chunk)
+            if isinstance(chunk, str):
+                chunk = chunk.encode()
+            write(offset, chunk)
+            written[offset] = len(chunk)
+            if len(chunk) < chunk_size:
+                # The last chunk of the file
+                self._end(state, offset + len(chunk))
+                return
+
+    @staticmethod
+    def _end(state, offset):
+        if state["end"] is None or offset < state["end"]:
+            state["end"] = offset
+
+    def close(self):
+        for channel in self.channels:
+            channel.close()
+        self.channels = []
+
+
 class RemoteClient(Client):
     """
     Interact with the salt master file server.
@@ -1131,6 +1245,9 @@ class RemoteClient(Client):
             self.auth = self.channel.auth
         else:
             self.auth = ""
+        # The number of chunk requests in flight when fetching a file
+        self.window = max(int(self.opts.get("file_transfer_window") or 1), 1)
+        self._chunk_fetcher = None
 
     def _refresh_channel(self):
         """
@@ -1166,6 +1283,53 @@ class RemoteClient(Client):
             pass
         if channel is not None:
             channel.close()
+        if self._chunk_fetcher is not None:
+            self._chunk_fetcher.close()
+            self._chunk_fetcher = None
+
+    def _stream_file(self, load, fn_, chunk_size, size=None):
+        """
+        Fetch the rest of a file with several chunk requests in flight, each
+        chunk written at its offset. Leaves ``fn_`` at the end of the chunks
+        written in a row, from where the file is fetched one chunk at a time.
+        """
+        if self._chunk_fetcher is None:
+            self._chunk_fetcher = SyncWrapper(
+                AsyncChunkFetcher,
+                (self.opts, self.window),
+                loop_kwarg="io_loop",
+            )
+        start = fn_.tell()
+
+        def write(offset, data):
+            fn_.seek(offset)
+            fn_.write(data)
+
+        try:
+            end = self._chunk_fetcher.fetch(load, chunk_size, start, write, size=size)
+        except Exception as exc:  # pylint: disable=broad-except
+            log.warning("Unable to stream %s: %s", load["path"], exc)
+            end = start
+        # Drop the chunks past a missing one, they are fetched again
+        fn_.seek(end)
+        fn_.truncate()
+
+    @staticmethod
+    def _file_matches(fn_, hash_server):
+        """
+        Check the file fetched against the hash of the file on the master
+        """
+        if not isinstance(hash_server, dict) or not hash_server.get("hsum"):
+            return True
+        hash_type = salt.utils.stringutils.to_str(
+            hash_server.get("hash_type", DEFAULT_HASH_TYPE)
+        )
+        hasher = hashlib.new(hash_type)
+        fn_.flush()
+        fn_.seek(0)
+        for chunk in iter(lambda: fn_.read(1024 * 1024), b""):
+            hasher.update(chunk)
+        return hasher.hexdigest() == hash_server["hsum"]
 
     def get_file(
         self, path, dest="", makedirs=False, saltenv="base", gzip=None, cachedir=None
@@ -1180,6 +1344,7 @@ class RemoteClient(Client):
         if senv:
             saltenv = senv
 
+        stat_server = None
         if not salt.utils.platform.is_windows():
             hash_server, stat_server = self.hash_and_stat_file(path, saltenv)
         else:
@@ -1263,6 +1428,13 @@ class RemoteClient(Client):
         else:
             log.debug("No dest file found")
 
+        # Once the size of the chunks is known, fetch the file with several
+        # chunk requests in flight
+        stream = self.window > 1
+        streamed = False
+        size = None
+        if isinstance(stat_server, (list, tuple)) and len(stat_server) > 6:
+            size = stat_server[6]
         while True:
             if not fn_:
                 load["loc"] = 0
@@ -1305,6 +1477,16 @@ class RemoteClient(Client):
                                 d_tries,
                             )
                             continue
+                    if streamed and not self._file_matches(fn_, hash_server):
+                        log.warning(
+                            "Bad download of file %s, fetching it again one "
+                            "chunk at a time",
+                            path,
+                        )
+                        streamed = False
+                        fn_.seek(0)
+                        fn_.truncate()
+                        continue
                     break
                 if not fn_:
                     with self._cache_loc(
@@ -1323,6 +1505,10 @@ class RemoteClient(Client):
                 if isinstance(data, str):
                     data = data.encode()
                 fn_.write(data)
+                if stream:
+                    stream = False
+                    streamed = True
+                    self._stream_file(load, fn_, len(data), size)
             except (TypeError, KeyError) as exc:
                 try:
                     data_type = type(data).__name__
@@ -1508,6 +1694,9 @@ class FSClient(RemoteClient):
         self._closing = False
         self.channel = salt.fileserver.FSChan(opts)
         self.auth = DumbAuth()
+        # The files are read locally, one chunk at a time
+        self.window = 1
+        self._chunk_fetcher = None
 
 
 # Provide backward compatibility for anyone directly using LocalClient (but no
@@ -22,6 +22,7 @@ import salt.utils.data
 import salt.utils.event
 import salt.utils.files
 import salt.utils.json
+import salt.utils.key_store
 import salt.utils.kinds
 import salt.utils.master
 import salt.utils.sdb
@@ -328,6 +329,7 @@ class Key:
         self.passphrase = salt.utils.sdb.sdb_get(
             self.opts.get("signing_key_pass"), self.opts
         )
+        self.store = salt.utils.key_store.factory(self.opts)
 
     def _check_minions_directories(self):
         """
@@ -482,13 +484,12 @@ class Key:
         """
         Accept a glob which to match the of a key and return the key's location
         """
-        if full:
-            matches = self.all_keys()
-        else:
-            matches = self.list_keys()
-        ret = {}
         if "," in match and isinstance(match, str):
             match = match.split(",")
+        if not full:
+            return self.store.match(match)
+        matches = self.all_keys()
+        ret = {}
         for status, keys in matches.items():
             for key in salt.utils.data.sorted_ignorecase(keys):
                 if isinstance(match, list):
@@ -533,24 +534,7 @@ class Key:
         """
         Return a dict of managed keys and what the key status are
         """
-        key_dirs = self._check_minions_directories()
-
-        ret = {}
-
-        for dir_ in key_dirs:
-            if dir_ is None:
-                continue
-            ret[os.path.basename(dir_)] = []
-            try:
-                for fn_ in salt.utils.data.sorted_ignorecase(os.listdir(dir_)):
-                    if not fn_.startswith("."):
-                        ret[os.path.basename(dir_)].append(
-                            salt.utils.stringutils.to_unicode(fn_)
-                        )
-            except OSError:
-                # key dir kind is not created yet, just skip
-                continue
-        return ret
+        return self.store.list_keys()
 
     def all_keys(self):
         """
@@ -564,31 +548,17 @@ class Key:
         """
         Return a dict of managed keys under a named status
         """
-        acc, pre, rej, den = self._check_minions_directories()
-        ret = {}
         if match.startswith("acc"):
-            ret[os.path.basename(acc)] = []
-            for fn_ in salt.utils.data.sorted_ignorecase(os.listdir(acc)):
-                if not fn_.startswith("."):
-                    ret[os.path.basename(acc)].append(fn_)
+            return self.store.list_keys((self.ACC,))
         elif match.startswith("pre") or match.startswith("un"):
-            ret[os.path.basename(pre)] = []
-            for fn_ in salt.utils.data.sorted_ignorecase(os.listdir(pre)):
-                if not fn_.startswith("."):
-                    ret[os.path.basename(pre)].append(fn_)
+            return self.store.list_keys((self.PEND,))
         elif match.startswith("rej"):
-            ret[os.path.basename(rej)] = []
-            for fn_ in salt.utils.data.sorted_ignorecase(os.listdir(rej)):
-                if not fn_.startswith("."):
-                    ret[os.path.basename(rej)].append(fn_)
-        elif match.startswith("den") and den is not None:
-            ret[os.path.basename(den)] = []
-            for fn_ in salt.utils.data.sorted_ignorecase(os.listdir(den)):
-                if not fn_.startswith("."):
-                    ret[os.path.basename(den)].append(fn_)
+            return self.store.list_keys((self.REJ,))
+        elif match.startswith("den"):
+            return self.store.list_keys((self.DEN,))
         elif match.startswith("all"):
             return self.all_keys()
-        return ret
+        return {}
 
     def key_str(self, match):
         """
@@ -598,9 +568,9 @@ class Key:
         for status, keys in self.name_match(match).items():
             ret[status] = {}
             for key in salt.utils.data.sorted_ignorecase(keys):
-                path = os.path.join(self.pki_dir, status, key)
-                with salt.utils.files.fopen(path, "r") as fp_:
-                    ret[status][key] = salt.utils.stringutils.to_unicode(fp_.read())
+                pub = self.store.get(status, key)
+                if pub is not None:
+                    ret[status][key] = pub
         return ret
 
     def key_str_all(self):
@@ -611,11 +581,21 @@ class Key:
         for status, keys in self.list_keys().items():
             ret[status] = {}
             for key in salt.utils.data.sorted_ignorecase(keys):
-                path = os.path.join(self.pki_dir, status, key)
-                with salt.utils.files.fopen(path, "r") as fp_:
-                    ret[status][key] = salt.utils.stringutils.to_unicode(fp_.read())
+                pub = self.store.get(status, key)
+                if pub is not None:
+                    ret[status][key] = pub
         return ret
 
+    def _fire_key_events(self, keys, act):
+        """
+        Fire a key event for each minion id in ``keys``, a dict of state ->
+        minion ids
+        """
+        for minion_ids in keys.values():
+            for key in minion_ids:
+                eload = {"result": True, "act": act, "id": key}
+                self.event.fire_event(eload, salt.utils.event.tagify(prefix="key"))
+
     def accept(
         self, match=None, match_dict=None, include_rejected=False, include_denied=False
     ):
@@ -634,25 +614,18 @@ class Key:
             keydirs.append(self.REJ)
         if include_denied:
             keydirs.append(self.DEN)
+        to_accept = {}
         invalid_keys = []
         for keydir in keydirs:
             for key in matches.get(keydir, []):
-                key_path = os.path.join(self.pki_dir, keydir, key)
                 try:
-                    salt.crypt.get_rsa_pub_key(key_path)
+                    salt.crypt.load_rsa_pub_key(self.store.get(keydir, key) or "")
                 except salt.exceptions.InvalidKeyError:
                     log.error("Invalid RSA public key: %s", key)
                     invalid_keys.append((keydir, key))
                     continue
-                try:
-                    shutil.move(
-                        key_path,
-                        os.path.join(self.pki_dir, self.ACC, key),
-                    )
-                    eload = {"result": True, "act": "accept", "id": key}
-                    self.event.fire_event(eload, salt.utils.event.tagify(prefix="key"))
-                except OSError:
-                    pass
+                to_accept.setdefault(keydir, []).append(key)
+        self._fire_key_events(self.store.move(to_accept, self.ACC), "accept")
         for keydir, key in invalid_keys:
             matches[keydir].remove(key)
             sys.stderr.write(f"Unable to accept invalid key for {key}.\n")
@@ -662,17 +635,8 @@ class Key:
         """
         Accept all keys in pre
         """
-        keys = self.list_keys()
-        for key in keys[self.PEND]:
-            try:
-                shutil.move(
-                    os.path.join(self.pki_dir, self.PEND, key),
-                    os.path.join(self.pki_dir, self.ACC, key),
-                )
-                eload = {"result": True, "act": "accept", "id": key}
-                self.event.fire_event(eload, salt.utils.event.tagify(prefix="key"))
-            except OSError:
-                pass
+        keys = self.store.list_keys((self.PEND,))
+        self._fire_key_events(self.store.move(keys, self.ACC), "accept")
         return self.list_keys()
 
     def delete_key(
@@ -690,34 +654,27 @@ class Key:
             matches = match_dict
         else:
             matches = {}
-        with salt.client.get_local_client(mopts=self.opts) as client:
-            for status, keys in matches.items():
-                for key in keys:
-                    try:
-                        if revoke_auth:
-                            if self.opts.get("rotate_aes_key") is False:
+        if revoke_auth:
+            with salt.client.get_local_client(mopts=self.opts) as client:
+                for status, keys in matches.items():
+                    for key in keys:
+                        if self.opts.get("rotate_aes_key") is False:
+                            print(
+                                "Immediate auth revocation specified but AES key"
+                                " rotation not allowed. Minion will not be"
+                                " disconnected until the master AES key is rotated."
+                            )
+                        else:
+                            try:
+                                client.cmd_async(key, "saltutil.revoke_auth")
+                            except salt.exceptions.SaltClientError:
                                 print(
-                                    "Immediate auth revocation specified but AES key"
-                                    " rotation not allowed. Minion will not be"
-                                    " disconnected until the master AES key is rotated."
+                                    "Cannot contact Salt master. "
+                                    "Connection for {} will remain up until "
+                                    "master AES key is rotated or auth is revoked "
+                                    "with 'saltutil.revoke_auth'.".format(key)
                                 )
-                            else:
-                                try:
-                                    client.cmd_async(key, "saltutil.revoke_auth")
-                                except salt.exceptions.SaltClientError:
-                                    print(
-                                        "Cannot contact Salt master. "
-                                        "Connection for {} will remain up until "
-                                        "master AES key is rotated or auth is revoked "
-                                        "with 'saltutil.revoke_auth'.".format(key)
-                                    )
-                        os.remove(os.path.join(self.pki_dir, status, key))
-                        eload = {"result": True, "act": "delete", "id": key}
-                        self.event.fire_event(
-                            eload, salt.utils.event.tagify(prefix="key")
-                        )
-                    except OSError:
-                        pass
+        self._fire_key_events(self.store.delete(matches), "delete")
         if self.opts.get("preserve_minions") is True:
             self.check_minion_cache(preserve_minions=matches.get("minions", []))
         else:
@@ -732,15 +689,8 @@ class Key:
         """
         Delete all denied keys
         """
-        keys = self.list_keys()
-        for status, keys in self.list_keys().items():
-            for key in keys[self.DEN]:
-                try:
-                    os.remove(os.path.join(self.pki_dir, status, key))
-                    eload = {"result": True, "act": "delete", "id": key}
-                    self.event.fire_event(eload, salt.utils.event.tagify(prefix="key"))
-                except OSError:
-                    pass
+        keys = self.store.list_keys((self.DEN,))
+        self._fire_key_events(self.store.delete(keys), "delete")
         self.check_minion_cache()
         return self.list_keys()
 
@@ -748,14 +698,7 @@ class Key:
         """
         Delete all keys
         """
-        for status, keys in self.list_keys().items():
-            for key in keys:
-                try:
-                    os.remove(os.path.join(self.pki_dir, status, key))
-                    eload = {"result": True, "act": "delete", "id": key}
-                    self.event.fire_event(eload, salt.utils.event.tagify(prefix="key"))
-                except OSError:
-                    pass
+        self._fire_key_events(self.store.delete(self.list_keys()), "delete")
         self.check_minion_cache()
         if self.opts.get("rotate_aes_key"):
             salt.crypt.dropfile(
@@ -781,17 +724,8 @@ class Key:
             keydirs.append(self.ACC)
         if include_denied:
             keydirs.append(self.DEN)
-        for keydir in keydirs:
-            for key in matches.get(keydir, []):
-                try:
-                    shutil.move(
-                        os.path.join(self.pki_dir, keydir, key),
-                        os.path.join(self.pki_dir, self.REJ, key),
-                    )
-                    eload = {"result": True, "act": "reject", "id": key}
-                    self.event.fire_event(eload, salt.utils.event.tagify(prefix="key"))
-                except OSError:
-                    pass
+        to_reject = {keydir: matches[keydir] for keydir in keydirs if keydir in matches}
+        self._fire_key_events(self.store.move(to_reject, self.REJ), "reject")
         self.check_minion_cache()
         if self.opts.get("rotate_aes_key"):
             salt.crypt.dropfile(
@@ -803,17 +737,8 @@ class Key:
         """
         Reject all keys in pre
         """
-        keys = self.list_keys()
-        for key in keys[self.PEND]:
-            try:
-                shutil.move(
-                    os.path.join(self.pki_dir, self.PEND, key),
-                    os.path.join(self.pki_dir, self.REJ, key),
-                )
-                eload = {"result": True, "act": "reject", "id": key}
-                self.event.fire_event(eload, salt.utils.event.tagify(prefix="key"))
-            except OSError:
-                pass
+        keys = self.store.list_keys((self.PEND,))
+        self._fire_key_events(self.store.move(keys, self.REJ), "reject")
         self.check_minion_cache()
         if self.opts.get("rotate_aes_key"):
             salt.crypt.dropfile(
@@ -821,6 +746,26 @@ class Key:
             )
         return self.list_keys()
 
+    def _fingerprints(self, matches, hash_type):
+        """
+        Return the fingerprints of the matched keys, the managed ones come from
+        the key store
+        """
+        ret = {}
+        managed = {}
+        for status, keys in matches.items():
+            if status == "local":
+                ret[status] = {
+                    key: salt.utils.crypt.pem_finger(
+                        os.path.join(self.pki_dir, key), sum_type=hash_type
+                    )
+                    for key in keys
+                }
+            else:
+                managed[status] = keys
+        ret.update(self.store.fingerprints(managed, hash_type))
+        return ret
+
     def finger(self, match, hash_type=None):
         """
         Return the fingerprint for a specified key
@@ -828,17 +773,7 @@ class Key:
         if hash_type is None:
             hash_type = __opts__["hash_type"]
 
-        matches = self.name_match(match, True)
-        ret = {}
-        for status, keys in matches.items():
-            ret[status] = {}
-            for key in keys:
-                if status == "local":
-                    path = os.path.join(self.pki_dir, key)
-                else:
-                    path = os.path.join(self.pki_dir, status, key)
-                ret[status][key] = salt.utils.crypt.pem_finger(path, sum_type=hash_type)
-        return ret
+        return self._fingerprints(self.name_match(match, True), hash_type)
 
     def finger_all(self, hash_type=None):
         """
@@ -847,16 +782,7 @@ class Key:
         if hash_type is None:
             hash_type = __opts__["hash_type"]
 
-        ret = {}
-        for status, keys in self.all_keys().items():
-            ret[status] = {}
-            for key in keys:
-                if status == "local":
-                    path = os.path.join(self.pki_dir, key)
-                else:
-                    path = os.path.join(self.pki_dir, status, key)
-                ret[status][key] = salt.utils.crypt.pem_finger(path, sum_type=hash_type)
-        return ret
+        return self._fingerprints(self.all_keys(), hash_type)
 
     def __enter__(self):
         return self
@@ -46,7 +46,10 @@ import salt.utils.gitfs
 import salt.utils.gzip_util
 import salt.utils.jid
 import salt.utils.job
+import salt.utils.key_set
+import salt.utils.key_store
 import salt.utils.master
+import salt.utils.minion_index
 import salt.utils.minions
 import salt.utils.platform
 import salt.utils.process
@@ -55,6 +58,7 @@ import salt.utils.ssdp
 import salt.utils.stringutils
 import salt.utils.user
 import salt.utils.verify
+import salt.utils.worker_pools
 import salt.utils.zeromq
 import salt.wheel
 from salt.config import DEFAULT_INTERVAL
@@ -330,13 +334,17 @@ class Maintenance(salt.utils.process.SignalHandlingProcess):
             else:
                 acc = "accepted"
 
-            for fn_ in os.listdir(os.path.join(self.pki_dir, acc)):
-                if not fn_.startswith("."):
-                    keys.append(fn_)
+            pki_dir = salt.utils.key_set.pki_dir(self.opts)
+            if self.opts.get("key_store", "dirs") != "dirs":
+                keys = salt.utils.key_store.factory(self.opts).list_keys((acc,))[acc]
+            else:
+                for fn_ in os.listdir(os.path.join(pki_dir, acc)):
+                    if not fn_.startswith("."):
+                        keys.append(fn_)
             log.debug("Writing master key cache")
             # Write a temporary file securely
             with salt.utils.atomicfile.atomic_open(
-                os.path.join(self.pki_dir, acc, ".key_cache"), mode="wb"
+                os.path.join(pki_dir, acc, ".key_cache"), mode="wb"
             ) as cache_file:
                 salt.payload.dump(keys, cache_file)
 
@@ -888,6 +896,24 @@ class Master(SMaster):
                 log.debug("Sleeping for two seconds to let concache rest")
                 time.sleep(2)
 
+            if salt.utils.key_set.enabled(self.opts):
+                log.info("Creating master key set process")
+                self.process_manager.add_process(
+                    salt.utils.key_set.KeySetService,
+                    args=(self.opts,),
+                    name="KeySetService",
+                )
+
+            if self.opts.get("minion_data_index") and self.opts.get(
+                "minion_data_cache"
+            ):
+                log.info("Creating master minion data index process")
+                self.process_manager.add_process(
+                    salt.utils.minion_index.MinionDataIndex,
+                    args=(self.opts,),
+                    name="MinionDataIndex",
+                )
+
             log.info("Creating master request server process")
             kwargs = {}
             if salt.utils.platform.spawning_platform():
@@ -1053,8 +1079,18 @@ class ReqServer(salt.utils.process.SignalHandlingProcess):
             name="ReqServer_ProcessManager", wait_for_kill=1
         )
 
+        if salt.utils.worker_pools.enabled(self.opts):
+            # Shared with the queue device and the MWorkers
+            salt.utils.worker_pools.init_stats(self.opts)
+
         req_channels = []
         for transport, opts in iter_transport_opts(self.opts):
+            if transport != "zeromq" and salt.utils.worker_pools.enabled(opts):
+                log.warning(
+                    "The %s transport does not route requests to worker pools, "
+                    "the workers of all the pools handle any request",
+                    transport,
+                )
             chan = salt.channel.server.ReqServerChannel.factory(opts)
             chan.pre_fork(self.process_manager)
             req_channels.append(chan)
@@ -1070,13 +1106,19 @@ class ReqServer(salt.utils.process.SignalHandlingProcess):
         # manager. We don't want the processes being started to inherit those
         # signal handlers
         with salt.utils.process.default_signals(signal.SIGINT, signal.SIGTERM):
-            for ind in range(int(self.opts["worker_threads"])):
-                name = f"MWorker-{ind}"
-                self.process_manager.add_process(
-                    MWorker,
-                    args=(self.opts, self.master_key, self.key, req_channels),
-                    name=name,
-                )
+            pools = salt.utils.worker_pools.pools(self.opts)
+            for pool, settings in pools.items():
+                for ind in range(settings["worker_threads"]):
+                    if pool == salt.utils.worker_pools.DEFAULT_POOL:
+                        name = f"MWorker-{ind}"
+                    else:
+                        name = f"MWorker-{pool}-{ind}"
+                    self.process_manager.add_process(
+                        MWorker,
+                        args=(self.opts, self.master_key, self.key, req_channels),
+                        kwargs={"pool": pool},
+                        name=name,
+                    )
         self.process_manager.run()
 
     def run(self):
@@ -1104,13 +1146,14 @@ class MWorker(salt.utils.process.SignalHandlingProcess):
     salt master.
     """
 
-    def __init__(self, opts, mkey, key, req_channels, **kwargs):
+    def __init__(self, opts, mkey, key, req_channels, pool=None, **kwargs):
         """
         Create a salt master worker process
 
         :param dict opts: The salt options
         :param dict mkey: The user running the salt master and the AES key
         :param dict key: The user running the salt master and the RSA key
+        :param str pool: The worker pool the worker is part of
 
         :rtype: MWorker
         :return: Master worker
@@ -1118,6 +1161,7 @@ class MWorker(salt.utils.process.SignalHandlingProcess):
         super().__init__(**kwargs)
         self.opts = opts
         self.req_channels = req_channels
+        self.pool = pool or salt.utils.worker_pools.DEFAULT_POOL
 
         self.mkey = mkey
         self.key = key
@@ -1163,6 +1207,8 @@ class MWorker(salt.utils.process.SignalHandlingProcess):
         """
         self.io_loop = tornado.ioloop.IOLoop()
         for req_channel in self.req_channels:
+            # Only this process gets requests from the queue of its pool
+            req_channel.opts["worker_pool"] = self.pool
             req_channel.post_fork(
                 self._handle_payload, io_loop=self.io_loop
             )  # TODO: cleaner? Maybe lazily?
@@ -1212,14 +1258,27 @@ class MWorker(salt.utils.process.SignalHandlingProcess):
         ) / self.stats[cmd]["runs"]
         if end - self.stat_clock > self.opts["master_stats_event_iter"]:
             # Fire the event with the stats and wipe the tracker
-            self.aes_funcs.event.fire_event(
-                {
-                    "time": end - self.stat_clock,
-                    "worker": self.name,
-                    "stats": self.stats,
-                },
-                tagify(self.name, "stats"),
-            )
+            data = {
+                "time": end - self.stat_clock,
+                "worker": self.name,
+                "pool": self.pool,
+                "stats": self.stats,
+            }
+            pool_stats = salt.utils.worker_pools.get_stats()
+            if pool_stats is not None:
+                # The number of requests waiting for or handled by the workers
+                # of each pool, and how long they take to reply
+                data["pools"] = pool_stats.snapshot()
+            compression = {}
+            for channel in self.req_channels:
+                compressor = getattr(channel, "compressor", None)
+                if compressor is not None and compressor.algorithms:
+                    # The bytes and time compression saved and took for the
+                    # requests of each transport
+                    compression[channel.opts.get("transport")] = dict(compressor.stats)
+            if compression:
+                data["compression"] = compression
+            self.aes_funcs.event.fire_event(data, tagify(self.name, "stats"))
             self.stats = collections.defaultdict(lambda: {"mean": 0, "runs": 0})
             self.stat_clock = end
 
@@ -1401,6 +1460,7 @@ class AESFuncs(TransportMethods):
             self.pki_dir = self.opts["cluster_pki_dir"]
         else:
             self.pki_dir = self.opts.get("pki_dir", "")
+        self.key_store = salt.utils.key_store.factory(self.opts)
 
     def __setup_fileserver(self):
         """
@@ -1433,18 +1493,18 @@ class AESFuncs(TransportMethods):
         """
         if not salt.utils.verify.valid_id(self.opts, id_):
             return False
-        pub_path = os.path.join(self.pki_dir, "minions", id_)
-        try:
-            pub = salt.crypt.get_rsa_pub_key(pub_path)
-        except OSError:
+        pub_str = self.key_store.get(salt.utils.key_store.ACC, id_)
+        if pub_str is None:
             log.warning(
                 "Salt minion claiming to be %s attempted to communicate with "
                 "master, but key could not be read and verification was denied.",
                 id_,
             )
             return False
+        try:
+            pub = salt.crypt.load_rsa_pub_key(pub_str)
         except (ValueError, IndexError, TypeError) as err:
-            log.error('Unable to load public key "%s": %s', pub_path, err)
+            log.error('Unable to load public key of "%s": %s', id_, err)
         try:
             if salt.crypt.public_decrypt(pub, token) == b"salt":
                 return True
@@ -1784,6 +1844,9 @@ class AESFuncs(TransportMethods):
                 "data",
                 {"grains": load["grains"], "pillar": data},
             )
+            salt.utils.minion_index.notify_update(
+                self.opts, load["id"], {"grains": load["grains"], "pillar": data}
+            )
             if self.opts.get("minion_data_cache_events") is True:
                 self.event.fire_event(
                     {"Minion data cache refresh": load["id"]},
@@ -1854,13 +1917,13 @@ class AESFuncs(TransportMethods):
         if "sig" in load:
             log.trace("Verifying signed event publish from minion")
             sig = load.pop("sig")
-            this_minion_pubkey = os.path.join(
-                self.pki_dir, "minions/{}".format(load["id"])
+            this_minion_pubkey = self.key_store.get(
+                salt.utils.key_store.ACC, load["id"]
             )
             serialized_load = salt.serializers.msgpack.serialize(load)
-            if not salt.crypt.verify_signature(
-                this_minion_pubkey, serialized_load, sig
-            ):
+            if this_minion_pubkey is None or not salt.crypt.PublicKey.from_str(
+                this_minion_pubkey
+            ).verify(serialized_load, sig):
                 log.info("Failed to verify event signature from minion %s.", load["id"])
                 if self.opts["drop_messages_signature_fail"]:
                     log.critical(
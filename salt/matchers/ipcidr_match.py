@@ -4,12 +4,36 @@ This is the default ipcidr matcher.
 
 import logging
 
+import salt.utils.minion_index
 import salt.utils.network
 from salt._compat import ipaddress
 
 log = logging.getLogger(__name__)
 
 
+def _match_index(tgt, opts, minion_id):
+    """
+    Match another minion against the minion data index of the master.
+    Returns None when the index can't answer.
+    """
+    if (
+        opts.get("__role") != "master"
+        or not opts.get("minion_data_index", False)
+        or salt.utils.minion_index.zmq is None
+    ):
+        return None
+    try:
+        indexed = salt.utils.minion_index.MinionIndexCli.instance(opts).match_ipcidr(
+            tgt
+        )
+    except Exception:  # pylint: disable=broad-except
+        log.exception("Failed to query the minion data index")
+        return None
+    if indexed is None or minion_id not in indexed["cached"]:
+        return None
+    return minion_id in indexed["minions"]
+
+
 def match(tgt, opts=None, minion_id=None):
     """
     Matches based on IP address or CIDR notation
@@ -17,6 +41,13 @@ def match(tgt, opts=None, minion_id=None):
     if not opts:
         opts = __opts__
 
+    if minion_id and minion_id != opts.get("id"):
+        # The grains in opts are not the ones of the minion being matched,
+        # look its addresses up in the minion data index of the master
+        match = _match_index(tgt, opts, minion_id)
+        if match is not None:
+            return match
+
     try:
         # Target is an address?
         tgt = ipaddress.ip_address(tgt)
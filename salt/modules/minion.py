@@ -8,6 +8,7 @@ import time
 
 import salt.key
 import salt.utils.data
+import salt.utils.key_store
 
 # Don't shadow built-ins.
 __func_alias__ = {"list_": "list"}
@@ -29,6 +30,17 @@ def list_():
     # We have to replace the minion/master directories
     pki_dir = pki_dir.replace("minion", "master")
 
+    key_store = __salt__["config.get"]("key_store", "dirs")
+    if key_store != "dirs":
+        return salt.utils.key_store.factory(
+            {
+                "pki_dir": pki_dir,
+                "key_store": key_store,
+                "key_store_path": __salt__["config.get"]("key_store_path"),
+                "hash_type": __salt__["config.get"]("hash_type", "sha256"),
+            }
+        ).list_keys()
+
     # The source code below is (nearly) a copy of salt.key.Key.list_keys
     key_dirs = _check_minions_directories(pki_dir)
 
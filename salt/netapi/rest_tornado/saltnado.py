@@ -371,7 +371,8 @@ class EventListener:
         """
         Callback for events on the event sub socket
         """
-        mtag, data = self.event.unpack(raw)
+        # The data is only deserialized if a future is waiting for the event
+        mtag, data = self.event.unpack(raw, lazy=True)
 
         # see if we have any futures that need this info:
         for (tag, matcher), futures in self.tag_map.items():
@@ -387,7 +388,7 @@ class EventListener:
             for future in futures:
                 if future.done():
                     continue
-                future.set_result({"data": data, "tag": mtag})
+                future.set_result({"data": data.load(), "tag": mtag})
                 self.tag_map[(tag, matcher)].remove(future)
                 if future in self.timeout_map:
                     tornado.ioloop.IOLoop.current().remove_timeout(
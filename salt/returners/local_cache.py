@@ -4,8 +4,11 @@ Return data to local job cache
 """
 
 import bisect
+import calendar
+import collections
 import errno
 import glob
+import hashlib
 import logging
 import os
 import shutil
@@ -37,6 +40,27 @@ RETURN_P = "return.p"
 OUT_P = "out.p"
 # endtime is the end time for a job, not stored as msgpack
 ENDTIME = "endtime"
+# segment log holding every minion return for a job when the "segment"
+# local_cache_storage layout is used
+RETURNS_SEG = ".returns.seg"
+# offset index for RETURNS_SEG, a stream of [minion_id, offset, length] entries
+RETURNS_IDX = ".returns.idx"
+# append-only log of [syndic_id, minions] entries written by save_minions when
+# the "segment" layout is used
+MINIONS_SEG = ".minions.seg"
+# number of segment indexes each process keeps in memory for duplicate return
+# detection
+SEGMENT_INDEX_CACHE_SIZE = 32
+
+# prefix of the time bucket directories used when local_cache_bucket_seconds
+# is set, followed by the UTC start time of the bucket as %Y%m%d%H%M%S
+BUCKET_PREFIX = "b"
+# index of the jobs stored in a time bucket, a stream of [jid, job] entries
+# where job holds the parts of the load needed to format the job listing
+BUCKET_INDEX = ".jobs.idx"
+
+# idx_path -> [bytes of the index already read, set of minion ids]
+_SEGMENT_INDEXES = collections.OrderedDict()
 
 
 def _job_dir():
@@ -46,6 +70,245 @@ def _job_dir():
     return os.path.join(__opts__["cachedir"], "jobs")
 
 
+def _bucket_seconds():
+    """
+    Return the size in seconds of the time buckets jobs are stored in, 0 when
+    the hashed directory layout is used
+    """
+    return __opts__.get("local_cache_bucket_seconds", 0) or 0
+
+
+def _bucket_name(jid):
+    """
+    Return the name of the time bucket directory a jid belongs to, or None if
+    time buckets are disabled or the jid carries no timestamp
+    """
+    bucket_seconds = _bucket_seconds()
+    if not bucket_seconds:
+        return None
+    jid_dt = salt.utils.jid.jid_to_datetime(jid)
+    if jid_dt is None:
+        return None
+    start = calendar.timegm(jid_dt.timetuple()) // bucket_seconds * bucket_seconds
+    return BUCKET_PREFIX + time.strftime("%Y%m%d%H%M%S", time.gmtime(start))
+
+
+def _bucket_start(name):
+    """
+    Return the UTC start time of a time bucket directory, or None if the
+    directory is not a time bucket
+    """
+    if not name.startswith(BUCKET_PREFIX) or len(name) != len(BUCKET_PREFIX) + 14:
+        return None
+    try:
+        return calendar.timegm(
+            time.strptime(name[len(BUCKET_PREFIX) :], "%Y%m%d%H%M%S")
+        )
+    except ValueError:
+        return None
+
+
+def _find_bucket_dir(jid, jhash):
+    """
+    Return the directory of a job stored in any time bucket, or None
+    """
+    jid_dt = salt.utils.jid.jid_to_datetime(jid)
+    if jid_dt is None:
+        return None
+    jid_time = calendar.timegm(jid_dt.timetuple())
+    try:
+        names = os.listdir(_job_dir())
+    except OSError:
+        return None
+    for name in sorted(names, reverse=True):
+        bucket_start = _bucket_start(name)
+        if bucket_start is None or bucket_start > jid_time:
+            continue
+        jid_dir = os.path.join(_job_dir(), name, jhash)
+        if os.path.isdir(jid_dir):
+            return jid_dir
+    return None
+
+
+def _jid_dir(jid):
+    """
+    Return the jid_dir for the given job id, taking time buckets into account
+    """
+    jhash = getattr(hashlib, __opts__["hash_type"])(
+        salt.utils.stringutils.to_bytes(str(jid))
+    ).hexdigest()
+    legacy_dir = os.path.join(_job_dir(), jhash[:2], jhash[2:])
+    bucket = _bucket_name(jid)
+    if bucket is None:
+        jid_dir = legacy_dir
+    else:
+        jid_dir = os.path.join(_job_dir(), bucket, jhash)
+    if os.path.isdir(jid_dir):
+        return jid_dir
+    if bucket is not None and os.path.isdir(legacy_dir):
+        # The job was stored before time buckets were enabled and has not
+        # been migrated by clean_old_jobs yet
+        return legacy_dir
+    # The job may be in a time bucket of another size, or stored before time
+    # buckets were disabled and not migrated back by clean_old_jobs yet
+    return _find_bucket_dir(jid, jhash) or jid_dir
+
+
+def _update_bucket_index(jid, jid_dir, clear_load):
+    """
+    Add a job to the index of the time bucket it is stored in
+    """
+    bucket_dir = os.path.dirname(jid_dir)
+    if _bucket_start(os.path.basename(bucket_dir)) is None:
+        return
+    job = {
+        key: clear_load[key]
+        for key in ("fun", "arg", "tgt", "tgt_type", "user", "metadata")
+        if key in clear_load
+    }
+    if "metadata" in clear_load.get("kwargs", {}):
+        job["kwargs"] = {"metadata": clear_load["kwargs"]["metadata"]}
+    index_path = os.path.join(bucket_dir, BUCKET_INDEX)
+    try:
+        with salt.utils.files.flopen(index_path, "ab") as wfh:
+            wfh.write(salt.payload.dumps([jid, job], use_bin_type=True))
+    except OSError as exc:
+        log.error("Failed to add job %s to index %s: %s", jid, index_path, exc)
+
+
+def _read_bucket_index(bucket_dir):
+    """
+    Return a dict mapping the job ids stored in a time bucket to their jobs
+    """
+    ret = {}
+    index_path = os.path.join(bucket_dir, BUCKET_INDEX)
+    try:
+        with salt.utils.files.fopen(index_path, "rb") as rfh:
+            unpacker = salt.utils.msgpack.Unpacker(raw=False)
+            unpacker.feed(rfh.read())
+    except OSError:
+        return ret
+    for jid, job in unpacker:
+        # The load can be saved more than once for a job, the last one wins
+        ret[jid] = job
+    return ret
+
+
+def _segment_storage():
+    """
+    Return True if the segment log layout is used to store job returns
+    """
+    return __opts__.get("local_cache_storage", "dirs") == "segment"
+
+
+def _read_segment_index(idx_fh):
+    """
+    Read the [minion_id, offset, length] entries from an open segment index.
+    A trailing entry that is still being written is ignored.
+    """
+    unpacker = salt.utils.msgpack.Unpacker(raw=False)
+    unpacker.feed(idx_fh.read())
+    return [entry for entry in unpacker if len(entry) == 3]
+
+
+def _segment_index_ids(idx_fh, idx_path):
+    """
+    Return the set of minion ids already present in a segment index.
+
+    The index file must be locked by the caller. Only the part of the index
+    written since the last call in this process is read, so duplicate
+    detection stays O(1) amortized per return even for very large jobs.
+    """
+    cached = _SEGMENT_INDEXES.pop(idx_path, None)
+    idx_fh.seek(0, os.SEEK_END)
+    size = idx_fh.tell()
+    if cached is None or cached[0] > size:
+        cached = [0, set()]
+    idx_fh.seek(cached[0])
+    for entry in _read_segment_index(idx_fh):
+        cached[1].add(entry[0])
+    cached[0] = size
+    _SEGMENT_INDEXES[idx_path] = cached
+    while len(_SEGMENT_INDEXES) > SEGMENT_INDEX_CACHE_SIZE:
+        _SEGMENT_INDEXES.popitem(last=False)
+    return cached[1]
+
+
+def _segment_returner(load, jid_dir):
+    """
+    Append a minion return to the segment log of a job
+    """
+    if not os.path.isdir(jid_dir):
+        log.error(
+            "An inconsistency occurred, a job was received with a job id "
+            "(%s) that is not present in the local cache",
+            load["jid"],
+        )
+        return False
+
+    record = salt.payload.dumps(
+        {
+            key: load[key]
+            for key in ["return", "retcode", "success", "out"]
+            if key in load
+        },
+        use_bin_type=True,
+    )
+    idx_path = os.path.join(jid_dir, RETURNS_IDX)
+    # The exclusive lock on the index serializes writers across MWorkers, the
+    # segment is always flushed before its index entry is appended so readers
+    # never need the lock.
+    with salt.utils.files.flopen(idx_path, "a+b") as idx_fh:
+        if load["id"] in _segment_index_ids(idx_fh, idx_path) or os.path.isdir(
+            os.path.join(jid_dir, load["id"])
+        ):
+            # Minion has already returned this jid and it should be dropped
+            log.error(
+                "An extra return was detected from minion %s, please verify "
+                "the minion, this could be a replay attack",
+                load["id"],
+            )
+            return False
+        with salt.utils.files.fopen(os.path.join(jid_dir, RETURNS_SEG), "ab") as seg_fh:
+            seg_fh.seek(0, os.SEEK_END)
+            offset = seg_fh.tell()
+            seg_fh.write(record)
+        entry = salt.utils.msgpack.packb(
+            [load["id"], offset, len(record)], use_bin_type=True
+        )
+        idx_fh.write(entry)
+        idx_fh.flush()
+        _SEGMENT_INDEXES[idx_path][0] += len(entry)
+        _SEGMENT_INDEXES[idx_path][1].add(load["id"])
+
+
+def _get_segment_returns(jid_dir):
+    """
+    Return the minion returns stored in the segment log of a job
+    """
+    ret = {}
+    idx_path = os.path.join(jid_dir, RETURNS_IDX)
+    seg_path = os.path.join(jid_dir, RETURNS_SEG)
+    if not os.path.isfile(idx_path) or not os.path.isfile(seg_path):
+        return ret
+    with salt.utils.files.fopen(idx_path, "rb") as idx_fh:
+        index = _read_segment_index(idx_fh)
+    with salt.utils.files.fopen(seg_path, "rb") as seg_fh:
+        data = memoryview(seg_fh.read())
+    for minion_id, offset, length in index:
+        if offset + length > len(data):
+            continue
+        try:
+            ret_data = salt.payload.loads(
+                data[offset : offset + length], encoding="utf-8"
+            )
+        except salt.exceptions.SaltDeserializationError:
+            log.error("Failed to deserialize return of %s in %s", minion_id, seg_path)
+            continue
+        ret[minion_id] = ret_data
+    return ret
+
+
 def _walk_through(job_dir):
     """
     Walk though the jid dir and look for jobs
@@ -57,6 +320,13 @@ def _walk_through(job_dir):
         if not os.path.exists(t_path):
             continue
 
+        if _bucket_start(top) is not None:
+            # Time buckets keep an index of their jobs, there is no need to
+            # list the bucket and read every load
+            for jid, job in _read_bucket_index(t_path).items():
+                yield jid, job, t_path, None
+            continue
+
         for final in os.listdir(t_path):
             load_path = os.path.join(t_path, final, LOAD_P)
 
@@ -97,7 +367,7 @@ def prep_jid(nocache=False, passed_jid=None, recurse_count=0):
     else:
         jid = passed_jid
 
-    jid_dir = salt.utils.jid.jid_dir(jid, _job_dir(), __opts__["hash_type"])
+    jid_dir = _jid_dir(jid)
 
     # Make sure we create the jid dir, otherwise someone else is using it,
     # meaning we need a new jid.
@@ -134,10 +404,13 @@ def returner(load):
     if load["jid"] == "req":
         load["jid"] = prep_jid(nocache=load.get("nocache", False))
 
-    jid_dir = salt.utils.jid.jid_dir(load["jid"], _job_dir(), __opts__["hash_type"])
+    jid_dir = _jid_dir(load["jid"])
     if os.path.exists(os.path.join(jid_dir, "nocache")):
         return
 
+    if _segment_storage():
+        return _segment_returner(load, jid_dir)
+
     hn_dir = os.path.join(jid_dir, load["id"])
 
     try:
@@ -191,7 +464,7 @@ def save_load(jid, clear_load, minions=None, recurse_count=0):
         log.error(err)
         raise salt.exceptions.SaltCacheError(err)
 
-    jid_dir = salt.utils.jid.jid_dir(jid, _job_dir(), __opts__["hash_type"])
+    jid_dir = _jid_dir(jid)
 
     # Save the invocation information
     try:
@@ -214,6 +487,9 @@ def save_load(jid, clear_load, minions=None, recurse_count=0):
             jid=jid, clear_load=clear_load, recurse_count=recurse_count + 1
         )
 
+    if _bucket_seconds():
+        _update_bucket_index(jid, jid_dir, clear_load)
+
     # if you have a tgt, save that for the UI etc
     if "tgt" in clear_load and clear_load["tgt"] != "":
         if minions is None:
@@ -241,7 +517,7 @@ def save_minions(jid, minions, syndic_id=None):
         minions,
     )
 
-    jid_dir = salt.utils.jid.jid_dir(jid, _job_dir(), __opts__["hash_type"])
+    jid_dir = _jid_dir(jid)
 
     try:
         if not os.path.exists(jid_dir):
@@ -254,6 +530,20 @@ def save_minions(jid, minions, syndic_id=None):
         else:
             raise
 
+    if _segment_storage():
+        minions_path = os.path.join(jid_dir, MINIONS_SEG)
+        try:
+            with salt.utils.files.flopen(minions_path, "ab") as wfh:
+                wfh.write(salt.payload.dumps([syndic_id, minions], use_bin_type=True))
+        except OSError as exc:
+            log.error(
+                "Failed to write minion list %s to job cache file %s: %s",
+                minions,
+                minions_path,
+                exc,
+            )
+        return
+
     if syndic_id is not None:
         minions_path = os.path.join(jid_dir, SYNDIC_MINIONS_P.format(syndic_id))
     else:
@@ -280,7 +570,7 @@ def get_load(jid):
     """
     Return the load data that marks a specified jid
     """
-    jid_dir = salt.utils.jid.jid_dir(jid, _job_dir(), __opts__["hash_type"])
+    jid_dir = _jid_dir(jid)
     load_fn = os.path.join(jid_dir, LOAD_P)
     if not os.path.exists(jid_dir) or not os.path.exists(load_fn):
         return {}
@@ -302,7 +592,10 @@ def get_load(jid):
             raise exc
     if ret is None:
         ret = {}
-    minions_cache = [os.path.join(jid_dir, MINIONS_P)]
+    minions_cache = []
+    minions_p = os.path.join(jid_dir, MINIONS_P)
+    if not _segment_storage() or os.path.exists(minions_p):
+        minions_cache.append(minions_p)
     minions_cache.extend(glob.glob(os.path.join(jid_dir, SYNDIC_MINIONS_P.format("*"))))
     all_minions = set()
     for minions_path in minions_cache:
@@ -313,6 +606,20 @@ def get_load(jid):
         except OSError as exc:
             salt.utils.files.process_read_exception(exc, minions_path)
 
+    minions_seg = os.path.join(jid_dir, MINIONS_SEG)
+    if os.path.isfile(minions_seg):
+        log.debug("Reading minion lists from %s", minions_seg)
+        # Later lists from the same (syndic) master replace earlier ones, just
+        # like rewriting the minions file does with the directory layout
+        seg_minions = {}
+        with salt.utils.files.fopen(minions_seg, "rb") as rfh:
+            unpacker = salt.utils.msgpack.Unpacker(raw=False)
+            unpacker.feed(rfh.read())
+            for syndic_id, minions in unpacker:
+                seg_minions[syndic_id] = minions
+        for minions in seg_minions.values():
+            all_minions.update(minions)
+
     if all_minions:
         ret["Minions"] = sorted(all_minions)
 
@@ -323,12 +630,13 @@ def get_jid(jid):
     """
     Return the information returned when the specified job id was executed
     """
-    jid_dir = salt.utils.jid.jid_dir(jid, _job_dir(), __opts__["hash_type"])
+    jid_dir = _jid_dir(jid)
 
     ret = {}
     # Check to see if the jid is real, if not return the empty dict
     if not os.path.isdir(jid_dir):
         return ret
+    ret.update(_get_segment_returns(jid_dir))
     for fn_ in os.listdir(jid_dir):
         if fn_.startswith("."):
             continue
@@ -420,6 +728,10 @@ def clean_old_jobs():
         if not os.path.exists(jid_root):
             return
 
+        if _bucket_seconds():
+            _clean_old_buckets(jid_root, keep_jobs_seconds)
+            return
+
         # Keep track of any empty t_path dirs that need to be removed later
         dirs_to_remove = set()
 
@@ -429,6 +741,10 @@ def clean_old_jobs():
             if not os.path.exists(t_path):
                 continue
 
+            if _bucket_start(top) is not None:
+                _unbucket(jid_root, t_path, keep_jobs_seconds)
+                continue
+
             # Check if there are any stray/empty JID t_path dirs
             t_path_dirs = os.listdir(t_path)
             if not t_path_dirs and t_path not in dirs_to_remove:
@@ -465,13 +781,101 @@ def clean_old_jobs():
                     _remove_job_dir(t_path)
 
 
+def _clean_old_buckets(jid_root, keep_jobs_seconds):
+    """
+    Remove the time buckets whose jobs are all older than keep_jobs_seconds.
+
+    Jobs stored with the hashed directory layout are moved into their time
+    bucket, or removed if they are expired, so existing caches are migrated
+    the first time the cleaner runs after time buckets are enabled.
+    """
+    bucket_seconds = _bucket_seconds()
+    for top in os.listdir(jid_root):
+        t_path = os.path.join(jid_root, top)
+        bucket_start = _bucket_start(top)
+        if bucket_start is not None:
+            if time.time() - (bucket_start + bucket_seconds) > keep_jobs_seconds:
+                _remove_job_dir(t_path)
+            continue
+
+        if not os.path.isdir(t_path):
+            continue
+        for final in os.listdir(t_path):
+            f_path = os.path.join(t_path, final)
+            jid_file = os.path.join(f_path, "jid")
+            if not os.path.isfile(jid_file):
+                # No jid file means corrupted cache entry, scrub it
+                _remove_job_dir(f_path)
+                continue
+            if time.time() - os.stat(jid_file).st_ctime > keep_jobs_seconds:
+                _remove_job_dir(f_path)
+                continue
+            with salt.utils.files.fopen(jid_file, "rb") as rfh:
+                jid = salt.utils.stringutils.to_unicode(rfh.read()).strip()
+            bucket = _bucket_name(jid)
+            if bucket is None:
+                # jids without a timestamp stay in the hashed layout
+                continue
+            bucket_dir = os.path.join(jid_root, bucket)
+            jid_dir = os.path.join(bucket_dir, top + final)
+            try:
+                os.makedirs(bucket_dir, exist_ok=True)
+                os.rename(f_path, jid_dir)
+            except OSError as exc:
+                log.error("Unable to migrate %s to %s: %s", f_path, jid_dir, exc)
+                continue
+            load_path = os.path.join(jid_dir, LOAD_P)
+            if os.path.isfile(load_path):
+                try:
+                    with salt.utils.files.fopen(load_path, "rb") as rfh:
+                        _update_bucket_index(jid, jid_dir, salt.payload.load(rfh))
+                except Exception:  # pylint: disable=broad-except
+                    log.exception("Failed to deserialize %s", load_path)
+
+        if not os.listdir(t_path):
+            _remove_job_dir(t_path)
+
+
+def _unbucket(jid_root, bucket_dir, keep_jobs_seconds):
+    """
+    Move the jobs of a time bucket back to the hashed directory layout, or
+    remove them if they are expired, so the cache is migrated back the first
+    time the cleaner runs after time buckets are disabled.
+    """
+    for jhash in os.listdir(bucket_dir):
+        f_path = os.path.join(bucket_dir, jhash)
+        if not os.path.isdir(f_path):
+            # The index of the bucket
+            continue
+        jid_file = os.path.join(f_path, "jid")
+        if not os.path.isfile(jid_file):
+            # No jid file means corrupted cache entry, scrub it
+            _remove_job_dir(f_path)
+            continue
+        if time.time() - os.stat(jid_file).st_ctime > keep_jobs_seconds:
+            _remove_job_dir(f_path)
+            continue
+        t_path = os.path.join(jid_root, jhash[:2])
+        jid_dir = os.path.join(t_path, jhash[2:])
+        try:
+            os.makedirs(t_path, exist_ok=True)
+            os.rename(f_path, jid_dir)
+        except OSError as exc:
+            log.error("Unable to migrate %s to %s: %s", f_path, jid_dir, exc)
+
+    if not any(
+        os.path.isdir(os.path.join(bucket_dir, name)) for name in os.listdir(bucket_dir)
+    ):
+        _remove_job_dir(bucket_dir)
+
+
 def update_endtime(jid, time):
     """
     Update (or store) the end time for a given job
 
     Endtime is stored as a plain text string
     """
-    jid_dir = salt.utils.jid.jid_dir(jid, _job_dir(), __opts__["hash_type"])
+    jid_dir = _jid_dir(jid)
     try:
         if not os.path.exists(jid_dir):
             os.makedirs(jid_dir)
@@ -487,7 +891,7 @@ def get_endtime(jid):
 
     Returns False if no endtime is present
     """
-    jid_dir = salt.utils.jid.jid_dir(jid, _job_dir(), __opts__["hash_type"])
+    jid_dir = _jid_dir(jid)
     etpath = os.path.join(jid_dir, ENDTIME)
     if not os.path.exists(etpath):
         return False
@@ -180,6 +180,22 @@ def _minion_hash(hash_type, minion_id):
     return hasher(salt.utils.stringutils.to_bytes(minion_id)).hexdigest()[:10]
 
 
+def _ipc_ring_path(node, opts):
+    """
+    Return the path of the shared memory ring of an event bus, or None if the
+    ring is disabled
+    """
+    if not opts.get("ipc_event_ring_size"):
+        return None
+    if node == "master":
+        return os.path.join(opts["sock_dir"], "master_event_ring")
+    id_hash = _minion_hash(
+        hash_type=opts["hash_type"],
+        minion_id=opts.get("hash_id", opts["id"]),
+    )
+    return os.path.join(opts["sock_dir"], f"minion_event_{id_hash}_ring")
+
+
 def ipc_publish_client(node, opts, io_loop):
     # Default to TCP for now
     kwargs = {"transport": "tcp", "ssl": None}
@@ -207,12 +223,21 @@ def ipc_publish_client(node, opts, io_loop):
             kwargs.update(
                 path=os.path.join(opts["sock_dir"], f"minion_event_{id_hash}_pub.ipc")
             )
+    ring_path = _ipc_ring_path(node, opts)
+    if ring_path:
+        import salt.transport.shm
+
+        kwargs.pop("transport")
+        return salt.transport.shm.PublishClient(
+            opts, io_loop, ring_path=ring_path, **kwargs
+        )
     return publish_client(opts, io_loop, **kwargs)
 
 
 def ipc_publish_server(node, opts):
-    # Default to TCP for now
-    kwargs = {"transport": "tcp", "ssl": None}
+    # Default to TCP for now. The listeners of the event bus are local, they
+    # get every event however long it takes them.
+    kwargs = {"transport": "tcp", "ssl": None, "buffer_size": 0}
     if opts["ipc_mode"] == "tcp":
         if node == "master":
             kwargs.update(
@@ -246,6 +271,9 @@ def ipc_publish_server(node, opts):
                     opts["sock_dir"], f"minion_event_{id_hash}_pull.ipc"
                 ),
             )
+    ring_path = _ipc_ring_path(node, opts)
+    if ring_path:
+        kwargs.update(ring_path=ring_path, ring_size=int(opts["ipc_event_ring_size"]))
     return publish_server(opts, **kwargs)
 
 
@@ -1,9 +1,39 @@
 """
 Helper functions for transport components to handle message framing
+
+Two framings are used on the wire. The legacy one msgpack encodes a
+``{"head": ..., "body": ...}`` map, the body being encoded a second time
+when it already is a serialized payload. The binary one is a fixed header
+followed by the encoded head and the body, which is sent as is when it
+already is bytes:
+
+    ``magic, flags, length of the head, length of the body``
+
+A binary frame starts with a byte msgpack never uses, so the two can be told
+apart and mixed on the same stream. Peers advertise they read binary frames
+by listing ``binary`` in the ``frames`` of the head of a legacy frame, the
+legacy framing stays the default for the peers which do not.
 """
 
+import struct
+
+import salt.payload
 import salt.utils.msgpack
 
+# The first byte of a binary frame, never the first byte of a msgpack frame
+MAGIC = b"\xc1"
+HEADER = struct.Struct("!cBHI")
+# The encoded empty head
+EMPTY_HEAD = 0x80
+# The body of the frame is the raw bytes, not an encoded object
+FLAG_RAW = 0x01
+
+BINARY = "binary"
+
+# Raw bodies up to this size are cheaper to copy twice than to slice out of
+# the buffer through a memoryview
+SMALL_BODY = 4096
+
 
 def frame_msg(body, header=None, raw_body=False):  # pylint: disable=unused-argument
     """
@@ -18,6 +48,175 @@ def frame_msg(body, header=None, raw_body=False):  # pylint: disable=unused-argu
     return salt.utils.msgpack.dumps(framed_msg)
 
 
+def frame_msg_binary(body, header=None, raw_body=False):
+    """
+    Frame the given message with the binary framing, ``body`` is sent as is
+    when ``raw_body`` is True and it is bytes
+    """
+    head = salt.payload.dumps(header or {}, use_bin_type=True)
+    if len(head) > 0xFFFF:
+        raise ValueError("The head of the frame is too large")
+    flags = 0
+    if raw_body and isinstance(body, (bytes, bytearray)):
+        flags |= FLAG_RAW
+    else:
+        body = salt.payload.dumps(body, use_bin_type=True)
+    return b"".join((HEADER.pack(MAGIC, flags, len(head), len(body)), head, body))
+
+
+def advertise(header=None):
+    """
+    Return ``header`` telling the peer we read binary frames
+    """
+    header = dict(header or {})
+    header["frames"] = [BINARY]
+    return header
+
+
+def advertised(header):
+    """
+    Return True if the head of a frame tells its sender reads binary frames
+    """
+    if not isinstance(header, dict):
+        return False
+    frames = header.get("frames")
+    return isinstance(frames, (list, tuple)) and BINARY in frames
+
+
+def frame_reply(body, header=None, binary=False):
+    """
+    Frame a reply with the framing of the request, telling a peer which
+    advertised it reads binary frames that we do too
+    """
+    if binary:
+        return frame_msg_binary(body, header=header)
+    if advertised(header):
+        header = {key: val for key, val in header.items() if key != "frames"}
+        header["framing"] = BINARY
+    return frame_msg(body, header=header)
+
+
+class FrameReader:
+    """
+    Split the bytes read from a stream into ``(head, body, binary)``
+    messages, whatever framing they were sent with.
+
+    The legacy frames go through one msgpack unpacker for as long as the
+    stream sends them, and their strings are decoded with
+    :py:func:`decode_embedded_strs` when ``decode`` is True. The unpacker
+    fails on the first byte of a binary frame, the bytes it did not read are
+    then handed back to the buffer of the binary frames. Those are read from
+    an offset in the buffer, which is only compacted once all the complete
+    frames in it were read, and their heads go through an unpacker of
+    their own.
+    """
+
+    def __init__(self, decode=True):
+        self.decode = decode
+        self.buffer = bytearray()
+        # The offset of the next binary frame in the buffer
+        self.pos = 0
+        self.unpacker = None
+        # The bytes fed to the unpacker
+        self._fed = 0
+        # Decodes the heads of the binary frames
+        self.heads = salt.utils.msgpack.Unpacker(raw=False)
+
+    def feed(self, data):
+        if self.unpacker is not None:
+            self.unpacker.feed(data)
+            self._fed += len(data)
+        else:
+            self.buffer += data
+
+    def __iter__(self):
+        while True:
+            if self.unpacker is not None:
+                yield from self._read_legacy()
+                if self.unpacker is not None:
+                    return
+            if self.pos >= len(self.buffer):
+                self._compact()
+                return
+            if self.buffer[self.pos] != MAGIC[0]:
+                self.unpacker = salt.utils.msgpack.Unpacker()
+                self.unpacker.feed(memoryview(self.buffer)[self.pos :])
+                self._fed = len(self.buffer) - self.pos
+                self.buffer = bytearray()
+                self.pos = 0
+                continue
+            yield from self._read_binary()
+            if self.pos < len(self.buffer) and self.buffer[self.pos] == MAGIC[0]:
+                # The next frame is not complete yet
+                self._compact()
+                return
+
+    def _compact(self):
+        """
+        Drop the frames already read from the buffer
+        """
+        if self.pos:
+            del self.buffer[: self.pos]
+            self.pos = 0
+
+    def _read_binary(self):
+        """
+        Read the complete binary frames at the start of the buffer
+        """
+        buffer = self.buffer
+        heads = self.heads
+        pos = self.pos
+        while len(buffer) - pos >= HEADER.size and buffer[pos] == MAGIC[0]:
+            _, flags, head_len, body_len = HEADER.unpack_from(buffer, pos)
+            start = pos + HEADER.size
+            end = start + head_len + body_len
+            if len(buffer) < end:
+                break
+            if head_len == 1 and buffer[start] == EMPTY_HEAD:
+                header = {}
+            else:
+                heads.feed(buffer[start : start + head_len])
+                header = next(heads)
+            if flags & FLAG_RAW and body_len <= SMALL_BODY:
+                body = bytes(buffer[start + head_len : end])
+            else:
+                with memoryview(buffer)[start + head_len : end] as body:
+                    if flags & FLAG_RAW:
+                        body = bytes(body)
+                    else:
+                        body = salt.payload.loads(body, encoding="utf-8")
+            pos = self.pos = end
+            yield header, body, True
+
+    def _read_legacy(self):
+        """
+        Read the complete legacy frames fed to the unpacker
+        """
+        while True:
+            start = self.unpacker.tell()
+            try:
+                framed_msg = next(self.unpacker)
+            except StopIteration:
+                return
+            except ValueError:
+                # Hand the bytes left back to the buffer when a binary frame
+                # follows, msgpack never starts an object with its first byte
+                if self.unpacker.tell() != start:
+                    raise
+                data = self.unpacker.read_bytes(self._fed - start)
+                if data[:1] != MAGIC:
+                    raise
+                self.unpacker = None
+                self.buffer = bytearray(data)
+                self.pos = 0
+                return
+            if self.decode:
+                framed_msg = decode_embedded_strs(framed_msg)
+                yield framed_msg["head"], framed_msg["body"], False
+            else:
+                yield framed_msg[b"head"], framed_msg[b"body"], False
+
+
 def frame_msg_ipc(body, header=None, raw_body=False):  # pylint: disable=unused-argument
     """
     Frame the given message with our wire protocol for IPC
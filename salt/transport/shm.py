@@ -0,0 +1,323 @@
+"""
+Shared memory ring buffer for the local event buses
+
+The event publisher writes every event once to a ring buffer in a file of
+the ``sock_dir`` which the listeners on the same host map in memory. The
+publisher's unix socket is only used to wake the listeners up: a listener
+registers as a doorbell subscriber and gets a single byte instead of each
+event.
+
+Ring layout: a header of ``magic, capacity, next sequence number, committed
+bytes, reserved bytes`` followed by ``capacity`` bytes of records. A record is
+``sequence number, length, packed event`` aligned on 8 bytes. The byte counts
+only grow, the position of a record in the ring is its byte count modulo the
+capacity. The publisher reserves the bytes of a record before writing it and
+commits them after, so a listener can tell when a record it read was
+overwritten.
+"""
+
+import asyncio
+import logging
+import mmap
+import os
+import struct
+import time
+
+import tornado.iostream
+
+import salt.transport.frame
+import salt.transport.tcp
+import salt.utils.event
+import salt.utils.files
+
+log = logging.getLogger(__name__)
+
+MAGIC = b"SALTRING"
+HEADER = struct.Struct("<8sQQQQ")
+HEADER_SIZE = 64
+RECORD = struct.Struct("<QI")
+# A record telling the readers to go back to the start of the ring
+WRAP = 0xFFFFFFFF
+
+
+def _align(size):
+    return (size + 7) & ~7
+
+
+class RingWriter:
+    """
+    Write packed events to the ring buffer, used by the event publisher
+    """
+
+    def __init__(self, path, capacity):
+        self.path = path
+        self.capacity = _align(capacity)
+        self.seq = 0
+        self.pos = 0
+        tmp_path = f"{path}.{os.getpid()}"
+        with salt.utils.files.set_umask(0o177):
+            with salt.utils.files.fopen(tmp_path, "wb") as fp_:
+                fp_.truncate(HEADER_SIZE + self.capacity)
+        fd = os.open(tmp_path, os.O_RDWR)
+        try:
+            self.mmap = mmap.mmap(fd, HEADER_SIZE + self.capacity)
+        finally:
+            os.close(fd)
+        self._write_header(0)
+        # Listeners still mapping the ring of a previous publisher keep it
+        os.replace(tmp_path, path)
+
+    def _write_header(self, reserved):
+        HEADER.pack_into(
+            self.mmap, 0, MAGIC, self.capacity, self.seq, self.pos, reserved
+        )
+
+    def write(self, data):
+        """
+        Append a packed event to the ring, returns False if it does not fit
+        """
+        size = _align(RECORD.size + len(data))
+        if size > self.capacity:
+            log.warning(
+                "Event of %d bytes does not fit in the ring buffer of %d bytes",
+                len(data),
+                self.capacity,
+            )
+            self.skip()
+            return False
+        offset = self.pos % self.capacity
+        tail = self.capacity - offset
+        skip = tail if tail < size else 0
+        # Mark the bytes we are about to overwrite before touching them
+        self._write_header(self.pos + skip + size)
+        if skip:
+            if tail >= RECORD.size:
+                RECORD.pack_into(self.mmap, HEADER_SIZE + offset, self.seq, WRAP)
+            offset = 0
+        start = HEADER_SIZE + offset
+        RECORD.pack_into(self.mmap, start, self.seq, len(data))
+        self.mmap[start + RECORD.size : start + RECORD.size + len(data)] = data
+        self.seq += 1
+        self.pos += skip + size
+        self._write_header(self.pos)
+        return True
+
+    def skip(self):
+        """
+        Count an event which could not be written, the readers see it as
+        missed
+        """
+        self.seq += 1
+        self._write_header(self.pos)
+
+    def close(self):
+        if self.mmap is not None:
+            self.mmap.close()
+            self.mmap = None
+
+
+class RingReader:
+    """
+    Read the packed events from the ring buffer, starting with the next one
+    written
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with salt.utils.files.fopen(path, "rb") as fp_:
+            self.inode = os.fstat(fp_.fileno()).st_ino
+            self.mmap = mmap.mmap(fp_.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.capacity, self.seq, self.pos, _ = HEADER.unpack_from(self.mmap)
+        if magic != MAGIC:
+            self.mmap.close()
+            raise ValueError(f"{path} is not an event ring buffer")
+        # The number of events lost because they were overwritten
+        self.missed = 0
+
+    def replaced(self):
+        """
+        Return True if a new publisher replaced the ring
+        """
+        try:
+            return os.stat(self.path).st_ino != self.inode
+        except OSError:
+            return True
+
+    def _skip_to_head(self):
+        _, _, seq, pos, _ = HEADER.unpack_from(self.mmap)
+        self.missed += seq - self.seq
+        self.seq = seq
+        self.pos = pos
+
+    def read(self):
+        """
+        Return the next packed event, or None. Events overwritten before they
+        were read are counted in ``missed``.
+        """
+        while True:
+            _, _, _, committed, _ = HEADER.unpack_from(self.mmap)
+            if self.pos >= committed:
+                return None
+            if committed - self.pos > self.capacity:
+                self._skip_to_head()
+                continue
+            offset = self.pos % self.capacity
+            tail = self.capacity - offset
+            if tail < RECORD.size:
+                self.pos += tail
+                continue
+            seq, length = RECORD.unpack_from(self.mmap, HEADER_SIZE + offset)
+            if length == WRAP:
+                self.pos += tail
+                continue
+            start = HEADER_SIZE + offset + RECORD.size
+            data = self.mmap[start : start + length]
+            _, _, _, _, reserved = HEADER.unpack_from(self.mmap)
+            if reserved - self.pos > self.capacity:
+                # The record was overwritten while we were reading it
+                self._skip_to_head()
+                continue
+            if seq > self.seq:
+                # Events the publisher was unable to write
+                self.missed += seq - self.seq
+            self.seq = seq + 1
+            self.pos += _align(RECORD.size + length)
+            return data
+
+    def close(self):
+        if self.mmap is not None:
+            self.mmap.close()
+            self.mmap = None
+
+
+class PublishClient(salt.transport.tcp.PublishClient):
+    """
+    Event bus listener reading the events from the ring buffer of the
+    publisher, which it connects to in order to get woken up. Falls back to
+    getting the events through the socket if the ring can not be opened.
+
+    :param str ring_path: The path of the ring buffer
+    :param callable gap_callback: Called with the number of events missed
+        when the listener fell too far behind
+    """
+
+    def __init__(self, opts, io_loop, **kwargs):  # pylint: disable=W0231
+        super().__init__(opts, io_loop, **kwargs)
+        self.ring_path = kwargs["ring_path"]
+        self.gap_callback = kwargs.get("gap_callback")
+        self.ring = None
+        self._doorbell = None
+        self._tags = None
+
+    def _open_ring(self):
+        if self.ring is not None:
+            if not self.ring.replaced():
+                return
+            self.ring.close()
+            self.ring = None
+        try:
+            self.ring = RingReader(self.ring_path)
+        except (OSError, ValueError) as exc:
+            log.debug(
+                "Unable to open the event ring buffer %s: %s", self.ring_path, exc
+            )
+
+    async def _connect(self, timeout=None):
+        if self._stream is not None:
+            return
+        await super()._connect(timeout=timeout)
+        self._doorbell = None
+        if self._stream is None:
+            return
+        self._open_ring()
+        if self.ring is not None:
+            try:
+                await self._stream.write(
+                    salt.transport.frame.frame_msg(
+                        {"doorbell": True}, header=salt.transport.frame.advertise()
+                    )
+                )
+            except tornado.iostream.StreamClosedError:
+                log.trace("Stream closed, unable to ring the doorbell")
+
+    def _read_ring(self):
+        subscriptions = None
+        if self.subscriptions:
+            if self._tags is None or self._tags[0] is not self.subscriptions:
+                self._tags = (
+                    self.subscriptions,
+                    salt.utils.event.TagFilter(self.subscriptions),
+                )
+            subscriptions = self._tags[1]
+        while True:
+            missed = self.ring.missed
+            msg = self.ring.read()
+            if self.ring.missed != missed:
+                log.warning(
+                    "Event listener fell behind, %d events were lost",
+                    self.ring.missed - missed,
+                )
+                if self.gap_callback:
+                    self.gap_callback(self.ring.missed - missed)
+            if msg is None or subscriptions is None:
+                return msg
+            tag = salt.utils.event.unpack_tag(msg)
+            if tag is None or subscriptions.match(tag):
+                return msg
+
+    async def _wait(self, timeout):
+        """
+        Wait for the doorbell, returns False on timeout
+        """
+        if self._doorbell is None:
+            self._doorbell = self._stream.read_bytes(4096, partial=True)
+        try:
+            await asyncio.wait_for(asyncio.shield(self._doorbell), timeout)
+        except (TimeoutError, asyncio.exceptions.TimeoutError):
+            return False
+        except tornado.iostream.StreamClosedError:
+            log.trace("Stream closed, reconnecting.")
+            stream = self._stream
+            self._stream = None
+            stream.close()
+            if self.disconnect_callback:
+                self.disconnect_callback()
+            await self.connect()
+            return True
+        finally:
+            if self._doorbell is not None and self._doorbell.done():
+                self._doorbell = None
+        return True
+
+    async def recv(self, timeout=None):
+        while self._stream is None:
+            await self.connect()
+            await asyncio.sleep(0.001)
+        if self.ring is None:
+            return await super().recv(timeout=timeout)
+        start = time.monotonic()
+        while not self._closing:
+            msg = self._read_ring()
+            if msg is not None or timeout == 0:
+                return msg
+            remaining = None
+            if timeout:
+                remaining = timeout - (time.monotonic() - start)
+                if remaining <= 0:
+                    return None
+            if not await self._wait(remaining):
+                return None
+            if self.ring is None:
+                # The publisher went away and we reconnected without a ring
+                return await super().recv(timeout=timeout)
+
+    def close(self):
+        doorbell = self._doorbell
+        self._doorbell = None
+        super().close()
+        if doorbell is not None:
+            # Retrieve the StreamClosedError of the pending read
+            doorbell.add_done_callback(lambda future: future.exception())
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
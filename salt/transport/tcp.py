@@ -7,9 +7,12 @@ Wire protocol: "len(payload) msgpack({'head': SOMEHEADER, 'body': SOMEBODY})"
 
 import asyncio
 import asyncio.exceptions
+import collections
 import errno
+import itertools
 import logging
 import multiprocessing
+import os
 import queue
 import select
 import socket
@@ -32,7 +35,9 @@ import salt.master
 import salt.payload
 import salt.transport.base
 import salt.transport.frame
+import salt.utils.admission
 import salt.utils.asynchronous
+import salt.utils.event
 import salt.utils.files
 import salt.utils.msgpack
 import salt.utils.platform
@@ -49,6 +54,16 @@ else:
 
 log = logging.getLogger(__name__)
 
+# What the PubServer does with a subscriber which fell too far behind:
+# disconnect it, so it connects and signs in again, or drop its oldest
+# payloads
+SLOW_SUBSCRIBER_DISCONNECT = "disconnect"
+SLOW_SUBSCRIBER_DROP_OLDEST = "drop_oldest"
+SLOW_SUBSCRIBER_POLICIES = (
+    SLOW_SUBSCRIBER_DISCONNECT,
+    SLOW_SUBSCRIBER_DROP_OLDEST,
+)
+
 
 class ClosingError(Exception):
     """ """
@@ -211,6 +226,7 @@ class PublishClient(salt.transport.base.PublishClient):
         "connect",
         "connect_uri",
         "recv",
+        "set_subscriptions",
     ]
     close_methods = [
         "close",
@@ -220,7 +236,8 @@ class PublishClient(salt.transport.base.PublishClient):
         super().__init__(opts, io_loop, **kwargs)
         self.opts = opts
         self.io_loop = io_loop
-        self.unpacker = salt.utils.msgpack.Unpacker()
+        self.reader = salt.transport.frame.FrameReader(decode=False)
+        self.subscriptions = []
         self.connected = False
         self._closing = False
         self._stream = None
@@ -291,7 +308,7 @@ class PublishClient(salt.transport.base.PublishClient):
                         ),
                         1,
                     )
-                    self.unpacker = salt.utils.msgpack.Unpacker()
+                    self.reader = salt.transport.frame.FrameReader(decode=False)
                     log.debug(
                         "PubClient conencted to %r %r:%r", self, self.host, self.port
                     )
@@ -302,7 +319,7 @@ class PublishClient(salt.transport.base.PublishClient):
                         socket.socket(sock_type, socket.SOCK_STREAM)
                     )
                     await asyncio.wait_for(stream.connect(self.path), 1)
-                    self.unpacker = salt.utils.msgpack.Unpacker()
+                    self.reader = salt.transport.frame.FrameReader(decode=False)
                     log.debug("PubClient conencted to %r %r", self, self.path)
             except Exception as exc:  # pylint: disable=broad-except
                 if self.path:
@@ -331,6 +348,8 @@ class PublishClient(salt.transport.base.PublishClient):
             self._closed = False
             self._stream = await self.getstream(timeout=timeout)
             if self._stream:
+                if self.subscriptions:
+                    await self._send_subscriptions()
                 if self.connect_callback:
                     self.connect_callback(True)
             self.connected = True
@@ -364,13 +383,35 @@ class PublishClient(salt.transport.base.PublishClient):
     async def send(self, msg):
         await self._stream.write(msg)
 
+    async def set_subscriptions(self, subscriptions):
+        """
+        Only get the events whose tag matches one of ``subscriptions``, a list
+        of ``[tag, match_type]`` pairs, from an event bus publisher. An empty
+        list gets all the events again.
+        """
+        self.subscriptions = list(subscriptions)
+        if self._stream is not None:
+            await self._send_subscriptions()
+
+    async def _send_subscriptions(self):
+        try:
+            await self._stream.write(
+                salt.transport.frame.frame_msg(
+                    {"subscriptions": self.subscriptions},
+                    header=salt.transport.frame.advertise(),
+                )
+            )
+        except tornado.iostream.StreamClosedError:
+            # They are sent again once we reconnect
+            log.trace("Stream closed, unable to send subscriptions")
+
     async def recv(self, timeout=None):
         while self._stream is None:
             await self.connect()
             await asyncio.sleep(0.001)
         if timeout == 0:
-            for msg in self.unpacker:
-                return msg[b"body"]
+            for _, body, _ in self.reader:
+                return body
             try:
                 events, _, _ = select.select([self._stream.socket], [], [], 0)
             except TimeoutError:
@@ -389,9 +430,9 @@ class PublishClient(salt.transport.base.PublishClient):
                                 self.disconnect_callback()
                             await self.connect()
                             return
-                        self.unpacker.feed(byts)
-                        for msg in self.unpacker:
-                            return msg[b"body"]
+                        self.reader.feed(byts)
+                        for _, body, _ in self.reader:
+                            return body
         elif timeout:
             try:
                 return await asyncio.wait_for(self.recv(), timeout=timeout)
@@ -404,8 +445,8 @@ class PublishClient(salt.transport.base.PublishClient):
                 await self.connect()
                 return
         else:
-            for msg in self.unpacker:
-                return msg[b"body"]
+            for _, body, _ in self.reader:
+                return body
             while not self._closing:
                 async with self._read_in_progress:
                     try:
@@ -420,9 +461,9 @@ class PublishClient(salt.transport.base.PublishClient):
                         await self.connect()
                         log.debug("Re-connected - continue")
                         continue
-                    self.unpacker.feed(byts)
-                    for msg in self.unpacker:
-                        return msg[b"body"]
+                    self.reader.feed(byts)
+                    for _, body, _ in self.reader:
+                        return body
 
     async def on_recv_handler(self, callback):
         while not self._stream:
@@ -485,6 +526,7 @@ class RequestServer(salt.transport.base.DaemonizedRequestServer):
         self._socket = None
         self.req_server = None
         self.ssl = self.opts.get("ssl", None)
+        self.admission = None
 
     @property
     def socket(self):
@@ -530,7 +572,13 @@ class RequestServer(salt.transport.base.DaemonizedRequestServer):
         """
         Pre-fork we need to create the zmq router device
         """
-        if USE_LOAD_BALANCER:
+        if router_enabled(self.opts):
+            process_manager.add_process(
+                RequestRouterServer,
+                args=(self.opts,),
+                name="RequestRouter",
+            )
+        elif USE_LOAD_BALANCER:
             self.socket_queue = multiprocessing.Queue()
             process_manager.add_process(
                 LoadBalancerServer,
@@ -553,12 +601,24 @@ class RequestServer(salt.transport.base.DaemonizedRequestServer):
         """
         self.message_handler = message_handler
         log.info("RequestServer workers %s", socket)
+        if salt.utils.admission.enabled(self.opts):
+            # Each worker process queues the requests it reads by class
+            self.admission = salt.utils.admission.AdmissionQueue(
+                salt.utils.admission.classes(self.opts)
+            )
 
         with salt.utils.asynchronous.current_ioloop(io_loop):
             ctx = None
             if self.ssl is not None:
                 ctx = salt.transport.base.ssl_context(self.ssl, server_side=True)
-            if USE_LOAD_BALANCER:
+            if router_enabled(self.opts):
+                # The router terminates TLS and hands over the requests
+                self.req_server = RequestRouterWorker(
+                    self.opts,
+                    self.handle_message,
+                    io_loop=io_loop,
+                )
+            elif USE_LOAD_BALANCER:
                 self.req_server = LoadBalancerWorker(
                     self.socket_queue,
                     self.handle_message,
@@ -579,7 +639,7 @@ class RequestServer(salt.transport.base.DaemonizedRequestServer):
                 self.req_server.add_socket(self._socket)
                 self._socket.listen(self.backlog)
 
-    async def handle_message(self, stream, payload, header=None):
+    async def handle_message(self, stream, payload, header=None, binary=False):
         try:
             cert = stream.socket.getpeercert()
         except AttributeError:
@@ -589,9 +649,45 @@ class RequestServer(salt.transport.base.DaemonizedRequestServer):
                 name = salt.transport.base.common_name(cert)
                 log.error("Request client cert %r", name)
         payload = self.decode_payload(payload)
-        reply = await self.message_handler(payload)
+        if self.admission is None:
+            reply = await self.message_handler(payload)
+        else:
+            reply = await self._handle_admitted(payload)
+            if reply is None:
+                return
         # XXX Handle StreamClosedError
-        stream.write(salt.transport.frame.frame_msg(reply, header=header))
+        stream.write(salt.transport.frame.frame_reply(reply, header, binary))
+
+    async def _handle_admitted(self, payload):
+        """
+        Handle a request once its class is allowed to, see
+        :py:mod:`salt.utils.admission`. Returns None if the request was
+        dropped.
+        """
+        name = self.admission.classify(payload)
+        admitted = tornado.concurrent.Future()
+        if not self.admission.put(name, admitted):
+            if name != "auth":
+                # Only sign in requests are sent in the clear, the client of
+                # any other request would not be able to read the hint
+                log.warning("Dropping request, the %s request queue is full", name)
+                return None
+            return salt.utils.admission.retry_reply(self.admission.retry_after(name))
+        self._dispatch()
+        await admitted
+        start = time.monotonic()
+        try:
+            return await self.message_handler(payload)
+        finally:
+            self.admission.done(name, time.monotonic() - start)
+            self._dispatch()
+
+    def _dispatch(self):
+        while True:
+            item = self.admission.pop()
+            if item is None:
+                break
+            item[1].set_result(True)
 
     def decode_payload(self, payload):
         return payload
@@ -631,17 +727,21 @@ class SaltMessageServer(tornado.tcpserver.TCPServer):
         """
         log.trace("Req client %s connected", address)
         self.clients.append((stream, address))
-        unpacker = salt.utils.msgpack.Unpacker()
+        reader = salt.transport.frame.FrameReader()
         try:
             while True:
                 wire_bytes = await stream.read_bytes(4096, partial=True)
-                unpacker.feed(wire_bytes)
-                for framed_msg in unpacker:
-                    framed_msg = salt.transport.frame.decode_embedded_strs(framed_msg)
-                    header = framed_msg["head"]
-                    self.io_loop.spawn_callback(
-                        self.message_handler, stream, framed_msg["body"], header
-                    )
+                reader.feed(wire_bytes)
+                for header, body, binary in reader:
+                    if binary:
+                        # The reply is framed the same way
+                        self.io_loop.spawn_callback(
+                            self.message_handler, stream, body, header, binary=True
+                        )
+                    else:
+                        self.io_loop.spawn_callback(
+                            self.message_handler, stream, body, header
+                        )
         except _StreamClosedError:
             log.trace("req client disconnected %s", address)
             self.remove_client((stream, address))
@@ -713,6 +813,291 @@ class LoadBalancerWorker(SaltMessageServer):
             pass
 
 
+def router_enabled(opts):
+    """
+    Return True if the requests go through the ``RequestRouter``
+    """
+    return bool(opts.get("tcp_request_router", False))
+
+
+def _router_worker_addr(opts):
+    """
+    Return the ``(path, host, port)`` the workers connect to the router on,
+    the unix socket path is None when ``ipc_mode`` is tcp
+    """
+    if opts.get("ipc_mode", "") == "tcp":
+        return None, "127.0.0.1", int(opts.get("tcp_master_workers", 4515))
+    return os.path.join(opts["sock_dir"], "tcp_workers.ipc"), None, None
+
+
+def _write(stream, data):
+    """
+    Write to a stream without waiting, returns False if it is closed
+    """
+    try:
+        future = stream.write(data)
+    except tornado.iostream.StreamClosedError:
+        return False
+    # Retrieve the StreamClosedError of a client which went away
+    future.add_done_callback(lambda future: future.exception())
+    return True
+
+
+class RequestRouter(tornado.tcpserver.TCPServer):
+    """
+    Front end of the request server when ``tcp_request_router`` is enabled.
+
+    Reads the requests of the clients and hands each of them to the worker
+    with the fewest requests in flight, over the connection the worker opened
+    to the router. The replies are written back to the connection the request
+    came from along with the header the client sent, so a client can have any
+    number of requests in flight on a single connection and they are spread
+    over all the workers.
+    """
+
+    # Based on default used in tornado.netutil.bind_sockets()
+    backlog = 128
+
+    def __init__(self, opts, io_loop=None, **kwargs):
+        super().__init__(**kwargs)
+        self.opts = opts
+        self.io_loop = io_loop or tornado.ioloop.IOLoop.current()
+        self._closing = False
+        self._socket = None
+        self._worker_socket = None
+        self._remove_handler = None
+        self.clients = set()
+        # Worker stream to the number of requests it has in flight
+        self.workers = {}
+        self._next_worker = 0
+        # Request id to (client stream, client header, worker stream, binary)
+        self.pending = {}
+        # Requests received while no worker was connected
+        self.waiting = collections.deque()
+        self._ids = itertools.count(1)
+
+    def open(self):
+        """
+        Bind the socket of the workers and the request port
+        """
+        path, host, port = _router_worker_addr(self.opts)
+        if path:
+            self._worker_socket = tornado.netutil.bind_unix_socket(path)
+        else:
+            self._worker_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self._worker_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self._worker_socket.setblocking(0)
+            self._worker_socket.bind((host, port))
+            self._worker_socket.listen(self.backlog)
+        self._remove_handler = tornado.netutil.add_accept_handler(
+            self._worker_socket, self._accept_worker
+        )
+        self._socket = _get_socket(self.opts)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        _set_tcp_keepalive(self._socket, self.opts)
+        self._socket.setblocking(0)
+        self._socket.bind(_get_bind_addr(self.opts, "ret_port"))
+        self._socket.listen(self.backlog)
+        self.add_socket(self._socket)
+
+    def _accept_worker(self, connection, address):
+        self.io_loop.spawn_callback(
+            self.handle_worker, tornado.iostream.IOStream(connection)
+        )
+
+    async def handle_stream(  # pylint: disable=arguments-differ,invalid-overridden-method
+        self, stream, address
+    ):
+        """
+        Read the requests of a client and hand them to the workers
+        """
+        log.trace("Req client %s connected", address)
+        self.clients.add(stream)
+        # The bodies are handed over in the framing they came in, the workers
+        # decode them
+        reader = salt.transport.frame.FrameReader(decode=False)
+        try:
+            while True:
+                wire_bytes = await stream.read_bytes(4096, partial=True)
+                reader.feed(wire_bytes)
+                for header, body, binary in reader:
+                    if not binary:
+                        header = salt.transport.frame.decode_embedded_strs(header)
+                    self.route(stream, header, body, binary)
+        except tornado.iostream.StreamClosedError:
+            log.trace("req client disconnected %s", address)
+        except Exception as exc:  # pylint: disable=broad-except
+            log.trace("Request router client exception: %s", exc, exc_info=True)
+            stream.close()
+        finally:
+            self.clients.discard(stream)
+
+    def least_busy(self):
+        """
+        Return the stream of the worker with the fewest requests in flight
+        """
+        workers = list(self.workers)
+        # Start with the next worker each time to spread the ties
+        self._next_worker = (self._next_worker + 1) % len(workers)
+        workers = workers[self._next_worker :] + workers[: self._next_worker]
+        return min(workers, key=self.workers.__getitem__)
+
+    def route(self, stream, header, body, binary=False):
+        """
+        Hand a request of a client to the least busy worker
+        """
+        request = (next(self._ids), stream, header, body, binary)
+        if not self.workers:
+            self.waiting.append(request)
+            return
+        self._send(self.least_busy(), *request)
+
+    def _send(self, worker, request_id, stream, header, body, binary):
+        self.pending[request_id] = (stream, header, worker, binary)
+        self.workers[worker] += 1
+        if binary:
+            frame = salt.transport.frame.frame_msg_binary(
+                body, header={"mid": request_id}
+            )
+        else:
+            frame = salt.transport.frame.frame_msg(body, header={"mid": request_id})
+        _write(worker, frame)
+
+    def reply(self, worker, header, body):
+        """
+        Write the reply of a worker back to the client of the request
+        """
+        header = salt.transport.frame.decode_embedded_strs(header)
+        request_id = header.get("mid") if isinstance(header, dict) else None
+        try:
+            stream, client_header, _, binary = self.pending.pop(request_id)
+        except KeyError:
+            log.trace("Dropping the reply to unknown request %s", request_id)
+            return
+        if worker in self.workers:
+            self.workers[worker] -= 1
+        _write(stream, salt.transport.frame.frame_reply(body, client_header, binary))
+
+    async def handle_worker(self, stream):
+        """
+        Hand the requests to a worker which connected and read its replies
+        """
+        log.debug("Request router worker connected")
+        self.workers[stream] = 0
+        while self.waiting:
+            self._send(self.least_busy(), *self.waiting.popleft())
+        reader = salt.transport.frame.FrameReader(decode=False)
+        try:
+            while True:
+                wire_bytes = await stream.read_bytes(4096, partial=True)
+                reader.feed(wire_bytes)
+                for header, body, _ in reader:
+                    self.reply(stream, header, body)
+        except tornado.iostream.StreamClosedError:
+            log.debug("Request router worker disconnected")
+        except Exception as exc:  # pylint: disable=broad-except
+            log.error("Request router worker exception: %s", exc, exc_info=True)
+            stream.close()
+        finally:
+            self.workers.pop(stream, None)
+            lost = [
+                request_id
+                for request_id, (_, _, worker, _) in self.pending.items()
+                if worker is stream
+            ]
+            for request_id in lost:
+                del self.pending[request_id]
+            if lost and not self._closing:
+                # The clients send the requests again once they time out
+                log.warning("A worker went away with %d requests in flight", len(lost))
+
+    def close(self):
+        """
+        Close the router
+        """
+        if self._closing:
+            return
+        self._closing = True
+        if self._remove_handler is not None:
+            self._remove_handler()
+            self._remove_handler = None
+        if self._worker_socket is not None:
+            self._worker_socket.close()
+            self._worker_socket = None
+        for stream in list(self.clients) + list(self.workers):
+            stream.close()
+        try:
+            self.stop()
+        except OSError as exc:
+            if exc.errno != 9:
+                raise
+
+
+class RequestRouterServer(salt.utils.process.SignalHandlingProcess):
+    """
+    Runs the ``RequestRouter`` in its own process
+    """
+
+    def __init__(self, opts, **kwargs):
+        super().__init__(**kwargs)
+        self.opts = opts
+
+    def run(self):
+        """
+        Start the request router
+        """
+        io_loop = tornado.ioloop.IOLoop()
+        with salt.utils.asynchronous.current_ioloop(io_loop):
+            ctx = None
+            if self.opts.get("ssl") is not None:
+                ctx = salt.transport.base.ssl_context(
+                    self.opts["ssl"], server_side=True
+                )
+            router = RequestRouter(self.opts, io_loop=io_loop, ssl_options=ctx)
+            router.open()
+            try:
+                io_loop.start()
+            except (KeyboardInterrupt, SystemExit):
+                pass
+            finally:
+                router.close()
+
+
+class RequestRouterWorker(SaltMessageServer):
+    """
+    Gets the requests from the ``RequestRouter`` over a connection the
+    worker opens to it, and sends the replies back the same way.
+    """
+
+    def __init__(self, opts, message_handler, *args, **kwargs):
+        super().__init__(message_handler, *args, **kwargs)
+        self.opts = opts
+        self.io_loop.spawn_callback(self.connect)
+
+    async def connect(self):
+        """
+        Connect to the router, again whenever the connection is lost
+        """
+        path, host, port = _router_worker_addr(self.opts)
+        if path:
+            family, addr = socket.AF_UNIX, path
+        else:
+            family, addr = socket.AF_INET, (host, port)
+        while not self._closing:
+            stream = tornado.iostream.IOStream(
+                socket.socket(family, socket.SOCK_STREAM)
+            )
+            try:
+                await stream.connect(addr)
+            except (OSError, tornado.iostream.StreamClosedError) as exc:
+                log.trace("Unable to connect to the request router: %s", exc)
+                stream.close()
+                await asyncio.sleep(0.5)
+                continue
+            # Returns once the connection is lost
+            await self.handle_stream(stream, addr)
+
+
 class TCPClientKeepAlive(tornado.tcpclient.TCPClient):
     """
     Override _create_stream() in TCPClient to enable keep alive support.
@@ -848,15 +1233,12 @@ class MessageClient:
     @tornado.gen.coroutine
     def _stream_return(self):
         self._stream_return_running = True
-        unpacker = salt.utils.msgpack.Unpacker()
+        reader = salt.transport.frame.FrameReader()
         while not self._closing:
             try:
                 wire_bytes = yield self._stream.read_bytes(4096, partial=True)
-                unpacker.feed(wire_bytes)
-                for framed_msg in unpacker:
-                    framed_msg = salt.transport.frame.decode_embedded_strs(framed_msg)
-                    header = framed_msg["head"]
-                    body = framed_msg["body"]
+                reader.feed(wire_bytes)
+                for header, body, _ in reader:
                     message_id = header.get("mid")
 
                     if message_id in self.send_future_map:
@@ -888,7 +1270,7 @@ class MessageClient:
                 self._stream = None
                 if stream:
                     stream.close()
-                unpacker = salt.utils.msgpack.Unpacker()
+                reader = salt.transport.frame.FrameReader()
                 yield self.connect()
             except TypeError:
                 # This is an invalid transport
@@ -912,7 +1294,7 @@ class MessageClient:
                 self._stream = None
                 if stream:
                     stream.close()
-                unpacker = salt.utils.msgpack.Unpacker()
+                reader = salt.transport.frame.FrameReader()
                 yield self.connect()
         self._stream_return_running = False
 
@@ -998,6 +1380,34 @@ class Subscriber:
         self._closing = False
         self._read_until_future = None
         self.id_ = None
+        # The event tags this subscriber wants, None for all of them
+        self.tags = None
+        # Only wake the subscriber up, it reads the events from the ring
+        self.doorbell = False
+        self._doorbell_future = None
+        # The payloads waiting to be written when the PubServer bounds the
+        # send buffers, see PubServer.send()
+        self.queue = collections.deque()
+        self.queued_bytes = 0
+        self.writing = False
+        # The number of payloads dropped since the subscriber connected
+        self.dropped = 0
+        # Set when payloads were dropped while the subscriber was behind
+        self.lagging = False
+        # Called with the subscriber when it falls behind
+        self.lag_callback = None
+        # The subscriber reads binary frames
+        self.binary = False
+
+    def lag(self):
+        """
+        Return how far behind the subscriber is
+        """
+        return {
+            "queued": len(self.queue),
+            "queued_bytes": self.queued_bytes,
+            "dropped": self.dropped,
+        }
 
     def close(self):
         if self._closing:
@@ -1036,10 +1446,27 @@ class PubServer(tornado.tcpserver.TCPServer):
         presence_callback=None,
         remove_presence_callback=None,
         ssl=None,
+        ring=None,
+        buffer_size=0,
+        slow_subscriber=SLOW_SUBSCRIBER_DISCONNECT,
+        coalesce_size=65536,
     ):
         super().__init__(ssl_options=ssl)
         self.io_loop = io_loop
         self.opts = opts
+        self.ring = ring
+        # The bytes queued for a subscriber before the slow subscriber policy
+        # kicks in, 0 to wait for each write to finish instead
+        self.buffer_size = buffer_size
+        if slow_subscriber not in SLOW_SUBSCRIBER_POLICIES:
+            log.warning(
+                "Unknown slow subscriber policy '%s', using '%s'",
+                slow_subscriber,
+                SLOW_SUBSCRIBER_DISCONNECT,
+            )
+            slow_subscriber = SLOW_SUBSCRIBER_DISCONNECT
+        self.slow_subscriber = slow_subscriber
+        self.coalesce_size = coalesce_size
         self._closing = False
         self.clients = set()
         self.presence_events = False
@@ -1067,15 +1494,21 @@ class PubServer(tornado.tcpserver.TCPServer):
     # pylint: enable=W1701
 
     async def _stream_read(self, client):
-        unpacker = salt.utils.msgpack.Unpacker()
+        reader = salt.transport.frame.FrameReader()
         while not self._closing:
             try:
                 client._read_until_future = client.stream.read_bytes(4096, partial=True)
                 wire_bytes = await client._read_until_future
-                unpacker.feed(wire_bytes)
-                for framed_msg in unpacker:
-                    framed_msg = salt.transport.frame.decode_embedded_strs(framed_msg)
-                    body = framed_msg["body"]
+                reader.feed(wire_bytes)
+                for header, body, binary in reader:
+                    if binary or salt.transport.frame.advertised(header):
+                        client.binary = True
+                    if isinstance(body, dict) and "subscriptions" in body:
+                        self._subscribe(client, body["subscriptions"])
+                        continue
+                    if isinstance(body, dict) and body.get("doorbell"):
+                        client.doorbell = self.ring is not None
+                        continue
                     if self.presence_callback:
                         self.presence_callback(client, body)
             except tornado.iostream.StreamClosedError as e:
@@ -1090,6 +1523,16 @@ class PubServer(tornado.tcpserver.TCPServer):
                 )
                 continue
 
+    def _subscribe(self, client, subscriptions):
+        """
+        Only forward the events matching ``subscriptions`` to the client
+        """
+        if subscriptions:
+            client.tags = salt.utils.event.TagFilter(subscriptions)
+        else:
+            client.tags = None
+        log.trace("Subscriber at %s subscribed to %r", client.address, subscriptions)
+
     def handle_stream(self, stream, address):
         try:
             cert = stream.socket.getpeercert()
@@ -1105,40 +1548,165 @@ class PubServer(tornado.tcpserver.TCPServer):
         self.io_loop.spawn_callback(self._stream_read, client)
 
     # TODO: ACK the publish through IPC
+    def _ring_doorbell(self, client):
+        """
+        Wake a subscriber reading the events from the ring up, unless it still
+        has a wake up on the way
+        """
+        future = client._doorbell_future
+        if future is not None and not future.done():
+            return
+        if future is not None and future.exception() is not None:
+            raise future.exception()
+        client._doorbell_future = client.stream.write(b"\x00")
+
+    def _remove_client(self, client):
+        log.debug("Subscriber at %s has disconnected from publisher", client.address)
+        client.close()
+        self.remove_presence_callback(client)
+        self.clients.discard(client)
+
+    async def send(self, client, payload):
+        """
+        Send a payload to a subscriber. With a bounded buffer the payload is
+        queued and written in the background, the slow subscriber policy
+        applies once the buffer of the subscriber is full. Returns False if
+        the subscriber has to be disconnected.
+        """
+        if not self.buffer_size:
+            try:
+                await client.stream.write(payload)
+            except tornado.iostream.StreamClosedError:
+                return False
+            return True
+        if client.stream.closed():
+            return False
+        if client.queue and client.queued_bytes + len(payload) > self.buffer_size:
+            if not self._overflow(client, payload):
+                return False
+        client.queue.append(payload)
+        client.queued_bytes += len(payload)
+        if not client.writing:
+            client.writing = True
+            self.io_loop.spawn_callback(self._write_queue, client)
+        return True
+
+    def _overflow(self, client, payload):
+        """
+        Apply the slow subscriber policy to a subscriber with a full buffer,
+        returns False if it has to be disconnected
+        """
+        if self.slow_subscriber == SLOW_SUBSCRIBER_DISCONNECT:
+            log.warning(
+                "Disconnecting subscriber at %s, it is %d bytes behind",
+                client.address,
+                client.queued_bytes,
+            )
+            return False
+        dropped = 0
+        while client.queue and client.queued_bytes + len(payload) > self.buffer_size:
+            client.queued_bytes -= len(client.queue.popleft())
+            dropped += 1
+        client.dropped += dropped
+        if not client.lagging:
+            client.lagging = True
+            log.warning(
+                "Subscriber at %s is falling behind, dropped %d payloads",
+                client.address,
+                dropped,
+            )
+            if client.lag_callback is not None:
+                try:
+                    client.lag_callback(client)
+                except Exception:  # pylint: disable=broad-except
+                    log.error("Subscriber lag callback failed", exc_info=True)
+        return True
+
+    async def _write_queue(self, client):
+        """
+        Write the payloads queued for a subscriber, coalescing the small ones
+        """
+        try:
+            while client.queue:
+                chunk = [client.queue.popleft()]
+                size = len(chunk[0])
+                while (
+                    client.queue and size + len(client.queue[0]) <= self.coalesce_size
+                ):
+                    chunk.append(client.queue.popleft())
+                    size += len(chunk[-1])
+                client.queued_bytes -= size
+                await client.stream.write(
+                    chunk[0] if len(chunk) == 1 else b"".join(chunk)
+                )
+            # Caught up
+            client.lagging = False
+        except tornado.iostream.StreamClosedError:
+            client.queue.clear()
+            client.queued_bytes = 0
+            self._remove_client(client)
+        finally:
+            client.writing = False
+
     async def publish_payload(self, package, topic_list=None):
         log.trace(
             "TCP PubServer sending payload: topic_list=%r %r", topic_list, package
         )
-        payload = salt.transport.frame.frame_msg(package)
+        # Each framing is only built if a subscriber reads it
+        framed = {}
+
+        def frame(client):
+            binary = client.binary is True
+            if binary not in framed:
+                if binary:
+                    framed[binary] = salt.transport.frame.frame_msg_binary(
+                        package, raw_body=True
+                    )
+                else:
+                    framed[binary] = salt.transport.frame.frame_msg(package)
+            return framed[binary]
+
+        ring = self.ring is not None and not topic_list
+        if ring:
+            if isinstance(package, bytes):
+                self.ring.write(package)
+            else:
+                log.error("Unable to write a %s to the event ring", type(package))
+                self.ring.skip()
         to_remove = []
         if topic_list:
             for topic in topic_list:
                 sent = False
                 for client in list(self.clients):
                     if topic == client.id_:
-                        try:
-                            # Write the packed str
-                            await client.stream.write(payload)
+                        # Write the packed str
+                        if await self.send(client, frame(client)):
                             sent = True
-                            # self.io_loop.add_future(f, lambda f: True)
-                        except tornado.iostream.StreamClosedError:
+                        else:
                             to_remove.append(client)
                 if not sent:
                     log.debug("Publish target %s not connected %r", topic, self.clients)
         else:
+            tag = None
+            if any(client.tags is not None for client in self.clients):
+                tag = salt.utils.event.unpack_tag(package)
             for client in list(self.clients):
-                try:
-                    # Write the packed str
-                    await client.stream.write(payload)
-                except tornado.iostream.StreamClosedError:
+                if (
+                    tag is not None
+                    and client.tags is not None
+                    and not client.tags.match(tag)
+                ):
+                    continue
+                if client.doorbell and ring:
+                    try:
+                        self._ring_doorbell(client)
+                    except tornado.iostream.StreamClosedError:
+                        to_remove.append(client)
+                # Write the packed str
+                elif not await self.send(client, frame(client)):
                     to_remove.append(client)
         for client in to_remove:
-            log.debug(
-                "Subscriber at %s has disconnected from publisher", client.address
-            )
-            client.close()
-            self.remove_presence_callback(client)
-            self.clients.discard(client)
+            self._remove_client(client)
         log.trace("TCP PubServer finished publishing payload")
 
 
@@ -1328,6 +1896,9 @@ class PublishServer(salt.transport.base.DaemonizedPublishServer):
         pull_port=None,
         pull_path=None,
         ssl=None,
+        ring_path=None,
+        ring_size=0,
+        buffer_size=None,
     ):
         self.opts = opts
         self.pub_sock = None
@@ -1338,6 +1909,12 @@ class PublishServer(salt.transport.base.DaemonizedPublishServer):
         self.pull_port = pull_port
         self.pull_path = pull_path
         self.ssl = ssl
+        self.ring_path = ring_path
+        self.ring_size = ring_size
+        self.ring = None
+        if buffer_size is None:
+            buffer_size = int(opts.get("tcp_pub_buffer_size") or 0)
+        self.buffer_size = buffer_size
 
     @property
     def topic_support(self):
@@ -1355,6 +1932,9 @@ class PublishServer(salt.transport.base.DaemonizedPublishServer):
             "pull_host": self.pull_host,
             "pull_port": self.pull_port,
             "pull_path": self.pull_path,
+            "ring_path": self.ring_path,
+            "ring_size": self.ring_size,
+            "buffer_size": self.buffer_size,
         }
 
     def publish_daemon(
@@ -1395,12 +1975,24 @@ class PublishServer(salt.transport.base.DaemonizedPublishServer):
         ctx = None
         if self.ssl is not None:
             ctx = salt.transport.base.ssl_context(self.ssl, server_side=True)
+        if self.ring_path and self.ring_size:
+            # Imported here, salt.transport.shm builds on this module
+            from salt.transport.shm import RingWriter
+
+            log.debug("Publish server writing events to ring %s", self.ring_path)
+            self.ring = RingWriter(self.ring_path, self.ring_size)
         self.pub_server = pub_server = PubServer(
             self.opts,
             io_loop=io_loop,
             presence_callback=presence_callback,
             remove_presence_callback=remove_presence_callback,
             ssl=ctx,
+            ring=self.ring,
+            buffer_size=self.buffer_size,
+            slow_subscriber=self.opts.get(
+                "tcp_pub_slow_subscriber", SLOW_SUBSCRIBER_DISCONNECT
+            ),
+            coalesce_size=int(self.opts.get("tcp_pub_coalesce_size") or 0),
         )
         if self.pub_path:
             log.debug(
@@ -1488,6 +2080,9 @@ class PublishServer(salt.transport.base.DaemonizedPublishServer):
         if self.pub_sock:
             self.pub_sock.close()
             self.pub_sock = None
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
 
 
 class TCPPublishServer(PublishServer):
@@ -1717,6 +2312,8 @@ class RequestClient(salt.transport.base.RequestClient):
         self.connect_callback = _null_callback
         self.backoff = opts.get("tcp_reconnect_backoff", 1)
         self.ssl = self.opts.get("ssl", None)
+        # Set once the server told us it reads binary frames
+        self._binary = False
 
     async def getstream(self, **kwargs):
         if self.source_ip or self.source_port:
@@ -1749,6 +2346,7 @@ class RequestClient(salt.transport.base.RequestClient):
     async def connect(self):  # pylint: disable=invalid-overridden-method
         if self._stream is None:
             self._connect_called = True
+            self._binary = False
             self._stream = await self.getstream()
             if self._stream:
                 if not self._stream_return_running:
@@ -1758,15 +2356,18 @@ class RequestClient(salt.transport.base.RequestClient):
 
     async def _stream_return(self):
         self._stream_return_running = True
-        unpacker = salt.utils.msgpack.Unpacker()
+        reader = salt.transport.frame.FrameReader()
         while not self._closing:
             try:
                 wire_bytes = await self._stream.read_bytes(4096, partial=True)
-                unpacker.feed(wire_bytes)
-                for framed_msg in unpacker:
-                    framed_msg = salt.transport.frame.decode_embedded_strs(framed_msg)
-                    header = framed_msg["head"]
-                    body = framed_msg["body"]
+                reader.feed(wire_bytes)
+                for header, body, binary in reader:
+                    if (
+                        not binary
+                        and header.get("framing") == salt.transport.frame.BINARY
+                    ):
+                        # The server reads binary frames, send them from now on
+                        self._binary = True
                     message_id = header.get("mid")
 
                     if message_id in self.send_future_map:
@@ -1797,7 +2398,7 @@ class RequestClient(salt.transport.base.RequestClient):
                 self._stream = None
                 if stream:
                     stream.close()
-                unpacker = salt.utils.msgpack.Unpacker()
+                reader = salt.transport.frame.FrameReader()
                 await self.connect()
             except TypeError:
                 # This is an invalid transport
@@ -1821,7 +2422,7 @@ class RequestClient(salt.transport.base.RequestClient):
                 self._stream = None
                 if stream:
                     stream.close()
-                unpacker = salt.utils.msgpack.Unpacker()
+                reader = salt.transport.frame.FrameReader()
                 await self.connect()
         self._stream_return_running = False
 
@@ -1865,7 +2466,12 @@ class RequestClient(salt.transport.base.RequestClient):
         if timeout is not None:
             self.io_loop.call_later(timeout, self.timeout_message, message_id, load)
 
-        item = salt.transport.frame.frame_msg(load, header=header)
+        if self._binary:
+            item = salt.transport.frame.frame_msg_binary(load, header=header)
+        else:
+            item = salt.transport.frame.frame_msg(
+                load, header=salt.transport.frame.advertise(header)
+            )
 
         async def _do_send():
             await self.connect()
@@ -5,12 +5,14 @@ Zeromq transport classes
 import asyncio
 import asyncio.exceptions
 import errno
+import functools
 import hashlib
 import logging
 import os
 import signal
 import sys
 import threading
+import time
 from random import randint
 
 import tornado
@@ -25,9 +27,11 @@ import zmq.eventloop.zmqstream
 
 import salt.payload
 import salt.transport.base
+import salt.utils.admission
 import salt.utils.files
 import salt.utils.process
 import salt.utils.stringutils
+import salt.utils.worker_pools
 import salt.utils.zeromq
 from salt._compat import ipaddress
 from salt.exceptions import SaltException, SaltReqTimeoutError
@@ -428,8 +432,6 @@ class RequestServer(salt.transport.base.DaemonizedRequestServer):
             self.clients.setsockopt(zmq.IPV4ONLY, 0)
         self.clients.setsockopt(zmq.BACKLOG, self.opts.get("zmq_backlog", 1000))
         self._start_zmq_monitor()
-        self.workers = context.socket(zmq.DEALER)
-        self.workers.setsockopt(zmq.LINGER, -1)
 
         if self.opts["mworker_queue_niceness"] and not salt.utils.platform.is_windows():
             log.info(
@@ -438,28 +440,41 @@ class RequestServer(salt.transport.base.DaemonizedRequestServer):
             )
             os.nice(self.opts["mworker_queue_niceness"])
 
-        if self.opts.get("ipc_mode", "") == "tcp":
-            self.w_uri = "tcp://127.0.0.1:{}".format(
-                self.opts.get("tcp_master_workers", 4515)
-            )
-        else:
-            self.w_uri = "ipc://{}".format(
-                os.path.join(self.opts["sock_dir"], "workers.ipc")
-            )
-
         log.info("Setting up the master communication server")
         log.info("ReqServer clients %s", self.uri)
         self.clients.bind(self.uri)
-        log.info("ReqServer workers %s", self.w_uri)
-        self.workers.bind(self.w_uri)
-        if self.opts.get("ipc_mode", "") != "tcp":
-            os.chmod(os.path.join(self.opts["sock_dir"], "workers.ipc"), 0o600)
 
+        # One socket for the workers of each pool, the default pool uses the
+        # workers.ipc socket
+        self.pools = {}
+        pools = [salt.utils.worker_pools.DEFAULT_POOL]
+        if salt.utils.worker_pools.enabled(self.opts):
+            pools = list(salt.utils.worker_pools.pools(self.opts))
+        for pool in pools:
+            workers = context.socket(zmq.DEALER)
+            workers.setsockopt(zmq.LINGER, -1)
+            w_uri = salt.utils.worker_pools.worker_uri(self.opts, pool)
+            log.info("ReqServer workers %s", w_uri)
+            workers.bind(w_uri)
+            if self.opts.get("ipc_mode", "") != "tcp":
+                os.chmod(
+                    salt.utils.worker_pools.worker_ipc_path(self.opts, pool), 0o600
+                )
+            self.pools[pool] = workers
+        self.workers = self.pools[salt.utils.worker_pools.DEFAULT_POOL]
+        self.w_uri = salt.utils.worker_pools.worker_uri(self.opts)
+
+        if salt.utils.admission.enabled(self.opts) or len(self.pools) > 1:
+            device = self._queue_device
+        else:
+            device = functools.partial(
+                zmq.device, zmq.QUEUE, self.clients, self.workers
+            )
         while True:
             if self.clients.closed or self.workers.closed:
                 break
             try:
-                zmq.device(zmq.QUEUE, self.clients, self.workers)
+                device()
             except zmq.ZMQError as exc:
                 if exc.errno == errno.EINTR:
                     continue
@@ -468,6 +483,106 @@ class RequestServer(salt.transport.base.DaemonizedRequestServer):
                 break
         context.term()
 
+    def _setup_queue_device(self):
+        self.admission = None
+        if salt.utils.admission.enabled(self.opts):
+            max_inflight = sum(
+                settings["worker_threads"]
+                for settings in salt.utils.worker_pools.pools(self.opts).values()
+            )
+            self.admission = salt.utils.admission.AdmissionQueue(
+                salt.utils.admission.classes(self.opts), max_inflight
+            )
+        self.router = None
+        if len(self.pools) > 1:
+            self.router = salt.utils.worker_pools.Router(self.opts)
+        self.pool_stats = salt.utils.worker_pools.get_stats()
+        self.tracker = salt.utils.admission.Tracker(self._replied)
+        self._next_expire = time.monotonic() + self.tracker.stale_after / 2
+
+    def _expire(self):
+        """
+        Give up on the requests lost with a worker, on a timer so it happens
+        however busy the device is. Their class would never get its slots
+        back otherwise.
+        """
+        now = time.monotonic()
+        if now >= self._next_expire:
+            self.tracker.expire()
+            self._next_expire = now + self.tracker.stale_after / 2
+
+    def _replied(self, key, elapsed):
+        name, pool = key
+        if name is not None:
+            self.admission.done(name, elapsed)
+        if self.pool_stats is not None:
+            self.pool_stats.replied(pool, elapsed)
+
+    def _dispatch(self, name, pool, msg):
+        request_id = self.tracker.dispatched((name, pool))
+        if self.pool_stats is not None:
+            self.pool_stats.dispatched(pool)
+        # The REP socket of the worker sends the id back with the reply, as
+        # part of the envelope
+        self.pools[pool].send_multipart([request_id] + msg)
+
+    def _queue_device(self):
+        """
+        Queue device which hands the requests to the worker pools, by
+        request class when admission control is enabled, see
+        :py:mod:`salt.utils.admission` and :py:mod:`salt.utils.worker_pools`
+        """
+        if not hasattr(self, "tracker"):
+            self._setup_queue_device()
+        admission = self.admission
+        poller = zmq.Poller()
+        poller.register(self.clients, zmq.POLLIN)
+        for workers in self.pools.values():
+            poller.register(workers, zmq.POLLIN)
+        while True:
+            socks = dict(poller.poll(1000))
+            for workers in self.pools.values():
+                if workers in socks:
+                    msg = workers.recv_multipart()
+                    self.tracker.replied(msg[0])
+                    self.clients.send_multipart(msg[1:])
+            if self.clients in socks:
+                msg = self.clients.recv_multipart()
+                # Only the envelope, the workers decode the request. A bad
+                # request goes to the default pool and class, where the
+                # worker answers it.
+                payload = salt.utils.admission.peek(msg[-1])
+                pool = salt.utils.worker_pools.DEFAULT_POOL
+                if self.router is not None:
+                    pool = self.router.route(payload)
+                if admission is None:
+                    self._dispatch(None, pool, msg)
+                else:
+                    name = admission.classify(payload)
+                    if not admission.put(name, (pool, msg)):
+                        self._turn_away(admission, name, msg)
+            self._expire()
+            while admission is not None:
+                item = admission.pop()
+                if item is None:
+                    break
+                name, (pool, msg) = item
+                self._dispatch(name, pool, msg)
+
+    def _turn_away(self, admission, name, msg):
+        """
+        Answer a request which did not fit in the queue of its class
+        """
+        if name != "auth":
+            # Only sign in requests are sent in the clear, the client of any
+            # other request would not be able to read the hint
+            log.warning("Dropping request, the %s request queue is full", name)
+            return
+        retry_after = admission.retry_after(name)
+        log.debug("Sign in queue is full, retry after %s seconds", retry_after)
+        reply = salt.payload.dumps(salt.utils.admission.retry_reply(retry_after))
+        self.clients.send_multipart(msg[:-1] + [reply])
+
     def close(self):
         """
         Cleanly shutdown the router socket
@@ -487,6 +602,9 @@ class RequestServer(salt.transport.base.DaemonizedRequestServer):
             self.clients.close()
         if hasattr(self, "workers") and self.workers.closed is False:
             self.workers.close()
+        for workers in getattr(self, "pools", {}).values():
+            if workers.closed is False:
+                workers.close()
         if hasattr(self, "stream"):
             self.stream.close()
         if hasattr(self, "_socket") and self._socket.closed is False:
@@ -537,20 +655,14 @@ class RequestServer(salt.transport.base.DaemonizedRequestServer):
         self._socket.setsockopt(zmq.LINGER, -1)
         self._start_zmq_monitor()
 
-        if self.opts.get("ipc_mode", "") == "tcp":
-            self.w_uri = "tcp://127.0.0.1:{}".format(
-                self.opts.get("tcp_master_workers", 4515)
-            )
-        else:
-            self.w_uri = "ipc://{}".format(
-                os.path.join(self.opts["sock_dir"], "workers.ipc")
-            )
+        # The pool of the MWorker is set by the MWorker itself
+        pool = self.opts.get("worker_pool")
+        self.w_uri = salt.utils.worker_pools.worker_uri(self.opts, pool)
         log.info("Worker binding to socket %s", self.w_uri)
         self._socket.connect(self.w_uri)
-        if self.opts.get("ipc_mode", "") != "tcp" and os.path.isfile(
-            os.path.join(self.opts["sock_dir"], "workers.ipc")
-        ):
-            os.chmod(os.path.join(self.opts["sock_dir"], "workers.ipc"), 0o600)
+        ipc_path = salt.utils.worker_pools.worker_ipc_path(self.opts, pool)
+        if self.opts.get("ipc_mode", "") != "tcp" and os.path.isfile(ipc_path):
+            os.chmod(ipc_path, 0o600)
         self.message_handler = message_handler
 
         async def callback():
@@ -0,0 +1,354 @@
+"""
+    salt.utils.admission
+    --------------------
+
+    Admission control for the master request server, used when
+    ``request_admission`` is enabled.
+
+    Requests are classified by command before they reach the MWorkers. Each
+    class has its own queue, a limit on the number of requests handed to the
+    workers at the same time and a priority: when a worker is free the oldest
+    request of the highest priority class which is below its limit is
+    dispatched. A class with a bounded queue turns requests away with a
+    retry-after hint once the queue is full, which ``AsyncAuth`` honours
+    before signing in again.
+
+    The command of the requests sent in the clear is read from their load.
+    The other requests of the minions are encrypted with the AES session
+    key, the minions name their command in the envelope. The requests of
+    older minions which do not name it fall in the ``default`` class.
+"""
+
+import collections
+import itertools
+import logging
+import math
+import struct
+import time
+
+import salt.payload
+import salt.utils.msgpack
+
+log = logging.getLogger(__name__)
+
+# The request classes and their settings, merged with the
+# ``request_classes`` option
+DEFAULT_CLASSES = {
+    "auth": {
+        "commands": ["_auth"],
+        "priority": 0,
+        "max_inflight": 2,
+        "max_queue": 1000,
+        "retry_after": 5,
+    },
+    "returns": {
+        "commands": ["_return", "_syndic_return"],
+        "priority": 20,
+        "max_inflight": 0,
+        "max_queue": 0,
+        "retry_after": 0,
+    },
+    "pillar": {
+        "commands": ["_pillar"],
+        "priority": 5,
+        "max_inflight": 0,
+        "max_queue": 0,
+        "retry_after": 0,
+    },
+    "files": {
+        "commands": [
+            "_serve_file",
+            "_file_hash",
+            "_file_hash_and_stat",
+            "_file_list",
+            "_file_list_emptydirs",
+            "_dir_list",
+            "_symlink_list",
+            "_file_envs",
+            "_file_recv",
+        ],
+        "priority": 5,
+        "max_inflight": 0,
+        "max_queue": 0,
+        "retry_after": 0,
+    },
+    "default": {
+        "commands": [],
+        "priority": 10,
+        "max_inflight": 0,
+        "max_queue": 0,
+        "retry_after": 0,
+    },
+}
+
+# The class of the requests for the commands no class handles
+DEFAULT_CLASS = "default"
+
+# The settings of the classes added with the ``request_classes`` option
+NEW_CLASS = {
+    "commands": [],
+    "priority": 10,
+    "max_inflight": 0,
+    "max_queue": 0,
+    "retry_after": 0,
+}
+
+# The largest retry-after hint sent to the minions
+MAX_RETRY_AFTER = 300
+
+# The id the request server gives the requests it hands to the workers
+REQUEST_ID = struct.Struct(">Q")
+
+# The weight of the latest request in the average handling time of a class
+EWMA_WEIGHT = 0.1
+
+
+def enabled(opts):
+    """
+    Return True if the request server queues the requests by class
+    """
+    return bool(opts.get("request_admission", False))
+
+
+def classes(opts):
+    """
+    Return the request classes, the settings in ``request_classes`` override
+    the defaults
+    """
+    ret = {name: dict(settings) for name, settings in DEFAULT_CLASSES.items()}
+    for name, settings in (opts.get("request_classes") or {}).items():
+        settings = settings or {}
+        if name not in ret:
+            if not settings.get("commands"):
+                log.warning(
+                    "Ignoring request class '%s', it does not list any commands",
+                    name,
+                )
+                continue
+            ret[name] = dict(NEW_CLASS)
+        ret[name].update(settings)
+    return ret
+
+
+def commands(classes):
+    """
+    Return the class of each command, the first class listing a command gets
+    it
+    """
+    ret = {}
+    for name, settings in classes.items():
+        for cmd in settings.get("commands") or ():
+            ret.setdefault(cmd, name)
+    return ret
+
+
+def command(payload):
+    """
+    Return the command of a decoded request, or None
+    """
+    if not isinstance(payload, dict):
+        return None
+    if payload.get("enc") == "clear":
+        load = payload.get("load")
+        if isinstance(load, dict):
+            return load.get("cmd")
+        return None
+    # Named by the client, the load is encrypted
+    return payload.get("cmd")
+
+
+def classify(payload, by_command=None):
+    """
+    Return the class of a request, ``payload`` is either the decoded request
+    or the serialized one. ``by_command`` maps the commands to their class,
+    see :py:func:`commands`, the default classes are used if it is None.
+    """
+    if by_command is None:
+        by_command = commands(DEFAULT_CLASSES)
+    if isinstance(payload, bytes):
+        payload = peek(payload)
+    return by_command.get(command(payload), DEFAULT_CLASS)
+
+
+def peek(data):
+    """
+    Return the parts of a serialized request the request server reads to
+    pick its class and worker pool, without decoding the load of the AES
+    requests. Falls back to decoding the whole request when it does not have
+    the usual layout, None if it is not a valid request.
+    """
+    try:
+        unpacker = salt.utils.msgpack.Unpacker(raw=False)
+        unpacker.feed(data)
+        envelope = {}
+        for _ in range(unpacker.read_map_header()):
+            key = unpacker.unpack()
+            if key in ("enc", "cmd"):
+                envelope[key] = unpacker.unpack()
+            elif key == "load" and envelope.get("enc") == "clear":
+                # The clear loads are small, the sign ins and the commands
+                # of the salt CLI
+                load = unpacker.unpack()
+                if isinstance(load, dict):
+                    envelope["load"] = {"cmd": load.get("cmd")}
+            elif key == "load" and "enc" in envelope:
+                unpacker.skip()
+            elif key == "load":
+                raise ValueError("The load comes before the encryption")
+            else:
+                unpacker.skip()
+        return envelope
+    except Exception:  # pylint: disable=broad-except
+        pass
+    try:
+        return salt.payload.loads(data)
+    except Exception:  # pylint: disable=broad-except
+        return None
+
+
+def retry_reply(retry_after):
+    """
+    Return the reply telling a client to send its request again after
+    ``retry_after`` seconds
+    """
+    return {"enc": "clear", "load": {"retry_after": retry_after}}
+
+
+def retry_after(reply):
+    """
+    Return the retry-after hint of a reply, or None. The hint is capped to
+    ``MAX_RETRY_AFTER``, a bad or hostile master can not hold the minion off
+    any longer.
+    """
+    if not isinstance(reply, dict) or reply.get("enc") != "clear":
+        return None
+    load = reply.get("load")
+    if not isinstance(load, dict) or "retry_after" not in load:
+        return None
+    hint = load["retry_after"]
+    if isinstance(hint, bool) or not isinstance(hint, (int, float)) or math.isnan(hint):
+        log.warning("Ignoring invalid retry-after hint %r", hint)
+        return None
+    return min(max(hint, 0), MAX_RETRY_AFTER)
+
+
+class AdmissionQueue:
+    """
+    Per class queues of requests, dispatched by priority within the
+    concurrency limits of the classes and of the request server.
+
+    :param dict classes: The request classes, see :py:func:`classes`
+    :param int max_inflight: The number of requests the workers handle at
+        the same time, 0 for no limit
+    """
+
+    def __init__(self, classes, max_inflight=0):
+        self.classes = classes
+        self.commands = commands(classes)
+        self.max_inflight = max_inflight
+        self.queues = {name: collections.deque() for name in classes}
+        self.inflight = dict.fromkeys(classes, 0)
+        self.latency = dict.fromkeys(classes, 0.0)
+        # Highest priority first
+        self.order = sorted(classes, key=lambda name: -classes[name]["priority"])
+
+    def classify(self, payload):
+        """
+        Return the class of a request, see :py:func:`classify`
+        """
+        return classify(payload, self.commands)
+
+    def put(self, name, item):
+        """
+        Queue a request, returns False if the queue of its class is full
+        """
+        max_queue = self.classes[name]["max_queue"]
+        if max_queue and len(self.queues[name]) >= max_queue:
+            return False
+        self.queues[name].append(item)
+        return True
+
+    def pop(self):
+        """
+        Return the next request to hand to the workers as a ``(class,
+        request)`` tuple, or None if none can be dispatched right now
+        """
+        if self.max_inflight and sum(self.inflight.values()) >= self.max_inflight:
+            return None
+        for name in self.order:
+            if not self.queues[name]:
+                continue
+            max_inflight = self.classes[name]["max_inflight"]
+            if max_inflight and self.inflight[name] >= max_inflight:
+                continue
+            self.inflight[name] += 1
+            return name, self.queues[name].popleft()
+        return None
+
+    def done(self, name, elapsed=None):
+        """
+        A request of class ``name`` was handled in ``elapsed`` seconds
+        """
+        self.inflight[name] = max(self.inflight[name] - 1, 0)
+        if elapsed is not None:
+            if self.latency[name]:
+                self.latency[name] += EWMA_WEIGHT * (elapsed - self.latency[name])
+            else:
+                self.latency[name] = elapsed
+
+    def retry_after(self, name):
+        """
+        Return how many seconds a client turned away should wait, the time
+        it takes to work through the queue of the class at the current pace
+        """
+        settings = self.classes[name]
+        workers = settings["max_inflight"] or self.max_inflight or 1
+        drain = len(self.queues[name]) * self.latency[name] / workers
+        return int(min(max(settings["retry_after"], drain), MAX_RETRY_AFTER))
+
+
+class Tracker:
+    """
+    Keeps track of the requests handed to the workers, for request servers
+    which only see the replies come back. Each request gets an id, which the
+    workers send back along with the reply.
+
+    :param callable done: Called with the key given to :py:meth:`dispatched`
+        and the time it took to get a reply, None if it never came
+    """
+
+    def __init__(self, done, stale_after=60):
+        self.done = done
+        self.stale_after = stale_after
+        # request id -> (key, dispatch time), oldest first
+        self.pending = {}
+        self._ids = itertools.count()
+
+    def dispatched(self, key):
+        """
+        Track a request handed to the workers, returns its id
+        """
+        request_id = REQUEST_ID.pack(next(self._ids) & 0xFFFFFFFFFFFFFFFF)
+        self.pending[request_id] = (key, time.monotonic())
+        return request_id
+
+    def replied(self, request_id):
+        try:
+            key, start = self.pending.pop(request_id)
+        except KeyError:
+            return
+        self.done(key, time.monotonic() - start)
+
+    def expire(self):
+        """
+        Give up on requests which never got a reply, a worker might have
+        died handling them
+        """
+        deadline = time.monotonic() - self.stale_after
+        while self.pending:
+            request_id = next(iter(self.pending))
+            key, start = self.pending[request_id]
+            if start >= deadline:
+                break
+            del self.pending[request_id]
+            self.done(key, None)
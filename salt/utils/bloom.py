@@ -0,0 +1,98 @@
+"""
+    salt.utils.bloom
+    ----------------
+
+    A Bloom filter: a compact set which tells for sure an item is not in it,
+    and that it probably is otherwise. The master attaches one of the minions
+    a publish targets to the publish, so the other minions skip it without
+    decrypting it.
+
+    The filter is serialized as the number of hash functions on one byte
+    followed by the bits, so it is read back without knowing how it was
+    sized.
+"""
+
+import hashlib
+import math
+
+import salt.utils.stringutils
+
+# The rate of false positives the filters are sized for
+ERROR_RATE = 0.01
+
+# The most hash functions of a filter
+MAX_HASHES = 16
+
+
+class BloomFilter:
+    """
+    :param int size: The number of bits of the filter, a multiple of 8
+    :param int hashes: The number of hash functions
+    :param bytes bits: The bits of the filter, all unset by default
+    """
+
+    def __init__(self, size, hashes, bits=None):
+        if size <= 0 or size % 8:
+            raise ValueError("The size of a Bloom filter is a multiple of 8 bits")
+        if not 0 < hashes <= MAX_HASHES:
+            raise ValueError(f"A Bloom filter has 1 to {MAX_HASHES} hash functions")
+        self.size = size
+        self.hashes = hashes
+        if bits is None:
+            self.bits = bytearray(size // 8)
+        elif len(bits) * 8 != size:
+            raise ValueError("The bits do not match the size of the Bloom filter")
+        else:
+            self.bits = bytearray(bits)
+
+    @classmethod
+    def from_items(cls, items, error_rate=ERROR_RATE):
+        """
+        Return a filter of the items, sized for ``error_rate`` false
+        positives
+        """
+        items = list(items)
+        count = max(len(items), 1)
+        size = math.ceil(-count * math.log(error_rate) / math.log(2) ** 2)
+        size = max(8, (size + 7) // 8 * 8)
+        hashes = min(max(round(size / count * math.log(2)), 1), MAX_HASHES)
+        ret = cls(size, hashes)
+        for item in items:
+            ret.add(item)
+        return ret
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(
+            salt.utils.stringutils.to_bytes(item), digest_size=16
+        ).digest()
+        first = int.from_bytes(digest[:8], "big")
+        # Odd, so the positions do not cycle early
+        second = int.from_bytes(digest[8:], "big") | 1
+        for index in range(self.hashes):
+            yield (first + index * second) % self.size
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item):
+        return all(
+            self.bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(item)
+        )
+
+    def dumps(self):
+        """
+        Return the serialized filter
+        """
+        return bytes([self.hashes]) + bytes(self.bits)
+
+    @classmethod
+    def loads(cls, data):
+        """
+        Return the filter serialized by :py:meth:`dumps`
+        """
+        data = salt.utils.stringutils.to_bytes(data)
+        if len(data) < 2:
+            raise ValueError("Truncated Bloom filter")
+        return cls((len(data) - 1) * 8, data[0], data[1:])
@@ -33,6 +33,7 @@ import salt.utils.crypt
 import salt.utils.data
 import salt.utils.event
 import salt.utils.files
+import salt.utils.key_store
 import salt.utils.msgpack
 import salt.utils.path
 import salt.utils.platform
@@ -264,7 +265,16 @@ def gen_keys(keysize=2048):
     return priv, pub
 
 
-def accept_key(pki_dir, pub, id_):
+def get_key_store(pki_dir, opts=None):
+    """
+    Return the key store of the master the minion keys in ``pki_dir`` are
+    managed with, the key directories unless ``opts`` configures another
+    ``key_store``
+    """
+    return salt.utils.key_store.factory(dict(opts or {}, pki_dir=pki_dir))
+
+
+def accept_key(pki_dir, pub, id_, opts=None):
     """
     If the master config was available then we will have a pki_dir key in
     the opts directory, this method places the pub key in the accepted
@@ -275,35 +285,31 @@ def accept_key(pki_dir, pub, id_):
         if not os.path.exists(key_path):
             os.makedirs(key_path)
 
-    key = os.path.join(pki_dir, "minions", id_)
-    with salt.utils.files.fopen(key, "w+") as fp_:
-        fp_.write(salt.utils.stringutils.to_str(pub))
-
-    oldkey = os.path.join(pki_dir, "minions_pre", id_)
-    if os.path.isfile(oldkey):
-        with salt.utils.files.fopen(oldkey) as fp_:
-            if fp_.read() == pub:
-                os.remove(oldkey)
+    store = get_key_store(pki_dir, opts)
+    pub = salt.utils.stringutils.to_str(pub)
+    store.put(salt.utils.key_store.ACC, id_, pub)
+    if store.get(salt.utils.key_store.PEND, id_) == pub:
+        store.delete({salt.utils.key_store.PEND: [id_]})
 
 
-def remove_key(pki_dir, id_):
+def remove_key(pki_dir, id_, opts=None):
     """
     This method removes a specified key from the accepted keys dir
     """
-    key = os.path.join(pki_dir, "minions", id_)
-    if os.path.isfile(key):
-        os.remove(key)
-        log.debug("Deleted '%s'", key)
+    store = get_key_store(pki_dir, opts)
+    if store.delete({salt.utils.key_store.ACC: [id_]}):
+        log.debug("Deleted the key of '%s'", id_)
 
 
-def rename_key(pki_dir, id_, new_id):
+def rename_key(pki_dir, id_, new_id, opts=None):
     """
     Rename a key, when an instance has also been renamed
     """
-    oldkey = os.path.join(pki_dir, "minions", id_)
-    newkey = os.path.join(pki_dir, "minions", new_id)
-    if os.path.isfile(oldkey):
-        os.rename(oldkey, newkey)
+    store = get_key_store(pki_dir, opts)
+    pub = store.get(salt.utils.key_store.ACC, id_)
+    if pub is not None:
+        store.put(salt.utils.key_store.ACC, new_id, pub)
+        store.delete({salt.utils.key_store.ACC: [id_]})
 
 
 def minion_config(opts, vm_):
@@ -469,7 +475,7 @@ def bootstrap(vm_, opts=None):
         if "append_domain" in vm_:
             key_id = ".".join([key_id, vm_["append_domain"]])
 
-        accept_key(opts["pki_dir"], vm_["pub_key"], key_id)
+        accept_key(opts["pki_dir"], vm_["pub_key"], key_id, opts=opts)
 
     if "os" not in vm_:
         vm_["os"] = salt.config.get_cloud_config_value("script", vm_, opts)
@@ -0,0 +1,196 @@
+"""
+    salt.utils.compression
+    ----------------------
+
+    Compression of the payloads of the request and publish channels, applied
+    before they are encrypted, configured with ``compression``.
+
+    The algorithm is negotiated when a minion signs in: the minion offers the
+    algorithms of its ``compression`` option and the master picks the first
+    one of its own the minion offered. The minion then compresses its
+    requests with it and names it in the envelope of each request, which
+    tells the master it can compress the reply. Peers which do not support
+    compression neither offer nor name an algorithm, so they only get plain
+    payloads.
+
+    A compressed payload starts with a byte msgpack never uses, so it is told
+    apart from a plain one without being told.
+
+    A payload is never decompressed past ``compression_max_size`` bytes, so a
+    peer can not exhaust the memory of the other with a small payload.
+"""
+
+import functools
+import logging
+import time
+import zlib
+
+try:
+    import zstandard
+
+    HAS_ZSTD = True
+except ImportError:
+    HAS_ZSTD = False
+
+log = logging.getLogger(__name__)
+
+# The first byte of a compressed payload, never the first byte of msgpack
+MARKER = b"\xc1"
+
+# The byte following the marker for each algorithm
+ZSTD = "zstd"
+ZLIB = "zlib"
+IDS = {ZSTD: b"\x01", ZLIB: b"\x02"}
+NAMES = {ident: name for name, ident in IDS.items()}
+
+# The default most bytes a payload is decompressed to
+MAX_SIZE = 100 * 1024 * 1024
+
+
+def available():
+    """
+    Return the algorithms this host supports
+    """
+    ret = [ZLIB]
+    if HAS_ZSTD:
+        ret.insert(0, ZSTD)
+    return ret
+
+
+def algorithms(opts):
+    """
+    Return the configured algorithms this host supports, in order of
+    preference
+    """
+    configured = opts.get("compression") or []
+    if isinstance(configured, str):
+        configured = [configured]
+    ret = []
+    for name in configured:
+        if name in available():
+            ret.append(name)
+        elif name in IDS:
+            log.debug("Compression algorithm '%s' is not available", name)
+        else:
+            log.warning("Ignoring unknown compression algorithm '%s'", name)
+    return ret
+
+
+def negotiate(opts, offered):
+    """
+    Return the first configured algorithm the peer offered, or None
+    """
+    if not isinstance(offered, (list, tuple)):
+        return None
+    for name in algorithms(opts):
+        if name in offered:
+            return name
+    return None
+
+
+def _compress(algorithm, data, level):
+    if algorithm == ZSTD:
+        if level is None:
+            return zstandard.ZstdCompressor().compress(data)
+        return zstandard.ZstdCompressor(level=level).compress(data)
+    return zlib.compress(data, -1 if level is None else level)
+
+
+def _decompress_zlib(data, max_size):
+    decompressor = zlib.decompressobj()
+    ret = decompressor.decompress(data, max_size)
+    if not decompressor.eof:
+        # Truncated, or more than max_size bytes
+        raise ValueError(f"The payload does not decompress to at most {max_size} bytes")
+    return ret
+
+
+def _decompress_zstd(data, max_size):
+    # The size in the frame header is trusted by the decompressor
+    if zstandard.frame_content_size(data) > max_size:
+        raise ValueError(f"The payload does not decompress to at most {max_size} bytes")
+    try:
+        return zstandard.ZstdDecompressor().decompress(data, max_output_size=max_size)
+    except zstandard.ZstdError as exc:
+        raise ValueError(f"Unable to decompress the payload: {exc}")
+
+
+def decompress(data, max_size=MAX_SIZE):
+    """
+    Return the payload, decompressed if it was compressed
+
+    :raises ValueError: If the payload decompresses to more than
+        ``max_size`` bytes
+    """
+    if data[:1] != MARKER:
+        return data
+    algorithm = NAMES.get(data[1:2])
+    if algorithm == ZLIB:
+        return _decompress_zlib(data[2:], max_size)
+    if algorithm == ZSTD and HAS_ZSTD:
+        return _decompress_zstd(data[2:], max_size)
+    raise ValueError("Unsupported compression of the payload")
+
+
+class Compressor:
+    """
+    Compresses the payloads of a channel and keeps count of the bytes and
+    time it took, so the savings of each channel can be measured.
+
+    :param dict opts: The master or minion options
+    """
+
+    def __init__(self, opts):
+        self.algorithms = algorithms(opts)
+        self.level = opts.get("compression_level")
+        self.threshold = int(opts.get("compression_threshold") or 0)
+        self.max_size = int(opts.get("compression_max_size") or MAX_SIZE)
+        self.stats = {
+            "compressed": 0,
+            "uncompressed": 0,
+            "bytes_in": 0,
+            "bytes_out": 0,
+            "compress_time": 0.0,
+            "decompressed": 0,
+            "decompress_time": 0.0,
+        }
+
+    def using(self, algorithm):
+        """
+        Return a function compressing payloads with ``algorithm``, or None if
+        it is not one of the configured algorithms
+        """
+        if algorithm not in self.algorithms:
+            return None
+        return functools.partial(self.compress, algorithm=algorithm)
+
+    def compress(self, data, algorithm):
+        """
+        Return the compressed payload, or the payload as is if it is smaller
+        than the threshold or does not compress
+        """
+        if len(data) < self.threshold:
+            self.stats["uncompressed"] += 1
+            return data
+        start = time.perf_counter()
+        packed = _compress(algorithm, data, self.level)
+        self.stats["compress_time"] += time.perf_counter() - start
+        if len(packed) + 2 >= len(data):
+            self.stats["uncompressed"] += 1
+            return data
+        self.stats["compressed"] += 1
+        self.stats["bytes_in"] += len(data)
+        self.stats["bytes_out"] += len(packed) + 2
+        return MARKER + IDS[algorithm] + packed
+
+    def decompress(self, data):
+        """
+        Return the payload, decompressed if it was compressed
+        """
+        if data[:1] != MARKER:
+            return data
+        start = time.perf_counter()
+        ret = decompress(data, self.max_size)
+        self.stats["decompress_time"] += time.perf_counter() - start
+        self.stats["decompressed"] += 1
+        return ret
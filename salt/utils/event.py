@@ -51,13 +51,16 @@ Namespaced tag
 
 import asyncio
 import atexit
+import collections
 import contextlib
 import datetime
 import errno
 import fnmatch
 import hashlib
+import itertools
 import logging
 import os
+import re
 import time
 from collections.abc import MutableMapping
 
@@ -71,6 +74,7 @@ import salt.payload
 import salt.utils.asynchronous
 import salt.utils.cache
 import salt.utils.dicttrim
+import salt.utils.event_return
 import salt.utils.files
 import salt.utils.platform
 import salt.utils.process
@@ -113,6 +117,7 @@ def get_event(
     io_loop=None,
     keep_loop=False,
     raise_errors=False,
+    filter_events=False,
 ):
     """
     Return an event object suitable for the named transport
@@ -121,6 +126,9 @@ def get_event(
                            operation for obtaining events. Eg use of
                            set_event_handler() API. Otherwise, operation
                            will be synchronous.
+    :param Bool filter_events: Have the publisher only send the events
+                               matching the subscribed tags, see
+                               SaltEvent.subscribe()
     """
     sock_dir = sock_dir or opts["sock_dir"]
     # TODO: AIO core is separate from transport
@@ -132,6 +140,7 @@ def get_event(
             io_loop=io_loop,
             keep_loop=keep_loop,
             raise_errors=raise_errors,
+            filter_events=filter_events,
         )
     return SaltEvent(
         node,
@@ -141,6 +150,7 @@ def get_event(
         io_loop=io_loop,
         keep_loop=keep_loop,
         raise_errors=raise_errors,
+        filter_events=filter_events,
     )
 
 
@@ -199,6 +209,335 @@ def tagify(suffix="", prefix="", base=SALT):
     return TAGPARTER.join([part for part in parts if part])
 
 
+def unpack_tag(raw):
+    """
+    Return the tag of a packed event without loading its data, or None if
+    ``raw`` is not a packed event
+    """
+    if not isinstance(raw, bytes):
+        return None
+    mtag, sep, _ = raw.partition(salt.utils.stringutils.to_bytes(TAGEND))
+    if not sep:
+        return None
+    try:
+        return mtag.decode()
+    except UnicodeDecodeError:
+        return None
+
+
+def _load_data(mdata):
+    try:
+        return salt.payload.loads(mdata, encoding="utf-8")
+    except SaltDeserializationError:
+        log.warning(
+            "SaltDeserializationError on unpacking data, the payload could be incomplete"
+        )
+        raise
+
+
+class LazyEventData(MutableMapping):
+    """
+    The data of a packed event, only deserialized the first time it is
+    accessed. Returned by ``SaltEvent.unpack(raw, lazy=True)`` so the tag of
+    an event can be checked without paying for the decoding of its data.
+
+    Code which needs an actual dict, to serialize it again for instance, calls
+    :py:meth:`load`.
+    """
+
+    __slots__ = ("_raw", "_data")
+
+    def __init__(self, raw):
+        self._raw = raw
+        self._data = None
+
+    @property
+    def loaded(self):
+        """
+        True once the data was deserialized
+        """
+        return self._data is not None
+
+    def load(self):
+        """
+        Deserialize the data if needed and return it as a dict
+        """
+        if self._data is None:
+            self._data = _load_data(self._raw)
+            self._raw = None
+        return self._data
+
+    def __getitem__(self, key):
+        return self.load()[key]
+
+    def __setitem__(self, key, value):
+        self.load()[key] = value
+
+    def __delitem__(self, key):
+        del self.load()[key]
+
+    def __iter__(self):
+        return iter(self.load())
+
+    def __len__(self):
+        return len(self.load())
+
+    def __repr__(self):
+        if self._data is None:
+            return f"<{self.__class__.__name__} of {len(self._raw)} bytes>"
+        return repr(self._data)
+
+
+class TagFilter:
+    """
+    Match event tags against the subscriptions a listener registered with the
+    event publisher, a list of ``[tag, match_type]`` pairs using the match
+    types of :py:meth:`SaltEvent.get_event`
+    """
+
+    def __init__(self, subscriptions):
+        self.everything = False
+        prefixes = []
+        suffixes = []
+        self.substrings = []
+        self.regexes = []
+        self.patterns = []
+        for tag, match_type in subscriptions:
+            if match_type == "startswith":
+                prefixes.append(tag)
+            elif match_type == "endswith":
+                suffixes.append(tag)
+            elif match_type == "find":
+                self.substrings.append(tag)
+            elif match_type == "regex":
+                try:
+                    self.regexes.append(re.compile("^" + tag))
+                except re.error:
+                    self.everything = True
+            elif match_type == "fnmatch":
+                self.patterns.append(re.compile(fnmatch.translate(tag)))
+            else:
+                # Not something we know how to filter on
+                self.everything = True
+        self.prefixes = tuple(prefixes)
+        self.suffixes = tuple(suffixes)
+        if "" in prefixes or "" in suffixes or "" in self.substrings:
+            self.everything = True
+
+    def match(self, tag):
+        """
+        Return True if the listener wants events with this tag
+        """
+        if self.everything:
+            return True
+        if self.prefixes and tag.startswith(self.prefixes):
+            return True
+        if self.suffixes and tag.endswith(self.suffixes):
+            return True
+        for substring in self.substrings:
+            if substring in tag:
+                return True
+        for regex in self.regexes:
+            if regex.search(tag):
+                return True
+        for pattern in self.patterns:
+            if pattern.match(tag):
+                return True
+        return False
+
+
+class _TagNode:
+    """
+    A node of the tag trie of :py:class:`PendingEvents`, ``tag`` is set when
+    events with the tag ending at this node are cached
+    """
+
+    __slots__ = ("children", "tag")
+
+    def __init__(self):
+        self.children = {}
+        self.tag = None
+
+
+class PendingEvents:
+    """
+    The events received for subscribed tags which were not asked for yet, in
+    the order they were received.
+
+    Each event is indexed by the subscriptions it matched when it came in, and
+    by its tag in a trie keyed on the ``/`` separated parts of the tags. The
+    oldest event for a subscription is found without going through the other
+    events, the oldest one starting with a tag only goes through the tags
+    below it. Other lookups go through the events in order.
+
+    :param int max_events: The number of events to keep, the oldest ones are
+        dropped past it. 0 for no limit.
+    """
+
+    def __init__(self, max_events=0):
+        self.max_events = max_events
+        self.events = collections.OrderedDict()
+        # (tag, match_func) -> event sequence numbers, removed lazily
+        self.subscriptions = {}
+        # tag -> event sequence numbers
+        self.tags = {}
+        self.trie = _TagNode()
+        self._seq = itertools.count()
+        self._warned = False
+
+    def __len__(self):
+        return len(self.events)
+
+    def __iter__(self):
+        return iter(self.events.values())
+
+    def clear(self):
+        self.events.clear()
+        self.tags.clear()
+        self.trie = _TagNode()
+        for seqs in self.subscriptions.values():
+            seqs.clear()
+
+    def subscribe(self, tag, match_func):
+        """
+        Index the events for a new subscription
+        """
+        if (tag, match_func) in self.subscriptions:
+            return
+        self.subscriptions[(tag, match_func)] = collections.deque(
+            seq for seq, evt in self.events.items() if match_func(evt["tag"], tag)
+        )
+
+    def unsubscribe(self, tag, match_func, remaining):
+        """
+        Drop a subscription, and the events it kept which do not match any of
+        the ``remaining`` ``[tag, match_func]`` subscriptions
+        """
+        for seq in self.subscriptions.pop((tag, match_func), ()):
+            evt = self.events.get(seq)
+            if evt is None:
+                continue
+            if not any(
+                pmatch_func(evt["tag"], ptag) for ptag, pmatch_func in remaining
+            ):
+                self._remove(seq)
+
+    def add(self, evt):
+        """
+        Cache an event if it matches any subscription, returns True if it does
+        """
+        matched = [
+            seqs
+            for (ptag, pmatch_func), seqs in self.subscriptions.items()
+            if pmatch_func(evt["tag"], ptag)
+        ]
+        if not matched:
+            return False
+        seq = next(self._seq)
+        self.events[seq] = evt
+        for seqs in matched:
+            seqs.append(seq)
+            if len(seqs) > 2 * len(self.events) + 64:
+                # Drop the events removed through other lookups
+                live = [num for num in seqs if num in self.events]
+                seqs.clear()
+                seqs.extend(live)
+        if evt["tag"] in self.tags:
+            self.tags[evt["tag"]].append(seq)
+        else:
+            self.tags[evt["tag"]] = collections.deque([seq])
+            self._trie_add(evt["tag"])
+        if self.max_events and len(self.events) > self.max_events:
+            if not self._warned:
+                log.warning(
+                    "More than %d events are waiting to be read, dropping the "
+                    "oldest ones",
+                    self.max_events,
+                )
+                self._warned = True
+            self._remove(next(iter(self.events)))
+        return True
+
+    def pop(self, tag, match_func, prefix=False):
+        """
+        Remove and return the oldest event matching ``tag``, or None. With
+        ``prefix`` the match function is known to be startswith.
+        """
+        seqs = self.subscriptions.get((tag, match_func))
+        if seqs is not None:
+            while seqs:
+                seq = seqs.popleft()
+                if seq in self.events:
+                    return self._remove(seq)
+            return None
+        if prefix:
+            oldest = None
+            for node in self._trie_prefix(tag):
+                seq = self.tags[node.tag][0]
+                if oldest is None or seq < oldest:
+                    oldest = seq
+            if oldest is None:
+                return None
+            return self._remove(oldest)
+        for seq, evt in self.events.items():
+            if match_func(evt["tag"], tag):
+                return self._remove(seq)
+        return None
+
+    def _remove(self, seq):
+        evt = self.events.pop(seq)
+        seqs = self.tags[evt["tag"]]
+        if seqs[0] == seq:
+            seqs.popleft()
+        else:
+            seqs.remove(seq)
+        if not seqs:
+            del self.tags[evt["tag"]]
+            self._trie_remove(evt["tag"])
+        return evt
+
+    def _trie_add(self, tag):
+        node = self.trie
+        for part in tag.split(TAGPARTER):
+            child = node.children.get(part)
+            if child is None:
+                child = node.children[part] = _TagNode()
+            node = child
+        node.tag = tag
+
+    def _trie_remove(self, tag):
+        path = [self.trie]
+        for part in tag.split(TAGPARTER):
+            path.append(path[-1].children[part])
+        path[-1].tag = None
+        parts = tag.split(TAGPARTER)
+        # Prune the nodes which are left empty
+        for num in range(len(parts), 0, -1):
+            node = path[num]
+            if node.tag is not None or node.children:
+                break
+            del path[num - 1].children[parts[num - 1]]
+
+    def _trie_prefix(self, prefix):
+        """
+        Yield the nodes of the cached tags starting with ``prefix``
+        """
+        parts = prefix.split(TAGPARTER)
+        node = self.trie
+        for part in parts[:-1]:
+            node = node.children.get(part)
+            if node is None:
+                return
+        stack = [
+            child for part, child in node.children.items() if part.startswith(parts[-1])
+        ]
+        while stack:
+            node = stack.pop()
+            if node.tag is not None:
+                yield node
+            stack.extend(node.children.values())
+
+
 class SaltEvent:
     """
     Warning! Use the get_event function or the code will not be
@@ -215,6 +554,7 @@ class SaltEvent:
         io_loop=None,
         keep_loop=False,
         raise_errors=False,
+        filter_events=False,
     ):
         """
         :param IOLoop io_loop: Pass in an io_loop if you want asynchronous
@@ -225,9 +565,13 @@ class SaltEvent:
                                the io loop or destroy it when the event handle
                                is destroyed. This is useful when using event
                                loops from within third party asynchronous code
+        :param Bool filter_events: Register the subscribed tags with the
+                                   publisher, which then only sends the
+                                   events matching them. See subscribe().
         """
         self.node = node
         self.keep_loop = keep_loop
+        self.filter_events = filter_events
         if io_loop is not None:
             self.io_loop = io_loop
             self._run_io_loop_sync = False
@@ -256,7 +600,12 @@ class SaltEvent:
         if salt.utils.platform.is_windows() and "ipc_mode" not in opts:
             self.opts["ipc_mode"] = "tcp"
         self.pending_tags = []
-        self.pending_events = []
+        self.pending_events = PendingEvents(self.opts.get("max_pending_events", 0))
+        # The tags registered with the publisher, as [tag, match_type] pairs
+        self.subscriptions = []
+        # The tags the publisher forwards on top of the subscriptions, without
+        # the events being kept, as [tag, match_type] pairs
+        self.expected = []
         self.__load_cache_regex()
         if listen and not self.cpub:
             # Only connect to the publisher at initialization time if
@@ -286,11 +635,21 @@ class SaltEvent:
         jobs are outstanding it is important to subscribe to prevent one call
         to get_event from discarding a response required by a subsequent call
         to get_event.
+
+        With ``filter_events`` the tags are also registered with the event
+        publisher, which then only forwards the events matching one of the
+        subscribed tags, or the tag get_event is waiting for. Events with other
+        tags are not sent at all, so an event must be subscribed to before it
+        is fired to be sure to get it. Until a tag is subscribed to all the
+        events are sent.
         """
         if tag is None:
             return
         match_func = self._get_match_func(match_type)
         self.pending_tags.append([tag, match_func])
+        self.pending_events.subscribe(tag, match_func)
+        self.subscriptions.append([tag, match_type or self.opts["event_match_type"]])
+        self._send_subscriptions()
 
     def unsubscribe(self, tag, match_type=None):
         """
@@ -304,14 +663,60 @@ class SaltEvent:
             self.pending_tags.remove([tag, match_func])
         except ValueError:
             pass
+        try:
+            self.subscriptions.remove(
+                [tag, match_type or self.opts["event_match_type"]]
+            )
+        except ValueError:
+            pass
+        else:
+            self._send_subscriptions()
 
-        old_events = self.pending_events
-        self.pending_events = []
-        for evt in old_events:
-            if any(
-                pmatch_func(evt["tag"], ptag) for ptag, pmatch_func in self.pending_tags
-            ):
-                self.pending_events.append(evt)
+        if [tag, match_func] not in self.pending_tags:
+            self.pending_events.unsubscribe(tag, match_func, self.pending_tags)
+
+    def expect(self, tag, match_type=None):
+        """
+        Have the event publisher forward the events matching ``tag`` too until
+        :py:meth:`unexpect` is called, without subscribing to them. Used for
+        the events fired before the tag to subscribe to is known, like the
+        returns of a job being published.
+        """
+        self.expected.append([tag, match_type or self.opts["event_match_type"]])
+        self._send_subscriptions()
+
+    def unexpect(self, tag, match_type=None):
+        """
+        Stop forwarding the events expected with :py:meth:`expect`
+        """
+        try:
+            self.expected.remove([tag, match_type or self.opts["event_match_type"]])
+        except ValueError:
+            return
+        self._send_subscriptions()
+
+    def _send_subscriptions(self, extra=None):
+        """
+        Register the subscribed tags, the expected ones and the ``extra`` ones
+        with the event publisher. Listeners without subscriptions get every
+        event.
+        """
+        if not self.filter_events or self.subscriber is None:
+            return
+        subscriptions = list(self.subscriptions)
+        if subscriptions:
+            subscriptions.extend(self.expected)
+        subscriptions.extend(extra or [])
+        try:
+            if self._run_io_loop_sync:
+                self.subscriber.set_subscriptions(subscriptions)
+            else:
+                self.io_loop.spawn_callback(
+                    self.subscriber.set_subscriptions, subscriptions
+                )
+        except AttributeError:
+            # The transport can not filter events for its subscribers
+            pass
 
     def connect_pub(self, timeout=None):
         """
@@ -329,6 +734,7 @@ class SaltEvent:
                     ),
                     loop_kwarg="io_loop",
                 )
+                self._send_subscriptions()
             try:
                 self.subscriber.connect(timeout=timeout)
                 self.cpub = True
@@ -349,6 +755,7 @@ class SaltEvent:
                 self.subscriber = salt.transport.ipc_publish_client(
                     self.node, self.opts, io_loop=self.io_loop
                 )
+                self._send_subscriptions()
                 self.io_loop.spawn_callback(self.subscriber.connect)
 
             # For the asynchronous case, the connect will be defered to when
@@ -364,7 +771,7 @@ class SaltEvent:
             return
         self.subscriber.close()
         self.subscriber = None
-        self.pending_events = []
+        self.pending_events.clear()
         self.cpub = False
 
     def connect_pull(self, timeout=1):
@@ -417,19 +824,18 @@ class SaltEvent:
         self.cpush = False
 
     @classmethod
-    def unpack(cls, raw):
+    def unpack(cls, raw, lazy=False):
+        """
+        Split a packed event in its tag and data. With ``lazy`` the data is
+        a :py:class:`LazyEventData`, deserialized when it is first accessed.
+        """
         mtag, sep, mdata = raw.partition(
             salt.utils.stringutils.to_bytes(TAGEND)
         )  # split tag from data
         mtag = salt.utils.stringutils.to_str(mtag)
-        try:
-            data = salt.payload.loads(mdata, encoding="utf-8")
-        except SaltDeserializationError:
-            log.warning(
-                "SaltDeserializationError on unpacking data, the payload could be incomplete"
-            )
-            raise
-        return mtag, data
+        if lazy:
+            return mtag, LazyEventData(mdata)
+        return mtag, _load_data(mdata)
 
     @classmethod
     def pack(cls, tag, data, max_size=None):
@@ -456,36 +862,27 @@ class SaltEvent:
         return getattr(self, f"_match_tag_{match_type}", None)
 
     def _check_pending(self, tag, match_func=None):
-        """Check the pending_events list for events that match the tag
+        """Remove and return the oldest cached event that matches the tag
 
         :param tag: The tag to search for
         :type tag: str
-        :param tags_regex: List of re expressions to search for also
-        :type tags_regex: list[re.compile()]
+        :param match_func: The function matching event tags with the tag
         :return:
         """
         if match_func is None:
             match_func = self._get_match_func()
-        old_events = self.pending_events
-        self.pending_events = []
-        ret = None
-        for evt in old_events:
-            if match_func(evt["tag"], tag):
-                if ret is None:
-                    ret = evt
-                    log.trace("get_event() returning cached event = %s", ret)
-                else:
-                    self.pending_events.append(evt)
-            elif any(
-                pmatch_func(evt["tag"], ptag) for ptag, pmatch_func in self.pending_tags
-            ):
-                self.pending_events.append(evt)
-            else:
-                log.trace(
-                    "get_event() discarding cached event that no longer has any"
-                    " subscriptions = %s",
-                    evt,
-                )
+        ret = self.pending_events.pop(
+            tag, match_func, prefix=match_func is self._match_tag_startswith
+        )
+        if ret is None:
+            return None
+        if isinstance(ret["data"], LazyEventData):
+            try:
+                ret["data"] = ret["data"].load()
+            except SaltDeserializationError:
+                log.error("Unable to deserialize received event")
+                return None
+        log.trace("get_event() returning cached event = %s", ret)
         return ret
 
     @staticmethod
@@ -560,8 +957,12 @@ class SaltEvent:
                 raw = self.subscriber.recv(timeout=wait)
                 if raw is None:
                     break
-                mtag, data = self.unpack(raw)
+                # Only the events we are waiting for get deserialized here
+                mtag, data = self.unpack(raw, lazy=True)
                 ret = {"data": data, "tag": mtag}
+                matched = match_func(mtag, tag)
+                if matched:
+                    ret["data"] = data.load()
             except KeyboardInterrupt:
                 return {"tag": "salt/event/exit", "data": {}}
             except tornado.iostream.StreamClosedError:
@@ -575,14 +976,10 @@ class SaltEvent:
             except RuntimeError:
                 return None
 
-            if not match_func(ret["tag"], tag) or not self._subproxy_match(ret["data"]):
+            if not matched or not self._subproxy_match(ret["data"]):
                 # tag not match
-                if any(
-                    pmatch_func(ret["tag"], ptag)
-                    for ptag, pmatch_func in self.pending_tags
-                ):
+                if self.pending_events.add(ret):
                     log.trace("get_event() caching unwanted event = %s", ret)
-                    self.pending_events.append(ret)
                 if wait:  # only update the wait timeout if we had one
                     wait = timeout_at - time.time()
                 continue
@@ -653,20 +1050,33 @@ class SaltEvent:
 
         ret = self._check_pending(tag, match_func)
         if ret is None:
-            if auto_reconnect:
-                raise_errors = self.raise_errors
-                self.raise_errors = True
-                while True:
-                    try:
-                        ret = self._get_event(wait, tag, match_func, no_block)
-                        break
-                    except tornado.iostream.StreamClosedError:
-                        self.close_pub()
-                        self.connect_pub(timeout=wait)
-                        continue
-                self.raise_errors = raise_errors
-            else:
-                ret = self._get_event(wait, tag, match_func, no_block)
+            # Have the publisher send the events we are waiting for as well
+            extra = None
+            if self.filter_events and self.subscriptions:
+                wanted = [tag, match_type or self.opts["event_match_type"]]
+                if wanted not in self.subscriptions:
+                    extra = [wanted]
+                    self._send_subscriptions(extra)
+            try:
+                if auto_reconnect:
+                    raise_errors = self.raise_errors
+                    self.raise_errors = True
+                    while True:
+                        try:
+                            ret = self._get_event(wait, tag, match_func, no_block)
+                            break
+                        except tornado.iostream.StreamClosedError:
+                            self.close_pub()
+                            self.connect_pub(timeout=wait)
+                            if extra:
+                                self._send_subscriptions(extra)
+                            continue
+                    self.raise_errors = raise_errors
+                else:
+                    ret = self._get_event(wait, tag, match_func, no_block)
+            finally:
+                if extra:
+                    self._send_subscriptions()
 
         if ret is None or full:
             return ret
@@ -943,6 +1353,7 @@ class MasterEvent(SaltEvent):
         io_loop=None,
         keep_loop=False,
         raise_errors=False,
+        filter_events=False,
     ):
         super().__init__(
             "master",
@@ -952,6 +1363,7 @@ class MasterEvent(SaltEvent):
             io_loop=io_loop,
             keep_loop=keep_loop,
             raise_errors=raise_errors,
+            filter_events=filter_events,
         )
 
 
@@ -1226,6 +1638,9 @@ class EventReturn(salt.utils.process.SignalHandlingProcess):
     """
     A dedicated process which listens to the master event bus and queues
     and forwards events to the specified returner.
+
+    Each returner gets the events in a thread of its own, see
+    :py:mod:`salt.utils.event_return`.
     """
 
     def __init__(self, opts, **kwargs):
@@ -1241,61 +1656,87 @@ class EventReturn(salt.utils.process.SignalHandlingProcess):
         super().__init__(**kwargs)
 
         self.opts = opts
-        self.event_return_queue = self.opts["event_return_queue"]
-        self.event_return_queue_max_seconds = self.opts.get(
-            "event_return_queue_max_seconds", 0
-        )
         local_minion_opts = self.opts.copy()
         local_minion_opts["file_client"] = "local"
         self.minion = salt.minion.MasterMinion(local_minion_opts)
-        self.event_queue = []
+        self.workers = []
         self.stop = False
+        self.stat_clock = time.time()
 
     def _handle_signals(self, signum, sigframe):
         # Flush and terminate
-        if self.event_queue:
-            self.flush_events()
+        self.stop_workers()
         self.stop = True
         super()._handle_signals(signum, sigframe)
 
-    def flush_events(self):
-        if isinstance(self.opts["event_return"], list):
-            # Multiple event returners
-            for r in self.opts["event_return"]:
-                log.debug("Calling event returner %s, one of many.", r)
-                event_return = f"{r}.event_return"
-                self._flush_event_single(event_return)
-        else:
-            # Only a single event returner
-            log.debug(
-                "Calling event returner %s, only one configured.",
-                self.opts["event_return"],
-            )
-            event_return = "{}.event_return".format(self.opts["event_return"])
-            self._flush_event_single(event_return)
-        del self.event_queue[:]
-
-    def _flush_event_single(self, event_return):
-        if event_return in self.minion.returners:
-            try:
-                self.minion.returners[event_return](self.event_queue)
-            except Exception as exc:  # pylint: disable=broad-except
+    def start_workers(self):
+        """
+        Start a thread for each configured event returner
+        """
+        returners = self.opts["event_return"]
+        if not isinstance(returners, list):
+            returners = [returners]
+        for returner in returners:
+            event_return = f"{returner}.event_return"
+            if event_return not in self.minion.returners:
                 log.error(
-                    "Could not store events - returner '%s' raised exception: %s",
+                    "Could not store return for event(s) - returner '%s' not found.",
                     event_return,
-                    exc,
                 )
-                # don't waste processing power unnecessarily on converting a
-                # potentially huge dataset to a string
-                if log.level <= logging.DEBUG:
-                    log.debug(
-                        "Event data that caused an exception: %s", self.event_queue
-                    )
-        else:
-            log.error(
-                "Could not store return for event(s) - returner '%s' not found.",
-                event_return,
+                continue
+            log.debug("Starting event returner %s", returner)
+            worker = salt.utils.event_return.ReturnerWorker(
+                returner,
+                self.minion.returners[event_return],
+                self.opts,
+                spill_dir=os.path.join(self.opts["cachedir"], "event_return", returner),
             )
+            worker.start()
+            self.workers.append(worker)
+
+    def stop_workers(self, timeout=30):
+        """
+        Have the returners store the queued events and wait for them, the
+        events they could not store are kept on disk
+        """
+        for worker in self.workers:
+            worker.stop()
+        deadline = time.monotonic() + timeout
+        for worker in self.workers:
+            worker.join(max(deadline - time.monotonic(), 0))
+            if worker.is_alive():
+                log.warning(
+                    "Event returner %s did not stop in time, queued events "
+                    "might be lost",
+                    worker.returner,
+                )
+        self.workers = []
+
+    def flush_events(self):
+        """
+        Have the returners store the queued events without waiting for full
+        batches
+        """
+        for worker in self.workers:
+            worker.flush()
+
+    def stats(self):
+        """
+        Return the stats of the queue of each returner
+        """
+        return {worker.returner: worker.stats() for worker in self.workers}
+
+    def _post_stats(self):
+        if not self.opts.get("master_stats"):
+            return
+        now = time.time()
+        if now - self.stat_clock <= self.opts["master_stats_event_iter"]:
+            return
+        self.event.fire_event(
+            {"time": now - self.stat_clock, "returners": self.stats()},
+            tagify(self.name, "stats"),
+        )
+        self.stat_clock = now
 
     def run(self):
         """
@@ -1307,12 +1748,12 @@ class EventReturn(salt.utils.process.SignalHandlingProcess):
             )
             os.nice(self.opts["event_return_niceness"])
 
+        self.start_workers()
         self.event = get_event("master", opts=self.opts, listen=True)
         events = self.event.iter_events(full=True)
         self.event.fire_event({}, "salt/event_listen/start")
         try:
             # events below is a generator, we will iterate until we get the salt/event/exit tag
-            oldestevent = None
             for event in events:
 
                 if event["tag"] == "salt/event/exit":
@@ -1323,52 +1764,17 @@ class EventReturn(salt.utils.process.SignalHandlingProcess):
                     allow=self.opts["event_return_whitelist"],
                     deny=self.opts["event_return_blacklist"],
                 ):
-                    # This event passed the filter, add it to the queue
-                    self.event_queue.append(event)
-                too_long_in_queue = False
-
-                # if max_seconds is >0, then we want to make sure we flush the queue
-                # every event_return_queue_max_seconds seconds,  If it's 0, don't
-                # apply any of this logic
-                if self.event_return_queue_max_seconds > 0:
-                    rightnow = datetime.datetime.now()
-                    if not oldestevent:
-                        oldestevent = rightnow
-                    age_in_seconds = (rightnow - oldestevent).seconds
-                    if age_in_seconds > 0:
-                        log.debug(
-                            "Oldest event in queue is %s seconds old.", age_in_seconds
-                        )
-                    if age_in_seconds >= self.event_return_queue_max_seconds:
-                        too_long_in_queue = True
-                        oldestevent = None
-                    else:
-                        too_long_in_queue = False
-
-                    if too_long_in_queue:
-                        log.debug(
-                            "Oldest event has been in queue too long, will flush queue"
-                        )
-
-                # If we are over the max queue size or the oldest item in the queue has been there too long
-                # then flush the queue
-                if (
-                    len(self.event_queue) >= self.event_return_queue
-                    or too_long_in_queue
-                ):
-                    log.debug("Flushing %s events.", len(self.event_queue))
-                    self.flush_events()
-                    oldestevent = None
+                    # This event passed the filter, queue it for the returners
+                    for worker in self.workers:
+                        worker.put(event)
+                self._post_stats()
                 if self.stop:
                     # We saw the salt/event/exit tag, we can stop eventing
                     break
-        finally:  # flush all we have at this moment
-            # No matter what, make sure we flush the queue even when we are exiting
-            # and there will be no more events.
-            if self.event_queue:
-                log.debug("Flushing %s events.", len(self.event_queue))
-
-                self.flush_events()
+        finally:
+            # No matter what, make sure the returners store what they have
+            # queued even when we are exiting and there will be no more events.
+            self.stop_workers()
 
     @staticmethod
     def _filter(event, allow=None, deny=None):
@@ -0,0 +1,497 @@
+"""
+    salt.utils.event_return
+    -----------------------
+
+    The pipeline of the EventReturn process, which hands the events of the
+    master event bus to the :conf_master:`event_return` returners.
+
+    Each returner gets its own thread and queue, so a returner which is slow
+    or down does not hold the others up. The events are handed to a returner
+    in batches of :conf_master:`event_return_queue` events, or whatever is
+    queued once the oldest event waited
+    :conf_master:`event_return_queue_max_seconds`. A batch the returner fails
+    to store is retried with an exponential backoff. After
+    :conf_master:`event_return_retries` retries the next batch is tried: if
+    the returner stores it, the failing batch is moved to the ``quarantine``
+    directory of the spill queue, so a batch the returner never takes does
+    not hold up the events behind it. If the next batch fails too the
+    returner is down, the failing batch is retried until it recovers and the
+    events behind it are spilled to disk. The quarantined batches are queued
+    again once the returner recovers.
+
+    A queue holds at most :conf_master:`event_return_queue_hwm` events in
+    memory. The events coming in past it are spilled to disk, in the cache
+    directory, until the returner catches up. Past
+    :conf_master:`event_return_spill_hwm` events on disk the oldest ones are
+    dropped. The events left on disk when the master stops are returned once
+    it starts again.
+"""
+
+import collections
+import logging
+import os
+import re
+import threading
+import time
+
+import salt.payload
+import salt.utils.files
+
+log = logging.getLogger(__name__)
+
+# The name of the files of the spill queue: sequence number, number of events
+# and time the oldest event was received
+SEGMENT_RE = re.compile(r"^(\d+)_(\d+)_(\d+(?:\.\d+)?)\.spill$")
+
+# The number of times a batch is retried when the option is not set
+DEFAULT_RETRIES = 5
+
+# The directory of the spill queue holding the batches the returner failed to
+# store after all the retries
+QUARANTINE_DIR = "quarantine"
+
+# The sequence number of the first file of an empty spill queue, files put
+# back at the front of the queue count down from it
+FIRST_SEGMENT = 10**12
+
+
+class SpillQueue:
+    """
+    Batches of events spilled to disk, one file per batch, oldest first.
+
+    :param str path: The directory of the queue, created if needed
+    :param int max_events: The number of events to keep, the oldest batches
+        are dropped past it. 0 for no limit.
+    """
+
+    def __init__(self, path, max_events=0):
+        self.path = path
+        self.max_events = max_events
+        # (sequence number, number of events, time of the oldest event)
+        self.segments = collections.deque()
+        self.events = 0
+        self.dropped = 0
+        if os.path.isdir(path):
+            found = []
+            for name in os.listdir(path):
+                match = SEGMENT_RE.match(name)
+                if match:
+                    found.append(
+                        (
+                            int(match.group(1)),
+                            int(match.group(2)),
+                            float(match.group(3)),
+                        )
+                    )
+            for segment in sorted(found):
+                self.segments.append(segment)
+                self.events += segment[1]
+            if self.events:
+                log.info("Found %d spilled events in %s", self.events, path)
+        else:
+            with salt.utils.files.set_umask(0o077):
+                os.makedirs(path)
+
+    def __len__(self):
+        return self.events
+
+    def _file(self, segment):
+        seq, count, stamp = segment
+        return os.path.join(self.path, f"{seq:016d}_{count}_{stamp:.3f}.spill")
+
+    def _write(self, seq, batch):
+        segment = (seq, len(batch), batch[0][0])
+        path = self._file(segment)
+        tmp_path = f"{path}.tmp"
+        with salt.utils.files.set_umask(0o177):
+            with salt.utils.files.fopen(tmp_path, "wb") as fp_:
+                salt.payload.dump(batch, fp_)
+        os.replace(tmp_path, path)
+        self.events += len(batch)
+        return segment
+
+    def oldest(self):
+        """
+        Return the time the oldest event on disk was received, or None
+        """
+        if not self.segments:
+            return None
+        return self.segments[0][2]
+
+    def append(self, batch):
+        """
+        Spill a batch of ``(time received, event)`` tuples
+        """
+        if not batch:
+            return
+        seq = self.segments[-1][0] + 1 if self.segments else FIRST_SEGMENT
+        self.segments.append(self._write(seq, batch))
+        while self.max_events and self.events > self.max_events:
+            dropped = self.segments[0][1]
+            self._remove(self.segments.popleft())
+            self.dropped += dropped
+            log.warning(
+                "More than %d events are spilled in %s, dropped the %d oldest",
+                self.max_events,
+                self.path,
+                dropped,
+            )
+
+    def appendleft(self, batch):
+        """
+        Put a batch back at the front of the queue
+        """
+        if not batch:
+            return
+        seq = self.segments[0][0] - 1 if self.segments else FIRST_SEGMENT
+        self.segments.appendleft(self._write(seq, batch))
+
+    def popleft(self):
+        """
+        Remove and return the oldest batch, or an empty list
+        """
+        if not self.segments:
+            return []
+        segment = self.segments.popleft()
+        path = self._file(segment)
+        try:
+            with salt.utils.files.fopen(path, "rb") as fp_:
+                batch = [tuple(item) for item in salt.payload.load(fp_)]
+        except Exception as exc:  # pylint: disable=broad-except
+            log.error("Unable to read the spilled events in %s: %s", path, exc)
+            self.dropped += segment[1]
+            batch = []
+        self._remove(segment)
+        return batch
+
+    def _remove(self, segment):
+        self.events -= segment[1]
+        try:
+            os.remove(self._file(segment))
+        except OSError as exc:
+            log.error("Unable to remove the spilled events: %s", exc)
+
+
+class ReturnerWorker(threading.Thread):
+    """
+    Hands the events queued for a returner to its ``event_return`` function,
+    in a thread of its own.
+
+    :param str returner: The name of the returner
+    :param callable func: The ``event_return`` function of the returner
+    :param dict opts: The master options
+    :param str spill_dir: Where the events are spilled, None to drop the
+        events past :conf_master:`event_return_queue_hwm` instead
+    """
+
+    def __init__(self, returner, func, opts, spill_dir=None):
+        super().__init__(name=f"EventReturn-{returner}", daemon=True)
+        self.returner = returner
+        self.func = func
+        self.batch_size = max(int(opts.get("event_return_queue") or 0), 1)
+        self.max_seconds = opts.get("event_return_queue_max_seconds") or 0
+        self.hwm = max(int(opts.get("event_return_queue_hwm") or 0), 0)
+        retries = opts.get("event_return_retries")
+        self.retries = int(DEFAULT_RETRIES if retries is None else retries)
+        self.backoff = opts.get("event_return_retry_backoff") or 1
+        self.backoff_max = opts.get("event_return_retry_backoff_max") or 300
+        self.spill = None
+        self.quarantine = None
+        spill_hwm = int(opts.get("event_return_spill_hwm") or 0)
+        if spill_dir and spill_hwm:
+            try:
+                self.spill = SpillQueue(spill_dir, spill_hwm)
+                self.quarantine = SpillQueue(
+                    os.path.join(spill_dir, QUARANTINE_DIR), spill_hwm
+                )
+            except OSError as exc:
+                log.error(
+                    "Unable to spill the events of returner '%s' to %s: %s",
+                    returner,
+                    spill_dir,
+                    exc,
+                )
+        # (time received, event) tuples: the oldest in memory, then the ones
+        # on disk, then the ones waiting to make up a batch to spill
+        self.memory = collections.deque()
+        self.overflow = []
+        self.inflight = None
+        self.cond = threading.Condition()
+        self.stopping = False
+        self._flush = False
+        self.returned = 0
+        self.failures = 0
+        self.dropped = 0
+        self.quarantined = 0
+        # True while the returner is down, the quarantined batches are queued
+        # again once it stores events. The batches left in quarantine by the
+        # previous run are retried too.
+        self.outage = bool(self.quarantine is not None and self.quarantine.segments)
+
+    def put(self, event):
+        """
+        Queue an event, spilling it to disk if too many are in memory
+        """
+        item = (time.time(), event)
+        with self.cond:
+            if self.spill is not None and (
+                self.overflow
+                or self.spill.segments
+                or (self.hwm and len(self.memory) >= self.hwm)
+            ):
+                self.overflow.append(item)
+                if len(self.overflow) >= self.batch_size:
+                    self._spill_overflow()
+            else:
+                self.memory.append(item)
+                if self.hwm and len(self.memory) > self.hwm:
+                    self.memory.popleft()
+                    self._drop(1, "too many events are queued")
+            self.cond.notify()
+
+    def flush(self):
+        """
+        Hand the queued events to the returner without waiting for a full
+        batch
+        """
+        with self.cond:
+            self._flush = True
+            self.cond.notify()
+
+    def stop(self):
+        """
+        Return the events in memory and stop, the events which could not be
+        returned are left on disk
+        """
+        with self.cond:
+            self.stopping = True
+            self.cond.notify_all()
+
+    def stats(self):
+        """
+        Return the number of events queued, spilled, returned, quarantined and
+        dropped, and how many seconds the oldest event not returned yet has waited
+        """
+        with self.cond:
+            oldest = [
+                items[0][0]
+                for items in (self.inflight, self.memory, self.overflow)
+                if items
+            ]
+            if self.spill is not None and self.spill.oldest() is not None:
+                oldest.append(self.spill.oldest())
+            return {
+                "queued": len(self.memory) + len(self.overflow),
+                "spilled": len(self.spill) if self.spill is not None else 0,
+                "returned": self.returned,
+                "failures": self.failures,
+                "quarantined": self.quarantined,
+                "dropped": self.dropped
+                + (self.spill.dropped if self.spill is not None else 0)
+                + (self.quarantine.dropped if self.quarantine is not None else 0),
+                "lag": time.time() - min(oldest) if oldest else 0,
+            }
+
+    def _drop(self, count, reason):
+        self.dropped += count
+        log.warning(
+            "Dropped %d events for returner '%s', %s", count, self.returner, reason
+        )
+
+    def _spill_overflow(self):
+        batch, self.overflow = self.overflow, []
+        try:
+            self.spill.append(batch)
+        except OSError as exc:
+            log.error("Unable to spill events to disk: %s", exc)
+            self._drop(len(batch), "they could not be spilled to disk")
+
+    def _quarantine(self, batch, attempts):
+        """
+        Set aside a batch the returner failed to store, on disk if spilling
+        is enabled
+        """
+        if self.quarantine is not None:
+            try:
+                self.quarantine.append(batch)
+                self.quarantined += len(batch)
+                log.error(
+                    "The returner '%s' failed %d times to store %d events, "
+                    "moved them to %s",
+                    self.returner,
+                    attempts,
+                    len(batch),
+                    self.quarantine.path,
+                )
+                return
+            except OSError as exc:
+                log.error("Unable to spill events to disk: %s", exc)
+        self._drop(len(batch), f"the returner failed {attempts} times to store them")
+
+    def _requeue(self, batch):
+        if not batch:
+            return
+        if self.spill is not None:
+            try:
+                self.spill.appendleft(batch)
+                return
+            except OSError as exc:
+                log.error("Unable to spill events to disk: %s", exc)
+        self._drop(len(batch), "they could not be returned before stopping")
+
+    def _recover(self):
+        """
+        Queue the quarantined batches again once the returner recovered
+        """
+        self.outage = False
+        if self.quarantine is None:
+            return
+        batches = []
+        while self.quarantine.segments:
+            batches.append(self.quarantine.popleft())
+        if batches:
+            log.info(
+                "The returner '%s' recovered, retrying %d quarantined batches",
+                self.returner,
+                len(batches),
+            )
+        for batch in reversed(batches):
+            self._requeue(batch)
+
+    def _refill(self):
+        """
+        Move the events on disk back to memory once there is room for them
+        """
+        while len(self.memory) < self.batch_size:
+            if self.spill is not None and self.spill.segments and not self.stopping:
+                self.memory.extend(self.spill.popleft())
+            elif self.overflow and not (self.spill is not None and self.spill.segments):
+                self.memory.extend(self.overflow)
+                self.overflow = []
+            else:
+                break
+
+    def _next_batch(self):
+        with self.cond:
+            while True:
+                self._refill()
+                if self.memory:
+                    if (
+                        len(self.memory) >= self.batch_size
+                        or self._flush
+                        or self.stopping
+                    ):
+                        break
+                    timeout = None
+                    if self.max_seconds:
+                        timeout = self.memory[0][0] + self.max_seconds - time.time()
+                        if timeout <= 0:
+                            break
+                elif self.stopping:
+                    return []
+                else:
+                    timeout = None
+                self.cond.wait(timeout)
+            count = min(self.batch_size, len(self.memory))
+            self.inflight = [self.memory.popleft() for _ in range(count)]
+            if not self.memory:
+                self._flush = False
+            return self.inflight
+
+    def _store(self, batch):
+        """
+        Hand a batch to the returner once. Returns True if it was stored.
+        """
+        events = [event for _, event in batch]
+        try:
+            self.func(events)
+        except Exception as exc:  # pylint: disable=broad-except
+            self.failures += 1
+            log.error(
+                "Could not store events - returner '%s' raised exception: %s",
+                self.returner,
+                exc,
+            )
+            # don't waste processing power unnecessarily on converting a
+            # potentially huge dataset to a string
+            if log.level <= logging.DEBUG:
+                log.debug("Event data that caused an exception: %s", events)
+            return False
+        self.returned += len(events)
+        return True
+
+    def _probe(self):
+        """
+        Try the batch behind one the returner keeps failing to store, to tell
+        a batch it never takes from a returner which is down. Returns True if
+        it was stored. Otherwise it is put back, and the events in memory are
+        spilled to disk while the returner is down.
+        """
+        with self.cond:
+            self._refill()
+            count = min(self.batch_size, len(self.memory))
+            batch = [self.memory.popleft() for _ in range(count)]
+        if not batch:
+            return False
+        if self._store(batch):
+            return True
+        with self.cond:
+            self.memory.extendleft(reversed(batch))
+            if not self.outage:
+                log.warning(
+                    "The returner '%s' is down, retrying until it recovers",
+                    self.returner,
+                )
+            self.outage = True
+            if self.spill is not None:
+                try:
+                    self.spill.appendleft(list(self.memory))
+                    self.memory.clear()
+                except OSError as exc:
+                    log.error("Unable to spill events to disk: %s", exc)
+        return False
+
+    def _send(self, batch):
+        """
+        Hand a batch to the returner, retrying with a backoff. Returns False
+        if the worker was stopped before the batch could be stored.
+        """
+        attempt = 0
+        delay = self.backoff
+        while not self._store(batch):
+            attempt += 1
+            with self.cond:
+                if self.stopping:
+                    return False
+            if self.retries and attempt % (self.retries + 1) == 0 and self._probe():
+                # The returner takes the events behind this batch
+                with self.cond:
+                    self._quarantine(batch, attempt)
+                return True
+            with self.cond:
+                log.debug(
+                    "Retrying to store %d events in %s seconds", len(batch), delay
+                )
+                self.cond.wait_for(lambda: self.stopping, delay)
+            delay = min(delay * 2, self.backoff_max)
+        if self.outage:
+            with self.cond:
+                self._recover()
+        return True
+
+    def run(self):
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                break
+            returned = self._send(batch)
+            with self.cond:
+                self.inflight = None
+                if self.stopping and not returned:
+                    # The returner is down, keep the rest for the next start
+                    self._requeue(batch + list(self.memory))
+                    self.memory.clear()
+                    break
+        with self.cond:
+            if self.overflow and self.spill is not None:
+                self._spill_overflow()
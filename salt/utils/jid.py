@@ -70,6 +70,20 @@ def jid_to_time(jid):
     return ret
 
 
+def jid_to_datetime(jid):
+    """
+    Convert a salt job id into a naive UTC datetime of when the job was
+    invoked, or None if the jid does not carry a timestamp
+    """
+    jid = str(jid)
+    if len(jid) != 20 and (len(jid) <= 21 or jid[20] != "_"):
+        return None
+    try:
+        return datetime.datetime.strptime(jid[:20], "%Y%m%d%H%M%S%f")
+    except ValueError:
+        return None
+
+
 def format_job_instance(job):
     """
     Format the job instance correctly
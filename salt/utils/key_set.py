@@ -0,0 +1,301 @@
+"""
+    salt.utils.key_set
+    ------------------
+
+    Shared snapshot of the minion keys known to the master, used when
+    ``key_cache`` is set to ``watch``.
+
+    The ``KeySetService`` master process watches the key directories of the
+    pki dir (with inotify when pyinotify is available, by polling the mtime of
+    the directories otherwise) and writes the sorted accepted, pending,
+    rejected and denied key lists to a snapshot file in the ``sock_dir`` every
+    time one of them changes. The snapshot is replaced atomically, so readers
+    like the MWorkers and :py:meth:`salt.key.Key.list_keys` only need to stat
+    it to know whether the copy they hold is still current.
+"""
+
+import logging
+import os
+import signal
+import time
+
+import salt.payload
+import salt.utils.atomicfile
+import salt.utils.data
+import salt.utils.files
+from salt.utils.process import Process
+
+try:
+    import pyinotify
+
+    HAS_PYINOTIFY = True
+    WATCH_MASK = (
+        pyinotify.IN_CREATE
+        | pyinotify.IN_DELETE
+        | pyinotify.IN_MOVED_FROM
+        | pyinotify.IN_MOVED_TO
+        | pyinotify.IN_DELETE_SELF
+        | pyinotify.IN_MOVE_SELF
+    )
+except ImportError:
+    HAS_PYINOTIFY = False
+    WATCH_MASK = None
+
+log = logging.getLogger(__name__)
+
+KEY_SET_FILE = "key_set.p"
+
+# The key directories tracked in the snapshot
+KEY_DIRS = ("minions", "minions_pre", "minions_rejected", "minions_denied")
+
+# How often the key directories are checked when inotify is not available
+POLL_INTERVAL = 0.1
+
+# snapshot path -> (stat signature, snapshot), so each process only loads the
+# snapshot again after the KeySetService replaced it
+_SNAPSHOTS = {}
+
+
+def enabled(opts):
+    """
+    Return True if the key directories are tracked by the KeySetService
+    """
+    return opts.get("key_cache") == "watch"
+
+
+def snapshot_path(opts):
+    """
+    Return the path of the key set snapshot
+    """
+    return os.path.join(opts["sock_dir"], KEY_SET_FILE)
+
+
+def pki_dir(opts):
+    """
+    Return the pki dir holding the minion keys
+    """
+    if opts.get("cluster_id"):
+        return opts.get("cluster_pki_dir", "")
+    return opts.get("pki_dir", "")
+
+
+def scan(path):
+    """
+    Return the set of keys in a key directory
+    """
+    try:
+        return {fn_ for fn_ in os.listdir(path) if not fn_.startswith(".")}
+    except OSError:
+        return set()
+
+
+def read(opts):
+    """
+    Return the current key set snapshot, a dict with a ``version`` and the
+    sorted key lists under ``keys``. Returns None when there is no snapshot
+    of the pki dir in ``opts``, in which case the key directories have to be
+    listed.
+    """
+    path = snapshot_path(opts)
+    try:
+        stat = os.stat(path)
+    except OSError:
+        _SNAPSHOTS.pop(path, None)
+        return None
+    signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    cached = _SNAPSHOTS.get(path)
+    if cached is not None and cached[0] == signature:
+        snapshot = cached[1]
+    else:
+        try:
+            with salt.utils.files.fopen(path, "rb") as fp_:
+                snapshot = salt.payload.load(fp_)
+        except Exception:  # pylint: disable=broad-except
+            log.debug("Unable to read the key set snapshot %s", path, exc_info=True)
+            return None
+        _SNAPSHOTS[path] = (signature, snapshot)
+    if snapshot.get("pki_dir") != pki_dir(opts):
+        return None
+    return snapshot
+
+
+def read_keys(opts, keydir):
+    """
+    Return the sorted list of keys in ``keydir`` from the key set snapshot,
+    or None if it is not available
+    """
+    if not enabled(opts):
+        return None
+    snapshot = read(opts)
+    if snapshot is None or keydir not in snapshot["keys"]:
+        return None
+    return list(snapshot["keys"][keydir])
+
+
+class KeySetService(Process):
+    """
+    Watches the key directories and keeps the key set snapshot up to date
+    """
+
+    def __init__(self, opts, **kwargs):
+        super().__init__(**kwargs)
+        self.opts = opts
+        self.path = snapshot_path(opts)
+        self.dirs = {keydir: os.path.join(pki_dir(opts), keydir) for keydir in KEY_DIRS}
+        self.keys = {}
+        self.version = 0
+        self.running = True
+
+    def signal_handler(self, sig, frame):
+        """
+        handle signals and shutdown
+        """
+        self.running = False
+
+    def cleanup(self):
+        """
+        Remove the snapshot so readers fall back to the key directories
+        """
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+    def refresh(self, keydirs=None):
+        """
+        Read the given key directories, all of them by default, from disk
+        """
+        for keydir in keydirs or KEY_DIRS:
+            self.keys[keydir] = scan(self.dirs[keydir])
+
+    def write(self):
+        """
+        Atomically replace the snapshot with the current key set
+        """
+        # The version only has to differ from the previous snapshots, also
+        # across restarts of the service
+        self.version = max(self.version + 1, time.time_ns())
+        snapshot = {
+            "version": self.version,
+            "pki_dir": pki_dir(self.opts),
+            "keys": {
+                keydir: salt.utils.data.sorted_ignorecase(keys)
+                for keydir, keys in self.keys.items()
+            },
+        }
+        with salt.utils.atomicfile.atomic_open(self.path, "wb") as fp_:
+            salt.payload.dump(snapshot, fp_)
+        log.trace("Wrote key set snapshot version %s", self.version)
+
+    def process_event(self, event):
+        """
+        Apply an inotify event to the key set, returns True if it changed
+        """
+        keydir = os.path.basename(event.path)
+        if keydir not in self.keys:
+            return False
+        if event.mask & (pyinotify.IN_DELETE_SELF | pyinotify.IN_MOVE_SELF):
+            # The directory itself went away, rescan once it is watched again
+            self.keys[keydir] = set()
+            return True
+        if not event.name or event.name.startswith("."):
+            return False
+        if event.mask & (pyinotify.IN_CREATE | pyinotify.IN_MOVED_TO):
+            self.keys[keydir].add(event.name)
+        else:
+            self.keys[keydir].discard(event.name)
+        return True
+
+    def _watch(self, watch_manager, watched):
+        """
+        Add inotify watches for the key directories which are not watched yet,
+        returns the directories which have to be read again
+        """
+        added = []
+        for keydir, path in self.dirs.items():
+            wd = watched.get(keydir)
+            if wd is not None and wd in watch_manager.watches:
+                continue
+            ret = watch_manager.add_watch(path, WATCH_MASK, quiet=True)
+            if ret.get(path, -1) >= 0:
+                watched[keydir] = ret[path]
+                added.append(keydir)
+            else:
+                watched.pop(keydir, None)
+        return added
+
+    def _run_inotify(self):
+        events = []
+        watch_manager = pyinotify.WatchManager()
+        notifier = pyinotify.Notifier(watch_manager, events.append, timeout=1000)
+        watched = {}
+        try:
+            while self.running:
+                added = self._watch(watch_manager, watched)
+                if added:
+                    # Entries created before the watch was in place are not
+                    # reported by inotify
+                    self.refresh(added)
+                    self.write()
+                if notifier.check_events():
+                    notifier.read_events()
+                    notifier.process_events()
+                changed = False
+                for event in events:
+                    if event.mask & pyinotify.IN_Q_OVERFLOW:
+                        self.refresh()
+                        changed = True
+                        continue
+                    if event.mask & pyinotify.IN_MOVE_SELF:
+                        # Stop following the moved directory, the path is
+                        # watched again once it exists
+                        watch_manager.rm_watch(event.wd, quiet=True)
+                    if self.process_event(event):
+                        changed = True
+                del events[:]
+                if changed:
+                    self.write()
+        finally:
+            notifier.stop()
+
+    def _mtimes(self):
+        mtimes = {}
+        for keydir, path in self.dirs.items():
+            try:
+                mtimes[keydir] = os.stat(path).st_mtime_ns
+            except OSError:
+                mtimes[keydir] = None
+        return mtimes
+
+    def _run_poll(self):
+        mtimes = {}
+        while self.running:
+            current = self._mtimes()
+            changed = [
+                keydir
+                for keydir, mtime in current.items()
+                if mtimes.get(keydir, -1) != mtime
+            ]
+            if changed:
+                self.refresh(changed)
+                self.write()
+                mtimes = current
+            time.sleep(POLL_INTERVAL)
+
+    def run(self):
+        """
+        Main loop of the service
+        """
+        signal.signal(signal.SIGTERM, self.signal_handler)
+        signal.signal(signal.SIGINT, self.signal_handler)
+        self.refresh()
+        self.write()
+        try:
+            if HAS_PYINOTIFY:
+                log.debug("KeySetService watching the key directories with inotify")
+                self._run_inotify()
+            else:
+                log.debug("KeySetService polling the key directories")
+                self._run_poll()
+        finally:
+            self.cleanup()
@@ -0,0 +1,520 @@
+"""
+    salt.utils.key_store
+    --------------------
+
+    Storage of the minion public keys managed by the master.
+
+    The ``key_store`` master option selects the backend:
+
+    ``dirs``
+        The default, one file per key in the ``minions``, ``minions_pre``,
+        ``minions_rejected`` and ``minions_denied`` directories of the pki dir.
+
+    ``sqlite``
+        A single SQLite database, ``key_store_path``, indexed by key state and
+        minion id. Listings and glob queries are served from the index, bulk
+        operations run in a single transaction and the fingerprint of each key
+        is stored next to it. Existing keys are imported from the key
+        directories the first time the database is opened.
+
+    Keys are grouped by state, named after the key directories. A minion id
+    can be in more than one state at a time, e.g. a denied key is stored next
+    to the accepted key it did not match.
+"""
+
+import fnmatch
+import logging
+import os
+import re
+import shutil
+import sqlite3
+import threading
+
+import salt.utils.crypt
+import salt.utils.data
+import salt.utils.files
+import salt.utils.key_set
+import salt.utils.stringutils
+from salt.exceptions import SaltConfigurationError
+
+log = logging.getLogger(__name__)
+
+ACC = "minions"
+PEND = "minions_pre"
+REJ = "minions_rejected"
+DEN = "minions_denied"
+STATES = (ACC, PEND, REJ, DEN)
+
+GLOB_CHARS = "*?["
+
+
+def factory(opts):
+    """
+    Return the key store configured in ``opts``
+    """
+    backend = opts.get("key_store", "dirs") or "dirs"
+    if backend == "dirs":
+        return DirKeyStore(opts)
+    if backend == "sqlite":
+        return SqliteKeyStore(opts)
+    raise SaltConfigurationError(f"Invalid key_store backend: {backend}")
+
+
+def _finger(pub, hash_type):
+    """
+    Return the fingerprint of a public key the same way
+    :py:func:`salt.utils.crypt.pem_finger` does for a key file
+    """
+    lines = [
+        line
+        for line in salt.utils.stringutils.to_str(pub).splitlines(True)
+        if line.strip()
+    ]
+    key = "".join(lines[1:-1]).replace("\r\n", "\n")
+    if not key:
+        # Not a PEM key at all
+        return ""
+    return salt.utils.crypt.pem_finger(key=key, sum_type=hash_type)
+
+
+def _literal_prefix(pattern):
+    """
+    Return the part of a glob before the first wildcard
+    """
+    for idx, char in enumerate(pattern):
+        if char in GLOB_CHARS:
+            return pattern[:idx]
+    return pattern
+
+
+class KeyStore:
+    """
+    Base class of the key stores, see the module documentation
+    """
+
+    def __init__(self, opts):
+        self.opts = opts
+        self.pki_dir = salt.utils.key_set.pki_dir(opts)
+
+    def list_keys(self, states=STATES):
+        """
+        Return a dict of the sorted minion ids in each of ``states``
+        """
+        raise NotImplementedError()
+
+    def get(self, state, minion_id):
+        """
+        Return the public key of ``minion_id`` in ``state``, or None
+        """
+        raise NotImplementedError()
+
+    def lookup(self, minion_id):
+        """
+        Return a dict of the states ``minion_id`` has a key in, and the keys
+        """
+        ret = {}
+        for state in STATES:
+            pub = self.get(state, minion_id)
+            if pub is not None:
+                ret[state] = pub
+        return ret
+
+    def put(self, state, minion_id, pub):
+        """
+        Store the public key of ``minion_id`` in ``state``, replacing the key
+        already stored there
+        """
+        raise NotImplementedError()
+
+    def move(self, keys, state):
+        """
+        Move the keys in ``keys``, a dict of state -> minion ids, to ``state``
+        and return the moved keys in the same form
+        """
+        raise NotImplementedError()
+
+    def delete(self, keys):
+        """
+        Delete the keys in ``keys``, a dict of state -> minion ids, and return
+        the deleted keys in the same form
+        """
+        raise NotImplementedError()
+
+    def match(self, patterns, states=STATES, regex=False):
+        """
+        Return a dict of the sorted minion ids in each of ``states`` which
+        match one of the glob (or regular expression) ``patterns``
+        """
+        if isinstance(patterns, str):
+            patterns = [patterns]
+        ret = {}
+        for state, minion_ids in self.list_keys(states).items():
+            matched = _filter(minion_ids, patterns, regex)
+            if matched:
+                ret[state] = matched
+        return ret
+
+    def fingerprint(self, state, minion_id, hash_type):
+        """
+        Return the fingerprint of the key of ``minion_id`` in ``state``
+        """
+        pub = self.get(state, minion_id)
+        if pub is None:
+            return ""
+        return _finger(pub, hash_type)
+
+    def fingerprints(self, keys, hash_type):
+        """
+        Return the fingerprints of ``keys``, a dict of state -> minion ids, as
+        a dict of state -> minion id -> fingerprint
+        """
+        return {
+            state: {
+                minion_id: self.fingerprint(state, minion_id, hash_type)
+                for minion_id in minion_ids
+            }
+            for state, minion_ids in keys.items()
+        }
+
+
+def _filter(minion_ids, patterns, regex=False):
+    """
+    Return the minion ids matching one of the patterns, keeping their order
+    """
+    if regex:
+        regs = [re.compile(pattern) for pattern in patterns]
+        return [mid for mid in minion_ids if any(reg.match(mid) for reg in regs)]
+    return [
+        mid
+        for mid in minion_ids
+        if any(fnmatch.fnmatch(mid, pattern) for pattern in patterns)
+    ]
+
+
+class DirKeyStore(KeyStore):
+    """
+    Keys stored as files in the key directories of the pki dir
+    """
+
+    def __init__(self, opts):
+        super().__init__(opts)
+        self._watch = salt.utils.key_set.enabled(opts)
+        # Once this store changed keys, the key set snapshot may not reflect
+        # the changes yet, so the key directories are read until the snapshot
+        # is replaced
+        self._stale = False
+        self._stale_version = None
+
+    def _changed(self):
+        """
+        Remember the key set snapshot which was current when keys changed
+        """
+        if self._watch:
+            snapshot = salt.utils.key_set.read(self.opts)
+            self._stale = True
+            self._stale_version = None if snapshot is None else snapshot["version"]
+
+    def _path(self, state, minion_id):
+        return os.path.join(self.pki_dir, state, minion_id)
+
+    def list_keys(self, states=STATES):
+        if self._watch:
+            snapshot = salt.utils.key_set.read(self.opts)
+            if snapshot is not None and self._stale:
+                if snapshot["version"] == self._stale_version:
+                    snapshot = None
+                else:
+                    self._stale = False
+            if snapshot is not None:
+                return {
+                    state: list(snapshot["keys"].get(state, [])) for state in states
+                }
+        ret = {}
+        for state in states:
+            ret[state] = []
+            try:
+                for fn_ in salt.utils.data.sorted_ignorecase(
+                    os.listdir(os.path.join(self.pki_dir, state))
+                ):
+                    if not fn_.startswith("."):
+                        ret[state].append(salt.utils.stringutils.to_unicode(fn_))
+            except OSError:
+                # key dir kind is not created yet, just skip
+                continue
+        return ret
+
+    def get(self, state, minion_id):
+        try:
+            with salt.utils.files.fopen(self._path(state, minion_id), "r") as fp_:
+                return salt.utils.stringutils.to_unicode(fp_.read())
+        except OSError:
+            return None
+
+    def put(self, state, minion_id, pub):
+        with salt.utils.files.fopen(self._path(state, minion_id), "w+") as fp_:
+            fp_.write(pub)
+        self._changed()
+
+    def move(self, keys, state):
+        ret = {}
+        for src, minion_ids in keys.items():
+            for minion_id in minion_ids:
+                try:
+                    shutil.move(
+                        self._path(src, minion_id), self._path(state, minion_id)
+                    )
+                except OSError:
+                    continue
+                ret.setdefault(src, []).append(minion_id)
+        self._changed()
+        return ret
+
+    def delete(self, keys):
+        ret = {}
+        for state, minion_ids in keys.items():
+            for minion_id in minion_ids:
+                try:
+                    os.remove(self._path(state, minion_id))
+                except OSError:
+                    continue
+                ret.setdefault(state, []).append(minion_id)
+        self._changed()
+        return ret
+
+    def fingerprint(self, state, minion_id, hash_type):
+        return salt.utils.crypt.pem_finger(
+            self._path(state, minion_id), sum_type=hash_type
+        )
+
+
+class SqliteKeyStore(KeyStore):
+    """
+    Keys stored in an indexed SQLite database
+    """
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS keys ("
+        " state TEXT NOT NULL,"
+        " id TEXT NOT NULL,"
+        " pub TEXT NOT NULL,"
+        " hash_type TEXT NOT NULL,"
+        " finger TEXT NOT NULL,"
+        " PRIMARY KEY (state, id))",
+        "CREATE INDEX IF NOT EXISTS keys_id ON keys (id)",
+        "CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)",
+    )
+
+    # The connections of each thread, a SQLite connection can not be used by
+    # another thread. They are keyed by pid too, so they are not shared with
+    # forked processes either.
+    _LOCAL = threading.local()
+
+    def __init__(self, opts):
+        super().__init__(opts)
+        self.path = opts.get("key_store_path") or os.path.join(
+            self.pki_dir, "keys.sqlite3"
+        )
+        self.hash_type = opts.get("hash_type", "sha256")
+
+    @classmethod
+    def _connections(cls):
+        try:
+            return cls._LOCAL.connections
+        except AttributeError:
+            cls._LOCAL.connections = {}
+            return cls._LOCAL.connections
+
+    @property
+    def conn(self):
+        connections = self._connections()
+        key = (os.getpid(), self.path)
+        conn = connections.get(key)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            for statement in self.SCHEMA:
+                conn.execute(statement)
+            connections[key] = conn
+            self._import_dirs(conn)
+        return conn
+
+    def close(self):
+        """
+        Close the connection of this thread to the database
+        """
+        conn = self._connections().pop((os.getpid(), self.path), None)
+        if conn is not None:
+            conn.close()
+
+    def _import_dirs(self, conn):
+        """
+        Import the keys of the key directories the first time the database is
+        opened
+        """
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("SELECT 1 FROM meta WHERE name = 'imported'").fetchone():
+                conn.execute("COMMIT")
+                return
+            dirs = DirKeyStore(dict(self.opts, key_cache=""))
+            count = 0
+            for state, minion_ids in dirs.list_keys().items():
+                for minion_id in minion_ids:
+                    pub = dirs.get(state, minion_id)
+                    if pub is not None:
+                        self._insert(conn, state, minion_id, pub)
+                        count += 1
+            conn.execute("INSERT INTO meta (name, value) VALUES ('imported', '1')")
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        if count:
+            log.info("Imported %s keys from %s into %s", count, self.pki_dir, self.path)
+
+    def _insert(self, conn, state, minion_id, pub):
+        conn.execute(
+            "INSERT OR REPLACE INTO keys (state, id, pub, hash_type, finger)"
+            " VALUES (?, ?, ?, ?, ?)",
+            (state, minion_id, pub, self.hash_type, _finger(pub, self.hash_type)),
+        )
+
+    def _transaction(self, func):
+        conn = self.conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            ret = func(conn)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return ret
+
+    def list_keys(self, states=STATES):
+        ret = {}
+        for state in states:
+            ret[state] = salt.utils.data.sorted_ignorecase(
+                row[0]
+                for row in self.conn.execute(
+                    "SELECT id FROM keys WHERE state = ?", (state,)
+                )
+            )
+        return ret
+
+    def get(self, state, minion_id):
+        row = self.conn.execute(
+            "SELECT pub FROM keys WHERE state = ? AND id = ?", (state, minion_id)
+        ).fetchone()
+        return row[0] if row else None
+
+    def lookup(self, minion_id):
+        return dict(
+            self.conn.execute(
+                "SELECT state, pub FROM keys WHERE id = ?", (minion_id,)
+            ).fetchall()
+        )
+
+    def put(self, state, minion_id, pub):
+        self._transaction(lambda conn: self._insert(conn, state, minion_id, pub))
+
+    def move(self, keys, state):
+        def _move(conn):
+            ret = {}
+            for src, minion_ids in keys.items():
+                for minion_id in minion_ids:
+                    if src == state:
+                        continue
+                    row = conn.execute(
+                        "SELECT pub, hash_type, finger FROM keys"
+                        " WHERE state = ? AND id = ?",
+                        (src, minion_id),
+                    ).fetchone()
+                    if row is None:
+                        continue
+                    conn.execute(
+                        "INSERT OR REPLACE INTO keys (state, id, pub, hash_type, finger)"
+                        " VALUES (?, ?, ?, ?, ?)",
+                        (state, minion_id) + tuple(row),
+                    )
+                    conn.execute(
+                        "DELETE FROM keys WHERE state = ? AND id = ?", (src, minion_id)
+                    )
+                    ret.setdefault(src, []).append(minion_id)
+            return ret
+
+        return self._transaction(_move)
+
+    def delete(self, keys):
+        def _delete(conn):
+            ret = {}
+            for state, minion_ids in keys.items():
+                for minion_id in minion_ids:
+                    cur = conn.execute(
+                        "DELETE FROM keys WHERE state = ? AND id = ?",
+                        (state, minion_id),
+                    )
+                    if cur.rowcount:
+                        ret.setdefault(state, []).append(minion_id)
+            return ret
+
+        return self._transaction(_delete)
+
+    def match(self, patterns, states=STATES, regex=False):
+        if isinstance(patterns, str):
+            patterns = [patterns]
+        if regex:
+            return super().match(patterns, states=states, regex=regex)
+        ret = {}
+        for state in states:
+            matched = set()
+            for pattern in patterns:
+                prefix = _literal_prefix(pattern)
+                if prefix == pattern:
+                    rows = self.conn.execute(
+                        "SELECT id FROM keys WHERE state = ? AND id = ?",
+                        (state, pattern),
+                    )
+                elif prefix:
+                    # Only scan the range of the index starting with the
+                    # literal part of the glob
+                    rows = self.conn.execute(
+                        "SELECT id FROM keys WHERE state = ? AND id >= ? AND id < ?",
+                        (state, prefix, prefix + "\U0010ffff"),
+                    )
+                else:
+                    rows = self.conn.execute(
+                        "SELECT id FROM keys WHERE state = ?", (state,)
+                    )
+                matched.update(
+                    row[0] for row in rows if fnmatch.fnmatch(row[0], pattern)
+                )
+            if matched:
+                ret[state] = salt.utils.data.sorted_ignorecase(matched)
+        return ret
+
+    def fingerprint(self, state, minion_id, hash_type):
+        row = self.conn.execute(
+            "SELECT pub, hash_type, finger FROM keys WHERE state = ? AND id = ?",
+            (state, minion_id),
+        ).fetchone()
+        if row is None:
+            return ""
+        if row[1] == hash_type:
+            return row[2]
+        return _finger(row[0], hash_type)
+
+    def fingerprints(self, keys, hash_type):
+        ret = {}
+        for state, minion_ids in keys.items():
+            minion_ids = set(minion_ids)
+            ret[state] = {}
+            for minion_id, pub, key_hash_type, finger in self.conn.execute(
+                "SELECT id, pub, hash_type, finger FROM keys WHERE state = ?",
+                (state,),
+            ):
+                if minion_id not in minion_ids:
+                    continue
+                if key_hash_type != hash_type:
+                    finger = _finger(pub, hash_type)
+                ret[state][minion_id] = finger
+        return ret
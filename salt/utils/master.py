@@ -18,6 +18,7 @@ import salt.payload
 import salt.pillar
 import salt.utils.atomicfile
 import salt.utils.files
+import salt.utils.minion_index
 import salt.utils.minions
 import salt.utils.platform
 import salt.utils.stringutils
@@ -525,10 +526,17 @@ class MasterPillarUtil:
                 ):
                     # Not saving pillar or grains, so just delete the cache file
                     self.cache.flush(bank, "data")
+                    salt.utils.minion_index.notify_update(self.opts, minion_id, None)
                 elif clear_pillar and minion_grains:
                     self.cache.store(bank, "data", {"grains": minion_grains})
+                    salt.utils.minion_index.notify_update(
+                        self.opts, minion_id, {"grains": minion_grains}
+                    )
                 elif clear_grains and minion_pillar:
                     self.cache.store(bank, "data", {"pillar": minion_pillar})
+                    salt.utils.minion_index.notify_update(
+                        self.opts, minion_id, {"pillar": minion_pillar}
+                    )
                 if clear_mine:
                     # Delete the whole mine file
                     self.cache.flush(bank, "mine")
@@ -0,0 +1,90 @@
+"""
+    salt.utils.merkle
+    -----------------
+
+    Merkle trees over a batch of messages, so the whole batch is signed with a
+    single signature over the root of the tree. The signature of a message is
+    then the signature of the root and the hashes of the path from the
+    message to the root, its proof.
+
+    Leaves and nodes are hashed with a different prefix, so a node can not be
+    passed off as a leaf. A node without a sibling is promoted to the next
+    level as is.
+"""
+
+import hashlib
+
+import salt.utils.stringutils
+
+LEAF = b"\x00"
+NODE = b"\x01"
+
+# The side of the sibling hash of each step of a proof
+LEFT = 0
+RIGHT = 1
+
+
+def leaf(data):
+    """
+    Return the hash of a message
+    """
+    return hashlib.sha256(LEAF + salt.utils.stringutils.to_bytes(data)).digest()
+
+
+def node(left, right):
+    """
+    Return the hash of the parent of two hashes
+    """
+    return hashlib.sha256(NODE + left + right).digest()
+
+
+def tree(messages):
+    """
+    Return the levels of the tree of a non empty list of messages, from the
+    leaves up to the root
+    """
+    if not messages:
+        raise ValueError("A Merkle tree needs at least one message")
+    levels = [[leaf(message) for message in messages]]
+    while len(levels[-1]) > 1:
+        below = levels[-1]
+        level = [node(below[i], below[i + 1]) for i in range(0, len(below) - 1, 2)]
+        if len(below) % 2:
+            level.append(below[-1])
+        levels.append(level)
+    return levels
+
+
+def root(levels):
+    """
+    Return the root hash of a tree
+    """
+    return levels[-1][0]
+
+
+def proof(levels, index):
+    """
+    Return the proof of the message at ``index``: a list of
+    ``[side, sibling hash]`` from the leaf up to the root
+    """
+    ret = []
+    for level in levels[:-1]:
+        sibling = index ^ 1
+        if sibling < len(level):
+            ret.append([LEFT if sibling < index else RIGHT, level[sibling]])
+        index //= 2
+    return ret
+
+
+def root_from_proof(data, path):
+    """
+    Return the root hash the proof of a message leads to
+    """
+    ret = leaf(data)
+    for side, sibling in path:
+        sibling = salt.utils.stringutils.to_bytes(sibling)
+        if side == LEFT:
+            ret = node(sibling, ret)
+        else:
+            ret = node(ret, sibling)
+    return ret
@@ -0,0 +1,614 @@
+"""
+    salt.utils.minion_index
+    -----------------------
+
+    In-memory inverted index of the grains and pillar stored in the minion
+    data cache, used by :py:class:`salt.utils.minions.CkMinions` to resolve
+    grain, pillar and ipcidr targets without reading the cache of every
+    minion.
+
+    The index lives in the ``MinionDataIndex`` master process. MWorkers push
+    updates to it whenever they store ``minions/<id>/data`` and query it over
+    IPC through :py:class:`MinionIndexCli`.
+"""
+
+import fnmatch
+import logging
+import os
+import re
+import signal
+import time
+
+import salt.cache
+import salt.payload
+import salt.utils.data
+from salt._compat import ipaddress
+from salt.defaults import DEFAULT_TARGET_DELIM
+from salt.utils.process import Process
+from salt.utils.zeromq import zmq
+
+log = logging.getLogger(__name__)
+
+SEARCH_TYPES = ("grains", "pillar")
+
+# Characters which make fnmatch treat a pattern as something else than a
+# literal string
+GLOB_CHARS = frozenset("*?[")
+
+# (pid, query socket path) -> MinionIndexCli, so each process keeps a single
+# connection to the index
+_CLIENTS = {}
+
+
+def notify_update(opts, minion_id, mdata):
+    """
+    Send the data just stored in ``minions/<minion_id>/data`` to the minion
+    data index, when it is enabled. A ``mdata`` of None removes the minion.
+    """
+    if not opts.get("minion_data_index", False) or zmq is None:
+        return
+    try:
+        MinionIndexCli.instance(opts).put(minion_id, mdata)
+    except Exception:  # pylint: disable=broad-except
+        log.exception("Failed to update the minion data index for %s", minion_id)
+
+
+def _match(target, pattern, regex_match=False, exact_match=False):
+    """
+    Match a lowercased indexed value against a pattern the same way
+    :py:func:`salt.utils.data.subdict_match` does
+    """
+    if regex_match:
+        try:
+            return re.match(pattern, target)
+        except Exception:  # pylint: disable=broad-except
+            log.error("Invalid regex '%s' in match", pattern)
+            return False
+    return target == pattern if exact_match else fnmatch.fnmatch(target, pattern)
+
+
+def parse_ipcidr(tgt):
+    """
+    Return the IP address or network of an ipcidr target, raises ValueError
+    when the target is neither
+    """
+    try:
+        # Target is an address?
+        return ipaddress.ip_address(tgt)
+    except ValueError:
+        # Target is a network?
+        return ipaddress.ip_network(tgt)
+
+
+class _TrieNode:
+    """
+    Node of an :py:class:`AddressTrie`, covering the addresses sharing the
+    first ``length`` bits of ``key``
+    """
+
+    __slots__ = ("key", "length", "children", "ids")
+
+    def __init__(self, key, length):
+        self.key = key
+        self.length = length
+        self.children = [None, None]
+        self.ids = set()
+
+
+class AddressTrie:
+    """
+    Path compressed binary radix trie of IP addresses, mapping each address
+    to the minions having it. Looking up a network walks at most ``bits``
+    nodes down to the network prefix, then collects the subtree below it, so
+    the cost of a lookup is proportional to the number of matching
+    addresses.
+    """
+
+    def __init__(self, bits):
+        self.bits = bits
+        self.root = _TrieNode(0, 0)
+
+    def _bit(self, key, pos):
+        """
+        Return the bit of ``key`` at position ``pos``, counting from the most
+        significant one
+        """
+        return (key >> (self.bits - pos - 1)) & 1
+
+    def _same_prefix(self, key, other, length):
+        return not (key ^ other) >> (self.bits - length)
+
+    def insert(self, address, minion_id):
+        """
+        Add an address of a minion
+        """
+        node = self.root
+        while node.length < self.bits:
+            bit = self._bit(address, node.length)
+            child = node.children[bit]
+            if child is None:
+                child = node.children[bit] = _TrieNode(address, self.bits)
+            else:
+                common = self.bits - (child.key ^ address).bit_length()
+                if common < child.length:
+                    # Split the compressed path where the keys diverge
+                    split = _TrieNode(address, common)
+                    split.children[self._bit(child.key, common)] = child
+                    node.children[bit] = child = split
+            node = child
+        node.ids.add(minion_id)
+
+    def remove(self, address, minion_id):
+        """
+        Remove an address of a minion, pruning the nodes left empty
+        """
+        path = []
+        node = self.root
+        while node.length < self.bits:
+            bit = self._bit(address, node.length)
+            child = node.children[bit]
+            if child is None or not self._same_prefix(child.key, address, child.length):
+                return
+            path.append((node, bit))
+            node = child
+        node.ids.discard(minion_id)
+        while path and not node.ids and node.children == [None, None]:
+            parent, bit = path.pop()
+            parent.children[bit] = None
+            node = parent
+
+    def lookup(self, network, prefixlen):
+        """
+        Return the set of minions with an address in ``network/prefixlen``
+        """
+        node = self.root
+        while node.length < prefixlen:
+            child = node.children[self._bit(network, node.length)]
+            if child is None:
+                return set()
+            node = child
+        if not self._same_prefix(node.key, network, prefixlen):
+            return set()
+        ret = set()
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            ret.update(node.ids)
+            stack.extend(child for child in node.children if child is not None)
+        return ret
+
+
+class MinionIndex:
+    """
+    Inverted index mapping top level grain/pillar keys to their values and
+    the minions having them.
+
+    Only the values that :py:func:`salt.utils.data.subdict_match` compares as
+    strings (scalars and lists of scalars) are indexed. Minions whose value
+    for a key is a dict, or a list holding dicts, are kept aside and matched
+    against their in-memory data, as are targets using nested keys.
+    """
+
+    def __init__(self):
+        # minion_id -> {"grains": {...}, "pillar": {...}}
+        self.data = {}
+        # search_type -> key -> lowercased value -> set of minion ids
+        self.values = {search_type: {} for search_type in SEARCH_TYPES}
+        # search_type -> key -> set of minion ids with complex values
+        self.complex = {search_type: {} for search_type in SEARCH_TYPES}
+        # IP version -> trie of the ipv4/ipv6 grains
+        self.addresses = {4: AddressTrie(32), 6: AddressTrie(128)}
+
+    def __len__(self):
+        return len(self.data)
+
+    def minions(self):
+        """
+        Return the set of minions with indexed data
+        """
+        return set(self.data)
+
+    @staticmethod
+    def _index_values(value):
+        """
+        Return the index entries of a top level value, or None if the value
+        has to be matched with subdict_match
+        """
+        if isinstance(value, dict):
+            return None
+        if isinstance(value, (list, tuple)):
+            if any(isinstance(member, dict) for member in value):
+                return None
+            members = value
+        else:
+            members = [value]
+        return {str(member).lower() for member in members}
+
+    @staticmethod
+    def _ip_addresses(mdata):
+        """
+        Return the IP addresses listed in the ipv4 and ipv6 grains of a minion
+        """
+        grains = mdata.get("grains")
+        if not isinstance(grains, dict):
+            return
+        for proto in ("ipv4", "ipv6"):
+            for address in grains.get(proto) or ():
+                try:
+                    yield ipaddress.ip_address(address)
+                except ValueError:
+                    continue
+
+    def remove(self, minion_id):
+        """
+        Remove a minion from the index
+        """
+        mdata = self.data.pop(minion_id, None)
+        if not mdata:
+            return
+        for address in self._ip_addresses(mdata):
+            self.addresses[address.version].remove(int(address), minion_id)
+        for search_type in SEARCH_TYPES:
+            search_data = mdata.get(search_type)
+            if not isinstance(search_data, dict):
+                continue
+            for key, value in search_data.items():
+                if not isinstance(key, str):
+                    continue
+                complex_ids = self.complex[search_type].get(key)
+                if complex_ids is not None and minion_id in complex_ids:
+                    complex_ids.discard(minion_id)
+                    if not complex_ids:
+                        del self.complex[search_type][key]
+                    continue
+                key_values = self.values[search_type].get(key)
+                if key_values is None:
+                    continue
+                for entry in self._index_values(value):
+                    ids = key_values.get(entry)
+                    if ids is None:
+                        continue
+                    ids.discard(minion_id)
+                    if not ids:
+                        del key_values[entry]
+                if not key_values:
+                    del self.values[search_type][key]
+
+    def update(self, minion_id, mdata):
+        """
+        Replace the indexed data of a minion, a ``mdata`` of None removes the
+        minion from the index
+        """
+        self.remove(minion_id)
+        if mdata is None:
+            return
+        self.data[minion_id] = mdata
+        for address in self._ip_addresses(mdata):
+            self.addresses[address.version].insert(int(address), minion_id)
+        for search_type in SEARCH_TYPES:
+            search_data = mdata.get(search_type)
+            if not isinstance(search_data, dict):
+                continue
+            for key, value in search_data.items():
+                if not isinstance(key, str):
+                    # traverse_dict_and_list only looks up string keys
+                    continue
+                entries = self._index_values(value)
+                if entries is None:
+                    self.complex[search_type].setdefault(key, set()).add(minion_id)
+                    continue
+                key_values = self.values[search_type].setdefault(key, {})
+                for entry in entries:
+                    key_values.setdefault(entry, set()).add(minion_id)
+
+    def match(
+        self,
+        search_type,
+        expr,
+        delimiter=DEFAULT_TARGET_DELIM,
+        regex_match=False,
+        exact_match=False,
+    ):
+        """
+        Return the set of indexed minions whose grains or pillar match
+        ``expr``, with the semantics of
+        :py:func:`salt.utils.data.subdict_match`
+        """
+        splits = expr.split(delimiter)
+        if len(splits) == 1:
+            # Delimiter not present, this can't possibly be a match
+            return set()
+        if len(splits) > 2 or splits[0] == "*":
+            # Nested keys and wildcard keys are matched on the in-memory data
+            return {
+                minion_id
+                for minion_id, mdata in self.data.items()
+                if salt.utils.data.subdict_match(
+                    mdata.get(search_type),
+                    expr,
+                    delimiter=delimiter,
+                    regex_match=regex_match,
+                    exact_match=exact_match,
+                )
+            }
+
+        key, pattern = splits
+        pattern = str(pattern).lower()
+        key_values = self.values[search_type].get(key, {})
+        ret = set()
+        if exact_match or (not regex_match and not GLOB_CHARS & set(pattern)):
+            ret.update(key_values.get(pattern, ()))
+        else:
+            for value, ids in key_values.items():
+                if _match(
+                    value, pattern, regex_match=regex_match, exact_match=exact_match
+                ):
+                    ret.update(ids)
+        for minion_id in self.complex[search_type].get(key, ()):
+            if salt.utils.data.subdict_match(
+                self.data[minion_id].get(search_type),
+                expr,
+                delimiter=delimiter,
+                regex_match=regex_match,
+                exact_match=exact_match,
+            ):
+                ret.add(minion_id)
+        return ret
+
+    def match_ipcidr(self, tgt):
+        """
+        Return the set of indexed minions with an ipv4 or ipv6 grain matching
+        an IP address or network, raises ValueError for invalid targets
+        """
+        tgt = parse_ipcidr(tgt)
+        trie = self.addresses[tgt.version]
+        if isinstance(tgt, (ipaddress.IPv4Address, ipaddress.IPv6Address)):
+            return trie.lookup(int(tgt), trie.bits)
+        return trie.lookup(int(tgt.network_address), tgt.prefixlen)
+
+
+class MinionDataIndex(Process):
+    """
+    Keeps a :py:class:`MinionIndex` of the minion data cache and answers
+    target queries from the MWorkers. The whole index is rebuilt from the
+    cache every ``minion_data_index_refresh`` seconds to catch updates made
+    outside of the master, like cache flushes done by runners.
+    """
+
+    def __init__(self, opts, **kwargs):
+        super().__init__(**kwargs)
+        self.opts = opts
+        self.index = MinionIndex()
+        self.query_sock = os.path.join(self.opts["sock_dir"], "minion_index.ipc")
+        self.update_sock = os.path.join(self.opts["sock_dir"], "minion_index_upd.ipc")
+        self.running = True
+
+    def signal_handler(self, sig, frame):
+        """
+        handle signals and shutdown
+        """
+        self.running = False
+
+    def cleanup(self):
+        """
+        remove sockets on shutdown
+        """
+        for sock in (self.query_sock, self.update_sock):
+            if os.path.exists(sock):
+                os.remove(sock)
+
+    def refresh(self):
+        """
+        Rebuild the index from the minion data cache
+        """
+        cache = salt.cache.factory(self.opts)
+        index = MinionIndex()
+        for minion_id in cache.list("minions"):
+            index.update(minion_id, cache.fetch(f"minions/{minion_id}", "data"))
+        self.index = index
+        log.debug("MinionDataIndex refreshed, %s minions indexed", len(index))
+
+    def _reply(self, matched, candidates):
+        """
+        Return the reply to a query matching ``matched``. Greedy queries send
+        the accepted minions as ``candidates``, those without cached data are
+        kept as well.
+        """
+        if candidates is None:
+            return {"minions": list(matched)}
+        cached = self.index.data
+        return {
+            "minions": [
+                minion_id
+                for minion_id in candidates
+                if minion_id in matched or minion_id not in cached
+            ]
+        }
+
+    def handle_query(self, msg):
+        """
+        Answer a query from a MinionIndexCli
+        """
+        if msg.get("cmd") == "match":
+            matched = self.index.match(
+                msg["search_type"],
+                msg["expr"],
+                delimiter=msg.get("delimiter", DEFAULT_TARGET_DELIM),
+                regex_match=msg.get("regex_match", False),
+                exact_match=msg.get("exact_match", False),
+            )
+            return self._reply(matched, msg.get("candidates"))
+        if msg.get("cmd") == "ipcidr":
+            try:
+                matched = self.index.match_ipcidr(msg["tgt"])
+            except ValueError:
+                log.error("Invalid IP/CIDR target: %s", msg["tgt"])
+                matched = set()
+            return self._reply(matched, msg.get("candidates"))
+        log.error("MinionDataIndex received an unknown query: %s", msg.get("cmd"))
+        return None
+
+    def run(self):
+        """
+        Main loop of the index, answers queries and applies updates
+        """
+        self.cleanup()
+        context = zmq.Context()
+        # the socket for incoming queries
+        query_in = context.socket(zmq.REP)
+        query_in.setsockopt(zmq.LINGER, 100)
+        query_in.bind("ipc://" + self.query_sock)
+
+        # the socket for incoming updates from the MWorkers
+        update_in = context.socket(zmq.PULL)
+        update_in.setsockopt(zmq.LINGER, 100)
+        update_in.bind("ipc://" + self.update_sock)
+
+        for sock in (self.query_sock, self.update_sock):
+            os.chmod(sock, 0o600)
+
+        poller = zmq.Poller()
+        poller.register(query_in, zmq.POLLIN)
+        poller.register(update_in, zmq.POLLIN)
+
+        signal.signal(signal.SIGINT, self.signal_handler)
+        signal.signal(signal.SIGTERM, self.signal_handler)
+
+        interval = self.opts.get("minion_data_index_refresh", 300)
+        last_refresh = 0
+        log.info("MinionDataIndex started")
+        while self.running:
+            if time.time() - last_refresh > interval:
+                try:
+                    self.refresh()
+                except Exception:  # pylint: disable=broad-except
+                    log.exception("MinionDataIndex failed to refresh the index")
+                last_refresh = time.time()
+            try:
+                socks = dict(poller.poll(1000))
+            except zmq.ZMQError:
+                log.exception("MinionDataIndex ZeroMQ-Error occurred")
+                break
+
+            if socks.get(update_in) == zmq.POLLIN:
+                try:
+                    minion_id, mdata = salt.payload.loads(update_in.recv())
+                    self.index.update(minion_id, mdata)
+                except (TypeError, ValueError):
+                    log.error("MinionDataIndex received a malformed update")
+
+            if socks.get(query_in) == zmq.POLLIN:
+                try:
+                    reply = self.handle_query(salt.payload.loads(query_in.recv()))
+                except Exception:  # pylint: disable=broad-except
+                    log.exception("MinionDataIndex failed to answer a query")
+                    reply = None
+                query_in.send(salt.payload.dumps(reply))
+
+        query_in.close()
+        update_in.close()
+        context.term()
+        self.cleanup()
+        log.debug("MinionDataIndex shutting down")
+
+
+class MinionIndexCli:
+    """
+    Connection client for the MinionDataIndex
+    """
+
+    def __init__(self, opts):
+        self.opts = opts
+        self.query_sock = os.path.join(self.opts["sock_dir"], "minion_index.ipc")
+        self.update_sock = os.path.join(self.opts["sock_dir"], "minion_index_upd.ipc")
+        self.timeout = self.opts.get("minion_data_index_timeout", 5)
+        self.context = zmq.Context()
+        self.query_out = None
+
+        # the socket for sending updates to the index, the updates are queued
+        # until it is connected so the first ones are not lost
+        self.update_out = self.context.socket(zmq.PUSH)
+        self.update_out.setsockopt(zmq.LINGER, 100)
+        self.update_out.connect("ipc://" + self.update_sock)
+
+    @classmethod
+    def instance(cls, opts):
+        """
+        Return the client of the current process, creating it if needed
+        """
+        key = (os.getpid(), os.path.join(opts["sock_dir"], "minion_index.ipc"))
+        if key not in _CLIENTS:
+            _CLIENTS[key] = cls(opts)
+        return _CLIENTS[key]
+
+    def _query_socket(self):
+        if self.query_out is None:
+            self.query_out = self.context.socket(zmq.REQ)
+            self.query_out.setsockopt(zmq.LINGER, 0)
+            self.query_out.connect("ipc://" + self.query_sock)
+        return self.query_out
+
+    def put(self, minion_id, mdata):
+        """
+        Send the new cached data of a minion to the index, a ``mdata`` of None
+        removes the minion
+        """
+        try:
+            self.update_out.send(
+                salt.payload.dumps([minion_id, mdata]), flags=zmq.NOBLOCK, track=False
+            )
+        except zmq.Again:
+            # The index is not running, it rebuilds from the cache when it is
+            log.debug("Unable to queue the minion data index update of %s", minion_id)
+
+    def match(
+        self,
+        search_type,
+        expr,
+        delimiter=DEFAULT_TARGET_DELIM,
+        regex_match=False,
+        exact_match=False,
+        candidates=None,
+    ):
+        """
+        Ask the index which minions match a grain or pillar target. When
+        ``candidates`` are given, the candidates matching it or without cached
+        data are returned instead, for greedy targeting. Returns a dict holding
+        the ``minions``, or None when the index did not answer in time.
+        """
+        return self._query(
+            {
+                "cmd": "match",
+                "search_type": search_type,
+                "expr": expr,
+                "delimiter": delimiter,
+                "regex_match": regex_match,
+                "exact_match": exact_match,
+                "candidates": candidates,
+            }
+        )
+
+    def match_ipcidr(self, tgt, candidates=None):
+        """
+        Ask the index which minions have an address matching an ipcidr
+        target, with the same ``candidates`` as :py:meth:`match`. Returns a
+        dict holding the ``minions``, or None when the index did not answer in
+        time.
+        """
+        return self._query({"cmd": "ipcidr", "tgt": tgt, "candidates": candidates})
+
+    def _query(self, msg):
+        """
+        Send a query to the index and wait for the reply
+        """
+        if not os.path.exists(self.query_sock):
+            return None
+        sock = self._query_socket()
+        sock.send(salt.payload.dumps(msg), track=False)
+        if not sock.poll(self.timeout * 1000):
+            log.warning("The minion data index did not answer in time")
+            # A REQ socket can't send again before it got its reply
+            sock.close()
+            self.query_out = None
+            return None
+        return salt.payload.loads(sock.recv())
@@ -3,6 +3,7 @@ This module contains routines used to verify the matcher against the minions
 expected to return
 """
 
+import collections
 import fnmatch
 import logging
 import os
@@ -14,6 +15,9 @@ import salt.roster
 import salt.transport
 import salt.utils.data
 import salt.utils.files
+import salt.utils.key_set
+import salt.utils.key_store
+import salt.utils.minion_index
 import salt.utils.network
 import salt.utils.stringutils
 import salt.utils.versions
@@ -196,6 +200,142 @@ def nodegroup_comp(nodegroup, nodegroups, skip=None, first_call=True):
         return ret
 
 
+COMPOUND_OPERS = ("and", "or", "not", "(", ")")
+
+# Relative cost of the compound matcher engines, None being a plain glob.
+# The cheapest words of an "and" are evaluated first so the expensive ones
+# can be skipped once the intersection is empty.
+COMPOUND_ENGINE_COST = {
+    "L": 0,
+    None: 1,
+    "E": 1,
+    "G": 2,
+    "P": 2,
+    "I": 2,
+    "J": 2,
+    "S": 2,
+    "R": 3,
+}
+
+# The number of compiled compound targets kept by each CkMinions
+COMPOUND_CACHE_SIZE = 1024
+
+
+class _CompoundParser:
+    """
+    Recursive descent parser turning compound target words into a tree of
+    ``("and", [nodes])``, ``("or", [nodes])``, ``("not", node)`` and
+    ``("match", engine, pattern, delimiter)`` nodes. "and" binds tighter than
+    "or", "not" applies to the following word or parenthesized group and a
+    "not" following a word implies an "and".
+    """
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.pos = 0
+
+    def _peek(self):
+        if self.pos < len(self.tokens):
+            return self.tokens[self.pos]
+        return None
+
+    def parse(self):
+        node = self._or()
+        if self.pos != len(self.tokens):
+            raise ValueError(f"unexpected {self.tokens[self.pos]!r}")
+        return node
+
+    def _or(self):
+        nodes = [self._and()]
+        while self._peek() == "or":
+            self.pos += 1
+            nodes.append(self._and())
+        return nodes[0] if len(nodes) == 1 else ("or", nodes)
+
+    def _and(self):
+        nodes = [self._not()]
+        while self._peek() in ("and", "not"):
+            if self._peek() == "and":
+                self.pos += 1
+            nodes.append(self._not())
+        return nodes[0] if len(nodes) == 1 else ("and", nodes)
+
+    def _not(self):
+        if self._peek() == "not":
+            self.pos += 1
+            return ("not", self._not())
+        return self._primary()
+
+    def _primary(self):
+        token = self._peek()
+        if token is None:
+            raise ValueError("unexpected end of expression")
+        self.pos += 1
+        if token == "(":
+            node = self._or()
+            # Unclosed parenthesis are closed at the end of the expression
+            if self._peek() == ")":
+                self.pos += 1
+            return node
+        if token in COMPOUND_OPERS:
+            raise ValueError(f"unexpected operator {token!r}")
+        return token
+
+
+def compile_compound(expr, nodegroups=None):
+    """
+    Parse a compound target, expanding the nodegroups it references, into a
+    tree which can be evaluated with set operations. Returns None if the
+    target is invalid.
+    """
+    if isinstance(expr, str):
+        words = expr.split()
+    else:
+        # we make a shallow copy in order to not affect the passed in arg
+        words = list(expr)
+
+    tokens = []
+    while words:
+        word = words.pop(0)
+        if word in COMPOUND_OPERS:
+            tokens.append(word)
+            continue
+        target_info = parse_target(word)
+        if target_info["engine"] == "N":
+            # if we encounter a node group, just evaluate it in-place
+            decomposed = nodegroup_comp(target_info["pattern"], nodegroups or {})
+            if decomposed:
+                words = decomposed + words
+            continue
+        tokens.append(
+            (
+                "match",
+                target_info["engine"],
+                target_info["pattern"],
+                target_info["delimiter"],
+            )
+        )
+
+    try:
+        tree = _CompoundParser(tokens).parse()
+    except ValueError as exc:
+        log.error("Invalid compound target %s: %s", expr, exc)
+        return None
+    log.debug("Compiled compound target %s: %s", expr, tree)
+    return tree
+
+
+def _compound_cost(node):
+    """
+    Return the cost of evaluating a compiled compound target node
+    """
+    if node[0] == "match":
+        return COMPOUND_ENGINE_COST.get(node[1], 3)
+    if node[0] == "not":
+        return _compound_cost(node[1])
+    return max(_compound_cost(child) for child in node[1])
+
+
 class CkMinions:
     """
     Used to check what minions should respond from a target
@@ -218,6 +358,9 @@ class CkMinions:
             self.pki_dir = self.opts.get("cluster_pki_dir", "")
         else:
             self.pki_dir = self.opts.get("pki_dir", "")
+        self.key_store = salt.utils.key_store.factory(opts)
+        # compound target -> compiled tree, see _compile_compound
+        self._compound_cache = collections.OrderedDict()
 
     def _check_nodegroup_minions(self, expr, greedy):  # pylint: disable=unused-argument
         """
@@ -262,6 +405,10 @@ class CkMinions:
         Retrieve complete minion list from PKI dir.
         Respects cache if configured
         """
+        if self.opts.get("key_store", "dirs") != "dirs" or salt.utils.key_set.enabled(
+            self.opts
+        ):
+            return self._accepted_minions()
         minions = []
         pki_cache_fn = os.path.join(self.pki_dir, self.acc, ".key_cache")
         try:
@@ -286,6 +433,12 @@ class CkMinions:
             )
             return minions
 
+    def _accepted_minions(self):
+        """
+        Return the sorted list of accepted minions from the key store
+        """
+        return self.key_store.list_keys((self.acc,))[self.acc]
+
     def _check_cache_minions(
         self, expr, delimiter, greedy, search_type, regex_match=False, exact_match=False
     ):
@@ -301,17 +454,27 @@ class CkMinions:
             return self.cache.list("minions")
 
         if greedy:
-            minions = []
-            for fn_ in salt.utils.data.sorted_ignorecase(
-                os.listdir(os.path.join(self.pki_dir, self.acc))
-            ):
-                if not fn_.startswith("."):
-                    minions.append(fn_)
+            minions = self._accepted_minions()
         elif cache_enabled:
-            minions = list_cached_minions()
+            minions = None
         else:
             return {"minions": [], "missing": []}
 
+        if cache_enabled and self.opts.get("minion_data_index", False):
+            indexed = self._query_minion_index(
+                search_type,
+                expr,
+                candidates=minions,
+                delimiter=delimiter,
+                regex_match=regex_match,
+                exact_match=exact_match,
+            )
+            if indexed is not None:
+                return {"minions": indexed["minions"], "missing": []}
+
+        if minions is None:
+            minions = list_cached_minions()
+
         if cache_enabled:
             if greedy:
                 cminions = list_cached_minions()
@@ -340,6 +503,25 @@ class CkMinions:
             minions = list(minions)
         return {"minions": minions, "missing": []}
 
+    def _query_minion_index(self, search_type, expr, candidates=None, **kwargs):
+        """
+        Ask the minion data index which minions match a grain, pillar or
+        (with a ``search_type`` of "ipcidr") ipcidr target. When greedy, the
+        accepted minions are passed as ``candidates`` and those without cached
+        data are returned too. Returns None when the index is not available,
+        in which case the minion data cache has to be searched.
+        """
+        if salt.utils.minion_index.zmq is None:
+            return None
+        try:
+            cli = salt.utils.minion_index.MinionIndexCli.instance(self.opts)
+            if search_type == "ipcidr":
+                return cli.match_ipcidr(expr, candidates=candidates)
+            return cli.match(search_type, expr, candidates=candidates, **kwargs)
+        except Exception:  # pylint: disable=broad-except
+            log.exception("Failed to query the minion data index")
+            return None
+
     def _check_grain_minions(self, expr, delimiter, greedy):
         """
         Return the minions found by looking via grains
@@ -385,10 +567,23 @@ class CkMinions:
         if greedy:
             minions = self._pki_minions()
         elif cache_enabled:
-            minions = self.cache.list("minions")
+            minions = None
         else:
             return {"minions": [], "missing": []}
 
+        if cache_enabled and self.opts.get("minion_data_index", False):
+            try:
+                salt.utils.minion_index.parse_ipcidr(expr)
+            except ValueError:
+                log.error("Invalid IP/CIDR target: %s", expr)
+                return {"minions": [], "missing": []}
+            indexed = self._query_minion_index("ipcidr", expr, candidates=minions)
+            if indexed is not None:
+                return {"minions": indexed["minions"], "missing": []}
+
+        if minions is None:
+            minions = self.cache.list("minions")
+
         if cache_enabled:
             if greedy:
                 cminions = self.cache.list("minions")
@@ -447,13 +642,7 @@ class CkMinions:
             log.error("Range exception in compound match: %s", exc)
             cache_enabled = self.opts.get("minion_data_cache", False)
             if greedy:
-                mlist = []
-                for fn_ in salt.utils.data.sorted_ignorecase(
-                    os.listdir(os.path.join(self.pki_dir, self.acc))
-                ):
-                    if not fn_.startswith("."):
-                        mlist.append(fn_)
-                return {"minions": mlist, "missing": []}
+                return {"minions": self._accepted_minions(), "missing": []}
             elif cache_enabled:
                 return {"minions": self.cache.list("minions"), "missing": []}
             else:
@@ -476,150 +665,101 @@ class CkMinions:
         if not isinstance(expr, str) and not isinstance(expr, (list, tuple)):
             log.error("Compound target that is neither string, list nor tuple")
             return {"minions": [], "missing": []}
-        minions = set(self._pki_minions())
-        log.debug("minions: %s", minions)
 
-        nodegroups = self.opts.get("nodegroups", {})
+        if not self.opts.get("minion_data_cache", False):
+            return {"minions": list(set(self._pki_minions())), "missing": []}
+
+        ref = {
+            "G": self._check_grain_minions,
+            "P": self._check_grain_pcre_minions,
+            "I": self._check_pillar_minions,
+            "J": self._check_pillar_pcre_minions,
+            "L": self._check_list_minions,
+            "S": self._check_ipcidr_minions,
+            "E": self._check_pcre_minions,
+            "R": self._all_minions,
+        }
+        if pillar_exact:
+            ref["I"] = self._check_pillar_exact_minions
+            ref["J"] = self._check_pillar_exact_minions
 
-        if self.opts.get("minion_data_cache", False):
-            ref = {
-                "G": self._check_grain_minions,
-                "P": self._check_grain_pcre_minions,
-                "I": self._check_pillar_minions,
-                "J": self._check_pillar_pcre_minions,
-                "L": self._check_list_minions,
-                "N": None,  # nodegroups should already be expanded
-                "S": self._check_ipcidr_minions,
-                "E": self._check_pcre_minions,
-                "R": self._all_minions,
-            }
-            if pillar_exact:
-                ref["I"] = self._check_pillar_exact_minions
-                ref["J"] = self._check_pillar_exact_minions
-
-            results = []
-            unmatched = []
-            opers = ["and", "or", "not", "(", ")"]
-            missing = []
-
-            if isinstance(expr, str):
-                words = expr.split()
-            else:
-                # we make a shallow copy in order to not affect the passed in arg
-                words = expr[:]
-
-            while words:
-                word = words.pop(0)
-                target_info = parse_target(word)
-
-                # Easy check first
-                if word in opers:
-                    if results:
-                        if results[-1] == "(" and word in ("and", "or"):
-                            log.error('Invalid beginning operator after "(": %s', word)
-                            return {"minions": [], "missing": []}
-                        if word == "not":
-                            if not results[-1] in ("&", "|", "("):
-                                results.append("&")
-                            results.append("(")
-                            results.append(str(set(minions)))
-                            results.append("-")
-                            unmatched.append("-")
-                        elif word == "and":
-                            results.append("&")
-                        elif word == "or":
-                            results.append("|")
-                        elif word == "(":
-                            results.append(word)
-                            unmatched.append(word)
-                        elif word == ")":
-                            if not unmatched or unmatched[-1] != "(":
-                                log.error(
-                                    "Invalid compound expr (unexpected "
-                                    "right parenthesis): %s",
-                                    expr,
-                                )
-                                return {"minions": [], "missing": []}
-                            results.append(word)
-                            unmatched.pop()
-                            if unmatched and unmatched[-1] == "-":
-                                results.append(")")
-                                unmatched.pop()
-                        else:  # Won't get here, unless oper is added
-                            log.error("Unhandled oper in compound expr: %s", expr)
-                            return {"minions": [], "missing": []}
-                    else:
-                        # seq start with oper, fail
-                        if word == "not":
-                            results.append("(")
-                            results.append(str(set(minions)))
-                            results.append("-")
-                            unmatched.append("-")
-                        elif word == "(":
-                            results.append(word)
-                            unmatched.append(word)
-                        else:
-                            log.error(
-                                "Expression may begin with binary operator: %s", word
-                            )
-                            return {"minions": [], "missing": []}
-
-                elif target_info and target_info["engine"]:
-                    if "N" == target_info["engine"]:
-                        # if we encounter a node group, just evaluate it in-place
-                        decomposed = nodegroup_comp(target_info["pattern"], nodegroups)
-                        if decomposed:
-                            words = decomposed + words
-                        continue
-
-                    engine = ref.get(target_info["engine"])
-                    if not engine:
-                        # If an unknown engine is called at any time, fail out
-                        log.error(
-                            'Unrecognized target engine "%s" for'
-                            ' target expression "%s"',
-                            target_info["engine"],
-                            word,
-                        )
-                        return {"minions": [], "missing": []}
-
-                    engine_args = [target_info["pattern"]]
-                    if target_info["engine"] in ("G", "P", "I", "J"):
-                        engine_args.append(target_info["delimiter"] or ":")
-                    engine_args.append(greedy)
-
-                    # ignore missing minions for lists if we exclude them with
-                    # a 'not'
-                    if "L" == target_info["engine"]:
-                        engine_args.append(results and results[-1] == "-")
-                    _results = engine(*engine_args)
-                    results.append(str(set(_results["minions"])))
-                    missing.extend(_results["missing"])
-                    if unmatched and unmatched[-1] == "-":
-                        results.append(")")
-                        unmatched.pop()
+        tree = self._compile_compound(expr)
+        if tree is None:
+            return {"minions": [], "missing": []}
+        state = {"ref": ref, "greedy": greedy, "missing": [], "all": None}
+        try:
+            minions = self._eval_compound(tree, state)
+        except CommandExecutionError as exc:
+            log.error("Invalid compound target %s: %s", expr, exc)
+            return {"minions": [], "missing": []}
+        return {"minions": list(minions), "missing": state["missing"]}
 
-                else:
-                    # The match is not explicitly defined, evaluate as a glob
-                    _results = self._check_glob_minions(word, True)
-                    results.append(str(set(_results["minions"])))
-                    if unmatched and unmatched[-1] == "-":
-                        results.append(")")
-                        unmatched.pop()
-
-            # Add a closing ')' for each item left in unmatched
-            results.extend([")" for item in unmatched])
-
-            results = " ".join(results)
-            log.debug("Evaluating final compound matching expr: %s", results)
-            try:
-                minions = list(eval(results))  # pylint: disable=W0123
-                return {"minions": minions, "missing": missing}
-            except Exception:  # pylint: disable=broad-except
-                log.error("Invalid compound target: %s", expr)
-                return {"minions": [], "missing": []}
+    def _compile_compound(self, expr):
+        """
+        Return the compiled tree of a compound target, parsing it only the
+        first time it is seen
+        """
+        key = expr if isinstance(expr, str) else tuple(expr)
+        try:
+            self._compound_cache.move_to_end(key)
+            return self._compound_cache[key]
+        except KeyError:
+            pass
+        except TypeError:
+            # Unhashable words, don't bother caching
+            return compile_compound(expr, self.opts.get("nodegroups", {}))
+        tree = compile_compound(expr, self.opts.get("nodegroups", {}))
+        self._compound_cache[key] = tree
+        while len(self._compound_cache) > COMPOUND_CACHE_SIZE:
+            self._compound_cache.popitem(last=False)
+        return tree
+
+    def _eval_compound(self, node, state, ignore_missing=False):
+        """
+        Evaluate a compiled compound target to the set of matching minions
+        """
+        kind = node[0]
+        if kind == "match":
+            _, engine, pattern, delimiter = node
+            if engine is None:
+                # The match is not explicitly defined, evaluate as a glob
+                return set(self._check_glob_minions(pattern, True)["minions"])
+            func = state["ref"].get(engine)
+            if func is None:
+                raise CommandExecutionError(f'Unrecognized target engine "{engine}"')
+            engine_args = [pattern]
+            if engine in ("G", "P", "I", "J"):
+                engine_args.append(delimiter or ":")
+            engine_args.append(state["greedy"])
+            if engine == "L":
+                # ignore missing minions for lists if we exclude them with
+                # a 'not'
+                engine_args.append(ignore_missing)
+            _results = func(*engine_args)
+            state["missing"].extend(_results["missing"])
+            return set(_results["minions"])
+
+        if kind == "not":
+            if state["all"] is None:
+                state["all"] = set(self._pki_minions())
+            child = node[1]
+            return state["all"] - self._eval_compound(
+                child, state, ignore_missing=child[0] == "match"
+            )
 
-        return {"minions": list(minions), "missing": []}
+        minions = None
+        # Cheap matchers first, so that an "and" which is already empty can
+        # skip the expensive ones
+        for child in sorted(node[1], key=_compound_cost):
+            if kind == "and":
+                if minions is not None and not minions:
+                    break
+                matched = self._eval_compound(child, state)
+                minions = matched if minions is None else minions & matched
+            else:
+                matched = self._eval_compound(child, state)
+                minions = matched if minions is None else minions | matched
+        return minions if minions is not None else set()
 
     def connected_ids(self, subset=None, show_ip=False):
         """
@@ -677,13 +817,7 @@ class CkMinions:
         """
         Return a list of all minions that have auth'd
         """
-        mlist = []
-        for fn_ in salt.utils.data.sorted_ignorecase(
-            os.listdir(os.path.join(self.pki_dir, self.acc))
-        ):
-            if not fn_.startswith("."):
-                mlist.append(fn_)
-        return {"minions": mlist, "missing": []}
+        return {"minions": self._accepted_minions(), "missing": []}
 
     def check_minions(
         self, expr, tgt_type="glob", delimiter=DEFAULT_TARGET_DELIM, greedy=True
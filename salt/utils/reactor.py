@@ -2,13 +2,20 @@
 Functions which implement running reactor jobs
 """
 
+import collections
+import copy
 import fnmatch
 import glob
+import hashlib
 import logging
 import os
+import re
+import threading
+import time
 
 import salt.client
 import salt.defaults.exitcodes
+import salt.payload
 import salt.runner
 import salt.state
 import salt.utils.args
@@ -28,6 +35,316 @@ REACTOR_INTERNAL_KEYWORDS = frozenset(
 )
 
 
+# The characters which make a reactor tag a glob
+GLOB_CHARS = re.compile(r"[*?[]")
+
+# Reactor SLS files with template tags are rendered for every event. The
+# others render to the same output until they change, as long as their
+# renderers leave plain text alone.
+TEMPLATE_TAGS = re.compile(r"\{[{%]")
+PLAIN_RENDERERS = frozenset(["jinja", "yaml", "json"])
+
+
+class ReactorMap:
+    """
+    The reactor configuration compiled to look up the reactions of a tag
+    without matching it against every configured glob.
+
+    Tags without wildcards are looked up in a dict, globs which are a prefix
+    followed by ``*`` by the prefix of the tag. The other globs are combined
+    in a single regular expression, the tag is only matched against each of
+    them when it matches the combination.
+
+    :param list react_map: The ``reactor`` configuration, a list of single
+        key dicts of tag glob to reactor SLS files
+    """
+
+    def __init__(self, react_map):
+        # Index of each glob in the configuration -> its reactions
+        self.reactions = []
+        self.literals = {}
+        # Length of the prefix -> prefix -> indexes
+        self.prefixes = {}
+        self.patterns = []
+        for ropt in react_map or []:
+            if not isinstance(ropt, dict):
+                continue
+            if len(ropt) != 1:
+                continue
+            key = next(iter(ropt.keys()))
+            val = ropt[key]
+            if isinstance(val, str):
+                val = [val]
+            elif not isinstance(val, list):
+                continue
+            index = len(self.reactions)
+            self.reactions.append(val)
+            key = str(key)
+            if not GLOB_CHARS.search(key):
+                self.literals.setdefault(key, []).append(index)
+            elif key.endswith("*") and not GLOB_CHARS.search(key[:-1]):
+                prefix = key[:-1]
+                self.prefixes.setdefault(len(prefix), {}).setdefault(prefix, []).append(
+                    index
+                )
+            else:
+                self.patterns.append((index, re.compile(fnmatch.translate(key))))
+        self.combined = None
+        if self.patterns:
+            self.combined = re.compile(
+                "|".join(f"(?:{regex.pattern})" for _, regex in self.patterns)
+            )
+
+    def match(self, tag):
+        """
+        Return the reactor SLS files for a tag, in the order of the
+        configuration
+        """
+        matched = list(self.literals.get(tag, ()))
+        for length, prefixes in self.prefixes.items():
+            matched.extend(prefixes.get(tag[:length], ()))
+        if self.combined is not None and self.combined.match(tag):
+            matched.extend(index for index, regex in self.patterns if regex.match(tag))
+        if len(matched) > 1:
+            matched.sort()
+        reactors = []
+        for index in matched:
+            reactors.extend(self.reactions[index])
+        return reactors
+
+
+# The reaction classes and their settings, merged with the
+# ``reactor_classes`` option
+DEFAULT_REACTION_CLASS = "default"
+
+# The weight of the latest reaction in the average latencies of a class
+EWMA_WEIGHT = 0.1
+
+
+def reaction_classes(opts):
+    """
+    Return the reaction classes, the ``default`` class gets the reactions of
+    the tags no other class claims. The queue of every class is bounded by
+    ``reactor_worker_hwm`` unless configured otherwise.
+    """
+    defaults = {
+        "tags": [],
+        "priority": 10,
+        "concurrency": 0,
+        "max_queue": opts.get("reactor_worker_hwm", 10000),
+        "coalesce": 0,
+    }
+    ret = {DEFAULT_REACTION_CLASS: dict(defaults, tags=[])}
+    for name, settings in (opts.get("reactor_classes") or {}).items():
+        ret.setdefault(name, dict(defaults, tags=[]))
+        ret[name].update(settings or {})
+        if isinstance(ret[name]["tags"], str):
+            ret[name]["tags"] = [ret[name]["tags"]]
+    return ret
+
+
+class ReactionPool:
+    """
+    The threads running the reactions, which are queued by class and by
+    reaction instead of in a single queue, so a flood of events for one
+    reaction does not hold the others up.
+
+    The class of a reaction is picked by the tag of its event. Each reaction,
+    identified by its SLS file and ID, gets its own queue in its class. When a
+    thread is free it runs the oldest reaction of the next queue in turn in
+    the highest priority class, skipping the reactions which already run as
+    many times as the ``concurrency`` of their class allows. Identical
+    reactions queued within ``coalesce`` milliseconds of each other only run
+    once.
+
+    It can be used as a :py:class:`salt.utils.process.ThreadPool`, the
+    functions given to :py:meth:`fire_async` by a running reaction run in the
+    thread of the reaction.
+
+    :param dict opts: The reactor options
+    """
+
+    def __init__(self, opts, num_threads=None):
+        self.classes = reaction_classes(opts)
+        # Highest priority first
+        self.order = sorted(
+            self.classes, key=lambda name: -self.classes[name]["priority"]
+        )
+        # class -> reaction -> deque of (time queued, func, args, kwargs)
+        self.queues = {name: collections.OrderedDict() for name in self.classes}
+        self.depth = dict.fromkeys(self.classes, 0)
+        self.inflight = collections.Counter()
+        self.wait = dict.fromkeys(self.classes, 0.0)
+        self.latency = dict.fromkeys(self.classes, 0.0)
+        self.done = dict.fromkeys(self.classes, 0)
+        self.coalesced = dict.fromkeys(self.classes, 0)
+        self.dropped = dict.fromkeys(self.classes, 0)
+        # Fingerprint of a reaction -> when it was last queued
+        self.recent = {}
+        self.cond = threading.Condition()
+        self._running = threading.local()
+        if num_threads is None:
+            num_threads = opts.get("reactor_worker_threads", 10)
+        self._workers = []
+        for _ in range(num_threads):
+            thread = threading.Thread(target=self._thread_target)
+            thread.daemon = True
+            thread.start()
+            self._workers.append(thread)
+
+    def classify(self, tag):
+        """
+        Return the class of the reactions to an event
+        """
+        for name in self.classes:
+            if name == DEFAULT_REACTION_CLASS:
+                continue
+            for pattern in self.classes[name]["tags"]:
+                if fnmatch.fnmatch(tag, pattern):
+                    return name
+        return DEFAULT_REACTION_CLASS
+
+    def submit(self, name, key, func, args=(), kwargs=None, fingerprint=None):
+        """
+        Queue a reaction of class ``name``. Returns False if the queue of the
+        class is full.
+
+        :param str key: Identifies the reaction, the reactions with the same
+            key share a queue and the concurrency limit of their class
+        :param str fingerprint: Identifies the identical reactions, which
+            are coalesced
+        """
+        settings = self.classes[name]
+        with self.cond:
+            now = time.monotonic()
+            window = (settings["coalesce"] or 0) / 1000.0
+            if window and fingerprint is not None:
+                last = self.recent.get(fingerprint)
+                if last is not None and now - last < window:
+                    self.coalesced[name] += 1
+                    return True
+                if len(self.recent) > 10000:
+                    self._prune_recent(now)
+                self.recent[fingerprint] = now
+            if settings["max_queue"] and self.depth[name] >= settings["max_queue"]:
+                self.dropped[name] += 1
+                return False
+            queue = self.queues[name].get(key)
+            if queue is None:
+                queue = self.queues[name][key] = collections.deque()
+            queue.append((now, func, args, kwargs or {}))
+            self.depth[name] += 1
+            self.cond.notify()
+        return True
+
+    def fire_async(self, func, args=None, kwargs=None):
+        """
+        Run a function in the pool, in the calling thread if it runs a
+        reaction already
+        """
+        if args is None:
+            args = []
+        if kwargs is None:
+            kwargs = {}
+        if getattr(self._running, "reaction", False):
+            func(*args, **kwargs)
+            return True
+        key = getattr(func, "__qualname__", repr(func))
+        return self.submit(DEFAULT_REACTION_CLASS, key, func, args, kwargs)
+
+    def stats(self):
+        """
+        Return the number of reactions queued, running, done, coalesced and
+        dropped by class, and the average seconds they wait in the queue and
+        take until they are done
+        """
+        with self.cond:
+            inflight = collections.Counter()
+            for (name, _), count in self.inflight.items():
+                inflight[name] += count
+            return {
+                name: {
+                    "depth": self.depth[name],
+                    "inflight": inflight[name],
+                    "done": self.done[name],
+                    "coalesced": self.coalesced[name],
+                    "dropped": self.dropped[name],
+                    "wait": self.wait[name],
+                    "latency": self.latency[name],
+                }
+                for name in self.classes
+            }
+
+    def _prune_recent(self, now):
+        window = max(
+            (settings["coalesce"] or 0) / 1000.0 for settings in self.classes.values()
+        )
+        self.recent = {
+            fingerprint: last
+            for fingerprint, last in self.recent.items()
+            if now - last < window
+        }
+
+    def _next(self):
+        """
+        Pop the next reaction to run, or return None
+        """
+        for name in self.order:
+            queues = self.queues[name]
+            concurrency = self.classes[name]["concurrency"]
+            for key, queue in queues.items():
+                if concurrency and self.inflight[(name, key)] >= concurrency:
+                    continue
+                item = queue.popleft()
+                if queue:
+                    # The other reactions of the class go first
+                    queues.move_to_end(key)
+                else:
+                    del queues[key]
+                self.depth[name] -= 1
+                self.inflight[(name, key)] += 1
+                return name, key, item
+        return None
+
+    @staticmethod
+    def _ewma(current, value):
+        if current:
+            return current + EWMA_WEIGHT * (value - current)
+        return value
+
+    def _thread_target(self):
+        self._running.reaction = True
+        while True:
+            with self.cond:
+                reaction = self._next()
+                while reaction is None:
+                    self.cond.wait(1)
+                    reaction = self._next()
+            name, key, (queued, func, args, kwargs) = reaction
+            started = time.monotonic()
+            try:
+                log.debug(
+                    "ReactionPool executing func: %s with args=%s kwargs=%s",
+                    func,
+                    args,
+                    kwargs,
+                )
+                func(*args, **kwargs)
+            except Exception as err:  # pylint: disable=broad-except
+                log.debug(err, exc_info=True)
+            finally:
+                now = time.monotonic()
+                with self.cond:
+                    self.inflight[(name, key)] -= 1
+                    if not self.inflight[(name, key)]:
+                        del self.inflight[(name, key)]
+                    self.done[name] += 1
+                    self.wait[name] = self._ewma(self.wait[name], started - queued)
+                    self.latency[name] = self._ewma(self.latency[name], now - queued)
+                    # A reaction at its concurrency limit might be able to run
+                    self.cond.notify()
+
+
 class Reactor(salt.utils.process.SignalHandlingProcess, salt.state.Compiler):
     """
     Read in the reactor configuration variable and compare it to events
@@ -47,6 +364,56 @@ class Reactor(salt.utils.process.SignalHandlingProcess, salt.state.Compiler):
         self.minion = salt.minion.MasterMinion(local_minion_opts)
         salt.state.Compiler.__init__(self, opts, self.minion.rend)
         self.is_leader = True
+        self.stat_clock = time.time()
+        # The compiled reactor configuration and what it was compiled from
+        self._reactor_map = None
+        self._reactor_map_key = None
+        # Reactor SLS file -> (mtime and size, render output or None if it
+        # depends on the event)
+        self._render_cache = {}
+
+    def _render(self, fn_, tag, data):
+        """
+        Render a reactor SLS file, the output of the files which do not
+        depend on the event is cached until they change
+        """
+        if not self.opts.get("reactor_render_cache", False):
+            return self.render_template(fn_, tag=tag, data=data)
+        try:
+            stat = os.stat(fn_)
+        except OSError:
+            return self.render_template(fn_, tag=tag, data=data)
+        key = (stat.st_mtime_ns, stat.st_size)
+        cached = self._render_cache.get(fn_)
+        if cached is not None and cached[0] == key:
+            if cached[1] is None:
+                return self.render_template(fn_, tag=tag, data=data)
+            return copy.deepcopy(cached[1])
+        res = self.render_template(fn_, tag=tag, data=data)
+        static = None
+        if self._is_static(fn_):
+            log.debug("Caching the render output of reactor SLS %s", fn_)
+            static = copy.deepcopy(res)
+        self._render_cache[fn_] = (key, static)
+        return res
+
+    def _is_static(self, fn_):
+        """
+        Return True if a reactor SLS file has no template tags and is only
+        rendered by renderers which leave plain text alone
+        """
+        try:
+            with salt.utils.files.fopen(fn_, "r") as fp_:
+                contents = fp_.read()
+        except (OSError, UnicodeDecodeError):
+            return False
+        if contents.startswith("#!"):
+            renderers = contents.split("\n", 1)[0][2:]
+        else:
+            renderers = self.opts.get("renderer") or "jinja|yaml"
+        if not {part.strip() for part in renderers.split("|")} <= PLAIN_RENDERERS:
+            return False
+        return TEMPLATE_TAGS.search(contents) is None
 
     def render_reaction(self, glob_ref, tag, data):
         """
@@ -66,7 +433,7 @@ class Reactor(salt.utils.process.SignalHandlingProcess, salt.state.Compiler):
             )
         for fn_ in globbed_ref:
             try:
-                res = self.render_template(fn_, tag=tag, data=data)
+                res = self._render(fn_, tag, data)
 
                 # for #20841, inject the sls name here since verify_high()
                 # assumes it exists in case there are any errors
@@ -78,38 +445,48 @@ class Reactor(salt.utils.process.SignalHandlingProcess, salt.state.Compiler):
                 log.exception('Failed to render "%s": ', fn_)
         return react
 
-    def list_reactors(self, tag):
+    def _read_reactor_map(self):
         """
-        Take in the tag from an event and return a list of the reactors to
-        process
+        Return the reactor configuration, read from a file if ``reactor`` is
+        a path
+        """
+        if not isinstance(self.opts["reactor"], str):
+            return self.opts["reactor"]
+        log.debug("Reading reactors from yaml %s", self.opts["reactor"])
+        try:
+            with salt.utils.files.fopen(self.opts["reactor"]) as fp_:
+                return salt.utils.yaml.safe_load(fp_) or []
+        except OSError:
+            log.error('Failed to read reactor map: "%s"', self.opts["reactor"])
+        except Exception:  # pylint: disable=broad-except
+            log.error('Failed to parse YAML in reactor map: "%s"', self.opts["reactor"])
+        return []
+
+    def compiled_reactors(self):
+        """
+        Return the compiled reactor configuration, compiled again when it
+        changes
         """
-        log.debug("Gathering reactors for tag %s", tag)
-        reactors = []
         if isinstance(self.opts["reactor"], str):
             try:
-                with salt.utils.files.fopen(self.opts["reactor"]) as fp_:
-                    react_map = salt.utils.yaml.safe_load(fp_)
+                stat = os.stat(self.opts["reactor"])
+                key = (self.opts["reactor"], stat.st_mtime_ns, stat.st_size)
             except OSError:
-                log.error('Failed to read reactor map: "%s"', self.opts["reactor"])
-            except Exception:  # pylint: disable=broad-except
-                log.error(
-                    'Failed to parse YAML in reactor map: "%s"', self.opts["reactor"]
-                )
+                key = (self.opts["reactor"], None, None)
         else:
-            react_map = self.opts["reactor"]
-        for ropt in react_map:
-            if not isinstance(ropt, dict):
-                continue
-            if len(ropt) != 1:
-                continue
-            key = next(iter(ropt.keys()))
-            val = ropt[key]
-            if fnmatch.fnmatch(tag, key):
-                if isinstance(val, str):
-                    reactors.append(val)
-                elif isinstance(val, list):
-                    reactors.extend(val)
-        return reactors
+            key = id(self.opts["reactor"])
+        if self._reactor_map is None or key != self._reactor_map_key:
+            self._reactor_map = ReactorMap(self._read_reactor_map())
+            self._reactor_map_key = key
+        return self._reactor_map
+
+    def list_reactors(self, tag):
+        """
+        Take in the tag from an event and return a list of the reactors to
+        process
+        """
+        log.debug("Gathering reactors for tag %s", tag)
+        return self.compiled_reactors().match(tag)
 
     def list_all(self):
         """
@@ -142,6 +519,7 @@ class Reactor(salt.utils.process.SignalHandlingProcess, salt.state.Compiler):
                 return {"status": False, "comment": "Reactor already exists."}
 
         self.minion.opts["reactor"].append({tag: reaction})
+        self._reactor_map = None
         return {"status": True, "comment": "Reactor added."}
 
     def delete_reactor(self, tag):
@@ -153,6 +531,7 @@ class Reactor(salt.utils.process.SignalHandlingProcess, salt.state.Compiler):
             _tag = next(iter(reactor.keys()))
             if _tag == tag:
                 self.minion.opts["reactor"].remove(reactor)
+                self._reactor_map = None
                 return {"status": True, "comment": "Reactor deleted."}
 
         return {"status": False, "comment": "Reactor does not exists."}
@@ -195,12 +574,31 @@ class Reactor(salt.utils.process.SignalHandlingProcess, salt.state.Compiler):
         self.resolve_aliases(chunks)
         return chunks
 
-    def call_reactions(self, chunks):
+    def call_reactions(self, chunks, tag=None):
         """
-        Execute the reaction state
+        Execute the reaction state, the reactions to an event with a tag are
+        queued by class
         """
         for chunk in chunks:
-            self.wrap.run(chunk)
+            if tag is None:
+                self.wrap.run(chunk)
+            else:
+                self.wrap.schedule(chunk, tag)
+
+    def _post_stats(self, event):
+        """
+        Fire an event with the stats of the reaction queues
+        """
+        if not self.opts.get("master_stats"):
+            return
+        now = time.time()
+        if now - self.stat_clock <= self.opts.get("master_stats_event_iter", 60):
+            return
+        event.fire_event(
+            {"time": now - self.stat_clock, "classes": self.wrap.pool.stats()},
+            salt.utils.event.tagify(self.name, "stats"),
+        )
+        self.stat_clock = now
 
     def run(self):
         """
@@ -275,9 +673,10 @@ class Reactor(salt.utils.process.SignalHandlingProcess, salt.state.Compiler):
                         chunks = self.reactions(data["tag"], data["data"], reactors)
                         if chunks:
                             try:
-                                self.call_reactions(chunks)
+                                self.call_reactions(chunks, data["tag"])
                             except SystemExit:
                                 log.warning("Exit ignored by reactor")
+                self._post_stats(event)
 
 
 class ReactWrap:
@@ -303,15 +702,43 @@ class ReactWrap:
                 opts["reactor_refresh_interval"]
             )
 
-        self.pool = salt.utils.process.ThreadPool(
-            self.opts["reactor_worker_threads"],  # number of workers for runner/wheel
-            queue_size=self.opts["reactor_worker_hwm"],  # queue size for those workers
-        )
+        # Queues the reactions by class, see reactor_classes
+        self.pool = ReactionPool(self.opts)
+        self._client_lock = threading.RLock()
+        # The clients of remote pubs are not shared between threads
+        self._dispatch_locks = {"local": threading.Lock(), "caller": threading.Lock()}
+
+    def schedule(self, low, tag):
+        """
+        Queue a reaction to the event with the given tag
+        """
+        name = self.pool.classify(tag)
+        key = "{}:{}".format(low.get("__sls__"), low.get("__id__"))
+        fingerprint = None
+        if self.pool.classes[name]["coalesce"]:
+            try:
+                fingerprint = hashlib.sha256(salt.payload.dumps(low)).hexdigest()
+            except Exception:  # pylint: disable=broad-except
+                log.debug("Unable to fingerprint reaction %s", key, exc_info=True)
+        if not self.pool.submit(name, key, self.run, (low,), fingerprint=fingerprint):
+            log.error(
+                "Reactor '%s' failed to queue %s '%s' for tag %s: the queue of "
+                "reaction class '%s' is full",
+                low.get("__id__"),
+                low.get("state"),
+                low.get("fun"),
+                tag,
+                name,
+            )
 
     def populate_client_cache(self, low):
         """
         Populate the client cache with an instance of the specified type
         """
+        with self._client_lock:
+            self._populate_client_cache(low)
+
+    def _populate_client_cache(self, low):
         reaction_type = low["state"]
         # pylint: disable=unsupported-membership-test,unsupported-assignment-operation
         if reaction_type not in self.client_cache:
@@ -476,10 +903,12 @@ class ReactWrap:
         """
         Wrap LocalClient for running :ref:`execution modules <all-salt.modules>`
         """
-        self.client_cache["local"].cmd_async(tgt, fun, **kwargs)
+        with self._dispatch_locks["local"]:
+            self.client_cache["local"].cmd_async(tgt, fun, **kwargs)
 
     def caller(self, fun, **kwargs):
         """
         Wrap LocalCaller to execute remote exec functions locally on the Minion
         """
-        self.client_cache["caller"].cmd(fun, *kwargs["arg"], **kwargs["kwarg"])
+        with self._dispatch_locks["caller"]:
+            self.client_cache["caller"].cmd(fun, *kwargs["arg"], **kwargs["kwarg"])
@@ -13,6 +13,7 @@ import sys
 
 import salt.defaults.exitcodes
 import salt.utils.files
+import salt.utils.key_store
 import salt.utils.path
 import salt.utils.platform
 import salt.utils.user
@@ -434,8 +435,12 @@ def check_max_open_files(opts):
             resource.RLIMIT_NOFILE
         )
 
-    accepted_keys_dir = os.path.join(opts.get("pki_dir"), "minions")
-    accepted_count = len(os.listdir(accepted_keys_dir))
+    if opts.get("key_store", "dirs") != "dirs":
+        acc = salt.utils.key_store.ACC
+        accepted_count = len(salt.utils.key_store.factory(opts).list_keys((acc,))[acc])
+    else:
+        accepted_keys_dir = os.path.join(opts.get("pki_dir"), "minions")
+        accepted_count = len(os.listdir(accepted_keys_dir))
 
     log.debug("This salt-master instance has accepted %s minion keys.", accepted_count)
 
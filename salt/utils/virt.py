@@ -11,6 +11,7 @@ import urllib
 import urllib.parse
 
 import salt.utils.files
+import salt.utils.key_store
 
 # pylint: disable=E0611
 
@@ -99,9 +100,9 @@ class VirtKey:
             )
             return False
 
-        pubfn = os.path.join(self.opts["pki_dir"], "minions", self.id)
-        with salt.utils.files.fopen(pubfn, "w+") as fp_:
-            fp_.write(pub)
+        salt.utils.key_store.factory(self.opts).put(
+            salt.utils.key_store.ACC, self.id, pub
+        )
         self.void()
         return True
 
@@ -0,0 +1,200 @@
+"""
+    salt.utils.worker_pools
+    -----------------------
+
+    Named pools of MWorkers, configured with ``worker_pools``.
+
+    Each pool has its own number of MWorker processes and the commands it
+    handles. The zeromq request server reads the ``cmd`` of every request and
+    hands the request to the workers of the pool for it. The load of the AES
+    requests is not decrypted for that, their clients name the ``cmd`` in the
+    envelope of the request. Requests for any other command, and the AES
+    requests of clients which do not name it, go to the ``default`` pool,
+    which has :conf_master:`worker_threads` workers unless configured.
+
+    The queue device keeps the number of requests handed to each pool and
+    their average handling time in shared memory, so the MWorkers can report
+    them along with their own stats.
+"""
+
+import logging
+import multiprocessing
+import os
+
+import salt.utils.admission
+
+log = logging.getLogger(__name__)
+
+DEFAULT_POOL = "default"
+
+# Route all the requests sent in the clear to a pool
+CLEAR = "clear"
+
+# The weight of the latest request in the average handling time of a pool
+EWMA_WEIGHT = 0.1
+
+# The stats shared by the queue device and the MWorkers, see init_stats()
+_STATS = None
+
+
+def enabled(opts):
+    """
+    Return True if the MWorkers are split in pools
+    """
+    return bool(opts.get("worker_pools"))
+
+
+def pools(opts):
+    """
+    Return the worker pools as a dict of pool name to number of workers and
+    commands, the ``default`` pool comes first
+    """
+    ret = {
+        DEFAULT_POOL: {"worker_threads": int(opts["worker_threads"]), "commands": []}
+    }
+    for name, settings in (opts.get("worker_pools") or {}).items():
+        settings = settings or {}
+        ret.setdefault(name, {"worker_threads": 1, "commands": []})
+        if "worker_threads" in settings:
+            ret[name]["worker_threads"] = int(settings["worker_threads"])
+        ret[name]["commands"] = list(settings.get("commands") or [])
+    for name, settings in ret.items():
+        if settings["worker_threads"] < 1:
+            log.warning(
+                "Worker pool '%s' needs at least one worker, starting one", name
+            )
+            settings["worker_threads"] = 1
+    return ret
+
+
+def routes(opts):
+    """
+    Return the mapping of command to worker pool
+    """
+    ret = {}
+    for name, settings in pools(opts).items():
+        for cmd in settings["commands"]:
+            if cmd in ret:
+                log.warning(
+                    "Command '%s' is routed to worker pools '%s' and '%s', "
+                    "using '%s'",
+                    cmd,
+                    ret[cmd],
+                    name,
+                    ret[cmd],
+                )
+                continue
+            ret[cmd] = name
+    return ret
+
+
+def worker_uri(opts, pool=None):
+    """
+    Return the URI the workers of ``pool`` get their requests from
+    """
+    pool = pool or DEFAULT_POOL
+    if opts.get("ipc_mode", "") == "tcp":
+        port = int(opts.get("tcp_master_workers", 4515))
+        if pool != DEFAULT_POOL:
+            names = [name for name in pools(opts) if name != DEFAULT_POOL]
+            port += 100 + names.index(pool)
+        return f"tcp://127.0.0.1:{port}"
+    return "ipc://{}".format(worker_ipc_path(opts, pool))
+
+
+def worker_ipc_path(opts, pool=None):
+    """
+    Return the path of the IPC socket of the workers of ``pool``
+    """
+    if not pool or pool == DEFAULT_POOL:
+        return os.path.join(opts["sock_dir"], "workers.ipc")
+    return os.path.join(opts["sock_dir"], f"workers-{pool}.ipc")
+
+
+class Router:
+    """
+    Map requests to the worker pool handling their command
+    """
+
+    def __init__(self, opts):
+        self.opts = opts
+        self.routes = routes(opts)
+
+    @staticmethod
+    def command(payload):
+        """
+        Return the command of a decoded request, or None
+        """
+        return salt.utils.admission.command(payload)
+
+    def route(self, payload):
+        """
+        Return the name of the pool which handles the request
+        """
+        if isinstance(payload, bytes):
+            payload = salt.utils.admission.peek(payload)
+        cmd = self.command(payload)
+        if cmd in self.routes:
+            return self.routes[cmd]
+        if (
+            CLEAR in self.routes
+            and isinstance(payload, dict)
+            and payload.get("enc") == "clear"
+        ):
+            return self.routes[CLEAR]
+        return DEFAULT_POOL
+
+
+class PoolStats:
+    """
+    The number of requests handed to the workers of each pool which did not
+    get a reply yet, and the average time the pool takes to reply, in shared
+    memory
+    """
+
+    def __init__(self, names):
+        self.names = list(names)
+        self.index = {name: num for num, name in enumerate(self.names)}
+        self.depth = multiprocessing.Array("l", len(self.names), lock=False)
+        self.latency = multiprocessing.Array("d", len(self.names), lock=False)
+
+    def dispatched(self, pool):
+        self.depth[self.index[pool]] += 1
+
+    def replied(self, pool, elapsed=None):
+        ind = self.index[pool]
+        self.depth[ind] = max(self.depth[ind] - 1, 0)
+        if elapsed is not None:
+            if self.latency[ind]:
+                self.latency[ind] += EWMA_WEIGHT * (elapsed - self.latency[ind])
+            else:
+                self.latency[ind] = elapsed
+
+    def snapshot(self):
+        """
+        Return the stats of all the pools
+        """
+        return {
+            name: {
+                "depth": self.depth[ind],
+                "latency": self.latency[ind],
+            }
+            for ind, name in enumerate(self.names)
+        }
+
+
+def init_stats(opts):
+    """
+    Create the shared pool stats, must be called before the queue device and
+    the MWorkers are started
+    """
+    global _STATS
+    _STATS = PoolStats(pools(opts))
+    return _STATS
+
+
+def get_stats():
+    """
+    Return the shared pool stats, or None
+    """
+    return _STATS
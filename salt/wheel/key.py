@@ -34,6 +34,7 @@ import salt.crypt
 import salt.key
 import salt.utils.crypt
 import salt.utils.files
+import salt.utils.key_store
 import salt.utils.platform
 from salt.utils.sanitizers import clean
 
@@ -434,11 +435,10 @@ def gen_accept(id_, keysize=2048, force=False):
     """
     id_ = clean.id(id_)
     ret = gen(id_, keysize)
-    acc_path = os.path.join(__opts__["pki_dir"], "minions", id_)
-    if os.path.isfile(acc_path) and not force:
+    store = salt.utils.key_store.factory(__opts__)
+    if store.get(salt.utils.key_store.ACC, id_) is not None and not force:
         return {}
-    with salt.utils.files.fopen(acc_path, "w+") as fp_:
-        fp_.write(salt.utils.stringutils.to_str(ret["pub"]))
+    store.put(salt.utils.key_store.ACC, id_, salt.utils.stringutils.to_str(ret["pub"]))
     return ret
 
 
@@ -0,0 +1,94 @@
+"""
+Measure the cost of encrypting and decrypting a message with each cipher of
+salt.crypt.Crypticle
+
+    python tests/cryptbench.py --time 2
+"""
+
+import argparse
+import os
+import time
+
+import salt.crypt
+
+SIZES = {"1KB": 1024, "100KB": 100 * 1024, "10MB": 10 * 1024 * 1024}
+
+
+def parse():
+    """
+    Parse the command line options
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--time",
+        type=float,
+        default=1.0,
+        help="The number of seconds to spend on each measure",
+    )
+    parser.add_argument(
+        "--size",
+        action="append",
+        choices=sorted(SIZES),
+        help="The message sizes to measure, all of them by default",
+    )
+    return parser.parse_args()
+
+
+def measure(func, seconds):
+    """
+    Return the mean number of seconds a call to ``func`` takes
+    """
+    func()
+    runs = 0
+    start = time.perf_counter()
+    elapsed = 0
+    while elapsed < seconds:
+        func()
+        runs += 1
+        elapsed = time.perf_counter() - start
+    return elapsed / runs
+
+
+def bench(crypticle, cipher, data, seconds):
+    """
+    Return the seconds taken to encrypt and decrypt ``data``, with new
+    buffers and with reused ones
+    """
+    encrypted = crypticle.encrypt(data, cipher=cipher)
+    ret = {
+        "encrypt": measure(lambda: crypticle.encrypt(data, cipher=cipher), seconds),
+        "decrypt": measure(
+            lambda: crypticle.decrypt(encrypted, cipher=cipher), seconds
+        ),
+    }
+    if cipher:
+        buffer = bytearray(len(data) + crypticle.AEAD_OVERHEAD)
+        ret["encrypt_into"] = measure(
+            lambda: crypticle.encrypt_into(data, buffer, cipher), seconds
+        )
+        ret["decrypt_into"] = measure(
+            lambda: crypticle.decrypt_into(encrypted, buffer, cipher), seconds
+        )
+    return ret
+
+
+def main():
+    options = parse()
+    crypticle = salt.crypt.Crypticle({}, salt.crypt.Crypticle.generate_key_string())
+    ciphers = [None]
+    if salt.crypt.HAS_AEAD:
+        ciphers.extend(salt.crypt.AEAD_CIPHERS)
+    print(f"{'cipher':<20}{'size':>8}{'operation':>15}{'usec/msg':>14}{'MB/s':>10}")
+    for name in options.size or SIZES:
+        data = os.urandom(SIZES[name])
+        for cipher in ciphers:
+            results = bench(crypticle, cipher, data, options.time)
+            for operation, seconds in results.items():
+                print(
+                    f"{cipher or 'aes-cbc-hmac':<20}{name:>8}{operation:>15}"
+                    f"{seconds * 1e6:>14.1f}{len(data) / seconds / 1e6:>10.1f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Measure the cost of reading frames off a TCP stream with
+salt.transport.frame.FrameReader, for each framing, against a bare msgpack
+unpacker reading legacy frames
+
+    python tests/framebench.py --count 20000 --size 300
+"""
+
+import argparse
+import os
+import time
+
+import salt.transport.frame
+import salt.utils.msgpack
+
+# The number of bytes read from the stream at a time by the TCP transport
+CHUNK_SIZE = 65536
+
+
+def parse():
+    """
+    Parse the command line options
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--count",
+        type=int,
+        default=20000,
+        help="The number of frames read in each run",
+    )
+    parser.add_argument(
+        "--size",
+        type=int,
+        default=300,
+        help="The size of the body of the frames",
+    )
+    parser.add_argument(
+        "--runs",
+        type=int,
+        default=5,
+        help="The number of runs, the best one is reported",
+    )
+    return parser.parse_args()
+
+
+def chunks(data):
+    """
+    Split ``data`` the way it is read from the stream
+    """
+    return [data[pos : pos + CHUNK_SIZE] for pos in range(0, len(data), CHUNK_SIZE)]
+
+
+def read_unpacker(data):
+    """
+    Read legacy frames with a bare msgpack unpacker
+    """
+    unpacker = salt.utils.msgpack.Unpacker()
+    count = 0
+    for chunk in data:
+        unpacker.feed(chunk)
+        for framed_msg in unpacker:
+            count += b"body" in framed_msg
+    return count
+
+
+def read_frames(data):
+    """
+    Read frames with a frame reader
+    """
+    reader = salt.transport.frame.FrameReader(decode=False)
+    count = 0
+    for chunk in data:
+        reader.feed(chunk)
+        for _ in reader:
+            count += 1
+    return count
+
+
+def measure(func, data, runs):
+    """
+    Return the best number of seconds ``func`` takes to read ``data``
+    """
+    best = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        func(data)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def main():
+    options = parse()
+    body = os.urandom(options.size)
+    streams = {
+        "unpacker": (
+            read_unpacker,
+            salt.transport.frame.frame_msg(body, header={"mid": 1}),
+        ),
+        "legacy": (
+            read_frames,
+            salt.transport.frame.frame_msg(body, header={"mid": 1}),
+        ),
+        "binary": (
+            read_frames,
+            salt.transport.frame.frame_msg_binary(
+                body, header={"mid": 1}, raw_body=True
+            ),
+        ),
+    }
+    print(f"{'reader':<12}{'frames':>10}{'seconds':>10}{'usec/frame':>12}")
+    for name, (func, frame) in streams.items():
+        data = chunks(frame * options.count)
+        assert func(data) == options.count
+        seconds = measure(func, data, options.runs)
+        print(
+            f"{name:<12}{options.count:>10}{seconds:>10.3f}"
+            f"{seconds / options.count * 1e6:>12.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
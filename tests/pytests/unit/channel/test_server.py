@@ -1,6 +1,15 @@
+import asyncio
+import collections
+import itertools
+
 import pytest
 
+import salt.channel.client
 import salt.channel.server as server
+import salt.crypt
+import salt.payload
+import salt.utils.compression
+from tests.support.mock import MagicMock, patch
 
 
 @pytest.fixture
@@ -41,3 +50,198 @@ def test_compare_keys_newline_tgt(key_data, linesep):
     assert not src_key.endswith(linesep)
     assert tgt_key.endswith("\n")
     assert server.ReqServerChannel.compare_keys(src_key, tgt_key) is True
+
+
+def test_req_server_compresses_negotiated_replies():
+    opts = {"compression": ["zlib"], "compression_threshold": 0}
+    channel = server.ReqServerChannel.__new__(server.ReqServerChannel)
+    channel.compressor = salt.utils.compression.Compressor(opts)
+    channel.crypticle = salt.crypt.Crypticle(
+        {}, salt.crypt.Crypticle.generate_key_string()
+    )
+    load = {"cmd": "_return", "return": "x" * 1000}
+    for compression, compressed in ((None, False), ("zlib", True), ("zstd", False)):
+        payload = {
+            "enc": "aes",
+            "load": channel.crypticle.dumps(
+                load, compress=channel.compressor.using("zlib")
+            ),
+        }
+        # Requests are decompressed whatever the envelope says
+        assert channel._decode_payload(payload)["load"] == load
+        compress = channel.compressor.using(compression)
+        reply = channel.crypticle.decrypt(
+            channel.crypticle.dumps(load, compress=compress)
+        )
+        assert (
+            reply[len(channel.crypticle.PICKLE_PAD) :].startswith(
+                salt.utils.compression.MARKER
+            )
+            is compressed
+        )
+
+
+def test_req_channel_package_load_compression():
+    opts = {"compression": ["zlib"], "pki_dir": "."}
+    auth = MagicMock()
+    auth.creds = {"aes": "key", "compression": "zlib"}
+    channel = salt.channel.client.AsyncReqChannel(opts, MagicMock(), auth)
+    assert channel._package_load(b"load")["compression"] == "zlib"
+
+    # The master did not negotiate compression, or is too old to
+    auth.creds = {"aes": "key"}
+    assert "compression" not in channel._package_load(b"load")
+    channel = salt.channel.client.AsyncReqChannel({"pki_dir": "."}, MagicMock(), auth)
+    auth.creds = {"aes": "key", "compression": "zlib"}
+    assert "compression" not in channel._package_load(b"load")
+
+
+def test_req_channel_package_load_cmd():
+    auth = MagicMock()
+    auth.creds = {"aes": "key"}
+    channel = salt.channel.client.AsyncReqChannel({"pki_dir": "."}, MagicMock(), auth)
+    # The master routes the request by the command in the envelope
+    assert channel._package_load(b"load", "_pillar")["cmd"] == "_pillar"
+    assert "cmd" not in channel._package_load(b"load")
+
+
+@pytest.mark.skipif(not salt.crypt.HAS_AEAD, reason="No AEAD ciphers available")
+def test_req_server_aead_cipher():
+    channel = server.ReqServerChannel.__new__(server.ReqServerChannel)
+    channel.compressor = salt.utils.compression.Compressor({})
+    channel.ciphers = ["aes-256-gcm"]
+    channel.crypticle = salt.crypt.Crypticle(
+        {}, salt.crypt.Crypticle.generate_key_string()
+    )
+    load = {"cmd": "_return", "id": "minion"}
+    payload = {
+        "enc": "aes",
+        "load": channel.crypticle.dumps(load, cipher="aes-256-gcm"),
+        "cipher": "aes-256-gcm",
+    }
+    assert channel._decode_payload(payload)["load"] == load
+
+    # Only the configured ciphers are accepted
+    payload = {
+        "enc": "aes",
+        "load": channel.crypticle.dumps(load, cipher="chacha20-poly1305"),
+        "cipher": "chacha20-poly1305",
+    }
+    with pytest.raises(salt.crypt.AuthenticationError):
+        channel._decode_payload(payload)
+
+
+def test_req_channel_package_load_cipher():
+    opts = {"aead_ciphers": ["aes-256-gcm"], "pki_dir": "."}
+    auth = MagicMock()
+    auth.creds = {"aes": "key", "cipher": "aes-256-gcm"}
+    with patch("salt.crypt.HAS_AEAD", True):
+        channel = salt.channel.client.AsyncReqChannel(opts, MagicMock(), auth)
+    assert channel._package_load(b"load")["cipher"] == "aes-256-gcm"
+
+    # The master did not negotiate a cipher, or is too old to
+    auth.creds = {"aes": "key"}
+    assert "cipher" not in channel._package_load(b"load")
+
+
+async def test_pub_server_batch_signing(tmp_path):
+    salt.crypt.gen_keys(str(tmp_path), "master", 2048)
+    opts = {"sign_pub_messages": True, "publish_batch_signing": True}
+    channel = server.PubServerChannel.__new__(server.PubServerChannel)
+    channel.opts = opts
+    channel.master_key = MagicMock(rsa_path=str(tmp_path / "master.pem"))
+    channel.compressor = salt.utils.compression.Compressor(opts)
+    channel.transport = MagicMock(topic_support=False)
+    channel._signer = None
+    channel._batch = []
+    channel._batch_task = None
+    published = []
+
+    async def publish_payload(payload, *args):
+        published.append(salt.payload.loads(payload))
+
+    channel.transport.publish_payload = publish_payload
+    key = salt.crypt.Crypticle.generate_key_string()
+    loads = [{"fun": "saltutil.find_job", "jid": str(jid)} for jid in range(5)]
+    with patch.object(server.PubServerChannel, "aes_key", key), patch(
+        "salt.master.SMaster.get_serial", side_effect=itertools.count(1)
+    ), patch.object(
+        salt.crypt.PrivateKey, "sign", autospec=True, wraps=salt.crypt.PrivateKey.sign
+    ) as sign:
+        for load in loads:
+            await channel.publish_payload(salt.payload.dumps(load))
+        await asyncio.sleep(0.01)
+    # Queued while nothing was sent yet, the publishes make up a single batch
+    sign.assert_called_once()
+    assert len(published) == 5
+    assert len({payload["sig"] for payload in published}) == 1
+
+    client = salt.channel.client.AsyncPubChannel.__new__(
+        salt.channel.client.AsyncPubChannel
+    )
+    client.opts = {"sign_pub_messages": True}
+    client.master_pubkey_path = str(tmp_path / "master.pub")
+    client._verified_roots = collections.deque(maxlen=32)
+    with patch(
+        "salt.crypt.verify_signature", wraps=salt.crypt.verify_signature
+    ) as verify:
+        for payload in published:
+            client._verify_master_signature(payload)
+    # The signature of the root is only verified once
+    verify.assert_called_once()
+    crypticle = salt.crypt.Crypticle({}, key)
+    assert [crypticle.loads(payload["load"]) for payload in published] == loads
+
+    # A load which is not part of the batch is rejected
+    forged = dict(published[0], load=published[1]["load"])
+    with pytest.raises(salt.crypt.AuthenticationError):
+        client._verify_master_signature(forged)
+
+
+async def test_pub_server_target_filter():
+    opts = {"sign_pub_messages": False, "publish_target_filter": 2}
+    channel = server.PubServerChannel.__new__(server.PubServerChannel)
+    channel.opts = opts
+    channel.compressor = salt.utils.compression.Compressor(opts)
+    channel.transport = MagicMock(topic_support=False)
+    channel.ckminions = MagicMock()
+    channel.ckminions.check_minions.return_value = {"minions": ["web1", "web2"]}
+    key = salt.crypt.Crypticle.generate_key_string()
+    with patch.object(server.PubServerChannel, "aes_key", key), patch(
+        "salt.master.SMaster.get_serial", side_effect=itertools.count(1)
+    ):
+        glob = salt.payload.loads(
+            channel.wrap_payload({"tgt": "web*", "tgt_type": "glob"})["payload"]
+        )
+        # Too many minions are targeted for a filter to be worth it
+        listed = salt.payload.loads(
+            channel.wrap_payload({"tgt": ["a", "b", "c"], "tgt_type": "list"})[
+                "payload"
+            ]
+        )
+    assert "tgt_filter" in glob
+    assert "tgt_filter" not in listed
+
+    client = salt.channel.client.AsyncPubChannel.__new__(
+        salt.channel.client.AsyncPubChannel
+    )
+    client.opts = {"id": "db1", "sign_pub_messages": False}
+    client.auth = MagicMock(crypticle=salt.crypt.Crypticle({}, key))
+    assert not client._targeted(glob)
+    assert await client._decode_payload(dict(glob)) is None
+    assert client._targeted(listed)
+
+    client.opts["id"] = "web1"
+    assert client._targeted(glob)
+    decoded = await client._decode_payload(dict(glob))
+    assert decoded["load"] == {"tgt": "web*", "tgt_type": "glob"}
+
+    # A filter which fails to validate is ignored
+    client.opts["id"] = "db1"
+    forged = dict(glob, tgt_filter_mac=b"\x00" * 32)
+    assert client._targeted(forged)
+    # As well as a filter moved to another publish
+    assert client._targeted(dict(glob, load=listed["load"]))
+    # Syndics pass on all the publishes
+    client.opts["__role"] = "syndic"
+    assert client._targeted(glob)
@@ -12,8 +12,10 @@ import pytest
 import salt.crypt
 import salt.master
 import salt.payload
+import salt.utils.compression
 import salt.utils.files
 from tests.support.helpers import dedent
+from tests.support.mock import patch
 
 from . import PRIV_KEY, PRIV_KEY2, PUB_KEY, PUB_KEY2
 
@@ -60,6 +62,78 @@ def test_cryptical_dumps_valid_nonce():
     assert master_crypt.loads(ret, nonce=nonce) == data
 
 
+def test_cryptical_dumps_compressed():
+    nonce = uuid.uuid4().hex
+    master_crypt = salt.crypt.Crypticle({}, salt.crypt.Crypticle.generate_key_string())
+    compressor = salt.utils.compression.Compressor({"compression": ["zlib"]})
+    data = {"foo": "bar" * 1000}
+    ret = master_crypt.dumps(data, nonce=nonce, compress=compressor.using("zlib"))
+
+    une = master_crypt.decrypt(ret)
+    assert une[len(master_crypt.PICKLE_PAD) + len(nonce) :].startswith(
+        salt.utils.compression.MARKER
+    )
+    # Compressed payloads are recognized without being told
+    assert master_crypt.loads(ret, nonce=nonce) == data
+    assert (
+        master_crypt.loads(ret, nonce=nonce, decompress=compressor.decompress) == data
+    )
+    assert compressor.stats["decompressed"] == 1
+
+
+@pytest.mark.skipif(not salt.crypt.HAS_AEAD, reason="No AEAD ciphers available")
+@pytest.mark.parametrize("cipher", salt.crypt.AEAD_CIPHERS)
+def test_cryptical_dumps_aead(cipher):
+    nonce = uuid.uuid4().hex
+    master_crypt = salt.crypt.Crypticle({}, salt.crypt.Crypticle.generate_key_string())
+    data = {"foo": "bar"}
+    ret = master_crypt.dumps(data, nonce=nonce, cipher=cipher)
+    assert master_crypt.loads(ret, nonce=nonce, cipher=cipher) == data
+    # The cipher is negotiated, never guessed
+    with pytest.raises(salt.crypt.AuthenticationError):
+        master_crypt.loads(ret, nonce=nonce)
+    with pytest.raises(salt.crypt.AuthenticationError):
+        master_crypt.loads(master_crypt.dumps(data), cipher=cipher)
+    tampered = bytearray(ret)
+    tampered[-1] ^= 1
+    with pytest.raises(salt.crypt.AuthenticationError):
+        master_crypt.loads(bytes(tampered), nonce=nonce, cipher=cipher)
+
+
+@pytest.mark.skipif(not salt.crypt.HAS_AEAD, reason="No AEAD ciphers available")
+def test_cryptical_aead_buffers():
+    crypticle = salt.crypt.Crypticle({}, salt.crypt.Crypticle.generate_key_string())
+    data = b"x" * 100
+    buffer = bytearray(200)
+    size = crypticle.encrypt_into(data, buffer, salt.crypt.AES_GCM)
+    assert size == len(data) + crypticle.AEAD_OVERHEAD
+    plain = bytearray(len(data))
+    assert crypticle.decrypt_into(buffer[:size], plain, salt.crypt.AES_GCM) == 100
+    assert plain == data
+    assert crypticle.decrypt(bytes(buffer[:size]), cipher=salt.crypt.AES_GCM) == data
+
+    with pytest.raises(ValueError):
+        crypticle.encrypt_into(data, bytearray(100), salt.crypt.AES_GCM)
+    # Nothing unauthenticated is left in the buffer
+    buffer[0] ^= 1
+    with pytest.raises(salt.crypt.AuthenticationError):
+        crypticle.decrypt_into(buffer[:size], plain, salt.crypt.AES_GCM)
+    assert plain == bytes(len(data))
+
+
+def test_negotiate_cipher():
+    opts = {"aead_ciphers": ["chacha20-poly1305", "nope", "aes-256-gcm"]}
+    with patch("salt.crypt.HAS_AEAD", True):
+        assert salt.crypt.aead_ciphers(opts) == ["chacha20-poly1305", "aes-256-gcm"]
+        assert salt.crypt.negotiate_cipher(opts, ["aes-256-gcm"]) == "aes-256-gcm"
+        assert salt.crypt.negotiate_cipher(opts, ["other"]) is None
+        # Old minions do not offer any
+        assert salt.crypt.negotiate_cipher(opts, None) is None
+        assert salt.crypt.negotiate_cipher({}, ["aes-256-gcm"]) is None
+    with patch("salt.crypt.HAS_AEAD", False):
+        assert salt.crypt.aead_ciphers(opts) == []
+
+
 def test_cryptical_dumps_invalid_nonce():
     nonce = uuid.uuid4().hex
     master_crypt = salt.crypt.Crypticle({}, salt.crypt.Crypticle.generate_key_string())
@@ -2,12 +2,16 @@
 Tests for the salt fileclient
 """
 
+import asyncio
 import errno
 import logging
 import os
+import random
 
 import pytest
 
+import salt.exceptions
+import salt.fileserver
 import salt.utils.files
 from salt import fileclient
 from tests.support.mock import AsyncMock, MagicMock, Mock, patch
@@ -239,3 +243,95 @@ def test_get_url_with_hash(client_opts):
                 result = client.get_url(url, dest)
 
                 assert result == "/path/to/file#with#hash"
+
+
+class FSChunkChannel:
+    """
+    Serve the chunk requests from the local fileserver, out of order and
+    failing the first ones if told to
+    """
+
+    def __init__(self, chan, fail=0, corrupt=False):
+        self.chan = chan
+        self.fail = fail
+        self.corrupt = corrupt
+        self.locs = []
+
+    async def send(self, load, raw=False):
+        self.locs.append(load["loc"])
+        await asyncio.sleep(random.random() / 100)
+        if self.fail:
+            self.fail -= 1
+            raise salt.exceptions.SaltReqTimeoutError("Timed out")
+        ret = self.chan.send(dict(load))
+        if self.corrupt and ret["data"]:
+            ret["data"] = b"x" * len(ret["data"])
+        return ret
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def streaming_client(minion_opts, tmp_path):
+    fs_root = tmp_path / "fs_root"
+    fs_root.mkdir()
+    minion_opts.update(
+        {
+            "file_roots": {"base": [str(fs_root)]},
+            "fileserver_backend": ["roots"],
+            "cachedir": str(tmp_path / "cache"),
+            "file_client": "local",
+            "file_buffer_size": 1000,
+            "file_transfer_window": 4,
+        }
+    )
+    data = os.urandom(10500)
+    (fs_root / "big.bin").write_bytes(data)
+    client = fileclient.RemoteClient.__new__(fileclient.RemoteClient)
+    fileclient.Client.__init__(client, minion_opts)
+    client._closing = False
+    client.channel = salt.fileserver.FSChan(minion_opts)
+    client.auth = fileclient.DumbAuth()
+    client.window = 4
+    client._chunk_fetcher = None
+    try:
+        yield client, data
+    finally:
+        client.destroy()
+
+
+def test_get_file_window(streaming_client, tmp_path):
+    client, data = streaming_client
+    channels = []
+
+    def channel(self):
+        channels.append(FSChunkChannel(client.channel, fail=len(channels) == 1))
+        return channels[-1]
+
+    dest = str(tmp_path / "big.bin")
+    with patch.object(fileclient.AsyncChunkFetcher, "_channel", channel):
+        assert client.get_file("salt://big.bin", dest=dest) == dest
+    with salt.utils.files.fopen(dest, "rb") as fp_:
+        assert fp_.read() == data
+    locs = sorted(loc for channel in channels for loc in channel.locs)
+    # All the chunks but the first one are fetched concurrently, the one
+    # which failed is fetched again
+    assert len(channels) == 5
+    assert len(locs) == len(set(locs)) + 1
+    assert set(locs) == set(range(1000, 11000, 1000))
+
+
+def test_get_file_window_bad_download(streaming_client, tmp_path, caplog):
+    client, data = streaming_client
+
+    def channel(self):
+        return FSChunkChannel(client.channel, corrupt=True)
+
+    dest = str(tmp_path / "big.bin")
+    with patch.object(fileclient.AsyncChunkFetcher, "_channel", channel):
+        with caplog.at_level(logging.WARNING):
+            assert client.get_file("salt://big.bin", dest=dest) == dest
+    assert "fetching it again one chunk at a time" in caplog.text
+    with salt.utils.files.fopen(dest, "rb") as fp_:
+        assert fp_.read() == data
@@ -0,0 +1,47 @@
+import pytest
+
+import salt.matchers.ipcidr_match as ipcidr_match
+import salt.utils.minion_index
+from tests.support.mock import MagicMock, patch
+
+
+@pytest.fixture
+def configure_loader_modules():
+    return {ipcidr_match: {}}
+
+
+@pytest.fixture
+def master_opts():
+    return {
+        "__role": "master",
+        "id": "master",
+        "minion_data_index": True,
+        "sock_dir": "/tmp",
+        "grains": {"ipv4": ["192.168.1.1"]},
+    }
+
+
+def test_match_own_grains(master_opts):
+    assert ipcidr_match.match("192.168.1.0/24", opts=master_opts)
+    assert not ipcidr_match.match("10.20.0.0/16", opts=master_opts)
+
+
+def test_match_other_minion_uses_index(master_opts):
+    indexed = MagicMock(return_value={"cached": ["web1", "web2"], "minions": ["web1"]})
+    with patch.object(salt.utils.minion_index.MinionIndexCli, "instance") as cli:
+        cli.return_value.match_ipcidr = indexed
+        assert ipcidr_match.match("10.20.0.0/16", opts=master_opts, minion_id="web1")
+        assert not ipcidr_match.match(
+            "10.20.0.0/16", opts=master_opts, minion_id="web2"
+        )
+        # Minions unknown to the index are matched against the grains in opts
+        assert ipcidr_match.match("192.168.1.0/24", opts=master_opts, minion_id="web3")
+    indexed.assert_called_with("192.168.1.0/24")
+
+
+def test_match_other_minion_index_unavailable(master_opts):
+    with patch.object(salt.utils.minion_index.MinionIndexCli, "instance") as cli:
+        cli.return_value.match_ipcidr.return_value = None
+        assert not ipcidr_match.match(
+            "10.20.0.0/16", opts=master_opts, minion_id="web1"
+        )
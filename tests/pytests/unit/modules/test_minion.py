@@ -0,0 +1,42 @@
+import pytest
+
+import salt.modules.minion as minion
+import salt.utils.key_store
+
+
+@pytest.fixture
+def master_opts(tmp_path):
+    return {
+        "pki_dir": str(tmp_path / "pki" / "master"),
+        "key_store": "sqlite",
+        "key_store_path": str(tmp_path / "keys.sqlite3"),
+    }
+
+
+@pytest.fixture
+def configure_loader_modules(master_opts):
+    config = dict(
+        master_opts, pki_dir=str(master_opts["pki_dir"]).replace("master", "minion")
+    )
+    return {
+        minion: {
+            "__salt__": {
+                "config.get": lambda key, default=None: config.get(key, default)
+            }
+        }
+    }
+
+
+def test_list_key_store(master_opts):
+    store = salt.utils.key_store.factory(master_opts)
+    store.put("minions", "web1", "pub")
+    store.put("minions_pre", "web2", "pub")
+    try:
+        assert minion.list_() == {
+            "minions": ["web1"],
+            "minions_pre": ["web2"],
+            "minions_rejected": [],
+            "minions_denied": [],
+        }
+    finally:
+        store.close()
@@ -0,0 +1,126 @@
+"""
+Unit tests for the time bucket layout of the Default Job Cache (local_cache).
+"""
+
+import os
+
+import pytest
+
+import salt.returners.local_cache as local_cache
+import salt.utils.jid
+from tests.support.mock import patch
+
+
+@pytest.fixture
+def tmp_cache_dir(tmp_path):
+    return tmp_path / "cache_dir"
+
+
+@pytest.fixture
+def jobs_dir(tmp_cache_dir):
+    return tmp_cache_dir / "jobs"
+
+
+@pytest.fixture
+def configure_loader_modules(tmp_cache_dir):
+    return {
+        local_cache: {
+            "__opts__": {
+                "cachedir": str(tmp_cache_dir),
+                "hash_type": "sha256",
+                "keep_jobs_seconds": 3600,
+                "local_cache_bucket_seconds": 3600,
+            }
+        }
+    }
+
+
+def _store_job(jid, fun="test.ping"):
+    local_cache.prep_jid(passed_jid=jid)
+    local_cache.save_load(
+        jid,
+        {"fun": fun, "jid": jid, "arg": [], "tgt": "minion1", "user": "root"},
+        minions=["minion1"],
+    )
+
+
+def test_jobs_are_stored_in_buckets(jobs_dir):
+    _store_job("20240101120500000000")
+    _store_job("20240101125900000000")
+    _store_job("20240101130000000000")
+
+    assert sorted(os.listdir(jobs_dir)) == ["b20240101120000", "b20240101130000"]
+    assert len(os.listdir(jobs_dir / "b20240101120000")) == 3
+
+
+def test_get_jids_reads_bucket_index():
+    _store_job("20240101120500000000")
+    _store_job("20240101130000000000", fun="saltutil.find_job")
+
+    # The jobs are listed from the bucket indexes without reading the loads
+    with patch("salt.payload.load") as load:
+        jids = local_cache.get_jids()
+        assert not load.called
+
+    assert sorted(jids) == ["20240101120500000000", "20240101130000000000"]
+    assert jids["20240101120500000000"]["Function"] == "test.ping"
+    assert [job["JID"] for job in local_cache.get_jids_filter(5)] == [
+        "20240101120500000000"
+    ]
+
+
+def test_clean_old_jobs_removes_expired_buckets(jobs_dir):
+    _store_job("20240101120500000000")
+    _store_job("20240101130000000000")
+
+    now = 1704117660  # 2024-01-01 14:01:00 UTC
+    with patch("time.time", return_value=now):
+        local_cache.clean_old_jobs()
+
+    assert os.listdir(jobs_dir) == ["b20240101130000"]
+    assert local_cache.get_load("20240101130000000000")["fun"] == "test.ping"
+
+
+def test_clean_old_jobs_migrates_hashed_layout(jobs_dir):
+    jid = salt.utils.jid.gen_jid({})
+    with patch.dict(local_cache.__opts__, {"local_cache_bucket_seconds": 0}):
+        _store_job(jid)
+    legacy_dir = salt.utils.jid.jid_dir(jid, str(jobs_dir), "sha256")
+    assert os.path.isdir(legacy_dir)
+
+    # Not migrated yet, still readable
+    assert local_cache.get_load(jid)["fun"] == "test.ping"
+
+    local_cache.clean_old_jobs()
+
+    assert not os.path.exists(legacy_dir)
+    assert os.listdir(jobs_dir) == [local_cache._bucket_name(jid)]
+    assert local_cache._jid_dir(jid) != legacy_dir
+    assert local_cache.get_load(jid)["fun"] == "test.ping"
+    assert list(local_cache.get_jids()) == [jid]
+
+
+def test_clean_old_jobs_migrates_back_to_hashed_layout(jobs_dir):
+    jid = salt.utils.jid.gen_jid({})
+    _store_job(jid)
+    bucket_dir = jobs_dir / local_cache._bucket_name(jid)
+    assert os.path.isdir(bucket_dir)
+
+    with patch.dict(local_cache.__opts__, {"local_cache_bucket_seconds": 0}):
+        # Not migrated back yet, still readable
+        assert local_cache.get_load(jid)["fun"] == "test.ping"
+        assert list(local_cache.get_jids()) == [jid]
+
+        local_cache.clean_old_jobs()
+
+        assert not os.path.exists(bucket_dir)
+        legacy_dir = salt.utils.jid.jid_dir(jid, str(jobs_dir), "sha256")
+        assert local_cache._jid_dir(jid) == legacy_dir
+        assert local_cache.get_load(jid)["fun"] == "test.ping"
+        assert list(local_cache.get_jids()) == [jid]
+
+
+def test_jobs_are_found_after_bucket_size_change():
+    _store_job("20240101120500000000")
+    with patch.dict(local_cache.__opts__, {"local_cache_bucket_seconds": 60}):
+        assert local_cache.get_load("20240101120500000000")["fun"] == "test.ping"
@@ -0,0 +1,102 @@
+"""
+Unit tests for the segment log layout of the Default Job Cache (local_cache).
+"""
+
+import os
+
+import pytest
+
+import salt.returners.local_cache as local_cache
+import salt.utils.jid
+
+
+@pytest.fixture
+def tmp_cache_dir(tmp_path):
+    return tmp_path / "cache_dir"
+
+
+@pytest.fixture
+def configure_loader_modules(tmp_cache_dir):
+    return {
+        local_cache: {
+            "__opts__": {
+                "cachedir": str(tmp_cache_dir),
+                "hash_type": "sha256",
+                "keep_jobs_seconds": 3600,
+                "local_cache_storage": "segment",
+            }
+        }
+    }
+
+
+@pytest.fixture
+def jid():
+    jid = local_cache.prep_jid()
+    local_cache.save_load(jid, {"fun": "test.ping", "jid": jid})
+    return jid
+
+
+def _ret(jid, minion_id, **kwargs):
+    load = {
+        "jid": jid,
+        "id": minion_id,
+        "return": True,
+        "retcode": 0,
+        "success": True,
+    }
+    load.update(kwargs)
+    return load
+
+
+def test_returner_writes_one_segment(jid):
+    for idx in range(20):
+        assert local_cache.returner(_ret(jid, f"minion{idx}")) is None
+
+    jid_dir = salt.utils.jid.jid_dir(jid, local_cache._job_dir(), "sha256")
+    assert sorted(os.listdir(jid_dir)) == sorted(
+        [".load.p", "jid", local_cache.RETURNS_IDX, local_cache.RETURNS_SEG]
+    )
+
+
+def test_get_jid(jid):
+    local_cache.returner(_ret(jid, "minion1"))
+    local_cache.returner(_ret(jid, "minion2", out="highstate", retcode=2))
+
+    assert local_cache.get_jid(jid) == {
+        "minion1": {"return": True, "retcode": 0, "success": True},
+        "minion2": {"return": True, "retcode": 2, "success": True, "out": "highstate"},
+    }
+
+
+def test_duplicate_return_is_dropped(jid):
+    assert local_cache.returner(_ret(jid, "minion1")) is None
+    # Drop the in-process index cache to make sure the check is done against
+    # the index on disk as another MWorker would
+    local_cache._SEGMENT_INDEXES.clear()
+    assert local_cache.returner(_ret(jid, "minion1", retcode=1)) is False
+    assert local_cache.get_jid(jid)["minion1"]["retcode"] == 0
+
+
+def test_return_for_unknown_jid():
+    assert local_cache.returner(_ret("20230101010101000000", "minion1")) is False
+
+
+def test_save_minions(jid):
+    local_cache.save_minions(jid, ["minion1", "minion2"])
+    local_cache.save_minions(jid, ["minion3"], syndic_id="syndic1")
+    # A newer list from the same master replaces the previous one
+    local_cache.save_minions(jid, ["minion4"], syndic_id="syndic1")
+
+    assert local_cache.get_load(jid)["Minions"] == ["minion1", "minion2", "minion4"]
+
+
+def test_get_jid_reads_dirs_layout(jid):
+    local_cache.returner(_ret(jid, "minion1"))
+    with pytest.MonkeyPatch.context() as mpatch:
+        mpatch.setitem(local_cache.__opts__, "local_cache_storage", "dirs")
+        local_cache.returner(_ret(jid, "minion2"))
+        # The dirs layout honours returns already stored in the segment log
+        # when reading
+        assert set(local_cache.get_jid(jid)) == {"minion1", "minion2"}
+    assert set(local_cache.get_jid(jid)) == {"minion1", "minion2"}
+    assert local_cache.returner(_ret(jid, "minion2")) is False
@@ -7,6 +7,9 @@ import time
 import pytest
 
 import salt.master
+import salt.payload
+import salt.utils.files
+import salt.utils.key_store
 import salt.utils.platform
 from tests.support.mock import MagicMock, patch
 
@@ -1053,3 +1056,23 @@ def test_syndic_return_cache_dir_creation_traversal(encrypted_requests):
     )
     assert not (cachedir / "syndics").exists()
     assert not (cachedir / "mamajama").exists()
+
+
+def test_handle_key_cache_key_store(maintenance_opts, tmp_path):
+    maintenance_opts.update(
+        key_cache="sched",
+        key_store="sqlite",
+        pki_dir=str(tmp_path),
+        key_store_path=str(tmp_path / "keys.sqlite3"),
+        cluster_id=None,
+    )
+    (tmp_path / "minions").mkdir()
+    store = salt.utils.key_store.factory(maintenance_opts)
+    store.put("minions", "web1", "pub")
+    store.put("minions_pre", "web2", "pub")
+    try:
+        salt.master.Maintenance(maintenance_opts).handle_key_cache()
+    finally:
+        store.close()
+    with salt.utils.files.fopen(tmp_path / "minions" / ".key_cache", "rb") as fp_:
+        assert salt.payload.load(fp_) == ["web1"]
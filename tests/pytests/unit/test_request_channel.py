@@ -1127,6 +1127,139 @@ async def test_req_chan_auth_v2(minion_opts, master_opts, pki_dir, io_loop):
         server.close()
 
 
+async def test_req_chan_auth_v2_session_ticket(
+    minion_opts, master_opts, pki_dir, io_loop
+):
+    minion_opts.update(
+        {
+            "master_uri": "tcp://127.0.0.1:4506",
+            "interface": "127.0.0.1",
+            "ret_port": 4506,
+            "ipv6": False,
+            "sock_dir": ".",
+            "pki_dir": str(pki_dir.joinpath("minion")),
+            "id": "minion",
+            "__role": "minion",
+            "keysize": 4096,
+            "max_minions": 0,
+            "auto_accept": False,
+            "open_mode": False,
+            "key_pass": None,
+            "publish_port": 4505,
+            "auth_mode": 1,
+            "acceptance_wait_time": 3,
+            "acceptance_wait_time_max": 3,
+        }
+    )
+    SMaster.secrets["aes"] = {
+        "secret": multiprocessing.Array(
+            ctypes.c_char,
+            salt.utils.stringutils.to_bytes(salt.crypt.Crypticle.generate_key_string()),
+        ),
+        "reload": salt.crypt.Crypticle.generate_key_string,
+    }
+    master_opts.update(pki_dir=str(pki_dir.joinpath("master")))
+    master_opts["master_sign_pubkey"] = False
+    master_opts["auth_session_tickets"] = True
+    server = salt.channel.server.ReqServerChannel.factory(master_opts)
+    server.auto_key = salt.daemons.masterapi.AutoKey(server.opts)
+    server.cache_cli = False
+    server.master_key = salt.crypt.MasterKeys(server.opts)
+    minion_opts["verify_master_pubkey_sign"] = False
+    minion_opts["always_verify_signature"] = False
+    client = salt.channel.client.AsyncReqChannel.factory(minion_opts, io_loop=io_loop)
+    try:
+        signin_payload = client.auth.minion_sign_in_payload()
+        assert "session" not in signin_payload
+        ret = server._auth(
+            client._package_load(signin_payload)["load"], sign_messages=True
+        )
+        creds = client.auth.handle_signin_response(signin_payload, ret)
+        assert "aes" in creds
+
+        # The next sign in resumes the session without any RSA operation
+        signin_payload = client.auth.minion_sign_in_payload()
+        assert "session" in signin_payload
+        with patch("salt.crypt.sign_message") as sign_message, patch(
+            "salt.crypt.private_encrypt"
+        ) as private_encrypt:
+            ret = server._auth(
+                client._package_load(signin_payload)["load"], sign_messages=True
+            )
+            assert not sign_message.called
+            assert not private_encrypt.called
+        assert "sig" not in ret
+        assert client.auth.handle_signin_response(signin_payload, ret) == creds
+
+        # A new master uses the same ticket key
+        server.close()
+        server = salt.channel.server.ReqServerChannel.factory(master_opts)
+        server.auto_key = salt.daemons.masterapi.AutoKey(server.opts)
+        server.cache_cli = False
+        server.master_key = salt.crypt.MasterKeys(server.opts)
+        signin_payload = client.auth.minion_sign_in_payload()
+        ret = server._auth(
+            client._package_load(signin_payload)["load"], sign_messages=True
+        )
+        assert "session" in ret["load"]
+
+        # Expired tickets fall back to the full auth, which issues a new one
+        ticket = signin_payload["session"]
+        signin_payload = client.auth.minion_sign_in_payload()
+        with patch("time.time", return_value=time.time() + 86401):
+            ret = server._auth(
+                client._package_load(signin_payload)["load"], sign_messages=True
+            )
+        assert "sig" in ret
+        assert client.auth.handle_signin_response(signin_payload, ret) == creds
+        assert client.auth.minion_sign_in_payload()["session"] != ticket
+
+        # So do tickets of another minion key
+        signin_payload = client.auth.minion_sign_in_payload()
+        pload = client._package_load(signin_payload)
+        with patch("salt.crypt.session_finger", return_value="other"):
+            ret = server._auth(pload["load"], sign_messages=True)
+        assert "sig" in ret
+    finally:
+        salt.crypt.AsyncAuth.session_map.clear()
+        client.close()
+        server.close()
+
+
+async def test_req_chan_auth_v2_retry_after(minion_opts, pki_dir, io_loop):
+    minion_opts.update(
+        {
+            "master_uri": "tcp://127.0.0.1:4506",
+            "pki_dir": str(pki_dir.joinpath("minion")),
+            "id": "minion",
+            "__role": "minion",
+            "keysize": 4096,
+        }
+    )
+    client = salt.channel.client.AsyncReqChannel.factory(minion_opts, io_loop=io_loop)
+    channel = MagicMock()
+
+    @tornado.gen.coroutine
+    def send(*args, **kwargs):
+        return {"enc": "clear", "load": {"retry_after": 5}}
+
+    @tornado.gen.coroutine
+    def sleep(delay):
+        delays.append(delay)
+
+    channel.send = send
+    delays = []
+    try:
+        with patch("random.uniform", return_value=2.5), patch(
+            "tornado.gen.sleep", sleep
+        ):
+            assert await client.auth.sign_in(channel=channel) == "retry"
+        assert delays == [7.5]
+        assert client.auth.retry_delay({"enc": "clear", "load": b"signed"}) is None
+    finally:
+        client.close()
+
+
 async def test_req_chan_auth_v2_with_master_signing(
     minion_opts, master_opts, pki_dir, io_loop
 ):
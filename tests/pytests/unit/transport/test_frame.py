@@ -0,0 +1,90 @@
+import pytest
+
+import salt.transport.frame
+
+
+def test_frame_msg_binary():
+    frame = salt.transport.frame.frame_msg_binary(
+        {"enc": "aes", "load": b"\xff\x00"}, header={"mid": 1}
+    )
+    assert frame[:1] == salt.transport.frame.MAGIC
+    reader = salt.transport.frame.FrameReader()
+    reader.feed(frame)
+    # Strings and bytes keep their types, nothing is decoded after the fact
+    assert list(reader) == [({"mid": 1}, {"enc": "aes", "load": b"\xff\x00"}, True)]
+
+
+def test_frame_msg_binary_raw_body():
+    frame = salt.transport.frame.frame_msg_binary(b"package", raw_body=True)
+    assert frame.endswith(b"package")
+    reader = salt.transport.frame.FrameReader()
+    reader.feed(frame)
+    assert list(reader) == [({}, b"package", True)]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 4096])
+def test_frame_reader_mixed_framings(chunk_size):
+    data = b"".join(
+        [
+            salt.transport.frame.frame_msg({"foo": "bar"}, header={"mid": 1}),
+            salt.transport.frame.frame_msg_binary({"foo": "bar"}, header={"mid": 2}),
+            salt.transport.frame.frame_msg(b"legacy"),
+            salt.transport.frame.frame_msg_binary(b"raw", raw_body=True),
+        ]
+    )
+    reader = salt.transport.frame.FrameReader()
+    messages = []
+    for start in range(0, len(data), chunk_size):
+        reader.feed(data[start : start + chunk_size])
+        messages.extend(reader)
+    assert messages == [
+        ({"mid": 1}, {"foo": "bar"}, False),
+        ({"mid": 2}, {"foo": "bar"}, True),
+        ({}, "legacy", False),
+        ({}, b"raw", True),
+    ]
+    assert not reader.buffer
+
+
+def test_frame_reader_legacy_stream():
+    reader = salt.transport.frame.FrameReader()
+    reader.feed(salt.transport.frame.frame_msg(b"one"))
+    assert list(reader) == [({}, "one", False)]
+    unpacker = reader.unpacker
+    reader.feed(salt.transport.frame.frame_msg(b"two")[:3])
+    assert list(reader) == []
+    reader.feed(salt.transport.frame.frame_msg(b"two")[3:])
+    assert list(reader) == [({}, "two", False)]
+    # The unpacker reads the whole legacy stream
+    assert reader.unpacker is unpacker
+
+    # Garbage is not mistaken for a binary frame
+    reader.feed(b"\x92\xc1")
+    with pytest.raises(ValueError):
+        list(reader)
+
+
+def test_frame_reader_no_decode():
+    reader = salt.transport.frame.FrameReader(decode=False)
+    reader.feed(salt.transport.frame.frame_msg(b"package", header={"mid": 1}))
+    assert list(reader) == [({b"mid": 1}, b"package", False)]
+
+
+def test_frame_reply():
+    header = salt.transport.frame.advertise({"mid": 1})
+    assert salt.transport.frame.advertised(header)
+    assert not salt.transport.frame.advertised({"mid": 1})
+    assert not salt.transport.frame.advertised(None)
+
+    reader = salt.transport.frame.FrameReader()
+    # A legacy request which advertised binary frames gets a legacy reply
+    # telling the client it can send them
+    reader.feed(salt.transport.frame.frame_reply("reply", header))
+    # An old client gets its header back as is
+    reader.feed(salt.transport.frame.frame_reply("reply", {"mid": 2}))
+    reader.feed(salt.transport.frame.frame_reply("reply", {"mid": 3}, binary=True))
+    assert list(reader) == [
+        ({"mid": 1, "framing": "binary"}, "reply", False),
+        ({"mid": 2}, "reply", False),
+        ({"mid": 3}, "reply", True),
+    ]
@@ -65,6 +65,8 @@ def test_master_ipc_server_unix(master_config, sock_dir):
     server = salt.transport.ipc_publish_server("master", master_config)
     assert server.pub_path == str(sock_dir / "master_event_pub.ipc")
     assert server.pull_path == str(sock_dir / "master_event_pull.ipc")
+    # Event listeners are never dropped behind
+    assert server.buffer_size == 0
 
 
 @pytest.mark.skip_on_windows(reason="Unix socket not available on win32")
@@ -0,0 +1,117 @@
+import os
+import time
+
+import pytest
+
+import salt.transport
+import salt.transport.shm
+import salt.utils.event
+from salt.utils.process import Process, clean_proc
+
+
+@pytest.fixture
+def ring_path(tmp_path):
+    return str(tmp_path / "master_event_ring")
+
+
+def _read_all(reader):
+    ret = []
+    while True:
+        msg = reader.read()
+        if msg is None:
+            return ret
+        ret.append(msg)
+
+
+def test_ring_read_write(ring_path):
+    writer = salt.transport.shm.RingWriter(ring_path, 256)
+    writer.write(b"before the reader")
+    reader = salt.transport.shm.RingReader(ring_path)
+    assert reader.read() is None
+    events = [f"event{num}".encode() * num for num in range(1, 8)]
+    for event in events:
+        writer.write(event)
+        # Read as they come in so the ring wraps around without losing any
+        assert reader.read() == event
+    assert reader.read() is None
+    assert reader.missed == 0
+    assert writer.pos > writer.capacity
+    reader.close()
+    writer.close()
+
+
+def test_ring_reader_falls_behind(ring_path):
+    writer = salt.transport.shm.RingWriter(ring_path, 256)
+    reader = salt.transport.shm.RingReader(ring_path)
+    for num in range(20):
+        writer.write(f"event{num:02d}".encode())
+    # Only the events written after the gap are read
+    assert _read_all(reader) == []
+    assert reader.missed == 20
+    writer.write(b"event20")
+    assert _read_all(reader) == [b"event20"]
+    reader.close()
+    writer.close()
+
+
+def test_ring_skip(ring_path):
+    writer = salt.transport.shm.RingWriter(ring_path, 64)
+    reader = salt.transport.shm.RingReader(ring_path)
+    assert not writer.write(b"x" * 100)
+    writer.write(b"event")
+    assert _read_all(reader) == [b"event"]
+    assert reader.missed == 1
+    reader.close()
+    writer.close()
+
+
+def test_ring_replaced(ring_path):
+    writer = salt.transport.shm.RingWriter(ring_path, 64)
+    reader = salt.transport.shm.RingReader(ring_path)
+    assert not reader.replaced()
+    writer.close()
+    writer = salt.transport.shm.RingWriter(ring_path, 64)
+    assert reader.replaced()
+    reader.close()
+    writer.close()
+
+
+@pytest.fixture
+def master_opts(master_opts, tmp_path):
+    sock_dir = tmp_path / "sock"
+    sock_dir.mkdir()
+    master_opts.update(sock_dir=str(sock_dir), ipc_event_ring_size=1024 * 1024)
+    return master_opts
+
+
+@pytest.fixture
+def event_publisher(master_opts):
+    publisher = salt.transport.ipc_publish_server("master", master_opts)
+    proc = Process(target=publisher.publish_daemon, args=[publisher.publish_payload])
+    proc.start()
+    pub_path = os.path.join(master_opts["sock_dir"], "master_event_pub.ipc")
+    timeout_at = time.time() + 30
+    while not os.path.exists(pub_path) and time.time() < timeout_at:
+        time.sleep(0.1)
+    try:
+        yield
+    finally:
+        clean_proc(proc)
+
+
+def test_event_bus_ring(master_opts, event_publisher):
+    with salt.utils.event.MasterEvent(
+        master_opts["sock_dir"], opts=master_opts, listen=True
+    ) as listener, salt.utils.event.MasterEvent(
+        master_opts["sock_dir"], opts=master_opts, listen=True
+    ) as other:
+        assert isinstance(listener.subscriber.obj, salt.transport.shm.PublishClient)
+        assert listener.subscriber.obj.ring is not None
+        # Let the publisher get the doorbell registrations
+        time.sleep(1)
+        listener.fire_event({"data": "foo1"}, "evt1")
+        evt = listener.get_event(tag="evt1", wait=10)
+        assert evt["data"] == "foo1"
+        evt = other.get_event(tag="evt1", wait=10)
+        assert evt["data"] == "foo1"
+        assert listener.get_event(tag="evt1", wait=0.5) is None
@@ -10,12 +10,17 @@ import tornado.concurrent
 import tornado.gen
 import tornado.ioloop
 import tornado.iostream
+import tornado.tcpclient
 from pytestshellutils.utils import ports
 
 import salt.channel.server
 import salt.exceptions
+import salt.payload
+import salt.transport.frame
 import salt.transport.tcp
-from tests.support.mock import MagicMock, PropertyMock, patch
+import salt.utils.event
+import salt.utils.msgpack
+from tests.support.mock import AsyncMock, MagicMock, PropertyMock, patch
 
 pytestmark = [
     pytest.mark.core_test,
@@ -619,6 +624,43 @@ async def test_salt_message_server_exception(master_opts, io_loop):
     stream.close.assert_called_once()
 
 
+async def test_request_server_admission(master_opts):
+    master_opts["request_admission"] = True
+    master_opts["request_classes"] = {"auth": {"max_inflight": 1, "max_queue": 1}}
+    handled = []
+    release = tornado.concurrent.Future()
+
+    async def message_handler(payload):
+        handled.append(payload["load"]["id"])
+        await release
+        return payload["load"]["id"]
+
+    server = salt.transport.tcp.RequestServer(master_opts)
+    server._socket = MagicMock()
+    with patch("salt.transport.tcp.SaltMessageServer"):
+        server.post_fork(message_handler, tornado.ioloop.IOLoop.current())
+    stream = MagicMock()
+    auth = [
+        {"enc": "clear", "load": {"cmd": "_auth", "id": f"minion{num}"}}
+        for num in range(3)
+    ]
+    tasks = [
+        asyncio.ensure_future(server.handle_message(stream, payload))
+        for payload in auth
+    ]
+    await tornado.gen.sleep(0.01)
+    # One sign in is handled, one is queued and one is turned away
+    assert handled == ["minion0"]
+    assert stream.write.call_count == 1
+    reply = salt.payload.loads(stream.write.call_args[0][0])["body"]
+    assert reply == {"enc": "clear", "load": {"retry_after": 5}}
+
+    release.set_result(True)
+    await asyncio.gather(*tasks)
+    assert handled == ["minion0", "minion1"]
+    assert not any(server.admission.inflight.values())
+
+
 @pytest.mark.usefixtures("_squash_exepected_message_client_warning")
 async def test_message_client_stream_return_exception(minion_opts, io_loop):
     msg = {"foo": "bar"}
@@ -680,3 +722,311 @@ async def test_pub_server_publish_payload_closed_stream(master_opts, io_loop):
     server.clients = {client}
     await server.publish_payload(package, topic_list)
     assert server.clients == set()
+
+
+async def test_pub_server__stream_read_subscriptions(master_opts, io_loop):
+    messages = [
+        salt.transport.frame.frame_msg({"subscriptions": [["evt1", "startswith"]]}),
+    ]
+    client = salt.transport.tcp.Subscriber(MagicMock(), "client address")
+    client.stream.read_bytes = AsyncMock(
+        side_effect=[messages[0], tornado.iostream.StreamClosedError()]
+    )
+    presence_callback = MagicMock()
+    server = salt.transport.tcp.PubServer(
+        master_opts, io_loop, presence_callback=presence_callback
+    )
+    await server._stream_read(client)
+    assert client.tags.match("evt1")
+    assert not client.tags.match("evt2")
+    presence_callback.assert_not_called()
+
+
+async def test_pub_server_publish_payload_subscriptions(master_opts, io_loop):
+    server = salt.transport.tcp.PubServer(master_opts, io_loop=io_loop)
+    clients = []
+    for subscriptions in ([["evt1", "startswith"]], [["evt2", "startswith"]], []):
+        client = salt.transport.tcp.Subscriber(MagicMock(), "client address")
+        client.stream.write = AsyncMock()
+        server._subscribe(client, subscriptions)
+        clients.append(client)
+    server.clients = set(clients)
+
+    await server.publish_payload(salt.utils.event.SaltEvent.pack("evt1", {}))
+    assert clients[0].stream.write.call_count == 1
+    assert clients[1].stream.write.call_count == 0
+    assert clients[2].stream.write.call_count == 1
+    # Payloads which are not events go to everyone
+    await server.publish_payload(b"not an event")
+    assert [client.stream.write.call_count for client in clients] == [2, 1, 2]
+    for client in clients:
+        client.close()
+
+
+async def test_tcp_pub_client_set_subscriptions(minion_opts, io_loop, tmp_path):
+    subscriptions = [["salt/job/1", "startswith"]]
+    with salt.transport.tcp.PublishClient(
+        minion_opts, io_loop, path=str(tmp_path / "pub.ipc")
+    ) as client:
+        # Kept until connected
+        await client.set_subscriptions(subscriptions)
+        stream = MagicMock()
+        stream.write = AsyncMock()
+        with patch.object(client, "getstream", AsyncMock(return_value=stream)):
+            await client.connect()
+        stream.write.assert_called_once_with(
+            salt.transport.frame.frame_msg(
+                {"subscriptions": subscriptions},
+                header={"frames": [salt.transport.frame.BINARY]},
+            )
+        )
+        await client.set_subscriptions([])
+        assert stream.write.call_count == 2
+
+
+def test_request_router_least_busy(master_opts):
+    router = salt.transport.tcp.RequestRouter(master_opts)
+    client = MagicMock()
+    router.route(client, {"mid": 1}, "queued")
+    assert len(router.waiting) == 1
+
+    workers = [MagicMock(), MagicMock()]
+    for worker in workers:
+        router.workers[worker] = 0
+    router._send(router.least_busy(), *router.waiting.popleft())
+    for num in range(2, 5):
+        router.route(client, {"mid": num}, f"request{num}")
+    assert sorted(router.workers.values()) == [2, 2]
+
+    # Replies go back to the client with the header it sent
+    request_id, (_, header, worker, _) = next(iter(router.pending.items()))
+    router.reply(worker, {"mid": request_id}, "reply")
+    client.write.assert_called_once_with(
+        salt.transport.frame.frame_msg("reply", header=header)
+    )
+    assert router.workers[worker] == 1
+    router.route(client, {"mid": 5}, "request5")
+    assert router.workers[worker] == 2
+
+    # Replies to unknown requests are dropped
+    router.reply(worker, {"mid": 1000}, "reply")
+    assert client.write.call_count == 1
+
+
+async def test_request_router(master_opts, io_loop, tmp_path):
+    master_opts["sock_dir"] = str(tmp_path)
+    master_opts["interface"] = "127.0.0.1"
+    master_opts["ret_port"] = ports.get_unused_localhost_port()
+    router = salt.transport.tcp.RequestRouter(master_opts, io_loop=io_loop)
+    router.open()
+
+    handled = []
+
+    def handler(num):
+        async def handle(stream, body, header):
+            handled.append(num)
+            await asyncio.sleep(0.01)
+            stream.write(salt.transport.frame.frame_msg(body, header=header))
+
+        return handle
+
+    workers = [
+        salt.transport.tcp.RequestRouterWorker(master_opts, handler(num))
+        for num in range(2)
+    ]
+    while len(router.workers) < 2:
+        await asyncio.sleep(0.01)
+    client = await tornado.tcpclient.TCPClient().connect(
+        "127.0.0.1", master_opts["ret_port"]
+    )
+    try:
+        for num in range(10):
+            await client.write(
+                salt.transport.frame.frame_msg(f"request{num}", header={"mid": num})
+            )
+        replies = {}
+        unpacker = salt.utils.msgpack.Unpacker()
+        while len(replies) < 10:
+            unpacker.feed(await client.read_bytes(4096, partial=True))
+            for framed_msg in unpacker:
+                framed_msg = salt.transport.frame.decode_embedded_strs(framed_msg)
+                replies[framed_msg["head"]["mid"]] = framed_msg["body"]
+        assert replies == {num: f"request{num}" for num in range(10)}
+        assert sorted(set(handled)) == [0, 1]
+        assert not router.pending
+    finally:
+        client.close()
+        for worker in workers:
+            worker.close()
+        router.close()
+
+
+async def test_request_binary_framing(master_opts, minion_opts, io_loop):
+    port = ports.get_unused_localhost_port()
+    server = salt.transport.tcp.RequestServer(master_opts)
+    requests = []
+
+    async def message_handler(payload):
+        requests.append(payload)
+        return {"enc": "clear", "load": payload["load"]}
+
+    server.message_handler = message_handler
+    binaries = []
+
+    async def handle_message(stream, payload, header=None, binary=False):
+        binaries.append(binary)
+        await server.handle_message(stream, payload, header, binary)
+
+    msg_server = salt.transport.tcp.SaltMessageServer(handle_message, io_loop=io_loop)
+    msg_server.listen(port, "127.0.0.1")
+    minion_opts["master_uri"] = f"tcp://127.0.0.1:{port}"
+    client = salt.transport.tcp.RequestClient(minion_opts, io_loop)
+    try:
+        load = {"enc": "clear", "load": b"\xff\x00"}
+        # The first request advertises binary frames, the server says it
+        # reads them too in its reply
+        assert await client.send(load) == {"enc": "clear", "load": b"\xff\x00"}
+        assert client._binary
+        assert await client.send(load) == {"enc": "clear", "load": b"\xff\x00"}
+        assert binaries == [False, True]
+        # Bytes stay bytes with the binary framing
+        assert requests[1] == load
+    finally:
+        client.close()
+        msg_server.close()
+
+
+async def test_pub_server_binary_subscriber(master_opts, io_loop):
+    server = salt.transport.tcp.PubServer(master_opts, io_loop=io_loop)
+    clients = []
+    for header in ({}, salt.transport.frame.advertise()):
+        client = salt.transport.tcp.Subscriber(MagicMock(), "client address")
+        client.stream.read_bytes = AsyncMock(
+            side_effect=[
+                salt.transport.frame.frame_msg({"subscriptions": []}, header=header),
+                tornado.iostream.StreamClosedError(),
+            ]
+        )
+        await server._stream_read(client)
+        client.stream.write = AsyncMock()
+        clients.append(client)
+    assert [client.binary for client in clients] == [False, True]
+    server.clients = set(clients)
+
+    await server.publish_payload(b"package")
+    clients[0].stream.write.assert_called_once_with(
+        salt.transport.frame.frame_msg(b"package")
+    )
+    clients[1].stream.write.assert_called_once_with(
+        salt.transport.frame.frame_msg_binary(b"package", raw_body=True)
+    )
+    for client in clients:
+        client.close()
+
+
+def _slow_subscriber():
+    client = salt.transport.tcp.Subscriber(MagicMock(), "client address")
+    client.stream.closed.return_value = False
+    client.writes = []
+
+    def write(data):
+        future = tornado.concurrent.Future()
+        client.writes.append((data, future))
+        return future
+
+    client.stream.write.side_effect = write
+    return client
+
+
+async def test_pub_server_bounded_buffer(master_opts, io_loop):
+    server = salt.transport.tcp.PubServer(
+        master_opts,
+        io_loop=io_loop,
+        buffer_size=10,
+        slow_subscriber="drop_oldest",
+        coalesce_size=6,
+    )
+    client = _slow_subscriber()
+    client.lag_callback = MagicMock()
+    server.clients = {client}
+
+    await server.publish_payload(b"one")
+    await asyncio.sleep(0.01)
+    # The first write is on its way, the next ones are queued
+    assert [data for data, _ in client.writes] == [
+        salt.transport.frame.frame_msg(b"one")
+    ]
+    for payload in (b"a", b"b", b"c", b"d"):
+        assert await server.send(client, payload)
+    assert client.queued_bytes == 4
+    assert await server.send(client, b"12345678")
+    # The oldest payloads were dropped to make room
+    assert list(client.queue) == [b"c", b"d", b"12345678"]
+    assert client.lag() == {
+        "queued": 3,
+        "queued_bytes": 10,
+        "dropped": 2,
+    }
+    client.lag_callback.assert_called_once_with(client)
+
+    # Small payloads are written together once the subscriber catches up
+    for _ in range(3):
+        client.writes[-1][1].set_result(None)
+        await asyncio.sleep(0.01)
+    assert [data for data, _ in client.writes[1:]] == [b"cd", b"12345678"]
+    assert not client.writing
+    assert not client.lagging
+    for payload in (b"e", b"f", b"g"):
+        assert await server.send(client, payload)
+    await asyncio.sleep(0.01)
+    assert client.writes[-1][0] == b"efg"
+    client.writes[-1][1].set_result(None)
+    client.close()
+
+
+async def test_pub_server_slow_subscriber_disconnect(master_opts, io_loop):
+    remove_presence_callback = MagicMock()
+    server = salt.transport.tcp.PubServer(
+        master_opts,
+        io_loop=io_loop,
+        remove_presence_callback=remove_presence_callback,
+        buffer_size=4,
+    )
+    assert server.slow_subscriber == "disconnect"
+    client = _slow_subscriber()
+    server.clients = {client}
+    for payload in (b"a", b"b", b"c", b"d"):
+        assert await server.send(client, payload)
+    await server.publish_payload(b"package")
+    assert server.clients == set()
+    remove_presence_callback.assert_called_once_with(client)
+    client.close()
+
+
+def test_pub_server_channel_lag():
+    channel = salt.channel.server.PubServerChannel.__new__(
+        salt.channel.server.PubServerChannel
+    )
+    channel.present = {}
+    channel.presence_events = True
+    channel.event = MagicMock()
+    client = salt.transport.tcp.Subscriber(MagicMock(), "client address")
+    client.id_ = "minion"
+    channel._add_client_present(client)
+    assert "lag" not in channel.event.fire_event.call_args_list[-1][0][0]
+
+    client.queue.append(b"payload")
+    client.queued_bytes = 7
+    client.dropped = 1
+    channel._client_lagging(client)
+    channel.event.fire_event.assert_called_with(
+        {
+            "id": "minion",
+            "queued": 1,
+            "queued_bytes": 7,
+            "dropped": 1,
+        },
+        "salt/presence/lag",
+    )
+    assert channel._lag() == {"minion": client.lag()}
+    client.close()
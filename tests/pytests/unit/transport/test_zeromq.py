@@ -1,4 +1,5 @@
 import logging
+import time
 
 import msgpack
 import pytest
@@ -10,7 +11,7 @@ import salt.transport.zeromq
 import salt.utils.platform
 import salt.utils.process
 import salt.utils.stringutils
-from tests.support.mock import AsyncMock, MagicMock
+from tests.support.mock import AsyncMock, MagicMock, patch
 
 log = logging.getLogger(__name__)
 
@@ -131,3 +132,28 @@ async def test_unclosed_publish_client(minion_opts, io_loop):
             client.__del__()  # pylint: disable=unnecessary-dunder-call
     finally:
         client.close()
+
+
+def test_queue_device_expires_lost_requests():
+    server = salt.transport.zeromq.RequestServer(
+        {"request_admission": True, "worker_threads": 2}
+    )
+    server.pools = {"default": MagicMock()}
+    server._setup_queue_device()
+    assert server.admission.classify({"enc": "aes", "cmd": "_pillar"}) == "pillar"
+    server.admission.put("auth", ("default", [b"ident", b"", b"request"]))
+    name, (pool, msg) = server.admission.pop()
+    server._dispatch(name, pool, msg)
+    forwarded = server.pools["default"].send_multipart.call_args[0][0]
+    # The request id goes first, the worker sends it back with the reply
+    assert forwarded[1:] == [b"ident", b"", b"request"]
+
+    # The worker died, the device is too busy to ever be idle
+    start = time.monotonic()
+    with patch("time.monotonic", return_value=start + 10):
+        server._expire()
+    assert server.admission.inflight["auth"] == 1
+    with patch("time.monotonic", return_value=start + 100):
+        server._expire()
+    assert server.admission.inflight["auth"] == 0
+    assert not server.tracker.pending
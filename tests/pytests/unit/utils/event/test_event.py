@@ -8,12 +8,13 @@ import tornado.iostream
 import zmq
 
 import salt.config
+import salt.payload
 import salt.utils.event
 import salt.utils.stringutils
 from salt.exceptions import SaltDeserializationError
 from salt.utils.event import SaltEvent
 from tests.support.events import eventpublisher_process, eventsender_process
-from tests.support.mock import patch
+from tests.support.mock import MagicMock, patch
 
 NO_LONG_IPC = False
 if getattr(zmq, "IPC_PATH_MAX_LEN", 103) <= 103:
@@ -188,6 +189,55 @@ def test_event_subscriptions_cache_regex(sock_dir):
             _assert_got_event(evt1, {"data": "foo1"})
 
 
+@pytest.mark.slow_test
+def test_event_filter_events(sock_dir):
+    """Test the publisher only sends the subscribed events"""
+    with eventpublisher_process(str(sock_dir)):
+        with salt.utils.event.MasterEvent(
+            str(sock_dir), listen=True, filter_events=True
+        ) as me:
+            me.subscribe("evt1")
+            # Give the publisher time to get the subscription
+            time.sleep(1)
+            me.fire_event({"data": "foo2"}, "evt2")
+            me.fire_event({"data": "foo1"}, "evt1")
+            evt1 = me.get_event_block()
+            assert evt1["tag"] == "evt1"
+            _assert_got_event(evt1["data"], {"data": "foo1"})
+
+            # The tag get_event waits for is sent as well
+            with eventsender_process({"data": "foo3"}, "evt3", str(sock_dir), 3):
+                evt3 = me.get_event(wait=10, tag="evt3")
+                _assert_got_event(evt3, {"data": "foo3"})
+
+            me.unsubscribe("evt1")
+            time.sleep(1)
+            me.fire_event({"data": "foo2"}, "evt2")
+            evt2 = me.get_event_block()
+            assert evt2["tag"] == "evt2"
+            _assert_got_event(evt2["data"], {"data": "foo2"})
+
+
+@pytest.mark.slow_test
+def test_event_filter_events_expect(sock_dir):
+    """Test the expected events are sent until subscribed to"""
+    with eventpublisher_process(str(sock_dir)):
+        with salt.utils.event.MasterEvent(
+            str(sock_dir), listen=True, filter_events=True
+        ) as me:
+            me.subscribe("evt1")
+            me.expect("job/")
+            time.sleep(1)
+            # Fired before the listener knows which tag to subscribe to
+            me.fire_event({"data": "foo2"}, "job/2")
+            time.sleep(1)
+            me.subscribe("job/2")
+            me.unexpect("job/")
+            assert me.expected == []
+            evt2 = me.get_event(wait=10, tag="job/2")
+            _assert_got_event(evt2, {"data": "foo2"})
+
+
 @pytest.mark.slow_test
 def test_event_multiple_clients(sock_dir):
     """Test event is received by multiple clients"""
@@ -411,3 +461,162 @@ def test_event_fire_ret_load():
         )
         assert mock_log_error.mock_calls[0].args[1] == "minion_id.example.org"
         assert mock_log_error.mock_calls[0].args[2] == "".join(test_traceback)
+
+
+def test_unpack_tag():
+    raw = SaltEvent.pack("salt/job/123/ret/minion", {"data": "foo"})
+    assert salt.utils.event.unpack_tag(raw) == "salt/job/123/ret/minion"
+    assert salt.utils.event.unpack_tag(b"no tag") is None
+    assert salt.utils.event.unpack_tag({"tag": "evt1"}) is None
+
+
+@pytest.mark.parametrize(
+    "subscriptions,matched,not_matched",
+    [
+        ([["salt/job/1", "startswith"]], "salt/job/1/ret/web1", "salt/job/2/new"),
+        ([["/new", "endswith"]], "salt/job/1/new", "salt/job/1/ret/web1"),
+        ([["ret", "find"]], "salt/job/1/ret/web1", "salt/job/1/new"),
+        ([["salt/job/[0-9]+/ret", "regex"]], "salt/job/1/ret/web1", "salt/job/x/ret"),
+        ([["salt/job/*/ret/web?", "fnmatch"]], "salt/job/1/ret/web1", "salt/job/1/new"),
+        ([["evt1", "startswith"], ["evt2", "startswith"]], "evt2", "evt3"),
+    ],
+)
+def test_tag_filter(subscriptions, matched, not_matched):
+    tags = salt.utils.event.TagFilter(subscriptions)
+    assert tags.match(matched)
+    assert not tags.match(not_matched)
+
+
+@pytest.mark.parametrize(
+    "subscriptions",
+    [
+        [["evt1", "startswith"], ["", "startswith"]],
+        [["evt1", "nope"]],
+        [["evt(", "regex"]],
+    ],
+)
+def test_tag_filter_everything(subscriptions):
+    assert salt.utils.event.TagFilter(subscriptions).match("anything")
+
+
+def _evt(tag):
+    return {"tag": tag, "data": {}}
+
+
+def test_pending_events_order():
+    event = SaltEvent(node=None, listen=False)
+    event.subscribe("salt/job/1")
+    event.subscribe("e..1$", "regex")
+    for tag in ("salt/job/1/new", "evt1", "other", "salt/job/1/ret/web1"):
+        event.pending_events.add(_evt(tag))
+    assert [evt["tag"] for evt in event.pending_events] == [
+        "salt/job/1/new",
+        "evt1",
+        "salt/job/1/ret/web1",
+    ]
+    assert event._check_pending("salt/job/1")["tag"] == "salt/job/1/new"
+    # Not a subscription, looked up in the tag trie
+    assert event._check_pending("salt/job/1/ret")["tag"] == "salt/job/1/ret/web1"
+    assert event._check_pending("salt/job/1") is None
+    # Neither, looked up in order
+    assert event._check_pending("evt", event._match_tag_find)["tag"] == "evt1"
+    assert not event.pending_events
+    assert not event.pending_events.tags
+    assert not event.pending_events.trie.children
+
+
+def test_pending_events_subscription_lookup_is_indexed():
+    calls = []
+
+    def match_func(event_tag, search_tag):
+        calls.append(event_tag)
+        return event_tag.startswith(search_tag)
+
+    pending = salt.utils.event.PendingEvents()
+    pending.subscribe("salt/job/1", match_func)
+    for num in range(10000):
+        pending.add(_evt(f"salt/job/1/ret/web{num}"))
+    assert len(calls) == 10000
+    for num in range(10000):
+        assert (
+            pending.pop("salt/job/1", match_func)["tag"] == f"salt/job/1/ret/web{num}"
+        )
+    assert len(calls) == 10000
+    assert pending.pop("salt/job/1", match_func) is None
+
+
+def test_pending_events_prefix_lookup():
+    pending = salt.utils.event.PendingEvents()
+    pending.subscribe("", SaltEvent._match_tag_startswith)
+    for tag in ("salt/jobs/2", "salt/job/1/ret/web1", "salt/job", "salt/job10"):
+        pending.add(_evt(tag))
+
+    def pop(tag):
+        evt = pending.pop(tag, SaltEvent._match_tag_endswith, prefix=True)
+        return evt and evt["tag"]
+
+    assert pop("salt/job/") == "salt/job/1/ret/web1"
+    assert pop("salt/job/") is None
+    assert pop("salt/job1") == "salt/job10"
+    assert pop("salt/job") == "salt/jobs/2"
+    assert pop("salt/job") == "salt/job"
+    assert pop("") is None
+
+
+def test_pending_events_unsubscribe():
+    event = SaltEvent(node=None, listen=False)
+    event.subscribe("salt/job/1")
+    event.subscribe("salt/job/1/ret")
+    event.subscribe("salt/job/2")
+    for tag in ("salt/job/1/new", "salt/job/1/ret/web1", "salt/job/2/new"):
+        event.pending_events.add(_evt(tag))
+    event.unsubscribe("salt/job/1")
+    assert [evt["tag"] for evt in event.pending_events] == [
+        "salt/job/1/ret/web1",
+        "salt/job/2/new",
+    ]
+    event.unsubscribe("salt/job/1/ret")
+    assert [evt["tag"] for evt in event.pending_events] == ["salt/job/2/new"]
+
+
+def test_pending_events_max_events():
+    pending = salt.utils.event.PendingEvents(max_events=2)
+    pending.subscribe("evt", SaltEvent._match_tag_startswith)
+    for num in range(3):
+        pending.add(_evt(f"evt{num}"))
+    assert [evt["tag"] for evt in pending] == ["evt1", "evt2"]
+    assert sorted(pending.tags) == ["evt1", "evt2"]
+
+
+def test_unpack_lazy():
+    raw = SaltEvent.pack("salt/job/1/ret/web1", {"return": True})
+    with patch("salt.payload.loads", wraps=salt.payload.loads) as loads:
+        tag, data = SaltEvent.unpack(raw, lazy=True)
+        assert tag == "salt/job/1/ret/web1"
+        assert not data.loaded
+        loads.assert_not_called()
+        assert data["return"] is True
+        assert data == {"return": True}
+        assert data.load() == {"return": True}
+        assert loads.call_count == 1
+    assert SaltEvent.unpack(raw) == ("salt/job/1/ret/web1", {"return": True})
+
+
+def test_get_event_only_decodes_wanted_events():
+    event = SaltEvent(node=None, listen=False)
+    event.subscribe("salt/job/2")
+    event.cpub = True
+    event.subscriber = MagicMock()
+    event.subscriber.recv.side_effect = [
+        SaltEvent.pack("salt/job/1/ret/web1", {"return": "other"}),
+        SaltEvent.pack("salt/job/2/ret/web1", {"return": "cached"}),
+        SaltEvent.pack("salt/job/3/ret/web1", {"return": "wanted"}),
+    ]
+    with patch("salt.payload.loads", wraps=salt.payload.loads) as loads:
+        assert event.get_event(tag="salt/job/3") == {"return": "wanted"}
+        assert loads.call_count == 1
+        # Cached events are decoded when they are asked for
+        evt = event.get_event(tag="salt/job/2", full=True)
+        assert evt == {"tag": "salt/job/2/ret/web1", "data": {"return": "cached"}}
+        assert isinstance(evt["data"], dict)
+        assert loads.call_count == 2
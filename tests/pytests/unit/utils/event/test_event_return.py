@@ -1,7 +1,10 @@
+import time
+
 import pytest
 from pytestshellutils.utils.processes import terminate_process
 
 import salt.utils.event
+import salt.utils.event_return
 import salt.utils.stringutils
 
 
@@ -86,3 +89,209 @@ def test_filter_allowed_but_denied():
         )
         is False
     )
+
+
+def _evt(num):
+    return {"tag": f"salt/test/{num}", "data": {"num": num}}
+
+
+def _worker(func, tmp_path=None, **opts):
+    opts = {
+        "event_return_queue": 2,
+        "event_return_queue_hwm": 4,
+        "event_return_spill_hwm": 100,
+        "event_return_retry_backoff": 0.01,
+        **opts,
+    }
+    spill_dir = str(tmp_path / "spill") if tmp_path else None
+    return salt.utils.event_return.ReturnerWorker("test", func, opts, spill_dir)
+
+
+def test_spill_queue(tmp_path):
+    spill = salt.utils.event_return.SpillQueue(str(tmp_path), max_events=4)
+    spill.append([(1.0, _evt(1)), (2.0, _evt(2))])
+    spill.append([(3.0, _evt(3))])
+    spill.appendleft([(0.0, _evt(0))])
+    assert len(spill) == 4
+    assert spill.oldest() == 0.0
+
+    # The queue is still there after a restart
+    spill = salt.utils.event_return.SpillQueue(str(tmp_path), max_events=4)
+    assert len(spill) == 4
+    spill.append([(4.0, _evt(4))])
+    assert spill.dropped == 1
+    events = []
+    while spill.segments:
+        events.extend(evt["data"]["num"] for _, evt in spill.popleft())
+    assert events == [1, 2, 3, 4]
+    assert not list(tmp_path.iterdir())
+
+
+def test_returner_worker_batches():
+    calls = []
+    worker = _worker(calls.append, event_return_queue_hwm=10)
+    worker.start()
+    for num in range(5):
+        worker.put(_evt(num))
+    worker.stop()
+    worker.join(10)
+    assert [[evt["data"]["num"] for evt in batch] for batch in calls] == [
+        [0, 1],
+        [2, 3],
+        [4],
+    ]
+    assert worker.stats()["returned"] == 5
+
+
+def test_returner_worker_spills_while_returner_is_down(tmp_path):
+    calls = []
+
+    def event_return(events):
+        if len(calls) < 3:
+            calls.append(None)
+            raise Exception("database is down")
+        calls.append([evt["data"]["num"] for evt in events])
+
+    worker = _worker(event_return, tmp_path, event_return_retry_backoff=0.5)
+    for num in range(20):
+        worker.put(_evt(num))
+    stats = worker.stats()
+    assert stats["queued"] == 4
+    assert stats["spilled"] == 16
+    worker.start()
+    worker.flush()
+    for _ in range(100):
+        if worker.stats()["returned"] == 20:
+            break
+        time.sleep(0.1)
+    worker.stop()
+    worker.join(10)
+    returned = [num for batch in calls[3:] for num in batch]
+    assert returned == list(range(20))
+    stats = worker.stats()
+    assert stats["failures"] == 3
+    assert stats["dropped"] == 0
+    assert stats["spilled"] == 0
+
+
+def test_returner_worker_keeps_events_on_disk_when_stopped(tmp_path):
+    def event_return(events):
+        raise Exception("database is down")
+
+    worker = _worker(event_return, tmp_path)
+    worker.start()
+    for num in range(7):
+        worker.put(_evt(num))
+    worker.stop()
+    worker.join(10)
+    assert not worker.is_alive()
+
+    spill = salt.utils.event_return.SpillQueue(str(tmp_path / "spill"))
+    events = []
+    while spill.segments:
+        events.extend(evt["data"]["num"] for _, evt in spill.popleft())
+    assert events == list(range(7))
+
+
+def test_returner_worker_drops_after_retries():
+    def event_return(events):
+        if events[0]["data"]["num"] == 0:
+            raise Exception("bad event")
+
+    worker = _worker(event_return, event_return_retries=1, event_return_queue=1)
+    worker.start()
+    worker.put(_evt(0))
+    worker.put(_evt(1))
+    for _ in range(100):
+        if worker.stats()["dropped"]:
+            break
+        time.sleep(0.1)
+    worker.stop()
+    worker.join(10)
+    stats = worker.stats()
+    assert stats["dropped"] == 1
+    assert stats["failures"] == 2
+
+
+def test_returner_worker_quarantines_after_retries(tmp_path):
+    def event_return(events):
+        if events[0]["data"]["num"] == 0:
+            raise Exception("bad event")
+        calls.append([evt["data"]["num"] for evt in events])
+
+    calls = []
+    worker = _worker(event_return, tmp_path, event_return_queue=1)
+    assert worker.retries == salt.utils.event_return.DEFAULT_RETRIES
+    worker.start()
+    worker.put(_evt(0))
+    worker.put(_evt(1))
+    for _ in range(100):
+        if worker.stats()["returned"]:
+            break
+        time.sleep(0.1)
+    worker.stop()
+    worker.join(10)
+    # The bad batch does not hold up the events behind it
+    assert calls == [[1]]
+    stats = worker.stats()
+    assert stats["quarantined"] == 1
+    assert stats["dropped"] == 0
+    assert stats["failures"] == salt.utils.event_return.DEFAULT_RETRIES + 1
+
+    quarantine = salt.utils.event_return.SpillQueue(
+        str(tmp_path / "spill" / salt.utils.event_return.QUARANTINE_DIR)
+    )
+    assert [evt for _, evt in quarantine.popleft()] == [_evt(0)]
+
+
+def test_returner_worker_retries_while_returner_is_down(tmp_path):
+    calls = []
+
+    def event_return(events):
+        if len(calls) < 12:
+            calls.append(None)
+            raise Exception("database is down")
+        calls.append([evt["data"]["num"] for evt in events])
+
+    worker = _worker(
+        event_return,
+        tmp_path,
+        event_return_retries=2,
+        event_return_queue=1,
+        event_return_retry_backoff_max=0.05,
+    )
+    worker.start()
+    for num in range(4):
+        worker.put(_evt(num))
+    for _ in range(100):
+        if worker.stats()["returned"] == 4:
+            break
+        time.sleep(0.1)
+    worker.stop()
+    worker.join(10)
+    # An outage longer than the retries quarantines nothing
+    assert [num for batch in calls[12:] for num in batch] == list(range(4))
+    stats = worker.stats()
+    assert stats["quarantined"] == 0
+    assert stats["dropped"] == 0
+    assert stats["spilled"] == 0
+
+
+def test_returner_worker_requeues_quarantine_once_recovered(tmp_path):
+    quarantine = salt.utils.event_return.SpillQueue(
+        str(tmp_path / "spill" / salt.utils.event_return.QUARANTINE_DIR)
+    )
+    quarantine.append([(time.time(), _evt(0))])
+
+    calls = []
+    worker = _worker(calls.append, tmp_path, event_return_queue=1)
+    worker.start()
+    worker.put(_evt(1))
+    for _ in range(100):
+        if worker.stats()["returned"] == 2:
+            break
+        time.sleep(0.1)
+    worker.stop()
+    worker.join(10)
+    assert [[evt["data"]["num"] for evt in batch] for batch in calls] == [[1], [0]]
+    assert not worker.quarantine.segments
@@ -0,0 +1,154 @@
+import pytest
+
+import salt.payload
+import salt.utils.admission
+from tests.support.mock import patch
+
+AUTH = {"enc": "clear", "load": {"cmd": "_auth", "id": "minion"}}
+RETURN = {"enc": "aes", "load": b"encrypted"}
+
+
+@pytest.fixture
+def admission():
+    classes = salt.utils.admission.classes(
+        {"request_classes": {"auth": {"max_queue": 2}, "nope": {}}}
+    )
+    return salt.utils.admission.AdmissionQueue(classes, max_inflight=3)
+
+
+@pytest.mark.parametrize(
+    "payload,expected",
+    [
+        (AUTH, "auth"),
+        (salt.payload.dumps(AUTH), "auth"),
+        (RETURN, "default"),
+        ({"enc": "aes", "load": b"encrypted", "cmd": "_return"}, "returns"),
+        ({"enc": "aes", "load": b"encrypted", "cmd": "_pillar"}, "pillar"),
+        ({"enc": "aes", "load": b"encrypted", "cmd": "_serve_file"}, "files"),
+        ({"enc": "aes", "load": b"encrypted", "cmd": "_mine"}, "default"),
+        ({"enc": "clear", "load": {"cmd": "publish"}}, "default"),
+        (b"\xc1garbage", "default"),
+        ("nope", "default"),
+    ],
+)
+def test_classify(payload, expected):
+    assert salt.utils.admission.classify(payload) == expected
+
+
+def test_classes():
+    classes = salt.utils.admission.classes(
+        {
+            "request_classes": {
+                "auth": {"max_queue": 10},
+                "nope": {},
+                "mine": {"commands": ["_mine", "_return"], "max_inflight": 4},
+            }
+        }
+    )
+    assert classes["auth"]["max_queue"] == 10
+    assert classes["auth"]["max_inflight"] == 2
+    assert "nope" not in classes
+    assert classes["mine"]["max_inflight"] == 4
+    assert salt.utils.admission.DEFAULT_CLASSES["auth"]["max_queue"] == 1000
+
+    admission = salt.utils.admission.AdmissionQueue(classes)
+    assert admission.classify({"enc": "aes", "cmd": "_mine"}) == "mine"
+    # The first class listing a command gets it
+    assert admission.classify({"enc": "aes", "cmd": "_return"}) == "returns"
+
+
+def test_retry_after():
+    reply = salt.utils.admission.retry_reply(5)
+    assert salt.utils.admission.retry_after(reply) == 5
+    assert salt.utils.admission.retry_after({"enc": "clear", "load": b""}) is None
+    assert salt.utils.admission.retry_after("bad load") is None
+
+    # The minion does not trust the hint of the master
+    huge = salt.utils.admission.retry_reply(10**9)
+    assert (
+        salt.utils.admission.retry_after(huge) == salt.utils.admission.MAX_RETRY_AFTER
+    )
+    assert salt.utils.admission.retry_after(salt.utils.admission.retry_reply(-5)) == 0
+    for hint in ("5", None, True, float("nan")):
+        reply = salt.utils.admission.retry_reply(hint)
+        assert salt.utils.admission.retry_after(reply) is None
+
+
+def test_peek():
+    request = {
+        "enc": "aes",
+        "load": b"encrypted",
+        "version": 2,
+        "cmd": "_pillar",
+    }
+    assert salt.utils.admission.peek(salt.payload.dumps(request)) == {
+        "enc": "aes",
+        "cmd": "_pillar",
+    }
+    request = {"enc": "clear", "load": {"cmd": "_auth", "id": "minion"}}
+    peeked = salt.utils.admission.peek(salt.payload.dumps(request))
+    assert peeked == {"enc": "clear", "load": {"cmd": "_auth"}}
+    assert salt.utils.admission.classify(peeked) == "auth"
+    # Requests with another layout are decoded
+    request = {"load": {"cmd": "_auth"}, "enc": "clear"}
+    assert salt.utils.admission.peek(salt.payload.dumps(request)) == request
+    assert salt.utils.admission.peek(salt.payload.dumps("bad load")) == "bad load"
+    assert salt.utils.admission.peek(b"\xc1garbage") is None
+
+
+def test_dispatch_by_priority_and_limits(admission):
+    for num in range(4):
+        assert admission.put("auth", f"auth{num}") is (num < 2)
+    for num in range(3):
+        assert admission.put("default", f"ret{num}")
+
+    # The default class goes first, the total limit applies
+    assert admission.pop() == ("default", "ret0")
+    assert admission.pop() == ("default", "ret1")
+    assert admission.pop() == ("default", "ret2")
+    assert admission.pop() is None
+
+    admission.done("default", 1.0)
+    admission.done("default", 1.0)
+    admission.done("default", 1.0)
+    assert admission.pop() == ("auth", "auth0")
+    assert admission.pop() == ("auth", "auth1")
+    # Only two sign ins at a time
+    assert admission.put("auth", "auth2")
+    assert admission.pop() is None
+    admission.done("auth", 2.0)
+    assert admission.pop() == ("auth", "auth2")
+
+
+def test_retry_after_grows_with_queue(admission):
+    assert admission.retry_after("auth") == 5
+    admission.done("auth", 20.0)
+    admission.put("auth", "auth0")
+    admission.put("auth", "auth1")
+    # Two sign ins of 20 seconds each, handled two at a time
+    assert admission.retry_after("auth") == 20
+    admission.latency["auth"] = 1000
+    assert admission.retry_after("auth") == salt.utils.admission.MAX_RETRY_AFTER
+
+
+def test_tracker(admission):
+    tracker = salt.utils.admission.Tracker(admission.done, stale_after=10)
+    admission.put("auth", "auth0")
+    admission.put("default", "ret0")
+    request_ids = {}
+    for _ in range(2):
+        name, _ = admission.pop()
+        request_ids[name] = tracker.dispatched(name)
+    assert len(set(request_ids.values())) == 2
+    assert admission.inflight["auth"] == admission.inflight["default"] == 1
+
+    # The replies come back in any order, even for the same client
+    tracker.replied(request_ids["default"])
+    tracker.replied(b"unknown")
+    assert (admission.inflight["auth"], admission.inflight["default"]) == (1, 0)
+    assert list(tracker.pending) == [request_ids["auth"]]
+
+    with patch("time.monotonic", return_value=10**9):
+        tracker.expire()
+    assert not any(admission.inflight.values())
+    assert not tracker.pending
@@ -0,0 +1,33 @@
+import pytest
+
+from salt.utils.bloom import BloomFilter
+
+
+def test_contains_its_items():
+    items = [f"minion{index}" for index in range(100)]
+    bloom = BloomFilter.from_items(items)
+    assert all(item in bloom for item in items)
+    # Sized for about 1% of false positives
+    false_positives = sum(f"other{index}" in bloom for index in range(10000))
+    assert false_positives < 300
+
+
+def test_empty_filter():
+    bloom = BloomFilter.from_items([])
+    assert "minion" not in bloom
+
+
+def test_dumps_loads():
+    bloom = BloomFilter.from_items(["minion1", "minion2"])
+    loaded = BloomFilter.loads(bloom.dumps())
+    assert loaded.size == bloom.size
+    assert loaded.hashes == bloom.hashes
+    assert "minion1" in loaded
+    assert "minion2" in loaded
+    assert "minion3" not in loaded
+
+
+@pytest.mark.parametrize("data", [b"", b"\x01", b"\x00\xff", b"\x11\xff"])
+def test_loads_invalid(data):
+    with pytest.raises(ValueError):
+        BloomFilter.loads(data)
@@ -873,3 +873,24 @@ def test_userdata_template():
                 "renderer": "jinja",
             }
             assert cloud.userdata_template(opts=opts, vm_={}, userdata="test") == "True"
+
+
+@pytest.mark.parametrize("key_store", ["dirs", "sqlite"])
+def test_accept_rename_remove_key(tmp_path, key_store):
+    pki_dir = str(tmp_path / "pki")
+    opts = {"key_store": key_store, "sock_dir": str(tmp_path)}
+    store = cloud.get_key_store(pki_dir, opts)
+    cloud.accept_key(pki_dir, "pub", "minion1", opts=opts)
+    assert store.lookup("minion1") == {"minions": "pub"}
+
+    store.put("minions_pre", "minion2", "pub")
+    cloud.accept_key(pki_dir, "pub", "minion2", opts=opts)
+    assert store.lookup("minion2") == {"minions": "pub"}
+
+    cloud.rename_key(pki_dir, "minion2", "minion3", opts=opts)
+    assert store.list_keys(("minions",)) == {"minions": ["minion1", "minion3"]}
+
+    cloud.remove_key(pki_dir, "minion1", opts=opts)
+    assert store.list_keys(("minions",)) == {"minions": ["minion3"]}
+    if key_store == "sqlite":
+        store.close()
@@ -0,0 +1,84 @@
+import os
+
+import pytest
+
+import salt.payload
+import salt.utils.compression
+from tests.support.mock import patch
+
+DATA = salt.payload.dumps({"return": "x" * 10000})
+
+
+def test_algorithms():
+    with patch("salt.utils.compression.HAS_ZSTD", False):
+        opts = {"compression": ["zstd", "nope", "zlib"]}
+        assert salt.utils.compression.algorithms(opts) == ["zlib"]
+        assert salt.utils.compression.algorithms({"compression": "zlib"}) == ["zlib"]
+        assert salt.utils.compression.algorithms({}) == []
+    with patch("salt.utils.compression.HAS_ZSTD", True):
+        opts = {"compression": ["zstd", "zlib"]}
+        assert salt.utils.compression.algorithms(opts) == ["zstd", "zlib"]
+
+
+@pytest.mark.parametrize(
+    "offered,expected",
+    [
+        (["zstd", "zlib"], "zlib"),
+        (["zstd"], None),
+        (None, None),
+        ("zlib", None),
+    ],
+)
+def test_negotiate(offered, expected):
+    with patch("salt.utils.compression.HAS_ZSTD", False):
+        opts = {"compression": ["zstd", "zlib"]}
+        assert salt.utils.compression.negotiate(opts, offered) == expected
+
+
+def test_compressor():
+    compressor = salt.utils.compression.Compressor(
+        {"compression": ["zlib"], "compression_threshold": 100}
+    )
+    compress = compressor.using("zlib")
+    assert compressor.using("zstd") is None
+
+    packed = compress(DATA)
+    assert packed.startswith(salt.utils.compression.MARKER)
+    assert len(packed) < len(DATA)
+    assert compressor.decompress(packed) == DATA
+    assert salt.utils.compression.decompress(packed) == DATA
+
+    # Small and incompressible payloads are left alone
+    small = salt.payload.dumps({"foo": "bar"})
+    assert compress(small) == small
+    assert compressor.decompress(small) == small
+    noise = salt.payload.dumps(os.urandom(2000))
+    assert compress(noise) == noise
+
+    assert compressor.stats["compressed"] == 1
+    assert compressor.stats["uncompressed"] == 2
+    assert compressor.stats["bytes_in"] == len(DATA)
+    assert compressor.stats["bytes_out"] == len(packed)
+    assert compressor.stats["decompressed"] == 1
+
+
+def test_decompress_unsupported():
+    with pytest.raises(ValueError):
+        salt.utils.compression.decompress(salt.utils.compression.MARKER + b"\x7fdata")
+
+
+def test_decompress_max_size():
+    compressor = salt.utils.compression.Compressor(
+        {"compression": ["zlib"], "compression_max_size": 1024}
+    )
+    compress = compressor.using("zlib")
+    assert compressor.decompress(compress(b"x" * 1024)) == b"x" * 1024
+    with pytest.raises(ValueError):
+        compressor.decompress(compress(b"x" * 1025))
+    bomb = compress(b"\x00" * 1024 * 1024)
+    assert len(bomb) < 2048
+    with pytest.raises(ValueError):
+        salt.utils.compression.decompress(bomb, max_size=1024 * 1024 - 1)
+    with pytest.raises(ValueError):
+        # Truncated
+        salt.utils.compression.decompress(bomb[:-4])
@@ -0,0 +1,132 @@
+import os
+
+import pytest
+
+import salt.key
+import salt.utils.key_set
+import salt.utils.minions
+from tests.support.mock import MagicMock, patch
+
+
+@pytest.fixture
+def opts(tmp_path):
+    pki_dir = tmp_path / "pki"
+    for keydir, keys in (
+        ("minions", ("web1", "Db1", ".key_cache")),
+        ("minions_pre", ("new1",)),
+        ("minions_rejected", ()),
+    ):
+        (pki_dir / keydir).mkdir(parents=True)
+        for key in keys:
+            (pki_dir / keydir / key).touch()
+    sock_dir = tmp_path / "sock"
+    sock_dir.mkdir()
+    return {
+        "__role": "master",
+        "pki_dir": str(pki_dir),
+        "sock_dir": str(sock_dir),
+        "cluster_id": None,
+        "key_cache": "watch",
+        "transport": "zeromq",
+        "signing_key_pass": None,
+    }
+
+
+@pytest.fixture
+def service(opts):
+    service = salt.utils.key_set.KeySetService(opts)
+    service.refresh()
+    service.write()
+    yield service
+    service.cleanup()
+
+
+def test_snapshot(opts, service):
+    snapshot = salt.utils.key_set.read(opts)
+    assert snapshot["keys"] == {
+        "minions": ["Db1", "web1"],
+        "minions_pre": ["new1"],
+        "minions_rejected": [],
+        "minions_denied": [],
+    }
+    # The snapshot is only loaded again once it was replaced
+    with patch("salt.payload.load") as load:
+        assert salt.utils.key_set.read(opts) is snapshot
+        assert not load.called
+
+    service.keys["minions"].add("web2")
+    service.write()
+    new_snapshot = salt.utils.key_set.read(opts)
+    assert new_snapshot["version"] > snapshot["version"]
+    assert new_snapshot["keys"]["minions"] == ["Db1", "web1", "web2"]
+
+
+def test_read_keys(opts, service):
+    assert salt.utils.key_set.read_keys(opts, "minions") == ["Db1", "web1"]
+    assert salt.utils.key_set.read_keys(opts, "accepted") is None
+    assert salt.utils.key_set.read_keys(dict(opts, key_cache=""), "minions") is None
+    assert (
+        salt.utils.key_set.read_keys(dict(opts, pki_dir="/other/pki"), "minions")
+        is None
+    )
+    service.cleanup()
+    assert salt.utils.key_set.read_keys(opts, "minions") is None
+
+
+def test_poll_picks_up_changes(opts):
+    service = salt.utils.key_set.KeySetService(opts)
+
+    def _sleep(interval):
+        if not os.path.exists(os.path.join(opts["pki_dir"], "minions", "web2")):
+            os.rename(
+                os.path.join(opts["pki_dir"], "minions_pre", "new1"),
+                os.path.join(opts["pki_dir"], "minions", "web2"),
+            )
+        else:
+            service.running = False
+
+    with patch("time.sleep", _sleep):
+        service._run_poll()
+    assert salt.utils.key_set.read_keys(opts, "minions") == ["Db1", "web1", "web2"]
+    assert salt.utils.key_set.read_keys(opts, "minions_pre") == []
+    service.cleanup()
+
+
+def test_ckminions_reads_snapshot(opts, service):
+    ckminions = salt.utils.minions.CkMinions(opts)
+    service.keys["minions"].add("web2")
+    service.write()
+    with patch("os.listdir") as listdir:
+        assert ckminions.check_minions("web*")["minions"] == ["web1", "web2"]
+        assert ckminions._all_minions()["minions"] == ["Db1", "web1", "web2"]
+        assert not listdir.called
+
+
+def test_key_list_keys_reads_snapshot(opts, service):
+    service.keys["minions_pre"].add("new2")
+    service.write()
+    with patch("salt.utils.event.get_event", MagicMock()):
+        key = salt.key.Key(opts)
+    assert key.list_keys() == {
+        "minions": ["Db1", "web1"],
+        "minions_pre": ["new1", "new2"],
+        "minions_rejected": [],
+        "minions_denied": [],
+    }
+
+    # After changing keys the instance reads the key directories
+    with patch("salt.crypt.load_rsa_pub_key"), patch.object(key, "check_minion_cache"):
+        key.accept("new1")
+    assert key.list_keys() == {
+        "minions": ["Db1", "new1", "web1"],
+        "minions_pre": [],
+        "minions_rejected": [],
+        "minions_denied": [],
+    }
+
+    # Until the snapshot is written again
+    service.refresh()
+    service.write()
+    with patch("os.listdir") as listdir:
+        assert key.list_keys()["minions"] == ["Db1", "new1", "web1"]
+        assert not listdir.called
@@ -0,0 +1,165 @@
+import threading
+
+import pytest
+
+import salt.crypt
+import salt.key
+import salt.utils.crypt
+import salt.utils.key_store
+from tests.support.mock import MagicMock, patch
+
+PUB = """-----BEGIN PUBLIC KEY-----
+MIIBIjANBgkqhkiG9w0BAQEFAAOCAQ8AMIIBCgKCAQEAoe5QSDYRWKyknbVyRrIj
+rm1ht5HgKzAVUber0x54+b/UgxTd1cqI6I+eDlx53LqZSH3G8Rd5cUh8LHoGedSa
+E62vEiJB85a0nvDe8xFT7S/Lfy7kPGkWsqhArwxI2nGDoUJdo/3P4Wz0MEzEO+ZJ
++4cvjCIBRVaPcEp0ebUHTmJ/dyCTOtjTk7dY+hnzIi2M8jNIfJjaHKeyw8j5o3UT
+eVKyRDzovHtVh9X5kDmQ6jsk0xNxz46Oco0nQz+Qz0A1sAunP0iVnZd66XZCLqYS
+FzfyZcKKUkiQb4VfcvvKmlOoaAoUpqF+b4jBWdKvszGNGgdyrU2jSNmvcvn3fi/y
+ywIDAQAB
+-----END PUBLIC KEY-----
+"""
+
+
+@pytest.fixture(params=["dirs", "sqlite"])
+def opts(request, tmp_path):
+    pki_dir = tmp_path / "pki"
+    for state in salt.utils.key_store.STATES:
+        (pki_dir / state).mkdir(parents=True)
+    (pki_dir / "minions" / "web1").write_text(PUB)
+    (pki_dir / "minions" / "Db1").write_text(PUB)
+    (pki_dir / "minions_pre" / "web2").write_text(PUB)
+    (pki_dir / "minions_pre" / ".hidden").write_text(PUB)
+    opts = {
+        "__role": "master",
+        "pki_dir": str(pki_dir),
+        "sock_dir": str(tmp_path),
+        "cachedir": str(tmp_path / "cache"),
+        "cluster_id": None,
+        "key_store": request.param,
+        "hash_type": "sha256",
+        "signing_key_pass": None,
+        "preserve_minion_cache": True,
+        "rotate_aes_key": False,
+    }
+    yield opts
+    if request.param == "sqlite":
+        salt.utils.key_store.SqliteKeyStore(opts).close()
+
+
+@pytest.fixture
+def store(opts):
+    return salt.utils.key_store.factory(opts)
+
+
+def test_list_and_get(store):
+    assert store.list_keys() == {
+        "minions": ["Db1", "web1"],
+        "minions_pre": ["web2"],
+        "minions_rejected": [],
+        "minions_denied": [],
+    }
+    assert store.list_keys(("minions_pre",)) == {"minions_pre": ["web2"]}
+    assert store.get("minions", "web1") == PUB
+    assert store.get("minions", "web2") is None
+    assert store.lookup("web2") == {"minions_pre": PUB}
+
+
+def test_put_move_delete(store):
+    store.put("minions_pre", "web3", PUB)
+    store.put("minions_denied", "web1", PUB)
+    assert store.lookup("web1") == {"minions": PUB, "minions_denied": PUB}
+
+    assert store.move({"minions_pre": ["web2", "web3", "nope"]}, "minions") == {
+        "minions_pre": ["web2", "web3"]
+    }
+    assert store.list_keys(("minions", "minions_pre")) == {
+        "minions": ["Db1", "web1", "web2", "web3"],
+        "minions_pre": [],
+    }
+
+    assert store.delete({"minions": ["web1", "nope"], "minions_denied": ["web1"]}) == {
+        "minions": ["web1"],
+        "minions_denied": ["web1"],
+    }
+    assert store.lookup("web1") == {}
+
+
+@pytest.mark.parametrize(
+    "patterns,regex,expected",
+    [
+        ("web*", False, {"minions": ["web1"], "minions_pre": ["web2"]}),
+        ("web1", False, {"minions": ["web1"]}),
+        (["db*", "D*"], False, {"minions": ["Db1"]}),
+        ("*[12]", False, {"minions": ["Db1", "web1"], "minions_pre": ["web2"]}),
+        ("nope*", False, {}),
+        (r"^web\d$", True, {"minions": ["web1"], "minions_pre": ["web2"]}),
+    ],
+)
+def test_match(store, patterns, regex, expected):
+    assert store.match(patterns, regex=regex) == expected
+
+
+def test_fingerprints(store):
+    finger = salt.utils.crypt.pem_finger(
+        str(store.pki_dir) + "/minions/web1", sum_type="sha256"
+    )
+    assert store.fingerprint("minions", "web1", "sha256") == finger
+    assert store.fingerprint("minions", "nope", "sha256") == ""
+    assert store.fingerprints({"minions": ["web1", "Db1"]}, "md5") == {
+        "minions": {
+            "web1": salt.utils.crypt.pem_finger(
+                str(store.pki_dir) + "/minions/web1", sum_type="md5"
+            ),
+            "Db1": salt.utils.crypt.pem_finger(
+                str(store.pki_dir) + "/minions/Db1", sum_type="md5"
+            ),
+        }
+    }
+
+
+def test_sqlite_imports_once(opts, tmp_path):
+    if opts["key_store"] != "sqlite":
+        pytest.skip("sqlite only")
+    store = salt.utils.key_store.factory(opts)
+    store.delete(store.list_keys())
+    store.close()
+    # Keys are only imported from the key directories once
+    store = salt.utils.key_store.factory(opts)
+    assert store.list_keys(("minions",)) == {"minions": []}
+
+
+def test_key_bulk_operations(opts):
+    with patch("salt.utils.event.get_event", MagicMock()):
+        key = salt.key.Key(opts)
+    key.store.put("minions_pre", "web3", PUB)
+    key.store.put("minions_pre", "bad", "not a key")
+
+    with patch("salt.crypt.dropfile"), patch("sys.stderr"):
+        assert key.accept("web*,bad") == {
+            "minions": ["web1", "web2", "web3"],
+            "minions_pre": ["bad"],
+        }
+        assert key.event.fire_event.call_count == 2
+        assert key.reject("bad") == {"minions_rejected": ["bad"]}
+        assert key.list_status("rej") == {"minions_rejected": ["bad"]}
+        assert key.key_str("web3") == {"minions": {"web3": PUB}}
+        assert key.delete_key("web*") == {}
+    assert key.list_keys()["minions"] == ["Db1"]
+    assert key.finger("Db1", hash_type="sha256") == {
+        "minions": {"Db1": key.store.fingerprint("minions", "Db1", "sha256")}
+    }
+
+
+def test_threads(store):
+    store.put("minions_pre", "web3", PUB)
+    ret = {}
+
+    def _read():
+        ret["pub"] = store.get("minions_pre", "web3")
+        if hasattr(store, "close"):
+            store.close()
+
+    thread = threading.Thread(target=_read)
+    thread.start()
+    thread.join()
+    assert ret["pub"] == PUB
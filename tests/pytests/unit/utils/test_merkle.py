@@ -0,0 +1,36 @@
+import pytest
+
+import salt.utils.merkle
+
+
+@pytest.mark.parametrize("count", [1, 2, 3, 5, 8])
+def test_proofs_lead_to_root(count):
+    messages = [f"message {index}".encode() for index in range(count)]
+    levels = salt.utils.merkle.tree(messages)
+    root = salt.utils.merkle.root(levels)
+    for index, message in enumerate(messages):
+        proof = salt.utils.merkle.proof(levels, index)
+        assert salt.utils.merkle.root_from_proof(message, proof) == root
+        assert salt.utils.merkle.root_from_proof(b"forged", proof) != root
+        # A proof does not lead to the root from another position
+        if count > 1:
+            other = messages[(index + 1) % count]
+            assert salt.utils.merkle.root_from_proof(other, proof) != root
+
+
+def test_single_message():
+    levels = salt.utils.merkle.tree([b"message"])
+    assert salt.utils.merkle.root(levels) == salt.utils.merkle.leaf(b"message")
+    assert salt.utils.merkle.proof(levels, 0) == []
+
+
+def test_node_is_not_a_leaf():
+    levels = salt.utils.merkle.tree([b"a", b"b"])
+    # The concatenated hashes of the children can not pass as a message
+    forged = levels[0][0] + levels[0][1]
+    assert salt.utils.merkle.leaf(forged) != salt.utils.merkle.root(levels)
+
+
+def test_empty_tree():
+    with pytest.raises(ValueError):
+        salt.utils.merkle.tree([])
@@ -0,0 +1,251 @@
+import pytest
+import zmq
+
+import salt.payload
+import salt.utils.data
+import salt.utils.minion_index
+import salt.utils.minions
+from salt._compat import ipaddress
+from tests.support.mock import MagicMock, patch
+
+MINION_DATA = {
+    "web1": {
+        "grains": {"os": "Ubuntu", "roles": ["web", "db"], "num_cpus": 4},
+        "pillar": {"env": "prod", "app": {"name": "shop", "tier": "front"}},
+    },
+    "web2": {
+        "grains": {"os": "ubuntu", "roles": ["web"], "num_cpus": 8},
+        "pillar": {"env": "dev", "app": [{"name": "blog"}]},
+    },
+    "db1": {
+        "grains": {"os": "CentOS", "roles": "db", "num_cpus": 4},
+        "pillar": {"env": "prod"},
+    },
+}
+
+
+@pytest.fixture
+def index():
+    index = salt.utils.minion_index.MinionIndex()
+    for minion_id, mdata in MINION_DATA.items():
+        index.update(minion_id, mdata)
+    return index
+
+
+def _subdict_match(search_type, expr, **kwargs):
+    return {
+        minion_id
+        for minion_id, mdata in MINION_DATA.items()
+        if salt.utils.data.subdict_match(mdata[search_type], expr, **kwargs)
+    }
+
+
+@pytest.mark.parametrize(
+    "search_type,expr,kwargs",
+    [
+        ("grains", "os:Ubuntu", {}),
+        ("grains", "os:ubu*", {}),
+        ("grains", "os:Cent[Oo]S", {}),
+        ("grains", "roles:web", {}),
+        ("grains", "roles:db", {}),
+        ("grains", "num_cpus:4", {}),
+        ("grains", "os:(ubuntu|centos)", {"regex_match": True}),
+        ("grains", "os:ubuntu", {"exact_match": True}),
+        ("grains", "missing:*", {}),
+        ("grains", "os", {}),
+        ("grains", "*:web", {}),
+        ("pillar", "env:prod", {}),
+        ("pillar", "app:name", {}),
+        ("pillar", "app:name:shop", {}),
+        ("pillar", "app:name:blog", {}),
+        ("pillar", "app:*", {}),
+    ],
+)
+def test_match_same_as_subdict_match(index, search_type, expr, kwargs):
+    assert index.match(search_type, expr, **kwargs) == _subdict_match(
+        search_type, expr, **kwargs
+    )
+
+
+def test_update_replaces_previous_data(index):
+    index.update("web2", {"grains": {"os": "Debian"}})
+    assert index.match("grains", "os:ubuntu") == {"web1"}
+    assert index.match("grains", "os:debian") == {"web2"}
+    assert index.match("grains", "roles:web") == {"web1"}
+
+
+def test_remove(index):
+    index.update("web1", None)
+    assert index.minions() == {"web2", "db1"}
+    assert index.match("grains", "os:ubuntu") == {"web2"}
+    assert index.match("pillar", "app:name:shop") == set()
+    assert "app" in index.complex["pillar"]
+    index.remove("web2")
+    assert "app" not in index.complex["pillar"]
+    assert "roles" in index.values["grains"]
+    assert "web" not in index.values["grains"]["roles"]
+
+
+def test_handle_query(index):
+    proc = salt.utils.minion_index.MinionDataIndex({"sock_dir": "/tmp"})
+    proc.index = index
+    ret = proc.handle_query(
+        {"cmd": "match", "search_type": "grains", "expr": "os:ubuntu"}
+    )
+    assert sorted(ret["minions"]) == ["web1", "web2"]
+    # Greedy queries also get the candidates without cached data, and only
+    # the candidates
+    ret = proc.handle_query(
+        {
+            "cmd": "match",
+            "search_type": "grains",
+            "expr": "os:ubuntu",
+            "candidates": ["web1", "db1", "nodata"],
+        }
+    )
+    assert ret == {"minions": ["web1", "nodata"]}
+    ret = proc.handle_query(
+        {"cmd": "ipcidr", "tgt": "10.0.0.0/8", "candidates": ["web1", "nodata"]}
+    )
+    assert ret == {"minions": ["nodata"]}
+
+
+def test_put_before_index_binds(tmp_path):
+    cli = salt.utils.minion_index.MinionIndexCli({"sock_dir": str(tmp_path)})
+    context = zmq.Context()
+    update_in = context.socket(zmq.PULL)
+    try:
+        # The first update of a process is not lost to a slow join
+        cli.put("web1", MINION_DATA["web1"])
+        update_in.bind("ipc://" + cli.update_sock)
+        assert update_in.poll(5000)
+        assert salt.payload.loads(update_in.recv()) == ["web1", MINION_DATA["web1"]]
+    finally:
+        update_in.close(0)
+        cli.update_out.close(0)
+        context.term()
+
+
+@pytest.mark.parametrize(
+    "greedy,expected", [(True, ["db1", "web1", "nodata"]), (False, ["db1", "web1"])]
+)
+def test_check_minions_uses_index(tmp_path, greedy, expected):
+    pki_dir = tmp_path / "pki"
+    (pki_dir / "minions").mkdir(parents=True)
+    for minion_id in ("db1", "web1", "web2", "nodata"):
+        (pki_dir / "minions" / minion_id).touch()
+    opts = {
+        "pki_dir": str(pki_dir),
+        "minion_data_cache": True,
+        "minion_data_index": True,
+    }
+    ckminions = salt.utils.minions.CkMinions(opts)
+    query = MagicMock(return_value={"minions": expected})
+    with patch.object(ckminions, "_query_minion_index", query), patch(
+        "salt.cache.Cache.fetch"
+    ) as fetch:
+        ret = ckminions.check_minions("env:prod", "pillar", greedy=greedy)
+        assert not fetch.called
+    assert ret["minions"] == expected
+    query.assert_called_once_with(
+        "pillar",
+        "env:prod",
+        candidates=["db1", "nodata", "web1", "web2"] if greedy else None,
+        delimiter=":",
+        regex_match=False,
+        exact_match=False,
+    )
+
+
+def test_check_minions_falls_back_to_cache(tmp_path):
+    opts = {
+        "pki_dir": str(tmp_path),
+        "minion_data_cache": True,
+        "minion_data_index": True,
+    }
+    ckminions = salt.utils.minions.CkMinions(opts)
+    with patch.object(
+        ckminions, "_query_minion_index", MagicMock(return_value=None)
+    ), patch("salt.cache.Cache.list", return_value=list(MINION_DATA)), patch(
+        "salt.cache.Cache.fetch",
+        side_effect=lambda bank, key: MINION_DATA[bank.split("/")[1]],
+    ):
+        ret = ckminions.check_minions("os:ubuntu", "grain", greedy=False)
+    assert sorted(ret["minions"]) == ["web1", "web2"]
+
+
+def test_address_trie():
+    trie = salt.utils.minion_index.AddressTrie(32)
+    addresses = {
+        "10.20.0.1": "web1",
+        "10.20.3.7": "web2",
+        "10.21.0.1": "db1",
+        "192.168.1.10": "db2",
+    }
+    for address, minion_id in addresses.items():
+        trie.insert(int(ipaddress.ip_address(address)), minion_id)
+    trie.insert(int(ipaddress.ip_address("10.20.0.1")), "web1-alias")
+
+    for network in (
+        "0.0.0.0/0",
+        "10.0.0.0/8",
+        "10.20.0.0/16",
+        "10.20.0.0/22",
+        "10.20.3.7/32",
+        "10.22.0.0/16",
+        "192.168.1.0/24",
+        "172.16.0.0/12",
+    ):
+        network = ipaddress.ip_network(network)
+        expected = {
+            minion_id
+            for address, minion_id in addresses.items()
+            if ipaddress.ip_address(address) in network
+        }
+        if ipaddress.ip_address("10.20.0.1") in network:
+            expected.add("web1-alias")
+        assert trie.lookup(int(network.network_address), network.prefixlen) == expected
+
+    trie.remove(int(ipaddress.ip_address("10.20.3.7")), "web2")
+    trie.remove(int(ipaddress.ip_address("10.20.0.1")), "web1")
+    assert trie.lookup(int(ipaddress.ip_address("10.20.0.0")), 16) == {"web1-alias"}
+    trie.remove(int(ipaddress.ip_address("10.20.0.1")), "web1-alias")
+    trie.remove(int(ipaddress.ip_address("10.21.0.1")), "db1")
+    trie.remove(int(ipaddress.ip_address("192.168.1.10")), "db2")
+    assert trie.root.children == [None, None]
+
+
+def test_match_ipcidr():
+    index = salt.utils.minion_index.MinionIndex()
+    index.update("web1", {"grains": {"ipv4": ["10.20.0.1"], "ipv6": ["fd00::1"]}})
+    index.update("web2", {"grains": {"ipv4": ["10.20.3.7", "not-an-ip"]}})
+    index.update("db1", {"grains": {"ipv4": ["10.21.0.1"]}})
+
+    assert index.match_ipcidr("10.20.0.0/16") == {"web1", "web2"}
+    assert index.match_ipcidr("10.21.0.1") == {"db1"}
+    assert index.match_ipcidr("fd00::/8") == {"web1"}
+    with pytest.raises(ValueError):
+        index.match_ipcidr("10.20.0.1/16")
+
+    index.update("web1", {"grains": {"ipv4": ["10.21.0.2"]}})
+    assert index.match_ipcidr("10.21.0.0/16") == {"db1", "web1"}
+    assert index.match_ipcidr("fd00::/8") == set()
+
+
+def test_check_ipcidr_minions_uses_index(tmp_path):
+    opts = {
+        "pki_dir": str(tmp_path),
+        "minion_data_cache": True,
+        "minion_data_index": True,
+    }
+    ckminions = salt.utils.minions.CkMinions(opts)
+    query = MagicMock(return_value={"minions": ["web1"]})
+    with patch.object(ckminions, "_query_minion_index", query), patch(
+        "salt.cache.Cache.fetch"
+    ) as fetch:
+        ret = ckminions.check_minions("10.20.0.0/16", "ipcidr", greedy=False)
+        assert not fetch.called
+        assert ret["minions"] == ["web1"]
+        query.assert_called_once_with("ipcidr", "10.20.0.0/16", candidates=None)
+        assert ckminions.check_minions("10.20.0.1/16", "ipcidr")["minions"] == []
+        query.assert_called_once()
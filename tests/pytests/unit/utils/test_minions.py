@@ -116,3 +116,110 @@ def test_validate_tgt_should_return_true_when_all_minions_are_found_in_valid_min
             "fnord", "fnord", "fnord", minions=target_minions
         )
         assert result is True
+
+
+@pytest.mark.parametrize(
+    "expr,expected",
+    [
+        ("L@a,b", ("match", "L", "a,b", None)),
+        (
+            "G@os:Ubuntu and web*",
+            ("and", [("match", "G", "os:Ubuntu", None), ("match", None, "web*", None)]),
+        ),
+        (
+            "a or b and c",
+            (
+                "or",
+                [
+                    ("match", None, "a", None),
+                    ("and", [("match", None, "b", None), ("match", None, "c", None)]),
+                ],
+            ),
+        ),
+        (
+            "a not ( b or c )",
+            (
+                "and",
+                [
+                    ("match", None, "a", None),
+                    (
+                        "not",
+                        (
+                            "or",
+                            [("match", None, "b", None), ("match", None, "c", None)],
+                        ),
+                    ),
+                ],
+            ),
+        ),
+        ("( a", ("match", None, "a", None)),
+        ("and a", None),
+        ("( a ) )", None),
+        ("a b", None),
+        ("", None),
+    ],
+)
+def test_compile_compound(expr, expected):
+    assert salt.utils.minions.compile_compound(expr) == expected
+
+
+def test_compile_compound_nodegroups():
+    nodegroups = {"group1": "L@foo,bar", "group2": ["N@group1", "or", "baz*"]}
+    assert salt.utils.minions.compile_compound(["N@group2"], nodegroups) == (
+        "or",
+        [("match", "L", "foo,bar", None), ("match", None, "baz*", None)],
+    )
+
+
+@pytest.fixture
+def compound_ckminions():
+    ckminions = salt.utils.minions.CkMinions(opts={"minion_data_cache": True})
+    minions = ["web1", "web2", "db1", "db2"]
+    with patch.object(ckminions, "_pki_minions", return_value=minions), patch.object(
+        ckminions,
+        "_check_grain_minions",
+        return_value={"minions": ["web1", "db1"], "missing": []},
+    ):
+        yield ckminions
+
+
+@pytest.mark.parametrize(
+    "expr,expected",
+    [
+        ("G@os:Ubuntu and web*", ["web1"]),
+        ("G@os:Ubuntu or web*", ["db1", "web1", "web2"]),
+        ("not G@os:Ubuntu", ["db2", "web2"]),
+        ("web* not G@os:Ubuntu", ["web2"]),
+        ("L@db2,nope or ( web* and not G@os:Ubuntu )", ["db2", "web2"]),
+        ("( G@os:Ubuntu or", []),
+    ],
+)
+def test_check_compound_minions(compound_ckminions, expr, expected):
+    ret = compound_ckminions.check_minions(expr, "compound")
+    assert sorted(ret["minions"]) == expected
+
+
+def test_check_compound_minions_missing(compound_ckminions):
+    ret = compound_ckminions.check_minions("L@db2,nope or G@os:Ubuntu", "compound")
+    assert ret["missing"] == ["nope"]
+    # Minions excluded with a 'not' are not reported as missing
+    ret = compound_ckminions.check_minions("web* and not L@nope", "compound")
+    assert ret["missing"] == []
+
+
+def test_check_compound_minions_short_circuit(compound_ckminions):
+    ret = compound_ckminions.check_minions("G@os:Ubuntu and L@nope", "compound")
+    assert ret["minions"] == []
+    # The list was evaluated first and emptied the result, the grain matcher
+    # is never called
+    assert not compound_ckminions._check_grain_minions.called
+
+
+def test_check_compound_minions_compiles_once(compound_ckminions):
+    with patch(
+        "salt.utils.minions.compile_compound",
+        wraps=salt.utils.minions.compile_compound,
+    ) as compile_compound:
+        for _ in range(3):
+            compound_ckminions.check_minions("G@os:Ubuntu and web*", "compound")
+    compile_compound.assert_called_once()
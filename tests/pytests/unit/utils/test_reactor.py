@@ -1,7 +1,12 @@
+import fnmatch
+import threading
+import time
+
 import pytest
 
 import salt.utils.data
 import salt.utils.reactor as reactor
+import salt.utils.yaml
 from tests.support.mock import MagicMock, call, patch
 
 
@@ -55,3 +60,230 @@ def test_run_master_reactor(master_opts, master_reactor):
                 master_reactor.run()
                 calls = [call(9)]
                 os_nice_mock.assert_has_calls(calls)
+
+
+def test_reactor_map():
+    react_map = [
+        {"salt/minion/*/start": ["/srv/reactor/start.sls"]},
+        {"salt/key": "/srv/reactor/key.sls"},
+        {"salt/job/*": ["/srv/reactor/job.sls"]},
+        {"salt/job/*/ret/web?": ["/srv/reactor/web.sls", "/srv/reactor/ret.sls"]},
+        {"*": ["/srv/reactor/all.sls"]},
+        {"salt/key": ["/srv/reactor/key2.sls"]},
+        "not a reactor",
+        {"salt/job/[0-9]*/new": ["/srv/reactor/new.sls"]},
+    ]
+    compiled = reactor.ReactorMap(react_map)
+    assert compiled.literals == {"salt/key": [1, 5]}
+    assert len(compiled.patterns) == 3
+    tags = (
+        "salt/minion/web1/start",
+        "salt/key",
+        "salt/keys",
+        "salt/job/123/ret/web1",
+        "salt/job/123/new",
+        "salt/job/abc/new",
+        "salt/job",
+        "",
+    )
+    for tag in tags:
+        expected = []
+        for ropt in react_map:
+            if isinstance(ropt, dict):
+                key, val = next(iter(ropt.items()))
+                if fnmatch.fnmatch(tag, key):
+                    expected.extend([val] if isinstance(val, str) else val)
+        assert compiled.match(tag) == expected, tag
+
+
+def test_list_reactors_refreshed(master_opts):
+    master_opts["reactor"] = [{"salt/job/*": ["/srv/reactor/job.sls"]}]
+    master_reactor = reactor.Reactor(master_opts)
+    assert master_reactor.list_reactors("salt/key") == []
+    compiled = master_reactor.compiled_reactors()
+    master_reactor.add_reactor("salt/key", ["/srv/reactor/key.sls"])
+    assert master_reactor.list_reactors("salt/key") == ["/srv/reactor/key.sls"]
+    assert master_reactor.compiled_reactors() is not compiled
+    master_reactor.delete_reactor("salt/key")
+    assert master_reactor.list_reactors("salt/key") == []
+
+
+def test_list_reactors_from_file(master_opts, tmp_path):
+    reactor_file = tmp_path / "reactor.conf"
+    reactor_file.write_text("- salt/key:\n  - /srv/reactor/key.sls\n")
+    master_opts["reactor"] = str(reactor_file)
+    master_reactor = reactor.Reactor(master_opts)
+    with patch("salt.utils.yaml.safe_load", wraps=salt.utils.yaml.safe_load) as load:
+        assert master_reactor.list_reactors("salt/key") == ["/srv/reactor/key.sls"]
+        assert master_reactor.list_reactors("salt/key") == ["/srv/reactor/key.sls"]
+        assert load.call_count == 1
+    reactor_file.write_text("- salt/key*:\n  - /srv/reactor/keys.sls\n")
+    assert master_reactor.list_reactors("salt/keys") == ["/srv/reactor/keys.sls"]
+
+
+def test_render_cache(master_reactor, tmp_path):
+    # The cache is opt-in
+    assert not master_reactor.opts["reactor_render_cache"]
+    master_reactor.opts["reactor_render_cache"] = True
+    static = tmp_path / "static.sls"
+    static.write_text("highstate:\n  local.state.apply:\n    - tgt: web*\n")
+    dynamic = tmp_path / "dynamic.sls"
+    dynamic.write_text(
+        "highstate:\n  local.state.apply:\n    - tgt: {{ data['id'] }}\n"
+    )
+    with patch.object(
+        master_reactor, "render_template", wraps=master_reactor.render_template
+    ) as render:
+        for num in range(3):
+            react = master_reactor.render_reaction(
+                str(static), "salt/minion/web1/start", {"id": "web1"}
+            )
+            assert react["highstate"]["__sls__"] == str(static)
+            react["highstate"]["local"].append({"arg": num})
+        assert render.call_count == 1
+        react = master_reactor.render_reaction(
+            str(static), "salt/minion/web1/start", {"id": "web1"}
+        )
+        assert react["highstate"]["local"] == [{"tgt": "web*"}, "state.apply"]
+
+        for minion in ("web1", "web2"):
+            react = master_reactor.render_reaction(
+                str(dynamic), "salt/minion/web1/start", {"id": minion}
+            )
+            assert react["highstate"]["local"] == [{"tgt": minion}, "state.apply"]
+        assert render.call_count == 3
+
+        static.write_text("highstate:\n  local.state.apply:\n    - tgt: db*\n")
+        react = master_reactor.render_reaction(
+            str(static), "salt/minion/web1/start", {"id": "web1"}
+        )
+        assert react["highstate"]["local"] == [{"tgt": "db*"}, "state.apply"]
+        assert render.call_count == 4
+
+
+@pytest.mark.parametrize(
+    "statement",
+    [
+        "{% include 'tgt.jinja' %}",
+        "{% from 'tgt.jinja' import tgt %}",
+        "{% import_yaml 'tgt.yaml' as tgt %}",
+        "{% set tgt = 'web*' %}",
+        "{{ __salt__['cmd.run']('hostname') }}",
+        "{{ None|strftime('%Y') }}",
+        "{{ [1, 2]|random }}",
+        "{{ grains['id'] }}",
+        "{{ opts['id'] }}",
+    ],
+)
+def test_render_cache_dynamic(master_reactor, tmp_path, statement):
+    sls = tmp_path / "dynamic.sls"
+    sls.write_text(statement + "\nhighstate:\n  local.state.apply:\n    - tgt: web*\n")
+    # Any template tag may depend on the event, or change on its own
+    assert not master_reactor._is_static(str(sls))
+
+
+@pytest.mark.parametrize(
+    "renderer,static",
+    [("#!yaml", True), ("#!jinja|yaml", True), ("#!mako|yaml", False), ("#!py", False)],
+)
+def test_render_cache_renderers(master_reactor, tmp_path, renderer, static):
+    sls = tmp_path / "render.sls"
+    sls.write_text(renderer + "\nhighstate:\n  local.state.apply:\n    - tgt: web*\n")
+    assert master_reactor._is_static(str(sls)) is static
+
+
+@pytest.fixture
+def reaction_pool():
+    opts = {
+        "reactor_worker_hwm": 100,
+        "reactor_classes": {
+            "auth": {
+                "tags": "salt/auth",
+                "priority": 0,
+                "concurrency": 1,
+                "max_queue": 3,
+                "coalesce": 60000,
+            },
+            "urgent": {"tags": ["salt/urgent/*"], "priority": 20},
+        },
+    }
+    return reactor.ReactionPool(opts, num_threads=0)
+
+
+def test_reaction_classes_max_queue():
+    opts = {
+        "reactor_worker_hwm": 100,
+        "reactor_classes": {"auth": {"max_queue": 3}, "urgent": {"priority": 20}},
+    }
+    classes = reactor.reaction_classes(opts)
+    assert classes["auth"]["max_queue"] == 3
+    # Every class is bounded by the high water mark unless configured
+    assert classes["urgent"]["max_queue"] == 100
+    assert classes["default"]["max_queue"] == 100
+
+
+def test_reaction_pool_classify(reaction_pool):
+    assert reaction_pool.classify("salt/auth") == "auth"
+    assert reaction_pool.classify("salt/urgent/db1") == "urgent"
+    assert reaction_pool.classify("salt/minion/web1/start") == "default"
+    assert reaction_pool.order == ["urgent", "default", "auth"]
+
+
+def test_reaction_pool_dispatch(reaction_pool):
+    def submit(name, key, fingerprint=None):
+        return reaction_pool.submit(
+            name, key, print, (name, key), fingerprint=fingerprint
+        )
+
+    for num in range(3):
+        assert submit("auth", "auth.sls:accept", fingerprint=f"minion{num}")
+    # Coalesced with the first one
+    assert submit("auth", "auth.sls:accept", fingerprint="minion0")
+    # The queue of the class is full
+    assert not submit("auth", "auth.sls:accept", fingerprint="minion4")
+    submit("default", "start.sls:highstate")
+    submit("default", "start.sls:highstate")
+    submit("default", "start.sls:notify")
+    submit("urgent", "urgent.sls:page")
+
+    def pop():
+        reaction = reaction_pool._next()
+        return reaction and reaction[:2]
+
+    # By priority, then the reactions of a class in turn
+    assert pop() == ("urgent", "urgent.sls:page")
+    assert pop() == ("default", "start.sls:highstate")
+    assert pop() == ("default", "start.sls:notify")
+    assert pop() == ("default", "start.sls:highstate")
+    assert pop() == ("auth", "auth.sls:accept")
+    # Only one at a time
+    assert pop() is None
+
+    stats = reaction_pool.stats()
+    assert stats["auth"]["depth"] == 2
+    assert stats["auth"]["inflight"] == 1
+    assert stats["auth"]["coalesced"] == 1
+    assert stats["auth"]["dropped"] == 1
+    assert stats["default"]["inflight"] == 3
+
+
+def test_reaction_pool_runs_reactions():
+    pool = reactor.ReactionPool({"reactor_worker_threads": 2})
+    done = threading.Event()
+    calls = []
+
+    def reaction(num):
+        # Runs in the thread of the reaction
+        assert pool.fire_async(calls.append, args=(num,))
+        if len(calls) == 5:
+            done.set()
+
+    for num in range(5):
+        pool.submit("default", "reaction", reaction, (num,))
+    assert done.wait(10)
+    assert sorted(calls) == list(range(5))
+    for _ in range(100):
+        if pool.stats()["default"]["done"] == 5:
+            break
+        time.sleep(0.01)
+    assert pool.stats()["default"]["done"] == 5
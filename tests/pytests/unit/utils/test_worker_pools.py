@@ -0,0 +1,86 @@
+import pytest
+
+import salt.payload
+import salt.utils.worker_pools
+
+
+@pytest.fixture
+def opts(tmp_path):
+    return {
+        "sock_dir": str(tmp_path),
+        "worker_threads": 5,
+        "ipc_mode": "",
+        "tcp_master_workers": 4515,
+        "cluster_id": None,
+        "worker_pools": {
+            "pillar": {"worker_threads": 2, "commands": ["_pillar"]},
+            "returns": {"worker_threads": 0, "commands": ["_return", "_pillar"]},
+            "auth": {"commands": ["clear"]},
+        },
+    }
+
+
+def test_pools(opts):
+    pools = salt.utils.worker_pools.pools(opts)
+    assert list(pools) == ["default", "pillar", "returns", "auth"]
+    assert pools["default"] == {"worker_threads": 5, "commands": []}
+    assert pools["pillar"]["worker_threads"] == 2
+    # Every pool gets at least one worker
+    assert pools["returns"]["worker_threads"] == 1
+    assert pools["auth"]["worker_threads"] == 1
+
+    opts["worker_pools"]["default"] = {"worker_threads": 3}
+    assert salt.utils.worker_pools.pools(opts)["default"]["worker_threads"] == 3
+
+
+def test_routes(opts):
+    # The first pool wins for commands routed to several pools
+    assert salt.utils.worker_pools.routes(opts) == {
+        "_pillar": "pillar",
+        "_return": "returns",
+        "clear": "auth",
+    }
+
+
+def test_worker_uri(opts, tmp_path):
+    assert salt.utils.worker_pools.worker_uri(opts) == "ipc://{}".format(
+        tmp_path / "workers.ipc"
+    )
+    assert salt.utils.worker_pools.worker_uri(opts, "pillar") == "ipc://{}".format(
+        tmp_path / "workers-pillar.ipc"
+    )
+    opts["ipc_mode"] = "tcp"
+    assert salt.utils.worker_pools.worker_uri(opts) == "tcp://127.0.0.1:4515"
+    assert salt.utils.worker_pools.worker_uri(opts, "pillar") == "tcp://127.0.0.1:4615"
+    assert salt.utils.worker_pools.worker_uri(opts, "auth") == "tcp://127.0.0.1:4617"
+
+
+def test_route(opts):
+    router = salt.utils.worker_pools.Router(opts)
+
+    def _aes(cmd):
+        # The load stays encrypted, the client names the command in the
+        # envelope
+        return {"enc": "aes", "load": b"encrypted", "cmd": cmd}
+
+    assert router.route(_aes("_pillar")) == "pillar"
+    assert router.route(salt.payload.dumps(_aes("_return"))) == "returns"
+    assert router.route(_aes("_mine")) == "default"
+    assert router.route({"enc": "clear", "load": {"cmd": "_auth"}}) == "auth"
+    # Older minions do not name the command
+    assert router.route({"enc": "aes", "load": b"encrypted"}) == "default"
+    assert router.route(b"\xc1garbage") == "default"
+
+
+def test_pool_stats():
+    stats = salt.utils.worker_pools.PoolStats(["default", "pillar"])
+    stats.dispatched("pillar")
+    stats.dispatched("pillar")
+    stats.replied("pillar", 2.0)
+    stats.replied("default")
+    assert stats.snapshot() == {
+        "default": {"depth": 0, "latency": 0.0},
+        "pillar": {"depth": 1, "latency": 2.0},
+    }
+    stats.replied("pillar", 4.0)
+    assert stats.snapshot()["pillar"] == {"depth": 0, "latency": 2.2}
@@ -10,6 +10,7 @@ import tempfile
 import pytest
 
 import salt.utils.files
+import salt.utils.key_store
 import salt.utils.verify
 from tests.support.mock import patch
 
@@ -299,3 +300,22 @@ def test_max_open_files(caplog):
                 win32file._setmaxstdio(mof_h)
             else:
                 resource.setrlimit(resource.RLIMIT_NOFILE, (mof_s, mof_h))
+
+
+def test_max_open_files_key_store(caplog, tmp_path):
+    opts = {
+        "max_open_files": 100000,
+        "pki_dir": str(tmp_path),
+        "key_store": "sqlite",
+        "key_store_path": str(tmp_path / "keys.sqlite3"),
+    }
+    store = salt.utils.key_store.factory(opts)
+    store.put("minions", "web1", "pub")
+    store.put("minions", "web2", "pub")
+    store.put("minions_pre", "web3", "pub")
+    try:
+        with caplog.at_level(logging.DEBUG):
+            salt.utils.verify.check_max_open_files(opts)
+    finally:
+        store.close()
+    assert "This salt-master instance has accepted 2 minion keys." in caplog.messages
@@ -20,6 +20,14 @@ class JidTestCase(TestCase):
         incorrect_jid_length = 2012
         self.assertEqual(salt.utils.jid.jid_to_time(incorrect_jid_length), "")
 
+    def test_jid_to_datetime(self):
+        self.assertEqual(
+            salt.utils.jid.jid_to_datetime("20131219110700123489_1234"),
+            datetime.datetime(2013, 12, 19, 11, 7, 0, 123489),
+        )
+        self.assertIsNone(salt.utils.jid.jid_to_datetime(2012))
+        self.assertIsNone(salt.utils.jid.jid_to_datetime("20131319110700123489"))
+
     def test_is_jid(self):
         self.assertTrue(salt.utils.jid.is_jid("20131219110700123489"))  # Valid JID
         self.assertFalse(salt.utils.jid.is_jid(20131219110700123489))  # int